@@ -0,0 +1,915 @@
+"""
+Asyncio email search engine
+
+search_messages() scans one folder at a time over one imaplib connection and
+EmailSearchEngine runs it on a single daemon thread, so a slow server or a
+PDF that needs OCR holds up everything else. search_messages_async() runs the
+same search as a coroutine on an asyncio event loop:
+
+- AsyncImapConnection is a small IMAP client on asyncio streams; commands are
+  tagged and may be issued concurrently, so the FETCH commands of one
+  connection are pipelined (pipeline_depth in flight)
+- every account gets num_connections connections taking folders from a
+  shared list, largest first; several accounts are searched at once
+- max_in_flight bounds the FETCH commands in flight over all connections
+- PDF text extraction and full-message parsing run in an executor, so the
+  loop keeps serving the other connections meanwhile
+- cancelling the task stops the search: pending commands are dropped, the
+  connections closed and the PDF processor told to stop
+
+The result dict has the same shape as the one of search_messages(). The sync
+state, the scan ledger and the Gmail fast path are only used by
+search_messages().
+
+AsyncEmailSearchEngine has the callbacks of EmailSearchEngine: the search runs
+on an event loop in a background thread and cancel_search() cancels its task.
+"""
+import asyncio
+import collections
+import re
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+try:
+    from gui.imap_search_components.pdf_processor import PDFProcessor
+except ImportError:
+    log("Warning: PDFProcessor not available, PDF search will be disabled")
+    PDFProcessor = None
+
+from gui.imap_search_components.batch_sizer import make_batch_sizer, split_by_budget
+from gui.imap_search_components.bodystructure import find_pdf_parts, build_section_fetch
+from gui.imap_search_components.fetch_parser import fetch_message_body, parse_fetch_items
+from gui.imap_search_components.fetch_pipeline import DEFAULT_MAX_IN_FLIGHT, compress_uid_set, chunk_uids
+from gui.imap_search_components.folder_scheduler import (
+    MAX_FOLDER_RETRIES,
+    NOSELECT_FLAGS,
+    parse_excluded_folders,
+    parse_list_response,
+    prioritize_folders,
+)
+from gui.imap_search_components.imap_scanner import (
+    TRIAGE_FETCH,
+    TRIAGE_FETCH_ENVELOPE,
+    SECTION_CHUNK_SIZE,
+    SECTION_BYTE_BUDGET,
+    WINDOW_BYTE_BUDGET,
+    pdf_attachments_from_item,
+    triage_headers,
+)
+from gui.imap_search_components.message_dedup import MessageDeduplicator, message_fingerprint
+from gui.imap_search_components.parallel_scanner import DEFAULT_NUM_CONNECTIONS, MAX_NUM_CONNECTIONS
+from gui.imap_search_components.search_engine import _imap_date_str, _normalize_date_range
+from gui.imap_search_components.search_planner import (
+    ESEARCH_RETURN,
+    MIN_PDF_MESSAGE_SIZE,
+    parse_esearch_response,
+    plan_imap_search,
+)
+from gui.imap_search_components.sync_state import quote_mailbox
+from gui.imap_search_components.uid_set import UidSet
+from gui.mail_search_components.mime_stream import iter_bytes_chunks, parse_message_stream
+
+# FETCH commands in flight over all connections of a search
+MAX_IN_FLIGHT = 32
+
+# Seconds allowed for connecting and for the server greeting
+CONNECT_TIMEOUT = 30
+
+# Seconds allowed for LOGOUT before the connection is just closed
+LOGOUT_TIMEOUT = 5
+
+# Longest response line (UID SEARCH results come as one line)
+READ_LIMIT = 16 * 1024 * 1024
+
+CANCELLED_ERROR = 'Wyszukiwanie przerwane przez użytkownika'
+
+_LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+_UNTAGGED_RE = re.compile(rb'\* (?:(\d+) )?([A-Za-z][A-Za-z0-9.-]*)(?: (.*))?$', re.DOTALL)
+_TAGGED_RE = re.compile(rb'(\S+) (OK|NO|BAD)\b ?(.*)$', re.DOTALL | re.IGNORECASE)
+_UIDVALIDITY_RE = re.compile(rb'\[UIDVALIDITY (\d+)\]', re.IGNORECASE)
+_MESSAGES_RE = re.compile(rb'\bMESSAGES\s+(\d+)', re.IGNORECASE)
+
+
+class AsyncImapError(Exception):
+    """IMAP connection lost or closed"""
+
+
+def _quote(value):
+    """Quote a string argument (e.g. LOGIN user name and password)."""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _response_data(untagged, name):
+    """Flatten the data of all untagged responses called name (imaplib layout)."""
+    return [item for response_name, items in untagged if response_name == name for item in items]
+
+
+class AsyncImapConnection:
+    """IMAP client on asyncio streams; commands may be issued concurrently"""
+
+    def __init__(self, reader, writer, pipeline_depth=DEFAULT_MAX_IN_FLIGHT):
+        """
+        Args:
+            reader: asyncio.StreamReader of the connection
+            writer: asyncio.StreamWriter of the connection
+            pipeline_depth: Commands sent before the first one completes
+        """
+        self.reader = reader
+        self.writer = writer
+        self.capabilities = None
+        self.pipeline_depth = max(1, int(pipeline_depth))
+        self._tag_counter = 0
+        self._pending = collections.deque()  # (tag, future, untagged) in send order
+        self._slots = asyncio.Semaphore(self.pipeline_depth)
+        self._reader_task = None
+        self._closed = False
+
+    @classmethod
+    async def open(cls, host, port, use_ssl=True, timeout=CONNECT_TIMEOUT,
+                   pipeline_depth=DEFAULT_MAX_IN_FLIGHT):
+        """
+        Connect and read the server greeting.
+
+        Args:
+            host: IMAP server name
+            port: IMAP server port
+            use_ssl: Connect with TLS (IMAPS)
+            timeout: Seconds allowed for connecting and the greeting
+            pipeline_depth: Commands sent before the first one completes
+
+        Returns:
+            AsyncImapConnection (not logged in yet)
+        """
+        ssl_context = ssl.create_default_context() if use_ssl else None
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, int(port), ssl=ssl_context, limit=READ_LIMIT), timeout)
+        conn = cls(reader, writer, pipeline_depth)
+        try:
+            greeting = await asyncio.wait_for(conn._read_response(), timeout)
+            if not re.match(rb'\* (OK|PREAUTH)\b', greeting[0], re.IGNORECASE):
+                raise AsyncImapError(f"Unexpected greeting: {greeting[0]!r}")
+        except BaseException:
+            conn.close()
+            raise
+        conn._reader_task = asyncio.ensure_future(conn._read_loop())
+        return conn
+
+    async def _read_response(self):
+        """Read one response; literals are returned as (line, literal) like imaplib does."""
+        items = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise AsyncImapError('connection closed by server')
+            line = line.rstrip(b'\r\n')
+            match = _LITERAL_RE.search(line)
+            if not match:
+                items.append(line)
+                return items
+            items.append((line, await self.reader.readexactly(int(match.group(1)))))
+
+    async def _read_loop(self):
+        error = AsyncImapError('connection closed')
+        try:
+            while True:
+                self._dispatch(await self._read_response())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e if isinstance(e, AsyncImapError) else AsyncImapError(f"connection lost: {e}")
+        finally:
+            self._closed = True
+            while self._pending:
+                _, future, _ = self._pending.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    def _dispatch(self, items):
+        """Hand a response to the command it belongs to."""
+        first = items[0]
+        head = first[0] if isinstance(first, tuple) else first
+        if head.startswith(b'* '):
+            match = _UNTAGGED_RE.match(head)
+            if not match or not self._pending:
+                return  # Unsolicited, e.g. EXISTS between commands
+            number, name, rest = match.groups()
+            # Strip '* ' and the response name, keep the number: b'12 (UID ...'
+            data = b' '.join(part for part in (number, rest) if part is not None)
+            items[0] = (data, first[1]) if isinstance(first, tuple) else data
+            # Servers answer pipelined commands in order: untagged data belongs to the oldest one
+            self._pending[0][2].append((name.decode('ascii').upper(), items))
+            return
+        match = _TAGGED_RE.match(head)
+        if not match:
+            return  # Continuation request - not used
+        for index, (tag, future, untagged) in enumerate(self._pending):
+            if tag == match.group(1):
+                del self._pending[index]
+                if not future.done():
+                    future.set_result((match.group(2).decode('ascii').upper(), untagged, match.group(3)))
+                return
+
+    async def command(self, line):
+        """
+        Send a command and wait for its completion.
+
+        Args:
+            line: Command without tag, e.g. 'UID FETCH 1:5 (UID FLAGS)'
+
+        Returns:
+            tuple: (status, untagged, text) - 'OK'/'NO'/'BAD', list of
+                   (name, data) untagged responses in imaplib layout and the
+                   completion text
+
+        Raises:
+            AsyncImapError: If the connection is lost
+        """
+        async with self._slots:
+            if self._closed:
+                raise AsyncImapError('connection closed')
+            self._tag_counter += 1
+            tag = b'A%04d' % self._tag_counter
+            future = asyncio.get_running_loop().create_future()
+            self._pending.append((tag, future, []))
+            self.writer.write(tag + b' ' + line.encode('utf-8') + b'\r\n')
+            await self.writer.drain()
+            return await future
+
+    async def login(self, user, password):
+        """Log in and read the capabilities announced after authentication."""
+        status, _, text = await self.command(f'LOGIN {_quote(user)} {_quote(password)}')
+        if status != 'OK':
+            raise AsyncImapError(f"LOGIN failed: {text.decode('utf-8', errors='replace')}")
+        status, untagged, _ = await self.command('CAPABILITY')
+        data = _response_data(untagged, 'CAPABILITY')
+        if status == 'OK' and data:
+            self.capabilities = tuple(data[-1].decode('ascii', errors='ignore').upper().split())
+
+    async def examine(self, folder):
+        """
+        Select a folder read-only.
+
+        Returns:
+            dict: {'exists': int, 'uidvalidity': str or None}, or None if refused
+        """
+        status, untagged, _ = await self.command(f'EXAMINE {quote_mailbox(folder)}')
+        if status != 'OK':
+            return None
+        exists = _response_data(untagged, 'EXISTS')
+        uidvalidity = None
+        for item in _response_data(untagged, 'OK'):
+            match = _UIDVALIDITY_RE.search(item) if isinstance(item, bytes) else None
+            if match:
+                uidvalidity = match.group(1).decode('ascii')
+        return {'exists': int(exists[-1]) if exists else 0, 'uidvalidity': uidvalidity}
+
+    async def list_folders(self):
+        """
+        List all folders.
+
+        Returns:
+            list: Folder dicts from parse_list_response(), or None if LIST failed
+        """
+        status, untagged, _ = await self.command('LIST "" "*"')
+        if status != 'OK':
+            return None
+        return parse_list_response(_response_data(untagged, 'LIST'))
+
+    async def message_count(self, folder):
+        """Number of messages in a folder (STATUS MESSAGES), or None."""
+        status, untagged, _ = await self.command(f'STATUS {quote_mailbox(folder)} (MESSAGES)')
+        if status != 'OK':
+            return None
+        for item in _response_data(untagged, 'STATUS'):
+            match = _MESSAGES_RE.search(item[0] if isinstance(item, tuple) else item)
+            if match:
+                return int(match.group(1))
+        return None
+
+    async def uid_search(self, criteria, esearch=False):
+        """
+        Run UID SEARCH on the selected folder.
+
+        Returns:
+            UidSet: Matching UIDs, or None if the server refused the search
+        """
+        if esearch:
+            status, untagged, _ = await self.command(f'UID SEARCH {ESEARCH_RETURN} {criteria}')
+            if status != 'OK':
+                return None
+            return UidSet.parse(parse_esearch_response(_response_data(untagged, 'ESEARCH'))['all'])
+        status, untagged, _ = await self.command(f'UID SEARCH {criteria}')
+        if status != 'OK':
+            return None
+        data = _response_data(untagged, 'SEARCH')
+        return UidSet.from_search_response(b' '.join(data) if data else None)
+
+    async def uid_fetch(self, uid_set, items):
+        """
+        Run UID FETCH.
+
+        Returns:
+            list: FetchRecord per message (see parse_fetch_items); [] if refused
+        """
+        data = await self.uid_fetch_data(uid_set, items)
+        return parse_fetch_items(data) if data else []
+
+    async def uid_fetch_data(self, uid_set, items):
+        """Run UID FETCH and return the raw data in imaplib layout (None if refused)."""
+        status, untagged, text = await self.command(f'UID FETCH {uid_set} {items}')
+        if status != 'OK':
+            log(f"UID FETCH {items} refused: {text.decode('utf-8', errors='replace')}", level="WARNING")
+            return None
+        return _response_data(untagged, 'FETCH')
+
+    async def logout(self):
+        """Log out (errors of a broken connection are ignored) and close."""
+        try:
+            if not self._closed:
+                await asyncio.wait_for(self.command('LOGOUT'), LOGOUT_TIMEOUT)
+        except (AsyncImapError, OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        """Close the connection at once; pending commands fail with AsyncImapError."""
+        self._closed = True
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        while self._pending:
+            _, future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(AsyncImapError('connection closed'))
+        self.writer.close()
+
+
+async def open_imap_connection(email_config, pipeline_depth=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Open and log in a connection for an account configuration.
+
+    Args:
+        email_config: Dict with 'server', 'port', 'use_ssl', 'email', 'password'
+        pipeline_depth: Commands sent before the first one completes
+
+    Returns:
+        AsyncImapConnection
+    """
+    conn = await AsyncImapConnection.open(email_config['server'], email_config['port'],
+                                          email_config.get('use_ssl', True),
+                                          pipeline_depth=pipeline_depth)
+    try:
+        await conn.login(email_config['email'], email_config['password'])
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+async def _run_fetches(conn, commands, fetch_slots):
+    """
+    Issue UID FETCH commands at once and collect their items in command order.
+
+    Returns:
+        tuple: (list of item lists, seconds until the first command completed)
+    """
+    async def fetch(uid_set, items):
+        async with fetch_slots:
+            return await conn.uid_fetch(uid_set, items)
+
+    started = time.monotonic()
+    tasks = [asyncio.ensure_future(fetch(uid_set, items)) for uid_set, items in commands]
+    results = []
+    latency = None
+    try:
+        for task in tasks:
+            results.append(await task)
+            if latency is None:
+                latency = time.monotonic() - started
+    finally:
+        for task in tasks:
+            task.cancel()
+    return results, latency
+
+
+def _pdf_attachments_from_raw(raw):
+    """Decode the PDF attachments of a full message (run in the executor)."""
+    with parse_message_stream(iter_bytes_chunks(raw)) as message:
+        return [(part.filename, part.read()) for part in message.parts]
+
+
+async def aiter_pdf_messages(conn, uids, fetch_slots, executor=None, sizer=None,
+                             should_stop=None, progress_callback=None, use_envelope=False, claim=None):
+    """
+    Yield messages carrying PDF attachments, downloading only the PDF sections.
+
+    Async counterpart of imap_scanner.iter_pdf_messages(): windows of triage
+    FETCH commands are issued at once, then the PDF sections of the
+    candidates grouped by section spec, bounded by the same byte budgets.
+
+    Args:
+        conn: AsyncImapConnection with the folder selected
+        uids: UIDs (as strings) to scan
+        fetch_slots: asyncio.Semaphore bounding FETCH commands in flight
+        executor: Executor for parsing full messages (servers without BODYSTRUCTURE)
+        sizer: Optional AdaptiveBatchSizer (adaptive by default)
+        should_stop: Optional callable returning True to stop scanning
+        progress_callback: Optional callable(processed, total)
+        use_envelope: Triage with ENVELOPE instead of the header fields
+        claim: Optional callable(fingerprint, uid) -> bool skipping copies of
+               messages scanned in another folder (see iter_pdf_messages)
+
+    Yields:
+        dict: {'uid', 'headers', 'pdf_parts', 'attachments', 'fingerprint'} as iter_pdf_messages()
+    """
+    should_stop = should_stop or (lambda: False)
+    sizer = sizer or make_batch_sizer()
+    triage_fetch = TRIAGE_FETCH_ENVELOPE if use_envelope else TRIAGE_FETCH
+    loop = asyncio.get_running_loop()
+    total = len(uids)
+    processed = 0
+    window_start = 0
+
+    while window_start < total and not should_stop():
+        window_uids = uids[window_start:window_start + sizer.size * conn.pipeline_depth]
+        window_start += len(window_uids)
+        candidates = {}
+        sizes = {}
+        full_fetch = []
+
+        started = time.monotonic()
+        triage, latency = await _run_fetches(
+            conn, [(compress_uid_set(chunk), triage_fetch) for chunk in chunk_uids(window_uids, sizer.size)],
+            fetch_slots)
+        sizer.record(len(window_uids), time.monotonic() - started, latency)
+
+        for item in (item for items in triage for item in items):
+            if item.uid is None:
+                continue  # Unsolicited FETCH (e.g. flag update)
+            uid = str(item.uid)
+            processed += 1
+            if progress_callback:
+                progress_callback(processed, total)
+            headers = triage_headers(item)
+            bodystructure = item.bodystructure
+            if bodystructure is not None:
+                pdf_parts = find_pdf_parts(bodystructure)
+                if pdf_parts:
+                    fingerprint = message_fingerprint(headers, pdf_parts)
+                    if claim and not claim(fingerprint, uid):
+                        continue
+                    candidates[uid] = (headers, pdf_parts, fingerprint)
+                    sizes[uid] = sum(part.get('size') or 0 for part in pdf_parts)
+            else:
+                full_fetch.append((uid, headers))
+
+        for round_uids in split_by_budget(sorted(candidates, key=int), sizes, WINDOW_BYTE_BUDGET):
+            if should_stop():
+                return
+            groups = {}
+            for uid in round_uids:
+                groups.setdefault(build_section_fetch(candidates[uid][1]), []).append(uid)
+            commands = [(compress_uid_set(chunk), spec)
+                        for spec, group_uids in groups.items()
+                        for chunk in split_by_budget(group_uids, sizes, SECTION_BYTE_BUDGET, SECTION_CHUNK_SIZE)]
+            sections, _ = await _run_fetches(conn, commands, fetch_slots)
+            found = []
+            for item in (item for items in sections for item in items):
+                uid = str(item.uid)
+                if uid not in candidates:
+                    continue
+                headers, pdf_parts, fingerprint = candidates.pop(uid)
+                attachments = pdf_attachments_from_item(item, pdf_parts)
+                if attachments:
+                    found.append({'uid': uid, 'headers': headers, 'pdf_parts': pdf_parts,
+                                  'attachments': attachments, 'fingerprint': fingerprint})
+            for result in sorted(found, key=lambda result: int(result['uid'])):
+                yield result
+
+        for uid, headers in full_fetch:
+            if should_stop():
+                return
+            async with fetch_slots:
+                data = await conn.uid_fetch_data(uid, '(BODY.PEEK[])')
+            raw = fetch_message_body(data)
+            if not raw:
+                continue
+            attachments = await loop.run_in_executor(executor, _pdf_attachments_from_raw, raw)
+            if attachments:
+                yield {'uid': uid, 'headers': headers, 'pdf_parts': [], 'attachments': attachments,
+                       'fingerprint': None}
+
+
+def _empty_results(error=None):
+    return {
+        'messages': [],
+        'message_to_folder_map': {},
+        'matches': {},
+        'folder_results': {},
+        'total_count': 0,
+        'error': error
+    }
+
+
+class _AccountSearch:
+    """Search of one account: folder planning, workers and result collection"""
+
+    def __init__(self, search, email_config, label_folders):
+        self.search = search
+        self.email_config = email_config
+        self.label_folders = label_folders
+        # Copies of a message in several folders of the account are scanned once
+        self.dedup = MessageDeduplicator() if search.criteria.get('deduplicate') else None
+
+    def label(self, folder):
+        """Folder name as shown in the results (prefixed by the account with several accounts)."""
+        if self.label_folders:
+            return f"{self.email_config.get('email', '')}: {folder}"
+        return folder
+
+    async def run(self):
+        search = self.search
+        connect = search.connect
+        try:
+            conn = await connect(self.email_config)
+        except Exception as e:
+            log(f"Could not connect to {self.email_config.get('server')}: {e}", level="ERROR")
+            search.errors.append(f"{self.email_config.get('email', '')}: {e}")
+            return
+
+        try:
+            folders = await self._plan_folders(conn)
+        except Exception as e:
+            conn.close()
+            log(f"Error planning folders of {self.email_config.get('email')}: {e}", level="ERROR")
+            search.errors.append(str(e))
+            return
+
+        search.add_folders(len(folders))
+        work = collections.deque((folder, 0) for folder in folders)
+        worker_count = max(1, min(search.num_connections, MAX_NUM_CONNECTIONS, len(folders) or 1))
+        workers = [self._worker(index, conn if index == 0 else None, work) for index in range(worker_count)]
+        await asyncio.gather(*workers)
+
+    async def _plan_folders(self, conn):
+        """Folder names to scan, largest first (STATUS commands are pipelined)."""
+        criteria = self.search.criteria
+        if criteria.get('folder_path'):
+            return [criteria['folder_path']]
+        listed = await conn.list_folders()
+        if listed is None:
+            log("Error listing folders, using INBOX only", level="WARNING")
+            return ['INBOX']
+        excluded = parse_excluded_folders(criteria.get('excluded_folders'))
+        names = [folder['name'] for folder in listed
+                 if folder['name'] not in excluded
+                 and not any(flag in NOSELECT_FLAGS for flag in folder['flags'])]
+        counts = await asyncio.gather(*(conn.message_count(name) for name in names))
+        return [folder for folder, _ in prioritize_folders(list(zip(names, counts)))]
+
+    async def _worker(self, index, conn, work):
+        search = self.search
+        try:
+            if conn is None:
+                if not work:
+                    return
+                try:
+                    conn = await search.connect(self.email_config)
+                except Exception as e:
+                    # Leave the folders to the other workers (server session limit)
+                    log(f"IMAP folder worker {index} could not connect: {e}", level="WARNING")
+                    return
+            while work and not search.should_stop():
+                folder, attempt = work.popleft()
+                try:
+                    await self._scan_folder(conn, folder)
+                except asyncio.CancelledError:
+                    conn.close()
+                    conn = None
+                    raise
+                except (AsyncImapError, OSError) as e:
+                    log(f"IMAP folder worker {index} lost connection in {folder}: {e}", level="WARNING")
+                    conn.close()
+                    conn = None
+                    if attempt < MAX_FOLDER_RETRIES:
+                        work.append((folder, attempt + 1))
+                    try:
+                        conn = await search.connect(self.email_config)
+                    except Exception as connect_error:
+                        log(f"IMAP folder worker {index} could not reconnect: {connect_error}", level="WARNING")
+                        return
+                except Exception as e:
+                    log(f"Error scanning folder {folder}: {e}", level="ERROR")
+                    search.errors.append(f"{self.label(folder)}: {e}")
+        finally:
+            if conn is not None:
+                await conn.logout()
+
+    async def _search_uids(self, conn, folder):
+        """UIDs in the date range, narrowed on the server as far as it supports."""
+        search = self.search
+        if await conn.examine(folder) is None:
+            log(f"Failed to select folder {folder}", level="WARNING")
+            return None
+        base = []
+        if search.date_from:
+            base.append(f'SINCE {_imap_date_str(search.date_from)}')
+        if search.date_to:
+            # BEFORE is exclusive, so the day after date_to is used
+            base.append(f'BEFORE {_imap_date_str(search.date_to + timedelta(days=1))}')
+        criteria = search.criteria
+        if criteria.get('narrow_search', False):
+            plans = plan_imap_search(conn.capabilities, base,
+                                     min_size=criteria.get('min_message_size', MIN_PDF_MESSAGE_SIZE),
+                                     content_type_filter=True,
+                                     subject_keywords=criteria.get('subject_keywords'))
+        else:
+            plans = plan_imap_search(None, base)
+        for plan in plans:
+            uids = await conn.uid_search(plan['criteria'], plan['esearch'])
+            if uids is not None:
+                log(f"Found {len(uids)} UIDs in {folder} using plan: {plan['description']}")
+                return uids
+            log(f"IMAP UID SEARCH plan refused in {folder}: {plan['description']}", level="WARNING")
+        return None
+
+    async def _scan_folder(self, conn, folder):
+        search = self.search
+        label = self.label(folder)
+        search.report(f"Przeszukiwanie folderu: {label}")
+        uids = await self._search_uids(conn, folder)
+        if not uids:
+            search.folder_done(label, 0, 0)
+            return
+
+        uids = list(uids)
+        messages_found = 0
+
+        def report_progress(processed, total):
+            if processed % 50 == 0:
+                search.report(f"Przetworzono {processed} wiadomości w {label}")
+
+        claim = self.dedup.claim_callback(folder) if self.dedup else None
+        async for pdf_message in aiter_pdf_messages(conn, uids, search.fetch_slots, search.executor,
+                                                    should_stop=search.should_stop,
+                                                    progress_callback=report_progress,
+                                                    use_envelope=search.envelope_triage,
+                                                    claim=claim):
+            matches = await search.check_pdfs(pdf_message['attachments'])
+            if matches:
+                search.add_match(label, pdf_message, matches)
+                messages_found += 1
+        search.folder_done(label, len(uids), messages_found)
+
+
+class _Search:
+    """State shared by the account searches of one search_messages_async() call"""
+
+    def __init__(self, criteria, progress_callback, executor, connect):
+        self.criteria = criteria
+        self.progress_callback = progress_callback
+        self.executor = executor
+        self.connect = connect
+        self.nip = criteria.get('nip', '').strip()
+        self.date_from, self.date_to = _normalize_date_range(criteria)
+        self.cancel_check = criteria.get('_cancel_check', lambda: False)
+        self.num_connections = int(criteria.get('num_connections', DEFAULT_NUM_CONNECTIONS))
+        self.fetch_slots = asyncio.Semaphore(int(criteria.get('max_in_flight', MAX_IN_FLIGHT)))
+        self.envelope_triage = criteria.get('envelope_triage', False)
+        self.pdf_processor = PDFProcessor() if PDFProcessor else None
+        self.results = _empty_results()
+        self.errors = []
+        self.folders_total = 0
+        self.folders_done = 0
+
+    def should_stop(self):
+        return self.cancel_check()
+
+    def progress(self):
+        if not self.folders_total:
+            return 0
+        return min(90, int(self.folders_done / self.folders_total * 90))
+
+    def report(self, message):
+        if self.progress_callback:
+            self.progress_callback(message, self.progress())
+
+    def add_folders(self, count):
+        self.folders_total += count
+
+    def folder_done(self, label, checked, found):
+        self.folders_done += 1
+        self.results['folder_results'][label] = {'total_checked': checked, 'matches_found': found}
+        log(f"Folder {label}: found {found} matches in {checked} messages")
+
+    async def check_pdfs(self, attachments):
+        """Search the NIP in PDF attachments; text extraction runs in the executor."""
+        if not self.pdf_processor:
+            return []
+        loop = asyncio.get_running_loop()
+        matches = []
+        for filename, pdf_content in attachments:
+            if not pdf_content or self.should_stop():
+                continue
+            try:
+                result = await loop.run_in_executor(self.executor, self.pdf_processor.search_in_pdf_attachment,
+                                                    pdf_content, self.nip, filename)
+            except Exception as e:
+                log(f"Error processing PDF {filename}: {e}", level="WARNING")
+                continue
+            if result.get('found'):
+                matches.extend(result.get('matches', []))
+        return matches
+
+    def add_match(self, label, pdf_message, matches):
+        msg = pdf_message['headers']
+        message_id = msg.get('Message-ID', pdf_message['uid'])
+        self.results['messages'].append({
+            'id': message_id,
+            'uid': pdf_message['uid'],
+            'subject': msg.get('Subject', ''),
+            'from': msg.get('From', ''),
+            'date': msg.get('Date', ''),
+            'folder': label,
+            'has_pdf': bool(pdf_message['attachments'])
+        })
+        self.results['message_to_folder_map'][message_id] = label
+        self.results['matches'][message_id] = matches
+        log(f"Found match in message UID {pdf_message['uid']}: {msg.get('Subject', 'No Subject')}")
+
+    def cancel(self):
+        if self.pdf_processor:
+            self.pdf_processor.cancel_search()
+
+
+async def search_messages_async(criteria, progress_callback=None, executor=None, connect=None):
+    """
+    Search for messages on an asyncio event loop.
+
+    Takes the criteria of search_messages() (without 'connection'; the sync
+    state, ledger and Gmail options are not used) plus:
+        - 'email_config': Account dict ('server', 'port', 'use_ssl', 'email', 'password')
+        - 'accounts': List of account dicts to search at once (instead of 'email_config');
+          folder names in the results are then prefixed with the account e-mail
+        - 'num_connections': Connections per account (default: 4)
+        - 'pipeline_depth': FETCH commands in flight per connection (default: 4)
+        - 'max_in_flight': FETCH commands in flight over all connections (default: 32)
+        - 'deduplicate': Scan copies of a message in several folders of an
+          account once (default: False)
+
+    Cancelling the task running this coroutine closes the connections and
+    raises asyncio.CancelledError; '_cancel_check' returning True instead ends
+    the search with the results found so far.
+
+    Args:
+        criteria: dict with search parameters (see above)
+        progress_callback: Optional callback function(message, progress_percent),
+                           called on the event loop thread
+        executor: Optional concurrent.futures executor for PDF text extraction
+                  (default: a thread pool owned by the search)
+        connect: Optional coroutine function(email_config) -> logged-in
+                 AsyncImapConnection (default: open_imap_connection)
+
+    Returns:
+        dict: Same structure as search_messages()
+    """
+    if progress_callback:
+        progress_callback("Rozpoczynam wyszukiwanie...", 0)
+
+    accounts = criteria.get('accounts') or ([criteria['email_config']] if criteria.get('email_config') else [])
+    if not criteria.get('nip', '').strip():
+        log("Error: NIP not provided in search criteria")
+        return _empty_results('Brak numeru NIP do wyszukania')
+    if not accounts:
+        log("Error: Account configuration not provided in search criteria")
+        return _empty_results('Brak połączenia z serwerem email')
+
+    pipeline_depth = criteria.get('pipeline_depth', DEFAULT_MAX_IN_FLIGHT)
+    if connect is None:
+        async def connect(email_config):
+            return await open_imap_connection(email_config, pipeline_depth)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(thread_name_prefix='pdf-search')
+    search = _Search(criteria, progress_callback, executor, connect)
+    log(f"Async search for NIP {search.nip} in {len(accounts)} account(s)")
+
+    try:
+        await asyncio.gather(*(_AccountSearch(search, config, len(accounts) > 1).run()
+                               for config in accounts))
+    except asyncio.CancelledError:
+        log("Async search cancelled")
+        search.cancel()
+        raise
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    results = search.results
+    results['total_count'] = len(results['messages'])
+    if search.should_stop():
+        log("Search cancelled by user")
+        results['error'] = CANCELLED_ERROR
+    elif search.errors:
+        results['error'] = '; '.join(search.errors)
+
+    if progress_callback:
+        progress_callback(f"Wyszukiwanie zakończone. Znaleziono {results['total_count']} wiadomości", 100)
+    log(f"Async search completed. Found {results['total_count']} messages with NIP matches")
+    return results
+
+
+class AsyncEmailSearchEngine:
+    """
+    Runs search_messages_async() on an event loop in a background thread
+
+    Same callbacks as EmailSearchEngine, so a window can use either engine;
+    cancel_search() cancels the search task instead of setting a flag polled
+    between messages.
+    """
+
+    def __init__(self, progress_callback, result_callback, executor=None):
+        """
+        Initialize search engine
+
+        Args:
+            progress_callback: Callback for progress updates (message, percent)
+            result_callback: Callback when search completes (results_dict)
+            executor: Optional executor for PDF text extraction
+        """
+        self.progress_callback = progress_callback
+        self.result_callback = result_callback
+        self.executor = executor
+        self.search_cancelled = False
+        self.search_thread = None
+        self._loop = None
+        self._task = None
+
+    def search_emails_threaded(self, email_config, search_criteria, page=0, per_page=500):
+        """
+        Start the search in a background thread
+
+        Args:
+            email_config: Account dict, or a list of them to search at once
+            search_criteria: dict with search parameters
+            page: Page number for pagination
+            per_page: Results per page
+        """
+        self.search_cancelled = False
+        if isinstance(email_config, (list, tuple)):
+            search_criteria['accounts'] = list(email_config)
+        else:
+            search_criteria['email_config'] = email_config
+        search_criteria['page'] = page
+        search_criteria['per_page'] = per_page
+        search_criteria['_cancel_check'] = lambda: self.search_cancelled
+
+        self.search_thread = threading.Thread(
+            target=self._threaded_search,
+            args=(search_criteria,),
+            daemon=True
+        )
+        self.search_thread.start()
+        log("Async search thread started")
+
+    def _threaded_search(self, search_criteria):
+        """Internal method that runs the event loop in the background thread"""
+        try:
+            results = asyncio.run(self._run(search_criteria))
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            log(f"Error in async search thread: {str(e)}")
+            results = _empty_results(str(e))
+        if self.result_callback and not self.search_cancelled:
+            self.result_callback(results)
+
+    async def _run(self, search_criteria):
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        if self.search_cancelled:
+            raise asyncio.CancelledError()
+        return await search_messages_async(search_criteria, self.progress_callback, self.executor)
+
+    def cancel_search(self):
+        """Cancel ongoing search"""
+        log("Search cancelled by user")
+        self.search_cancelled = True
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass  # Loop already closed
@@ -0,0 +1,130 @@
+"""
+Adaptive FETCH batch sizing
+
+A fixed number of UIDs per FETCH fits no mailbox: on small messages over a
+slow link 200-UID batches leave the connection idle between round trips, on
+200 x 20 MB scans a single batch holds gigabytes in memory.
+
+AdaptiveBatchSizer measures how long batches take (and, for pipelined
+commands, the latency of the first response) and sizes the next batch so it
+takes about max(TARGET_BATCH_SECONDS, RTT_FACTOR * RTT): long enough that the
+round trip is a small part of it, short enough to stay responsive to stop
+requests. The size at most doubles per step and drops at once when batches
+get slow.
+
+Downloads are bounded separately by bytes: split_by_budget() groups UIDs so
+the known sizes (BODYSTRUCTURE section sizes or RFC822.SIZE) of one group
+stay within a byte budget.
+"""
+
+# Default number of UIDs in the first batch
+DEFAULT_BATCH_SIZE = 200
+
+# Bounds of the adaptive batch size
+MIN_BATCH_SIZE = 20
+MAX_BATCH_SIZE = 2000
+
+# Seconds a batch should take at least, and in round trips
+TARGET_BATCH_SECONDS = 0.5
+RTT_FACTOR = 4
+
+# Weight of a new measurement in the running averages
+SMOOTHING = 0.3
+
+
+class AdaptiveBatchSizer:
+    """Number of UIDs per FETCH, adapted to measured throughput and latency"""
+
+    def __init__(self, initial_size=DEFAULT_BATCH_SIZE, min_size=MIN_BATCH_SIZE,
+                 max_size=MAX_BATCH_SIZE, target_seconds=TARGET_BATCH_SECONDS):
+        """
+        Args:
+            initial_size: UIDs in the first batch
+            min_size: Smallest batch size
+            max_size: Largest batch size
+            target_seconds: Shortest time a batch should take
+        """
+        self.min_size = max(1, int(min_size))
+        self.max_size = max(self.min_size, int(max_size))
+        self.size = min(max(int(initial_size), self.min_size), self.max_size)
+        self.target_seconds = target_seconds
+        self.rtt = None                 # Seconds until the first response (smoothed)
+        self.seconds_per_message = None  # Smoothed batch time per UID
+
+    @property
+    def adaptive(self):
+        """False for a fixed batch size."""
+        return self.min_size < self.max_size
+
+    def record(self, count, elapsed, latency=None):
+        """
+        Record a completed batch and size the next one.
+
+        Args:
+            count: Number of UIDs fetched
+            elapsed: Seconds from sending the command(s) to the last response
+            latency: Seconds until the first response, if measured (round trip)
+
+        Returns:
+            int: Batch size to use next
+        """
+        if not self.adaptive or count <= 0 or elapsed <= 0:
+            return self.size
+        if latency is not None:
+            self.rtt = latency if self.rtt is None else (1 - SMOOTHING) * self.rtt + SMOOTHING * latency
+        per_message = elapsed / count
+        if self.seconds_per_message is None:
+            self.seconds_per_message = per_message
+        else:
+            self.seconds_per_message = (1 - SMOOTHING) * self.seconds_per_message + SMOOTHING * per_message
+
+        target = self.target_seconds
+        if self.rtt is not None:
+            target = max(target, RTT_FACTOR * self.rtt)
+        wanted = int(target / self.seconds_per_message) if self.seconds_per_message > 0 else self.max_size
+        self.size = min(max(wanted, self.min_size), self.size * 2, self.max_size)
+        return self.size
+
+
+def make_batch_sizer(batch_size=None):
+    """
+    Return a batch sizer: adaptive, or fixed when batch_size is given.
+
+    Args:
+        batch_size: Fixed number of UIDs per FETCH, or None to adapt
+
+    Returns:
+        AdaptiveBatchSizer
+    """
+    if batch_size:
+        return AdaptiveBatchSizer(batch_size, min_size=batch_size, max_size=batch_size)
+    return AdaptiveBatchSizer()
+
+
+def split_by_budget(uids, sizes, byte_budget, max_count=None):
+    """
+    Split UIDs into consecutive groups whose total size stays within a byte budget.
+
+    A UID larger than the budget forms a group of its own.
+
+    Args:
+        uids: UIDs in the order they should be fetched
+        sizes: Dict UID -> expected bytes (missing UIDs count as 0)
+        byte_budget: Maximum bytes per group
+        max_count: Optional maximum number of UIDs per group
+
+    Yields:
+        list: UIDs of one group
+    """
+    group = []
+    group_bytes = 0
+    for uid in uids:
+        size = sizes.get(uid) or 0
+        if group and (group_bytes + size > byte_budget or (max_count and len(group) >= max_count)):
+            yield group
+            group = []
+            group_bytes = 0
+        group.append(uid)
+        group_bytes += size
+    if group:
+        yield group
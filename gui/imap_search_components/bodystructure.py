@@ -0,0 +1,214 @@
+"""
+IMAP BODYSTRUCTURE parsing for attachment-aware message scanning
+
+Lets the search engine decide from a single `(BODYSTRUCTURE)` FETCH which MIME
+sections of a message carry PDF attachments, so that only those sections are
+downloaded with `BODY.PEEK[<section>]` and messages without PDFs are skipped
+without any further round trip.
+
+Section numbers follow RFC 3501 section 6.4.5:
+- parts of a multipart body are numbered 1, 2, 3... (nested: 2.1, 2.2...)
+- a non-multipart message has a single part "1"
+- parts of an encapsulated message/rfc822 are numbered below the part that
+  contains it (e.g. "2.1", "2.2")
+"""
+import base64
+import binascii
+import quopri
+import email.utils
+from email.header import decode_header, make_header
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+# FETCH responses are parsed by fetch_parser; parse_fetch_items stays importable from here
+from gui.imap_search_components.fetch_parser import parse_fetch_items  # noqa: F401
+
+
+def _param_dict(params):
+    """Convert a BODYSTRUCTURE parameter list ("NAME" "value" ...) to a dict."""
+    result = {}
+    if not isinstance(params, list):
+        return result
+    for i in range(0, len(params) - 1, 2):
+        key, value = params[i], params[i + 1]
+        if isinstance(key, str):
+            if isinstance(value, bytes):
+                value = value.decode('utf-8', errors='replace')
+            result[key.lower()] = value
+    return result
+
+
+def _decode_filename(params, base_name):
+    """
+    Get a decoded filename from body or disposition parameters.
+
+    Handles plain values, RFC 2231 (name*=utf-8''..., name*0*=...) and
+    RFC 2047 encoded words (=?utf-8?B?...?=).
+    """
+    related = [(key, value) for key, value in params.items()
+               if key == base_name or key.startswith(base_name + '*')]
+    if not related:
+        return None
+
+    # decode_params expects the main value as its first element
+    decoded = email.utils.decode_params([('', '')] + [
+        (key, f'"{email.utils.quote(value or "")}"') for key, value in related
+    ])
+    for key, value in decoded[1:]:
+        if key != base_name:
+            continue
+        value = email.utils.unquote(email.utils.collapse_rfc2231_value(value))
+        if '=?' in value:
+            try:
+                value = str(make_header(decode_header(value)))
+            except Exception:
+                pass
+        return value
+    return None
+
+
+def _walk_parts(body, section, parts):
+    """Recursively collect leaf parts of a parsed BODYSTRUCTURE."""
+    if not isinstance(body, list) or not body:
+        return
+
+    if isinstance(body[0], list):
+        # Multipart: child bodies first, then the subtype and extension data
+        index = 0
+        for child in body:
+            if not isinstance(child, list):
+                break
+            index += 1
+            child_section = f"{section}.{index}" if section else str(index)
+            _walk_parts(child, child_section, parts)
+        return
+
+    section = section or '1'
+    if len(body) < 7:
+        return
+
+    main_type = (body[0] or '').lower()
+    sub_type = (body[1] or '').lower()
+    params = _param_dict(body[2])
+    encoding = (body[5] or '7BIT').upper()
+    try:
+        size = int(body[6])
+    except (TypeError, ValueError):
+        size = 0
+
+    if main_type == 'message' and sub_type == 'rfc822' and len(body) > 8:
+        nested = body[8]
+        if isinstance(nested, list) and nested and isinstance(nested[0], list):
+            _walk_parts(nested, section, parts)
+        else:
+            _walk_parts(nested, f"{section}.1", parts)
+        disposition_index = 11
+    elif main_type == 'text':
+        disposition_index = 9
+    else:
+        disposition_index = 8
+
+    disposition = None
+    disposition_params = {}
+    if len(body) > disposition_index and isinstance(body[disposition_index], list):
+        disp = body[disposition_index]
+        if disp and isinstance(disp[0], str):
+            disposition = disp[0].lower()
+            if len(disp) > 1:
+                disposition_params = _param_dict(disp[1])
+
+    filename = _decode_filename(disposition_params, 'filename') or _decode_filename(params, 'name')
+
+    parts.append({
+        'section': section,
+        'content_type': f"{main_type}/{sub_type}",
+        'encoding': encoding,
+        'size': size,
+        'filename': filename,
+        'disposition': disposition,
+    })
+
+
+def list_body_parts(bodystructure):
+    """
+    List all leaf (non-multipart) parts of a parsed BODYSTRUCTURE.
+
+    Args:
+        bodystructure: Parsed BODYSTRUCTURE list (see parse_fetch_items)
+
+    Returns:
+        list: Part dicts with 'section', 'content_type', 'encoding', 'size',
+              'filename' and 'disposition' keys
+    """
+    parts = []
+    _walk_parts(bodystructure, '', parts)
+    return parts
+
+
+def is_pdf_part(part):
+    """
+    Check whether a body part is a PDF attachment.
+
+    application/pdf parts always count; any other leaf part (typically
+    application/octet-stream) counts when its filename ends with .pdf.
+    """
+    if part['content_type'] == 'application/pdf':
+        return True
+    if part['content_type'].startswith('multipart/'):
+        return False
+    filename = part.get('filename')
+    return bool(filename) and filename.lower().endswith('.pdf')
+
+
+def find_pdf_parts(bodystructure):
+    """
+    Find PDF attachment parts in a parsed BODYSTRUCTURE.
+
+    Args:
+        bodystructure: Parsed BODYSTRUCTURE list (see parse_fetch_items)
+
+    Returns:
+        list: Part dicts (see list_body_parts) of PDF attachments, in MIME order
+    """
+    return [part for part in list_body_parts(bodystructure) if is_pdf_part(part)]
+
+
+def build_section_fetch(parts):
+    """
+    Build the FETCH item list for downloading the given body parts.
+
+    Example: parts with sections 2 and 3.1 -> "(BODY.PEEK[2] BODY.PEEK[3.1])"
+    """
+    return '(' + ' '.join(f"BODY.PEEK[{part['section']}]" for part in parts) + ')'
+
+
+def decode_part_payload(raw, encoding):
+    """
+    Decode a body section fetched with BODY.PEEK[n] using its transfer encoding.
+
+    Args:
+        raw: Raw section bytes as sent by the server
+        encoding: Content-Transfer-Encoding from BODYSTRUCTURE (e.g. 'BASE64')
+
+    Returns:
+        bytes: Decoded payload (raw bytes for 7bit/8bit/binary or on decode error)
+    """
+    if raw is None:
+        return b''
+    if isinstance(raw, str):
+        raw = raw.encode('latin-1', errors='replace')
+    encoding = (encoding or '').upper()
+    try:
+        if encoding == 'BASE64':
+            return base64.b64decode(raw)
+        if encoding == 'QUOTED-PRINTABLE':
+            return quopri.decodestring(raw)
+    except (binascii.Error, ValueError) as e:
+        log(f"Could not decode {encoding} body section: {e}", level="WARNING")
+    return raw
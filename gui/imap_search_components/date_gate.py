@@ -0,0 +1,148 @@
+"""
+Date range gating before any body download
+
+IMAP SEARCH SINCE/BEFORE compare dates only (in the server's time zone), so
+the first and last day of a range return messages outside it. The exact
+check - half-open range [start, end) - is done here on INTERNALDATE, or on
+the Date header field alone, fetched with pipelined UID FETCH commands before
+any message body is downloaded.
+
+Times are compared in the local time zone of this computer: naive range
+bounds (e.g. from the date picker) are local times, aware message times are
+converted to local time first instead of dropping their UTC offset.
+"""
+import email
+import email.utils
+import time
+from contextlib import closing
+
+from gui.imap_search_components.batch_sizer import make_batch_sizer
+from gui.imap_search_components.fetch_pipeline import (
+    DEFAULT_MAX_IN_FLIGHT,
+    compress_uid_set,
+    chunk_uids,
+    pipelined_uid_fetch,
+)
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+# Gate FETCH on the server's arrival time
+INTERNALDATE_GATE_FETCH = '(UID INTERNALDATE)'
+
+# Gate FETCH on the Date header field (the sender's date)
+DATE_HEADER_GATE_FETCH = '(UID BODY.PEEK[HEADER.FIELDS (DATE)])'
+
+
+def local_naive(dt):
+    """Return dt as a naive local time (aware values are converted, naive ones kept)."""
+    if dt is not None and dt.tzinfo is not None:
+        return dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def parse_date_header(value):
+    """
+    Parse a Date header value.
+
+    Returns:
+        datetime (aware when the header has a zone), or None if missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def datetime_in_range(dt, start, end):
+    """
+    Check dt against the half-open range [start, end).
+
+    Args:
+        dt: Message datetime (naive = local time) or None
+        start: Inclusive start or None
+        end: Exclusive end or None
+
+    Returns:
+        bool: True when dt is in range or unknown (messages are not dropped
+              for a missing or malformed date)
+    """
+    if dt is None:
+        return True
+    dt = local_naive(dt)
+    if start is not None and dt < local_naive(start):
+        return False
+    if end is not None and dt >= local_naive(end):
+        return False
+    return True
+
+
+def record_datetime(record, use_date_header=False):
+    """
+    Message datetime of a gate FETCH record.
+
+    Args:
+        record: FetchRecord of INTERNALDATE_GATE_FETCH or DATE_HEADER_GATE_FETCH
+        use_date_header: Read the Date header field instead of INTERNALDATE
+
+    Returns:
+        datetime or None
+    """
+    if use_date_header:
+        return parse_date_header(email.message_from_bytes(record.header or b'').get('Date'))
+    return record.internaldate
+
+
+def filter_uids_by_date(imap_conn, uids, start, end, use_date_header=False,
+                        max_in_flight=DEFAULT_MAX_IN_FLIGHT, should_stop=None):
+    """
+    Keep the UIDs whose date is within [start, end), fetching dates only.
+
+    Args:
+        imap_conn: IMAP connection with the folder selected
+        uids: UIDs (as strings) in scan order
+        start: Inclusive start datetime or None
+        end: Exclusive end datetime or None
+        use_date_header: Gate on the Date header field instead of INTERNALDATE
+        max_in_flight: Number of FETCH commands kept in flight
+        should_stop: Optional callable returning True to stop (the rest of
+                     the UIDs is then kept)
+
+    Returns:
+        list: UIDs in range, in the original order; UIDs the server returned
+              no date for are kept
+    """
+    uids = [str(uid) for uid in uids]
+    if not uids or (start is None and end is None):
+        return uids
+    should_stop = should_stop or (lambda: False)
+    gate_fetch = DATE_HEADER_GATE_FETCH if use_date_header else INTERNALDATE_GATE_FETCH
+    sizer = make_batch_sizer()
+    excluded = set()
+    position = 0
+
+    while position < len(uids) and not should_stop():
+        window_uids = uids[position:position + sizer.size * max(1, max_in_flight)]
+        position += len(window_uids)
+        commands = ((compress_uid_set(chunk), gate_fetch) for chunk in chunk_uids(window_uids, sizer.size))
+        started = time.monotonic()
+        latency = None
+        with closing(pipelined_uid_fetch(imap_conn, commands, max_in_flight)) as items:
+            for item in items:
+                if latency is None:
+                    latency = time.monotonic() - started
+                if item.uid is not None and not datetime_in_range(record_datetime(item, use_date_header),
+                                                                  start, end):
+                    excluded.add(str(item.uid))
+        sizer.record(len(window_uids), time.monotonic() - started, latency)
+
+    if excluded:
+        log(f"Date gate: skipping {len(excluded)} of {len(uids)} messages outside the date range")
+    return [uid for uid in uids if uid not in excluded]
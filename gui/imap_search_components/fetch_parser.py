@@ -0,0 +1,413 @@
+"""
+IMAP FETCH response parser
+
+Every IMAP code path reads FETCH responses through parse_fetch_items():
+the triage and section downloads of the scanners, the INTERNALDATE
+fallback filter, Gmail X-GM-MSGID deduplication, sequence-to-UID mapping
+and full message downloads.
+
+The tokenizer works on the response bytes as imaplib returns them (literals
+split out into separate items) and builds one FetchRecord per message:
+
+- parenthesized lists become nested Python lists
+- atoms become str (NIL becomes None), quoted strings str, literals bytes
+- attribute names are upper-cased; section specs keep their brackets, e.g.
+  'BODY[HEADER.FIELDS (DATE FROM)]' or 'BODY[2]<0>'
+
+FetchRecord is a dict of those raw attributes, with typed accessors that are
+converted on first use: uid, size, internaldate (aware datetime), flags,
+modseq, gm_msgid, bodystructure, envelope and body sections. EnvelopeHeaders
+serves Subject/From/Date/Message-ID from ENVELOPE for scans that skip the
+header download.
+"""
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+# One token per match: '(' | ')' | quoted string | literal marker {n} | atom.
+# Atoms may carry a [section] spec (with spaces and parentheses) and a <partial>.
+# Matched on the latin-1 decoded response, so atoms need no decoding of their own
+_TOKEN_RE = re.compile(
+    r'(\()'
+    r'|(\))'
+    r'|"((?:[^"\\]|\\.)*)"'
+    r'|\{(\d+)\+?\}'
+    r'|([^\s()"{\[\]]+(?:\[[^\]]*\])?(?:<\d+>)?)'
+)
+
+_QUOTED_ESCAPE_RE = re.compile(r'\\(.)')
+
+# Start of an untagged FETCH response as returned by imaplib: b'12 (UID ...'
+_MESSAGE_START_RE = re.compile(rb'^\d+ \(')
+
+# INTERNALDATE: "15-Dec-2024 10:30:00 +0000" (the day may be space-padded)
+_INTERNALDATE_RE = re.compile(
+    r'\s*(\d{1,2})-([A-Za-z]{3})-(\d{4}) (\d{2}):(\d{2}):(\d{2}) ([+-])(\d{2})(\d{2})')
+
+_MONTHS = {name: number for number, name in enumerate(
+    ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC'), 1)}
+
+# One address of an ENVELOPE address list
+Address = namedtuple('Address', 'name route mailbox host')
+
+ENVELOPE_FIELDS = ('date', 'subject', 'from_', 'sender', 'reply_to',
+                   'to', 'cc', 'bcc', 'in_reply_to', 'message_id')
+
+# Header names served by EnvelopeHeaders -> Envelope attribute
+_ENVELOPE_TEXT_HEADERS = {'date': 'date', 'subject': 'subject',
+                          'in-reply-to': 'in_reply_to', 'message-id': 'message_id'}
+_ENVELOPE_ADDRESS_HEADERS = {'from': 'from_', 'sender': 'sender', 'reply-to': 'reply_to',
+                             'to': 'to', 'cc': 'cc', 'bcc': 'bcc'}
+
+
+def _group_fetch_data(data):
+    """
+    Group raw imaplib FETCH data into one (text, literals) pair per message.
+
+    imaplib splits every literal out of the response line, so a single message
+    may be spread over several items, e.g.:
+        [(b'1 (UID 5 BODY[HEADER] {342}', b'<header>'), b' BODYSTRUCTURE (...))']
+
+    Args:
+        data: Data list returned by imap_conn.uid('fetch', ...)
+
+    Returns:
+        list: [(text_bytes, [literal_bytes, ...]), ...]
+    """
+    messages = []
+    current = None
+    for item in data or []:
+        if isinstance(item, tuple):
+            head = item[0] if isinstance(item[0], bytes) else b''
+            literal = item[1] if len(item) > 1 else b''
+            if current is None or _MESSAGE_START_RE.match(head):
+                current = [[head], [literal]]
+                messages.append(current)
+            else:
+                current[0].append(head)
+                current[1].append(literal)
+        elif isinstance(item, bytes):
+            if _MESSAGE_START_RE.match(item):
+                current = [[item], []]
+                messages.append(current)
+            elif current is not None:
+                current[0].append(item)
+    return [(b''.join(text), literals) for text, literals in messages]
+
+
+def tokenize(text, literals=()):
+    """
+    Parse FETCH response text into nested Python lists.
+
+    Args:
+        text: Response bytes with literals replaced by their {n} markers
+        literals: Literal bytes in the order of the markers
+
+    Returns:
+        list: Tokens - atoms as str (NIL as None), quoted strings as str,
+              literals as bytes, parenthesized lists as lists
+    """
+    literal_iter = iter(literals)
+    stack = []
+    current = []
+    append = current.append
+    for match in _TOKEN_RE.finditer(text.decode('latin-1')):
+        kind = match.lastindex
+        if kind == 5:
+            atom = match.group(5)
+            append(None if atom.upper() == 'NIL' else atom)
+        elif kind == 1:
+            stack.append(current)
+            current = []
+            append = current.append
+        elif kind == 2:
+            if stack:
+                closed = current
+                current = stack.pop()
+                append = current.append
+                append(closed)
+        elif kind == 3:
+            value = match.group(3)
+            if '\\' in value:
+                value = _QUOTED_ESCAPE_RE.sub(r'\1', value)
+            if not value.isascii():
+                value = value.encode('latin-1').decode('utf-8', errors='replace')
+            append(value)
+        else:
+            append(next(literal_iter, b''))
+    # Close any lists left open by a truncated response
+    while stack:
+        closed = current
+        current = stack.pop()
+        current.append(closed)
+    return current
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_text(value):
+    """ENVELOPE strings come quoted (str) or as literals (bytes)."""
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+
+def parse_internaldate(value):
+    """
+    Parse an INTERNALDATE value.
+
+    Args:
+        value: String like '15-Dec-2024 10:30:00 +0000'
+
+    Returns:
+        datetime: Timezone-aware datetime, or None if the value is malformed
+    """
+    match = _INTERNALDATE_RE.match(value or '')
+    if not match:
+        return None
+    day, month, year, hour, minute, second, sign, off_hours, off_minutes = match.groups()
+    month = _MONTHS.get(month.upper())
+    if month is None:
+        return None
+    offset = timedelta(hours=int(off_hours), minutes=int(off_minutes))
+    try:
+        return datetime(int(year), month, int(day), int(hour), int(minute), int(second),
+                        tzinfo=timezone(-offset if sign == '-' else offset))
+    except ValueError:
+        return None
+
+
+def _parse_addresses(value):
+    if not isinstance(value, list):
+        return []
+    addresses = []
+    for address in value:
+        if isinstance(address, list) and len(address) >= 4:
+            addresses.append(Address(*(_to_text(field) for field in address[:4])))
+    return addresses
+
+
+class Envelope:
+    """Parsed ENVELOPE: strings as sent (RFC 2047 encoded words not decoded)"""
+
+    __slots__ = ENVELOPE_FIELDS
+
+    def __init__(self, values):
+        """
+        Args:
+            values: Parsed ENVELOPE list (date, subject, from, sender, reply-to,
+                    to, cc, bcc, in-reply-to, message-id)
+        """
+        values = list(values) + [None] * (len(ENVELOPE_FIELDS) - len(values))
+        for name, value in zip(ENVELOPE_FIELDS, values):
+            if name in ('from_', 'sender', 'reply_to', 'to', 'cc', 'bcc'):
+                value = _parse_addresses(value)
+            else:
+                value = _to_text(value)
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f"Envelope(subject={self.subject!r}, message_id={self.message_id!r})"
+
+
+def format_addresses(addresses):
+    """
+    Format ENVELOPE addresses as a header value ('Name <box@host>, ...').
+
+    Display names are kept as sent (RFC 2047 encoded words are not decoded);
+    group start/end markers are skipped.
+
+    Returns:
+        str, or None for no addresses
+    """
+    values = []
+    for address in addresses:
+        if address.mailbox is None or address.host is None:
+            continue
+        value = f"{address.mailbox}@{address.host}"
+        values.append(f"{address.name} <{value}>" if address.name else value)
+    return ', '.join(values) or None
+
+
+class EnvelopeHeaders:
+    """
+    Triage header fields read from ENVELOPE instead of a parsed header block
+
+    get() and [] behave like on the email.message.Message of a header fetch:
+    values as sent (RFC 2047 encoded words are decoded only by whoever needs
+    the text, e.g. for a hit), None for missing headers. INTERNALDATE is kept
+    in .internaldate.
+    """
+
+    __slots__ = ('envelope', 'internaldate')
+
+    def __init__(self, envelope, internaldate=None):
+        """
+        Args:
+            envelope: Envelope of the message
+            internaldate: Timezone-aware INTERNALDATE or None
+        """
+        self.envelope = envelope
+        self.internaldate = internaldate
+
+    def get(self, name, failobj=None):
+        key = name.lower()
+        if key in _ENVELOPE_TEXT_HEADERS:
+            value = getattr(self.envelope, _ENVELOPE_TEXT_HEADERS[key])
+        elif key in _ENVELOPE_ADDRESS_HEADERS:
+            value = format_addresses(getattr(self.envelope, _ENVELOPE_ADDRESS_HEADERS[key]))
+        else:
+            value = None
+        return failobj if value is None else value
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+
+class FetchRecord(dict):
+    """
+    Attributes of one FETCH response
+
+    Keys are the upper-cased attribute names ('SEQ', 'UID', 'BODYSTRUCTURE',
+    'BODY[HEADER]'...) with the raw parsed values; the properties return typed
+    values, None when the attribute is missing or malformed.
+    """
+
+    __slots__ = ()
+
+    @property
+    def seq(self):
+        """Message sequence number (int)."""
+        return _to_int(self.get('SEQ'))
+
+    @property
+    def uid(self):
+        """UID (int)."""
+        return _to_int(self.get('UID'))
+
+    @property
+    def size(self):
+        """RFC822.SIZE (int)."""
+        return _to_int(self.get('RFC822.SIZE'))
+
+    @property
+    def internaldate(self):
+        """INTERNALDATE as a timezone-aware datetime."""
+        return parse_internaldate(self.get('INTERNALDATE'))
+
+    @property
+    def flags(self):
+        """FLAGS as a tuple of str."""
+        flags = self.get('FLAGS')
+        return tuple(flag for flag in flags if isinstance(flag, str)) if isinstance(flags, list) else ()
+
+    @property
+    def modseq(self):
+        """MODSEQ (int, CONDSTORE)."""
+        value = self.get('MODSEQ')
+        return _to_int(value[0] if isinstance(value, list) and value else value)
+
+    @property
+    def gm_msgid(self):
+        """X-GM-MSGID (int, Gmail)."""
+        return _to_int(self.get('X-GM-MSGID'))
+
+    @property
+    def bodystructure(self):
+        """Parsed BODYSTRUCTURE list (see bodystructure.find_pdf_parts)."""
+        value = self.get('BODYSTRUCTURE')
+        return value if isinstance(value, list) else None
+
+    @property
+    def envelope(self):
+        """Envelope, or None."""
+        value = self.get('ENVELOPE')
+        return Envelope(value) if isinstance(value, list) else None
+
+    def section(self, spec):
+        """
+        Get a body section, e.g. section('2') for BODY[2] or section('') for BODY[].
+
+        Partial responses (BODY[2]<0>) are found too.
+
+        Returns:
+            bytes, or None if the section is missing
+        """
+        key = f'BODY[{spec.upper()}]'
+        value = self.get(key)
+        if value is None:
+            for name, candidate in self.items():
+                if name.startswith(key + '<'):
+                    value = candidate
+                    break
+        return value if isinstance(value, bytes) else None
+
+    @property
+    def header(self):
+        """
+        Header block of BODY[HEADER], BODY[HEADER.FIELDS (...)] or RFC822.HEADER.
+
+        Works whatever spacing/case the server used in the section spec.
+        """
+        for key, value in self.items():
+            if (key.startswith('BODY[HEADER') or key == 'RFC822.HEADER') and isinstance(value, bytes):
+                return value
+        return None
+
+    @property
+    def body(self):
+        """Complete raw message of BODY[] or RFC822."""
+        value = self.section('')
+        if value is None and isinstance(self.get('RFC822'), bytes):
+            value = self['RFC822']
+        return value
+
+
+def parse_fetch_items(data):
+    """
+    Parse imaplib FETCH data into one record per message.
+
+    Args:
+        data: Data list returned by imap_conn.uid('fetch', ...) or imap_conn.fetch()
+
+    Returns:
+        list: FetchRecord per message, e.g. {'SEQ': '1', 'UID': '5',
+              'BODYSTRUCTURE': [...], 'BODY[HEADER]': b'...'} with .uid == 5
+    """
+    records = []
+    for text, literals in _group_fetch_data(data):
+        tokens = tokenize(text, literals)
+        if len(tokens) < 2 or not isinstance(tokens[1], list):
+            continue
+        record = FetchRecord(SEQ=tokens[0])
+        items = tokens[1]
+        for i in range(0, len(items) - 1, 2):
+            name = items[i]
+            if isinstance(name, str):
+                record[name.upper()] = items[i + 1]
+        records.append(record)
+    return records
+
+
+def fetch_message_body(data):
+    """
+    Get the raw message from the data of a BODY[] / BODY.PEEK[] / RFC822 FETCH.
+
+    Unsolicited FETCH responses (e.g. flag updates) in the data are skipped.
+
+    Returns:
+        bytes: Raw RFC 822 message, or None
+    """
+    for record in parse_fetch_items(data):
+        body = record.body
+        if body is not None:
+            return body
+    return None
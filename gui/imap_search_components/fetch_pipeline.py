@@ -0,0 +1,167 @@
+"""
+Pipelined UID FETCH for imaplib connections
+
+imaplib sends one command and waits for its tagged completion before the next
+one can be issued, so a scan costs one network round trip per FETCH. This
+module keeps several UID FETCH commands in flight on the same connection
+(RFC 3501 section 5.5 allows multiple outstanding commands) and yields parsed
+FETCH responses as soon as each one has been read from the socket.
+
+UID lists are sent as compact sequence sets (e.g. "1:5000,5002:9000") instead
+of comma-joined UIDs, which keeps command lines short on large mailboxes.
+
+Connections that are not imaplib.IMAP4 instances (or a depth of 1) fall back
+to plain sequential `uid('fetch', ...)` calls.
+"""
+import imaplib
+from collections import deque
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+from gui.imap_search_components.fetch_parser import parse_fetch_items
+from gui.imap_search_components.uid_set import UidSet
+
+# Default number of UIDs per FETCH command
+DEFAULT_CHUNK_SIZE = 200
+
+# Default number of FETCH commands kept in flight
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+def compress_uid_set(uids):
+    """
+    Serialize UIDs to a compact IMAP sequence set.
+
+    Example: ['1', '2', '3', '7', '9', '10'] -> '1:3,7,9:10'
+
+    Args:
+        uids: Iterable of UIDs (str or int) or a UidSet
+
+    Returns:
+        str: IMAP sequence set (empty string for no UIDs)
+    """
+    if isinstance(uids, UidSet):
+        return uids.to_sequence_set()
+    numbers = sorted({int(uid) for uid in uids})
+    ranges = []
+    start = prev = None
+    for number in numbers:
+        if prev is not None and number == prev + 1:
+            prev = number
+            continue
+        if start is not None:
+            ranges.append(f"{start}:{prev}" if prev != start else str(start))
+        start = prev = number
+    if start is not None:
+        ranges.append(f"{start}:{prev}" if prev != start else str(start))
+    return ','.join(ranges)
+
+
+def chunk_uids(uids, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Split a UID list (or UidSet) into consecutive chunks of at most chunk_size UIDs."""
+    chunk_size = max(1, int(chunk_size))
+    for i in range(0, len(uids), chunk_size):
+        yield uids[i:i + chunk_size]
+
+
+def supports_pipelining(imap_conn):
+    """Check if commands can be pipelined on this connection (imaplib only)."""
+    return isinstance(imap_conn, imaplib.IMAP4)
+
+
+class _FetchPipeline:
+    """Keeps up to max_in_flight UID FETCH commands outstanding on one connection"""
+
+    def __init__(self, imap_conn, max_in_flight):
+        self.conn = imap_conn
+        self.max_in_flight = max_in_flight
+        self.pending = deque()
+
+    def _send(self, commands):
+        """Send commands until the in-flight window is full."""
+        while len(self.pending) < self.max_in_flight:
+            command = next(commands, None)
+            if command is None:
+                return
+            uid_set, fetch_items = command
+            tag = self.conn._command('UID', 'FETCH', uid_set, fetch_items)
+            self.pending.append((tag, uid_set))
+
+    def _drain(self):
+        """Parse FETCH responses read so far."""
+        data = self.conn.untagged_responses.pop('FETCH', None)
+        if data:
+            yield from parse_fetch_items(data)
+
+    def _read_response(self):
+        """Read one server response (untagged or tagged)."""
+        self.conn._get_response()
+        self.conn._check_bye()
+
+    def run(self, commands):
+        commands = iter(commands)
+        try:
+            self._send(commands)
+            while self.pending:
+                tag, uid_set = self.pending[0]
+                # Responses arrive in command order; yield them while waiting
+                while self.conn.tagged_commands[tag] is None:
+                    self._read_response()
+                    yield from self._drain()
+                self.pending.popleft()
+                typ, data = self.conn.tagged_commands.pop(tag)
+                yield from self._drain()
+                if typ == 'BAD':
+                    raise self.conn.error(f"UID FETCH command error: {typ} {data}")
+                if typ != 'OK':
+                    log(f"UID FETCH {uid_set} failed: {typ} {data}", level="WARNING")
+                # Refill the window as soon as a command completes
+                self._send(commands)
+        finally:
+            self._discard_pending()
+
+    def _discard_pending(self):
+        """Read and drop responses of commands still in flight (e.g. after stop)."""
+        try:
+            while self.pending:
+                tag, _ = self.pending.popleft()
+                while self.conn.tagged_commands.get(tag, ()) is None:
+                    self._read_response()
+                self.conn.tagged_commands.pop(tag, None)
+        except Exception as e:
+            log(f"Error discarding pipelined FETCH responses: {e}", level="WARNING")
+        self.conn.untagged_responses.pop('FETCH', None)
+
+
+def pipelined_uid_fetch(imap_conn, commands, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Run UID FETCH commands keeping up to max_in_flight of them outstanding.
+
+    Closing the generator early (e.g. on user stop) reads and discards the
+    responses of commands already sent, so the connection stays usable.
+
+    Args:
+        imap_conn: IMAP connection object with the folder selected
+        commands: Iterable of (uid_set, fetch_items) tuples, e.g.
+                  [('1:200', '(UID BODYSTRUCTURE)'), ...]
+        max_in_flight: Maximum number of commands outstanding at once
+
+    Yields:
+        FetchRecord: Parsed FETCH responses (see parse_fetch_items) as they arrive
+    """
+    if max_in_flight <= 1 or not supports_pipelining(imap_conn):
+        for uid_set, fetch_items in commands:
+            status, data = imap_conn.uid('fetch', uid_set, fetch_items)
+            if status != 'OK':
+                log(f"UID FETCH {uid_set} failed: {status}", level="WARNING")
+                continue
+            yield from parse_fetch_items(data)
+        return
+
+    yield from _FetchPipeline(imap_conn, max_in_flight).run(commands)
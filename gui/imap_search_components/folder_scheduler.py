@@ -0,0 +1,275 @@
+"""
+Folder-level parallel IMAP scanning
+
+Server-side rules file invoices into many folders; scanning them one after
+another leaves the other connections the server allows unused. This module
+lists the folders (LIST), drops excluded and non-selectable ones, reads the
+message count of each with STATUS and scans them over several connections
+at once, largest folder first - a large folder started last would otherwise
+keep one connection busy long after the others have finished.
+
+Workers pull folders from a shared queue and keep their connection between
+folders. A worker that loses its connection reconnects and scans the folder
+again; if it cannot reconnect, the folder goes back to the queue for the others.
+"""
+import imaplib
+import queue
+import re
+import threading
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+from gui.imap_search_components.parallel_scanner import MAX_NUM_CONNECTIONS
+from gui.imap_search_components.sync_state import quote_mailbox
+
+# LIST flags of folders that cannot be selected (RFC 3501, RFC 5258)
+NOSELECT_FLAGS = ('\\NOSELECT', '\\NONEXISTENT')
+
+# Number of times a folder is scanned again after its connection dropped
+MAX_FOLDER_RETRIES = 2
+
+_LIST_LINE_RE = re.compile(r'\(([^)]*)\)\s+(NIL|"(?:[^"\\]|\\.)*")\s+(.*)$')
+
+
+def _unquote(value):
+    """Remove IMAP quoting from a string."""
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
+
+
+def parse_list_response(list_response):
+    """
+    Parse the data of a LIST command.
+
+    Handles quoted, atom and literal folder names, e.g.
+    b'(\\HasNoChildren) "/" "Faktury/2025"' or
+    (b'(\\HasNoChildren) "/" {13}', b'Faktury "Q1"').
+
+    Args:
+        list_response: Data list returned by imap_conn.list()
+
+    Returns:
+        list: Dicts {'name': str, 'flags': tuple of upper-case flags,
+              'delimiter': str or None} in server order
+    """
+    folders = []
+    for item in list_response or []:
+        literal = None
+        if isinstance(item, tuple):
+            item, literal = item[0], item[1]
+        if not isinstance(item, bytes):
+            continue
+        match = _LIST_LINE_RE.match(item.decode('utf-8', errors='ignore').strip())
+        if not match:
+            continue
+        flags, delimiter, name = match.groups()
+        if literal is not None:
+            name = literal.decode('utf-8', errors='ignore')
+        else:
+            name = _unquote(name.strip())
+        folders.append({
+            'name': name,
+            'flags': tuple(flag.upper() for flag in flags.split()),
+            'delimiter': None if delimiter == 'NIL' else _unquote(delimiter),
+        })
+    return folders
+
+
+def parse_excluded_folders(excluded_folders):
+    """
+    Parse a comma-separated list of folders to exclude.
+
+    Args:
+        excluded_folders: String like 'Spam, Kosz' (or None)
+
+    Returns:
+        set: Folder names; a folder is excluded when its full name matches
+    """
+    if not excluded_folders:
+        return set()
+    return {name.strip() for name in excluded_folders.split(',') if name.strip()}
+
+
+def folder_message_count(imap_conn, folder):
+    """
+    Read the number of messages in a folder with STATUS (MESSAGES).
+
+    Returns:
+        int: Message count, or None if STATUS failed
+    """
+    try:
+        status, data = imap_conn.status(quote_mailbox(folder), '(MESSAGES)')
+    except imaplib.IMAP4.error as e:
+        log(f"STATUS failed for {folder}: {e}", level="WARNING")
+        return None
+    if status != 'OK':
+        return None
+    for item in data or []:
+        if isinstance(item, bytes):
+            match = re.search(rb'\bMESSAGES\s+(\d+)', item, re.IGNORECASE)
+            if match:
+                return int(match.group(1))
+    return None
+
+
+def prioritize_folders(counts):
+    """
+    Order folders for scanning: largest first, unknown sizes last, empty ones dropped.
+
+    Args:
+        counts: List of (folder, message_count or None) in LIST order
+
+    Returns:
+        list: (folder, message_count) tuples in scan order
+    """
+    known = [(folder, count) for folder, count in counts if count]
+    unknown = [(folder, count) for folder, count in counts if count is None]
+    return sorted(known, key=lambda item: -item[1]) + unknown
+
+
+def plan_folder_scan(imap_conn, excluded_folders=None):
+    """
+    List the folders to scan and order them by size.
+
+    Args:
+        imap_conn: Logged-in IMAP connection
+        excluded_folders: Comma-separated folder names to skip (or None)
+
+    Returns:
+        list: (folder, message_count) tuples in scan order; [('INBOX', None)]
+              if LIST fails
+    """
+    excluded = parse_excluded_folders(excluded_folders)
+    try:
+        status, data = imap_conn.list()
+    except imaplib.IMAP4.error as e:
+        log(f"Error listing folders: {e}, using INBOX only", level="WARNING")
+        return [('INBOX', None)]
+    if status != 'OK':
+        return [('INBOX', None)]
+
+    counts = []
+    for folder in parse_list_response(data):
+        if folder['name'] in excluded:
+            log(f"Skipping excluded folder {folder['name']}")
+            continue
+        if any(flag in NOSELECT_FLAGS for flag in folder['flags']):
+            continue
+        counts.append((folder['name'], folder_message_count(imap_conn, folder['name'])))
+    return prioritize_folders(counts)
+
+
+def _close_connection(imap_conn):
+    """Log out, ignoring errors of a broken connection."""
+    try:
+        imap_conn.logout()
+    except Exception:
+        pass
+
+
+def scan_folders_parallel(connect, folders, scan_folder, num_connections, should_stop=None):
+    """
+    Scan folders concurrently, each worker on its own connection.
+
+    Args:
+        connect: Callable returning a new logged-in IMAP connection
+        folders: Folder names in scan order (see plan_folder_scan)
+        scan_folder: Callable(imap_conn, folder) run in a worker thread; the
+                     folder is not selected yet. Its return value is stored
+                     in the result
+        num_connections: Maximum number of concurrent connections
+        should_stop: Optional callable returning True to stop handing out folders
+
+    Returns:
+        dict: {
+            'results': {folder: scan_folder() return value},
+            'errors': {folder: error message} for folders that failed,
+            'connections': number of connections that took part
+        }
+
+    Raises:
+        Exception: The connection error if no connection could be opened
+    """
+    should_stop = should_stop or (lambda: False)
+    work = queue.Queue()
+    for folder in folders:
+        work.put((folder, 0))
+    stats = {'results': {}, 'errors': {}, 'connections': 0}
+    stats_lock = threading.Lock()
+    connect_errors = []
+
+    def worker(index):
+        try:
+            imap_conn = connect()
+        except Exception as e:
+            log(f"IMAP folder worker {index} could not connect: {e}", level="WARNING")
+            with stats_lock:
+                connect_errors.append(e)
+            return
+
+        with stats_lock:
+            stats['connections'] += 1
+
+        try:
+            while not should_stop():
+                try:
+                    folder, attempt = work.get_nowait()
+                except queue.Empty:
+                    break
+
+                try:
+                    result = scan_folder(imap_conn, folder)
+                    with stats_lock:
+                        stats['results'][folder] = result
+                except (imaplib.IMAP4.abort, OSError) as e:
+                    log(f"IMAP folder worker {index} lost connection in {folder}: {e}", level="WARNING")
+                    if attempt >= MAX_FOLDER_RETRIES:
+                        with stats_lock:
+                            stats['errors'][folder] = str(e)
+                    else:
+                        work.put((folder, attempt + 1))
+                    # The connection is dead either way; the next folder gets a new one
+                    _close_connection(imap_conn)
+                    try:
+                        imap_conn = connect()
+                    except Exception as connect_error:
+                        # Leave the folder to the other workers
+                        log(f"IMAP folder worker {index} could not reconnect: {connect_error}", level="WARNING")
+                        imap_conn = None
+                        return
+                except Exception as e:
+                    log(f"Error scanning folder {folder}: {e}", level="ERROR")
+                    with stats_lock:
+                        stats['errors'][folder] = str(e)
+        finally:
+            if imap_conn is not None:
+                _close_connection(imap_conn)
+
+    worker_count = max(1, min(int(num_connections), MAX_NUM_CONNECTIONS, len(folders) or 1))
+    threads = [threading.Thread(target=worker, args=(i,), name=f"imap-folders-{i}", daemon=True)
+               for i in range(worker_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if stats['connections'] == 0 and connect_errors:
+        raise connect_errors[0]
+
+    if not should_stop():
+        while True:
+            try:
+                folder, _ = work.get_nowait()
+            except queue.Empty:
+                break
+            stats['errors'][folder] = 'not scanned (all connections failed)'
+            log(f"Folder {folder} left unscanned (all connections failed)", level="ERROR")
+
+    return stats
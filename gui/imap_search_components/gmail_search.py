@@ -0,0 +1,186 @@
+"""
+Gmail fast path (X-GM-RAW search, X-GM-MSGID deduplication)
+
+Gmail servers advertise the X-GM-EXT-1 capability. With it the candidate set
+is built by Gmail's own search index:
+
+    UID SEARCH X-GM-RAW "has:attachment filename:pdf after:<ts> before:<ts>"
+
+which usually leaves only a small fraction of a folder to triage. Gmail
+exposes every label as a folder, so one message can be seen in INBOX, in
+user labels and in "[Gmail]/All Mail". X-GM-MSGID is the same in all of
+them and is used to scan each message only once per search.
+"""
+import math
+import re
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+from gui.imap_search_components.fetch_pipeline import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_MAX_IN_FLIGHT,
+    compress_uid_set,
+    chunk_uids,
+    pipelined_uid_fetch,
+)
+from gui.imap_search_components.sync_state import quote_mailbox
+from gui.imap_search_components.uid_set import UidSet
+
+GMAIL_CAPABILITY = 'X-GM-EXT-1'
+
+# Gmail search operators selecting messages with PDF attachments
+PDF_ATTACHMENT_QUERY = 'has:attachment filename:pdf'
+
+
+def supports_gmail_extensions(imap_conn):
+    """Check if the connection advertises Gmail IMAP extensions."""
+    capabilities = getattr(imap_conn, 'capabilities', ()) or ()
+    return isinstance(capabilities, (tuple, list, set)) and GMAIL_CAPABILITY in capabilities
+
+
+def build_gmail_raw_query(date_from=None, date_before=None):
+    """
+    Build the Gmail search query for messages with PDF attachments.
+
+    Dates are given to Gmail as Unix timestamps, so the range is exact
+    regardless of the account's time zone (Gmail interprets yyyy/mm/dd dates
+    in Pacific time).
+
+    Args:
+        date_from: Start datetime (inclusive) or None
+        date_before: End datetime (exclusive) or None
+
+    Returns:
+        str: e.g. 'has:attachment filename:pdf after:1733011200 before:1733616000'
+    """
+    parts = [PDF_ATTACHMENT_QUERY]
+    if date_from:
+        # after: is exclusive in Gmail - step back one second to include date_from
+        parts.append(f"after:{int(math.floor(date_from.timestamp())) - 1}")
+    if date_before:
+        parts.append(f"before:{int(math.ceil(date_before.timestamp()))}")
+    return ' '.join(parts)
+
+
+def gmail_raw_criterion(query):
+    """Return an X-GM-RAW search key with the query quoted."""
+    return 'X-GM-RAW "' + query.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def gmail_search_uids(imap_conn, folder, date_from=None, date_before=None):
+    """
+    Select a folder and search it with X-GM-RAW.
+
+    Args:
+        imap_conn: IMAP connection to a Gmail server
+        folder: Folder (label) to search
+        date_from: Start datetime (inclusive) or None
+        date_before: End datetime (exclusive) or None
+
+    Returns:
+        UidSet: UIDs found, or None if the search failed (caller falls back
+                to the standard search)
+    """
+    query = build_gmail_raw_query(date_from, date_before)
+    try:
+        status, data = imap_conn.select(quote_mailbox(folder), readonly=True)
+        if status != 'OK':
+            log(f"Failed to select folder {folder}: {data}", level="ERROR")
+            return None
+
+        log(f"Executing Gmail UID SEARCH in {folder}: X-GM-RAW \"{query}\"")
+        status, data = imap_conn.uid('search', None, gmail_raw_criterion(query))
+        if status != 'OK':
+            log(f"Gmail X-GM-RAW search failed: {data}", level="WARNING")
+            return None
+    except Exception as e:
+        log(f"Error in Gmail X-GM-RAW search: {e}", level="WARNING")
+        return None
+
+    uids = UidSet.from_search_response(data[0] if data else None)
+    log(f"Gmail search found {len(uids)} messages with PDF attachments in {folder}")
+    return uids
+
+
+def fetch_gmail_msgids(imap_conn, uids, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Fetch X-GM-MSGID for UIDs of the selected folder.
+
+    Returns:
+        dict: {uid: msgid} (UIDs missing from the response are left out)
+    """
+    commands = ((compress_uid_set(chunk), '(UID X-GM-MSGID)')
+                for chunk in chunk_uids(uids, DEFAULT_CHUNK_SIZE * 5))
+    return {str(record.uid): record.gm_msgid
+            for record in pipelined_uid_fetch(imap_conn, commands, max_in_flight)
+            if record.uid is not None and record.gm_msgid is not None}
+
+
+def find_all_mail_folder(list_response):
+    """
+    Find the "All Mail" folder in a LIST response by its \\All flag.
+
+    The folder name is localized (e.g. "[Gmail]/Wszystkie"), so the
+    RFC 6154 special-use flag is used instead of the name.
+
+    Args:
+        list_response: Data list returned by imap_conn.list()
+
+    Returns:
+        str: Folder name, or None
+    """
+    for folder_info in list_response or []:
+        if not isinstance(folder_info, bytes):
+            continue
+        line = folder_info.decode('utf-8', errors='ignore')
+        flags = re.match(r'\(([^)]*)\)', line)
+        name = re.search(r'"([^"]+)"$', line)
+        if flags and name and re.search(r'\\All\b', flags.group(1)):
+            return name.group(1)
+    return None
+
+
+class GmailMessageDeduplicator:
+    """Remembers X-GM-MSGIDs seen during one search across folders"""
+
+    def __init__(self):
+        self.seen = set()
+
+    def filter_new(self, imap_conn, uids):
+        """
+        Drop UIDs of messages already seen in another folder of this search.
+
+        Args:
+            imap_conn: IMAP connection with the folder selected
+            uids: UIDs (as strings) found in the folder
+
+        Returns:
+            list: UIDs of messages not seen before (order kept; a UidSet
+                  when uids is a UidSet)
+        """
+        if not uids:
+            return uids
+        try:
+            msgids = fetch_gmail_msgids(imap_conn, uids)
+        except Exception as e:
+            log(f"Could not fetch X-GM-MSGID (no deduplication): {e}", level="WARNING")
+            return uids
+
+        new_uids = []
+        for uid in uids:
+            msgid = msgids.get(uid)
+            if msgid is None:
+                new_uids.append(uid)
+            elif msgid not in self.seen:
+                self.seen.add(msgid)
+                new_uids.append(uid)
+        skipped = len(uids) - len(new_uids)
+        if skipped:
+            log(f"Gmail: skipping {skipped} messages already seen under another label")
+        return UidSet(new_uids) if isinstance(uids, UidSet) else new_uids
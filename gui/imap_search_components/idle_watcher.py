@@ -0,0 +1,275 @@
+"""
+IMAP IDLE watch mode (RFC 2177)
+
+Keeps one connection per watched folder in IDLE, so the server pushes a
+notification (EXISTS) as soon as a message is delivered. The watcher then
+leaves IDLE, looks up the new UIDs with 'UID SEARCH UID <next>:*' and hands
+them to a callback - in the application, the same PDF/NIP pipeline as a
+normal search - and goes back to IDLE.
+
+IDLE is re-issued every IDLE_RESTART_INTERVAL seconds (servers drop idle
+clients after 30 minutes). Servers without the IDLE capability are polled
+with NOOP instead. A lost connection is reopened after RECONNECT_DELAY and
+messages delivered meanwhile are picked up from the last seen UID.
+
+imaplib (before Python 3.14) has no IDLE support; IdleSession drives the
+command with imaplib's own tag and line primitives.
+"""
+import imaplib
+import select
+import threading
+import time
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+from gui.imap_search_components.search_planner import server_capabilities
+from gui.imap_search_components.sync_state import quote_mailbox, read_mailbox_state, filter_new_uids
+from gui.imap_search_components.uid_set import UidSet
+
+# RFC 2177: clients should re-issue IDLE at least every 29 minutes
+IDLE_RESTART_INTERVAL = 25 * 60
+
+# How often a waiting watcher checks should_stop()
+STOP_CHECK_INTERVAL = 1.0
+
+# NOOP polling interval for servers without IDLE
+POLL_INTERVAL = 60
+
+# Delay before reopening a lost connection
+RECONNECT_DELAY = 10
+
+
+def supports_idle(imap_conn):
+    """Check if the server announces the IDLE capability."""
+    capabilities = server_capabilities(imap_conn)
+    return capabilities is not None and 'IDLE' in capabilities
+
+
+def _wait_readable(imap_conn, timeout):
+    """Wait up to timeout seconds for data from the server."""
+    sock = getattr(imap_conn, 'sock', None)
+    if sock is None:
+        return False
+    pending = getattr(sock, 'pending', None)
+    if pending is not None and pending():
+        return True
+    readable, _, _ = select.select([sock], [], [], timeout)
+    return bool(readable)
+
+
+class IdleSession:
+    """One IDLE command on a connection with a folder selected"""
+
+    def __init__(self, imap_conn):
+        self.conn = imap_conn
+        self.tag = None
+
+    def start(self):
+        """
+        Send IDLE and wait for the server's continuation.
+
+        Returns:
+            list: Untagged lines received before the continuation
+        """
+        self.tag = self.conn._new_tag()
+        self.conn.send(self.tag + b' IDLE\r\n')
+        lines = []
+        while True:
+            line = self.conn._get_line()
+            if line.startswith(b'+'):
+                return lines
+            if line.startswith(self.tag + b' '):
+                self.tag = None
+                raise self.conn.error(f"IDLE rejected: {line.decode('utf-8', errors='replace')}")
+            lines.append(line)
+
+    def wait(self, timeout):
+        """
+        Wait for notifications from the server.
+
+        Args:
+            timeout: Seconds to wait
+
+        Returns:
+            list: Untagged lines (e.g. [b'* 5 EXISTS']), empty on timeout
+        """
+        if not _wait_readable(self.conn, timeout):
+            return []
+        lines = [self.conn._get_line()]
+        while _wait_readable(self.conn, 0):
+            lines.append(self.conn._get_line())
+        return lines
+
+    def done(self):
+        """
+        End IDLE and read the command completion.
+
+        Returns:
+            list: Untagged lines received before the completion
+        """
+        if self.tag is None:
+            return []
+        self.conn.send(b'DONE\r\n')
+        lines = []
+        while True:
+            line = self.conn._get_line()
+            if line.startswith(self.tag + b' '):
+                self.tag = None
+                return lines
+            lines.append(line)
+
+
+def fetch_new_uids(imap_conn, next_uid):
+    """
+    Return UIDs >= next_uid in the selected folder.
+
+    Args:
+        imap_conn: IMAP connection with the folder selected
+        next_uid: Lowest UID not seen yet
+
+    Returns:
+        UidSet: New UIDs (possibly empty)
+    """
+    status, data = imap_conn.uid('search', None, f'UID {next_uid}:*')
+    if status != 'OK':
+        raise imap_conn.error(f"UID SEARCH failed: {data}")
+    return filter_new_uids(UidSet.from_search_response(data[0] if data else None), next_uid)
+
+
+def _sleep(seconds, should_stop):
+    """Sleep in short steps so a stop request is noticed quickly."""
+    deadline = time.monotonic() + seconds
+    while not should_stop():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(STOP_CHECK_INTERVAL, remaining))
+
+
+def _wait_for_change(imap_conn, should_stop, use_idle, restart_interval, poll_interval):
+    """Block until the server reports a change, the interval ends or a stop is requested."""
+    if not use_idle:
+        _sleep(poll_interval, should_stop)
+        if not should_stop():
+            imap_conn.noop()
+        return
+
+    session = IdleSession(imap_conn)
+    try:
+        if session.start():
+            return
+        deadline = time.monotonic() + restart_interval
+        while not should_stop():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if session.wait(min(STOP_CHECK_INTERVAL, remaining)):
+                # Any notification (EXISTS, EXPUNGE, FETCH) triggers a UID check
+                return
+    finally:
+        session.done()
+
+
+def watch_folder(connect, folder, handle_new_uids, should_stop,
+                 restart_interval=IDLE_RESTART_INTERVAL, poll_interval=POLL_INTERVAL,
+                 reconnect_delay=RECONNECT_DELAY):
+    """
+    Watch one folder until should_stop() returns True.
+
+    Messages present when watching starts are not reported; after a lost
+    connection, messages delivered meanwhile are.
+
+    Args:
+        connect: Callable returning a new logged-in IMAP connection
+        folder: Folder to watch
+        handle_new_uids: Callable(conn, folder, uid_set) called with the folder
+                         selected on conn and no IDLE in progress
+        should_stop: Callable returning True to stop watching
+        restart_interval: Seconds after which IDLE is re-issued
+        poll_interval: NOOP polling interval for servers without IDLE
+        reconnect_delay: Seconds to wait before reconnecting
+    """
+    conn = None
+    next_uid = None
+    uidvalidity = None
+
+    while not should_stop():
+        try:
+            if conn is None:
+                conn = connect()
+                status, data = conn.select(quote_mailbox(folder), readonly=True)
+                if status != 'OK':
+                    raise conn.error(f"cannot select {folder}: {data}")
+                state = read_mailbox_state(conn, folder)
+                if uidvalidity is not None and state['uidvalidity'] != uidvalidity:
+                    log(f"UIDVALIDITY of {folder} changed - watching from the current state", level="WARNING")
+                    next_uid = None
+                uidvalidity = state['uidvalidity']
+                if next_uid is None:
+                    next_uid = state['uidnext']
+                if next_uid is None:
+                    existing = fetch_new_uids(conn, 1)
+                    next_uid = int(existing[-1]) + 1 if existing else 1
+                use_idle = supports_idle(conn)
+                log(f"Watching {folder} from UID {next_uid} ({'IDLE' if use_idle else 'NOOP polling'})")
+
+            new_uids = fetch_new_uids(conn, next_uid)
+            if new_uids:
+                log(f"{len(new_uids)} new message(s) in {folder}: UID {new_uids}")
+                next_uid = int(new_uids[-1]) + 1
+                try:
+                    handle_new_uids(conn, folder, new_uids)
+                except (imaplib.IMAP4.abort, OSError):
+                    raise
+                except Exception as e:
+                    log(f"Error handling new messages in {folder}: {e}", level="ERROR")
+
+            _wait_for_change(conn, should_stop, use_idle, restart_interval, poll_interval)
+
+        except (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError) as e:
+            log(f"Watch connection for {folder} lost: {e}", level="WARNING")
+            _close(conn)
+            conn = None
+            _sleep(reconnect_delay, should_stop)
+
+    _close(conn)
+    log(f"Stopped watching {folder}")
+
+
+def _close(conn):
+    """Log out, ignoring errors of a broken connection."""
+    if conn is None:
+        return
+    try:
+        conn.logout()
+    except Exception:
+        pass
+
+
+def watch_folders(connect, folders, handle_new_uids, should_stop, **kwargs):
+    """
+    Watch several folders, each on its own connection, until should_stop().
+
+    Args:
+        connect: Callable returning a new logged-in IMAP connection
+        folders: Folder names (e.g. ['INBOX', 'Faktury'])
+        handle_new_uids: Callable(conn, folder, uid_set); may run concurrently
+                         for different folders
+        should_stop: Callable returning True to stop watching
+        **kwargs: Passed to watch_folder()
+    """
+    threads = [
+        threading.Thread(target=watch_folder, args=(connect, folder, handle_new_uids, should_stop),
+                         kwargs=kwargs, name=f"imap-idle-{folder}", daemon=True)
+        for folder in folders
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,367 @@
+"""
+Attachment-level IMAP scanning helpers
+
+Shared by search_messages() and the threaded scanner in the main window.
+Instead of downloading whole messages, a scan first fetches BODYSTRUCTURE and
+a few header fields for a batch of UIDs, then downloads only the MIME sections
+that carry PDF attachments. The full message is fetched only on demand (e.g.
+when a hit has to be stored as an .eml copy).
+"""
+import email
+import imaplib
+import time
+from contextlib import closing
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+from gui.imap_search_components.bodystructure import (
+    find_pdf_parts,
+    build_section_fetch,
+    decode_part_payload,
+)
+from gui.imap_search_components.fetch_parser import EnvelopeHeaders, fetch_message_body
+from gui.imap_search_components.batch_sizer import make_batch_sizer, split_by_budget
+from gui.imap_search_components.message_dedup import message_fingerprint
+from gui.imap_search_components.fetch_pipeline import (
+    DEFAULT_MAX_IN_FLIGHT,
+    compress_uid_set,
+    chunk_uids,
+    pipelined_uid_fetch,
+)
+from gui.mail_search_components.mime_stream import iter_bytes_chunks, parse_message_stream
+
+# Header fields needed to file an invoice (date folder, log line, dedup)
+TRIAGE_HEADER_FIELDS = 'DATE FROM SUBJECT MESSAGE-ID'
+
+# Triage FETCH: structure, size plus the few header fields we actually use
+TRIAGE_FETCH = f'(UID RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({TRIAGE_HEADER_FIELDS})])'
+
+# Envelope triage: the same fields from the server's parsed ENVELOPE, no header block to parse
+TRIAGE_FETCH_ENVELOPE = '(UID RFC822.SIZE INTERNALDATE BODYSTRUCTURE ENVELOPE)'
+
+# Messages per section FETCH command (sections are large, keep commands small)
+SECTION_CHUNK_SIZE = 20
+
+# Section bytes requested by one FETCH command
+SECTION_BYTE_BUDGET = 8 * 1024 * 1024
+
+# Section bytes downloaded and held before the messages are yielded
+WINDOW_BYTE_BUDGET = 64 * 1024 * 1024
+
+
+def triage_headers(item):
+    """
+    Header fields of a triage FETCH item.
+
+    Returns:
+        EnvelopeHeaders when the item has an ENVELOPE, otherwise the
+        email.message.Message parsed from the fetched header fields
+    """
+    envelope = item.envelope
+    if envelope is not None:
+        return EnvelopeHeaders(envelope, item.internaldate)
+    return email.message_from_bytes(item.header or b'')
+
+
+def pdf_attachments_from_item(item, pdf_parts):
+    """
+    Build decoded PDF attachments from a parsed section FETCH item.
+
+    Args:
+        item: FetchRecord containing BODY[<section>] literals
+        pdf_parts: Part dicts from find_pdf_parts()
+
+    Returns:
+        list: [(filename, decoded_pdf_bytes), ...] in MIME order
+    """
+    attachments = []
+    for part in pdf_parts:
+        raw = item.section(part['section'])
+        if raw is None:
+            continue
+        filename = part['filename'] or f"attachment_{part['section']}.pdf"
+        attachments.append((filename, decode_part_payload(raw, part['encoding'])))
+    return attachments
+
+
+def fetch_full_message(imap_conn, uid):
+    """
+    Download the complete raw message without setting the \\Seen flag.
+
+    Returns:
+        bytes: Raw RFC 822 message, or None on failure
+    """
+    status, data = imap_conn.uid('fetch', uid, '(BODY.PEEK[])')
+    if status != 'OK' or not data:
+        return None
+    return fetch_message_body(data)
+
+
+def fetch_message_pdfs(imap_conn, uid):
+    """
+    Download the full message and extract its headers and PDF attachments.
+
+    Returns:
+        tuple: (email.message.Message with the top-level headers,
+                [(filename, decoded_pdf_bytes), ...]), or None if the server
+               returned no message
+    """
+    raw = fetch_full_message(imap_conn, uid)
+    if not raw:
+        return None
+
+    # Streaming parse: only the PDF parts are decoded
+    with parse_message_stream(iter_bytes_chunks(raw)) as message:
+        return message.headers, [(part.filename, part.read()) for part in message.parts]
+
+
+def fetch_pdf_attachments_full(imap_conn, uid):
+    """
+    Download the full message and extract PDF attachments from it.
+
+    Fallback for servers returning no usable BODYSTRUCTURE.
+
+    Returns:
+        list: [(filename, decoded_pdf_bytes), ...]
+    """
+    result = fetch_message_pdfs(imap_conn, uid)
+    return result[1] if result else []
+
+
+def _report_window_prefix(window_done, window_uids, last_uid, pending_uids):
+    """Report the UIDs of a window processed before a stop: up to last_uid and below any pending UID."""
+    limit = int(last_uid)
+    if pending_uids:
+        limit = min(limit, min(int(uid) for uid in pending_uids) - 1)
+    done = [uid for uid in window_uids if int(uid) <= limit]
+    if done:
+        window_done(done)
+
+
+def iter_pdf_messages(imap_conn, uids, batch_size=None, should_stop=None,
+                      accept=None, progress_callback=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                      window_done=None, sizer=None, use_envelope=False, claim=None, failed=None):
+    """
+    Yield messages carrying PDF attachments, downloading only the PDF sections.
+
+    UIDs are processed in windows of batch_size * max_in_flight messages. For
+    each window the triage FETCH commands are pipelined, then the PDF sections
+    of all candidates are fetched with pipelined commands grouped by section
+    spec (most invoices share e.g. BODY.PEEK[2]), so a window costs a couple
+    of round trips instead of one per message.
+
+    Without a fixed batch_size the triage batch size adapts to the measured
+    throughput and round-trip time (see batch_sizer). Section downloads are
+    bounded by bytes, using the part sizes from BODYSTRUCTURE (RFC822.SIZE
+    when unknown): SECTION_BYTE_BUDGET per command and WINDOW_BYTE_BUDGET held
+    in memory before the messages are yielded.
+
+    Messages whose triage or PDF sections the server did not return (a
+    rejected FETCH, a missing section) are scanned again from the full
+    message. UIDs that fail there too are passed to failed() and their window
+    is not reported to window_done, so the caller does not treat the scan as
+    complete.
+
+    Args:
+        imap_conn: IMAP connection object with the folder selected
+        uids: List of UIDs (as strings) to scan
+        batch_size: Fixed number of UIDs per triage FETCH, or None to adapt
+        should_stop: Optional callable returning True to stop scanning
+        accept: Optional callable(headers) -> bool; messages rejected here are
+                skipped before any section is downloaded
+        progress_callback: Optional callable(processed, total)
+        max_in_flight: Number of FETCH commands kept in flight
+        window_done: Optional callable(window_uids) called once every message
+                     of a window has been yielded and handled (checkpoints);
+                     after a stop it gets the processed part of the window
+        sizer: Optional AdaptiveBatchSizer to continue from (e.g. one per
+               connection across chunks); overrides batch_size
+        use_envelope: Triage with ENVELOPE instead of the header fields; the
+                      'headers' are then EnvelopeHeaders
+        claim: Optional callable(fingerprint, uid) -> bool; messages it
+               rejects (copies already scanned in another folder, see
+               MessageDeduplicator) are skipped before any section is downloaded
+        failed: Optional callable(uids) called with the UIDs of a window that
+                could not be scanned
+
+    Yields:
+        dict: {
+            'uid': message UID,
+            'headers': email.message.Message with the triage header fields
+                       (EnvelopeHeaders with use_envelope),
+            'pdf_parts': part dicts from find_pdf_parts(),
+            'attachments': [(filename, decoded_pdf_bytes), ...],
+            'fingerprint': message_fingerprint() value or None
+        }
+    """
+    should_stop = should_stop or (lambda: False)
+    sizer = sizer or make_batch_sizer(batch_size)
+    triage_fetch = TRIAGE_FETCH_ENVELOPE if use_envelope else TRIAGE_FETCH
+    total = len(uids)
+    processed = 0
+    window_start = 0
+
+    while window_start < total:
+        if should_stop():
+            return
+
+        window_uids = uids[window_start:window_start + sizer.size * max(1, max_in_flight)]
+        window_start += len(window_uids)
+        candidates = {}
+        sizes = {}
+        full_fetch = []         # (uid, headers or None when triage failed)
+        triaged = set()
+        window_failed = []
+
+        # Phase 1: triage (structure + header fields), pipelined and timed for the sizer
+        triage_commands = ((compress_uid_set(chunk), triage_fetch)
+                           for chunk in chunk_uids(window_uids, sizer.size))
+        started = time.monotonic()
+        latency = None
+        try:
+            with closing(pipelined_uid_fetch(imap_conn, triage_commands, max_in_flight)) as items:
+                for item in items:
+                    if latency is None:
+                        latency = time.monotonic() - started
+                    if should_stop():
+                        return
+
+                    if item.uid is None:
+                        continue  # Unsolicited FETCH (e.g. flag update)
+                    uid = str(item.uid)
+                    triaged.add(uid)
+
+                    processed += 1
+                    if progress_callback:
+                        progress_callback(processed, total)
+
+                    headers = triage_headers(item)
+                    if accept and not accept(headers):
+                        continue
+
+                    bodystructure = item.bodystructure
+                    if bodystructure is not None:
+                        pdf_parts = find_pdf_parts(bodystructure)
+                        if pdf_parts:
+                            fingerprint = message_fingerprint(headers, pdf_parts)
+                            if claim and not claim(fingerprint, uid):
+                                continue
+                            candidates[uid] = (headers, pdf_parts, fingerprint)
+                            sizes[uid] = (sum(part.get('size') or 0 for part in pdf_parts)
+                                          or item.size or 0)
+                    else:
+                        # No usable BODYSTRUCTURE - fall back to the full message
+                        full_fetch.append((uid, headers))
+        except (imaplib.IMAP4.abort, OSError):
+            raise
+        except Exception as e:
+            log(f"Error fetching triage window at {window_start - len(window_uids)}: {e} "
+                f"- falling back to full messages", level="WARNING")
+            full_fetch.extend((uid, None) for uid in window_uids if str(uid) not in triaged)
+        else:
+            sizer.record(len(window_uids), time.monotonic() - started, latency)
+
+        def stop_after(last_uid, later_full_fetch):
+            # Report the processed prefix of the window, then end the scan
+            if window_done:
+                pending = list(candidates) + [uid for uid, _ in later_full_fetch]
+                _report_window_prefix(window_done, window_uids, last_uid, pending)
+
+        # Phase 2: PDF sections in UID order, in rounds of at most WINDOW_BYTE_BUDGET
+        # bytes. Within a round, commands are grouped by section spec and pipelined;
+        # results are collected before yielding so the caller may issue its own
+        # commands (e.g. fetch_full_message) while no FETCH is in flight.
+        for round_uids in split_by_budget(sorted(candidates, key=int), sizes, WINDOW_BYTE_BUDGET):
+            groups = {}
+            for uid in round_uids:
+                groups.setdefault(build_section_fetch(candidates[uid][1]), []).append(uid)
+            section_commands = [(compress_uid_set(chunk), spec)
+                                for spec, group_uids in groups.items()
+                                for chunk in split_by_budget(group_uids, sizes, SECTION_BYTE_BUDGET,
+                                                             SECTION_CHUNK_SIZE)]
+            found = []
+            try:
+                with closing(pipelined_uid_fetch(imap_conn, section_commands, max_in_flight)) as items:
+                    for item in items:
+                        uid = str(item.uid)
+                        if uid not in candidates:
+                            continue
+                        headers, pdf_parts, fingerprint = candidates.pop(uid)
+                        attachments = pdf_attachments_from_item(item, pdf_parts)
+                        if len(attachments) == len(pdf_parts) and all(data for _, data in attachments):
+                            found.append({
+                                'uid': uid,
+                                'headers': headers,
+                                'pdf_parts': pdf_parts,
+                                'attachments': attachments,
+                                'fingerprint': fingerprint,
+                            })
+                        else:
+                            # A section missing or empty in the response
+                            full_fetch.append((uid, headers))
+                        if should_stop():
+                            break
+            except (imaplib.IMAP4.abort, OSError):
+                raise
+            except Exception as e:
+                log(f"Error fetching PDF sections at {window_start - len(window_uids)}: {e}", level="WARNING")
+            # Sections the server did not return: scan the full message instead
+            if not should_stop():
+                for uid in round_uids:
+                    if uid in candidates:
+                        full_fetch.append((uid, candidates.pop(uid)[0]))
+
+            # Hits in UID order, so a stop leaves a processed prefix of the window
+            found.sort(key=lambda result: int(result['uid']))
+            for result in found:
+                yield result
+                if should_stop():
+                    stop_after(result['uid'], full_fetch)
+                    return
+            if should_stop():
+                return
+
+        full_fetch.sort(key=lambda entry: int(entry[0]))
+        for index, (uid, headers) in enumerate(full_fetch):
+            if should_stop():
+                return
+            try:
+                result = fetch_message_pdfs(imap_conn, uid)
+            except (imaplib.IMAP4.abort, OSError):
+                raise
+            except Exception as e:
+                log(f"Error fetching message UID {uid}: {e}", level="WARNING")
+                result = None
+            if result is None:
+                window_failed.append(uid)
+                continue
+            if headers is None:
+                headers = result[0]
+                if accept and not accept(headers):
+                    continue
+            attachments = result[1]
+            if attachments:
+                yield {
+                    'uid': uid,
+                    'headers': headers,
+                    'pdf_parts': [],
+                    'attachments': attachments,
+                    'fingerprint': None,
+                }
+                if should_stop():
+                    stop_after(uid, full_fetch[index + 1:])
+                    return
+
+        if window_failed:
+            log(f"{len(window_failed)} messages could not be scanned: {compress_uid_set(window_failed)}",
+                level="ERROR")
+            if failed:
+                failed(window_failed)
+        elif window_done and not should_stop():
+            window_done(window_uids)
@@ -0,0 +1,110 @@
+"""
+Cross-folder duplicate suppression
+
+With several folders searched, the same message is often found in INBOX, an
+archive folder and a folder filled by a mail rule. A message is identified
+by its Message-ID plus the filename and size of every PDF part (from
+BODYSTRUCTURE, so the fingerprint is known at triage time): the first copy
+seen in a search claims the fingerprint, later copies in other folders are
+not downloaded.
+
+With a ScanLedger the fingerprints are also kept between searches, linked
+to the hashes of the PDFs they carried; a copy of a message scanned before
+is then skipped when the stored text does not match.
+"""
+import hashlib
+import threading
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+# Owner of fingerprints known (from the ledger) not to match: every copy is skipped
+_NO_MATCH = object()
+
+
+def message_fingerprint(headers, pdf_parts):
+    """
+    Fingerprint of a message for duplicate detection.
+
+    Args:
+        headers: Triage headers (email.message.Message or EnvelopeHeaders)
+        pdf_parts: PDF part dicts from find_pdf_parts()
+
+    Returns:
+        str: SHA-256 hex digest of Message-ID and PDF filenames/sizes, or None
+             for messages without a Message-ID or PDF parts
+    """
+    message_id = (headers.get('Message-ID') or '').strip()
+    if not message_id or not pdf_parts:
+        return None
+    parts = sorted((part.get('filename') or '', part.get('size') or 0) for part in pdf_parts)
+    key = '\n'.join([message_id] + [f"{filename}\t{size}" for filename, size in parts])
+    return hashlib.sha256(key.encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+class MessageDeduplicator:
+    """Fingerprints claimed by the folders of one search (shared by worker threads)"""
+
+    def __init__(self, ledger=None, account=None, match=None):
+        """
+        Args:
+            ledger: Optional ScanLedger with fingerprints of earlier searches
+            account: Account key in the ledger
+            match: Callable(text) -> bool checking stored PDF text (e.g. for
+                   the NIP); required for the ledger to be consulted
+        """
+        self.ledger = ledger
+        self.account = account
+        self.match = match
+        self.skipped = 0
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def claim(self, fingerprint, folder, uid):
+        """
+        Claim a message for scanning.
+
+        The first (folder, uid) presenting a fingerprint owns it; the same
+        message may claim again (e.g. rescanned after a lost connection).
+
+        Args:
+            fingerprint: Value of message_fingerprint() (None is never a duplicate)
+            folder: Folder of the message
+            uid: Message UID
+
+        Returns:
+            bool: False if the message is a copy that need not be scanned
+        """
+        if fingerprint is None:
+            return True
+        owner = (folder, str(uid))
+        with self._lock:
+            current = self._owners.get(fingerprint)
+            if current is None:
+                if self._known_not_matching(fingerprint):
+                    current = self._owners[fingerprint] = _NO_MATCH
+                else:
+                    self._owners[fingerprint] = owner
+                    return True
+            if current == owner:
+                return True
+            self.skipped += 1
+            return False
+
+    def claim_callback(self, folder):
+        """Return callable(fingerprint, uid) claiming messages of one folder (see iter_pdf_messages)."""
+        return lambda fingerprint, uid: self.claim(fingerprint, folder, uid)
+
+    def _known_not_matching(self, fingerprint):
+        if self.ledger is None or self.match is None:
+            return False
+        try:
+            return self.ledger.fingerprint_matches(self.account, fingerprint, self.match) is False
+        except Exception as e:
+            log(f"Could not look up message fingerprint in ledger: {e}", level="WARNING")
+            return False
@@ -0,0 +1,238 @@
+"""
+Parallel multi-connection IMAP scanning
+
+A single IMAP session is bound by round trips and per-connection throughput,
+while most servers allow 10-15 concurrent sessions per account. This module
+splits the UID list of a folder into work chunks and scans them over several
+authenticated connections at once, each running iter_pdf_messages().
+
+Workers pull chunks from a shared queue, so a connection that cannot be
+opened (server session limit) or drops mid-scan just leaves its work to the
+others. Hits are numbered through a shared ScanResultSink, which keeps the
+found_count-based file naming unique across threads.
+"""
+import imaplib
+import queue
+import threading
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+from gui.imap_search_components.batch_sizer import make_batch_sizer
+from gui.imap_search_components.fetch_pipeline import DEFAULT_MAX_IN_FLIGHT
+from gui.imap_search_components.imap_scanner import iter_pdf_messages
+from gui.imap_search_components.sync_state import quote_mailbox
+
+# Default number of concurrent IMAP connections
+DEFAULT_NUM_CONNECTIONS = 4
+
+# Upper bound accepted from the UI (typical per-account server limit)
+MAX_NUM_CONNECTIONS = 15
+
+# Bounds for the number of UIDs handed to a worker at a time
+MIN_WORK_CHUNK_SIZE = 50
+MAX_WORK_CHUNK_SIZE = 500
+
+
+class ScanResultSink:
+    """Thread-safe hit counter shared by scanner workers"""
+
+    def __init__(self, found_count=0):
+        self._lock = threading.Lock()
+        self.found_count = found_count
+        self._handled_uids = set()
+
+    def next_found_number(self):
+        """Reserve the next hit number (used as file name prefix)."""
+        with self._lock:
+            self.found_count += 1
+            return self.found_count
+
+    def mark_handled(self, uid):
+        """Record that the message with this UID has been fully handled."""
+        with self._lock:
+            self._handled_uids.add(str(uid))
+
+    def unhandled(self, uids):
+        """Return the UIDs from the list that have not been handled yet."""
+        with self._lock:
+            return [uid for uid in uids if str(uid) not in self._handled_uids]
+
+
+def work_chunk_size(total, num_connections):
+    """
+    Pick the number of UIDs per work chunk.
+
+    About four chunks per connection balance the load when some workers are
+    slower (large PDFs) while keeping chunks big enough for efficient FETCHes.
+    """
+    per_chunk = -(-total // (max(1, num_connections) * 4))
+    return max(MIN_WORK_CHUNK_SIZE, min(MAX_WORK_CHUNK_SIZE, per_chunk))
+
+
+def _close_connection(imap_conn):
+    """Close the selected folder and log out, ignoring errors."""
+    try:
+        imap_conn.close()
+    except Exception:
+        pass
+    try:
+        imap_conn.logout()
+    except Exception:
+        pass
+
+
+def scan_uids_parallel(connect, folder, uids, handle_message, num_connections=DEFAULT_NUM_CONNECTIONS,
+                       should_stop=None, accept=None, progress_callback=None,
+                       batch_size=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                       chunk_size=None, sink=None, chunk_done=None, use_envelope=False, claim=None):
+    """
+    Scan UIDs of one folder for PDF attachments over several IMAP connections.
+
+    Args:
+        connect: Callable returning a new logged-in IMAP connection
+        folder: Folder to select (read-only) on every connection
+        uids: List of UIDs (as strings) to scan
+        handle_message: Callable(imap_conn, pdf_message) run in the worker
+                        thread for every message yielded by iter_pdf_messages;
+                        imap_conn is the worker's connection (for on-demand
+                        full message download)
+        num_connections: Maximum number of concurrent connections
+        should_stop: Optional callable returning True to stop scanning
+        accept: Optional callable(headers) -> bool (see iter_pdf_messages)
+        progress_callback: Optional callable(processed, total), called from
+                           worker threads
+        batch_size: Fixed number of UIDs per triage FETCH, or None to adapt
+                    to throughput and round-trip time
+        max_in_flight: Number of FETCH commands kept in flight per connection
+        chunk_size: Number of UIDs handed to a worker at a time (default:
+                    about four chunks per connection, see work_chunk_size)
+        sink: Optional ScanResultSink shared with handle_message (hit numbering)
+        chunk_done: Optional callable(uids) called from the worker threads with
+                    UIDs that have been scanned completely (checkpoints)
+        use_envelope: Triage with ENVELOPE instead of the header fields
+                      (see iter_pdf_messages)
+        claim: Optional callable(fingerprint, uid) -> bool skipping copies of
+               messages scanned in another folder (see iter_pdf_messages)
+
+    Returns:
+        dict: {
+            'connections': number of connections that took part,
+            'processed': number of triaged messages,
+            'unscanned': number of UIDs left when all workers failed,
+            'failed': UIDs that could not be scanned (see iter_pdf_messages),
+            'errors': list of error messages
+        }
+
+    Raises:
+        Exception: The connection error if no connection could be opened
+    """
+    should_stop = should_stop or (lambda: False)
+    total = len(uids)
+    sink = sink if sink is not None else ScanResultSink()
+    stats = {'connections': 0, 'processed': 0, 'failed': [], 'errors': []}
+    stats_lock = threading.Lock()
+    connect_errors = []
+
+    chunk_size = max(1, chunk_size or work_chunk_size(total, num_connections))
+    work = queue.Queue()
+    for i in range(0, total, chunk_size):
+        work.put(uids[i:i + chunk_size])
+
+    def report_progress():
+        with stats_lock:
+            stats['processed'] += 1
+            processed = min(stats['processed'], total)
+        if progress_callback:
+            progress_callback(processed, total)
+
+    def report_failed(failed_uids):
+        with stats_lock:
+            stats['failed'].extend(failed_uids)
+
+    def worker(index):
+        try:
+            imap_conn = connect()
+            status, _ = imap_conn.select(quote_mailbox(folder), readonly=True)
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"cannot select folder {folder}")
+        except Exception as e:
+            log(f"IMAP worker {index} could not connect: {e}", level="WARNING")
+            with stats_lock:
+                connect_errors.append(e)
+            return
+
+        with stats_lock:
+            stats['connections'] += 1
+        # Batch size adapts per connection and carries over between chunks
+        sizer = make_batch_sizer(batch_size)
+
+        try:
+            while not should_stop():
+                try:
+                    chunk = work.get_nowait()
+                except queue.Empty:
+                    break
+
+                work_chunk = chunk
+                chunk = sink.unhandled(chunk)
+                if chunk_done and len(chunk) < len(work_chunk):
+                    # Messages handled before a lost connection count as scanned
+                    pending = {str(uid) for uid in chunk}
+                    chunk_done([uid for uid in work_chunk if str(uid) not in pending])
+                try:
+                    pdf_messages = iter_pdf_messages(
+                        imap_conn, chunk,
+                        sizer=sizer,
+                        should_stop=should_stop,
+                        accept=accept,
+                        progress_callback=lambda processed, chunk_total: report_progress(),
+                        max_in_flight=max_in_flight,
+                        window_done=chunk_done,
+                        use_envelope=use_envelope,
+                        claim=claim,
+                        failed=report_failed
+                    )
+                    for pdf_message in pdf_messages:
+                        try:
+                            handle_message(imap_conn, pdf_message)
+                        except Exception as e:
+                            log(f"Error handling message UID {pdf_message['uid']}: {e}", level="WARNING")
+                        sink.mark_handled(pdf_message['uid'])
+                except (imaplib.IMAP4.abort, OSError) as e:
+                    # Connection lost - hand the rest of the chunk to other workers
+                    log(f"IMAP worker {index} lost connection: {e}", level="WARNING")
+                    with stats_lock:
+                        stats['errors'].append(str(e))
+                    work.put(work_chunk)
+                    return
+        finally:
+            _close_connection(imap_conn)
+
+    worker_count = max(1, min(int(num_connections), MAX_NUM_CONNECTIONS, work.qsize() or 1))
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(worker_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if stats['connections'] == 0 and connect_errors:
+        raise connect_errors[0]
+
+    unscanned = 0
+    if not should_stop():
+        while True:
+            try:
+                unscanned += len(work.get_nowait())
+            except queue.Empty:
+                break
+    if unscanned:
+        log(f"{unscanned} messages in {folder} left unscanned (all connections failed)", level="ERROR")
+
+    stats['unscanned'] = unscanned
+    return stats
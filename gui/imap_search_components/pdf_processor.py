@@ -192,6 +192,65 @@ class PDFProcessor:
         
         return {'found': False, 'matches': [], 'method': 'not_found'}
     
+    def extract_text(self, pdf_content, attachment_name=""):
+        """
+        Extract the text of a PDF for storing in the scan ledger
+        
+        Uses text extraction (pdfplumber); OCR is used when the configured
+        engine is OCR or the PDF has no text layer.
+        
+        Args:
+            pdf_content: PDF bytes
+            attachment_name: Name of the attachment for logging
+            
+        Returns:
+            str: Extracted text (empty string if nothing could be extracted)
+        """
+        if not pdf_content or self.search_cancelled:
+            return ""
+        
+        resolved_engine = self._get_configured_engine()
+        text = ""
+        try:
+            if resolved_engine != 'ocr' and HAVE_PDFPLUMBER:
+                with io.BytesIO(pdf_content) as pdf_stream:
+                    with pdfplumber.open(pdf_stream) as pdf:
+                        for page in pdf.pages:
+                            if self.search_cancelled:
+                                break
+                            page_text = page.extract_text()
+                            if page_text:
+                                text += page_text + "\n"
+            
+            if not text.strip() and HAVE_OCR and not self.search_cancelled:
+                text = self._ocr_text(pdf_content, attachment_name)
+        except Exception as e:
+            log(f"Error extracting text from {attachment_name}: {str(e)}")
+        
+        return text
+    
+    def search_in_text(self, text, search_text):
+        """
+        Search for text in already extracted PDF text
+        
+        Args:
+            text: Extracted PDF text (e.g. from extract_text() or the scan ledger)
+            search_text: Text to search for (case-insensitive)
+            
+        Returns:
+            dict: Same structure as search_in_pdf_attachment()
+        """
+        search_text_lower = search_text.lower().strip()
+        if not search_text_lower:
+            return {'found': False, 'matches': [], 'method': 'empty_search'}
+        if not text or not text.strip():
+            return {'found': False, 'matches': [], 'method': 'no_content'}
+        
+        matches = self._extract_matches(text, search_text_lower)
+        if search_text_lower in text.lower() or matches:
+            return {'found': True, 'matches': matches, 'method': 'stored_text'}
+        return {'found': False, 'matches': [], 'method': 'not_found'}
+    
     def _search_with_text_extraction(self, pdf_content, search_text_lower, attachment_name):
         """Try to extract text directly from PDF and search"""
         if not HAVE_PDFPLUMBER:
@@ -237,6 +296,48 @@ class PDFProcessor:
         
         return {'found': False, 'matches': [], 'method': 'text_extraction_failed'}
     
+    def _ocr_text(self, pdf_content, attachment_name):
+        """Convert PDF pages to images and return the OCR text"""
+        # Try to detect poppler path (Windows-specific, but won't break on Linux)
+        poppler_path = None
+        if sys.platform == 'win32':
+            possible_paths = [
+                r"C:\poppler\Library\bin",
+                r"C:\Program Files\poppler\Library\bin",
+            ]
+            for path in possible_paths:
+                if os.path.exists(path):
+                    poppler_path = path
+                    break
+        
+        # Convert PDF to images
+        if poppler_path:
+            images = convert_from_bytes(pdf_content, dpi=200, poppler_path=poppler_path)
+        else:
+            images = convert_from_bytes(pdf_content, dpi=200)
+        
+        all_ocr_text = ""
+        
+        # Single-threaded OCR processing
+        for page_num, image in enumerate(images):
+            if self.search_cancelled:
+                break
+            
+            log(f"OCR strona {page_num + 1}/{len(images)} z PDF {attachment_name}")
+            
+            # Perform OCR - try Polish and English
+            try:
+                page_text = pytesseract.image_to_string(image, lang='pol+eng')
+            except Exception as e:
+                # Fallback to English only if Polish not available
+                log(f"Fallback to English OCR: {e}")
+                page_text = pytesseract.image_to_string(image, lang='eng')
+            
+            if page_text:
+                all_ocr_text += page_text + "\n"
+        
+        return all_ocr_text
+    
     def _search_with_ocr(self, pdf_content, search_text_lower, attachment_name):
         """Use OCR to extract text from PDF and search"""
         if not HAVE_OCR:
@@ -246,43 +347,7 @@ class PDFProcessor:
             log(f"Executing OCR using pytesseract for {attachment_name}")
             log(f"Próba OCR z PDF: {attachment_name}")
             
-            # Try to detect poppler path (Windows-specific, but won't break on Linux)
-            poppler_path = None
-            if sys.platform == 'win32':
-                possible_paths = [
-                    r"C:\poppler\Library\bin",
-                    r"C:\Program Files\poppler\Library\bin",
-                ]
-                for path in possible_paths:
-                    if os.path.exists(path):
-                        poppler_path = path
-                        break
-            
-            # Convert PDF to images
-            if poppler_path:
-                images = convert_from_bytes(pdf_content, dpi=200, poppler_path=poppler_path)
-            else:
-                images = convert_from_bytes(pdf_content, dpi=200)
-            
-            all_ocr_text = ""
-            
-            # Single-threaded OCR processing
-            for page_num, image in enumerate(images):
-                if self.search_cancelled:
-                    break
-                
-                log(f"OCR strona {page_num + 1}/{len(images)} z PDF {attachment_name}")
-                
-                # Perform OCR - try Polish and English
-                try:
-                    page_text = pytesseract.image_to_string(image, lang='pol+eng')
-                except Exception as e:
-                    # Fallback to English only if Polish not available
-                    log(f"Fallback to English OCR: {e}")
-                    page_text = pytesseract.image_to_string(image, lang='eng')
-                
-                if page_text:
-                    all_ocr_text += page_text + "\n"
+            all_ocr_text = self._ocr_text(pdf_content, attachment_name)
             
             if all_ocr_text.strip():
                 # Search for the text (case-insensitive)
@@ -0,0 +1,299 @@
+"""
+Resumable IMAP scans: UID checkpoints and reconnect with backoff
+
+A long scan stores a checkpoint per (account, folder): the highest UID below
+which every message of the scan has been processed, with the hit count so
+far. UIDs only grow, so a scan interrupted by a dropped connection or by the
+user (Przerwij) continues from the checkpoint: the same search run again
+skips UIDs <= the checkpoint. A checkpoint applies only to the same search
+(NIP and date range) and the same UIDVALIDITY. Folders finished before the
+interruption keep their checkpoint too; all checkpoints of a search are
+removed once the whole search completes.
+
+Parallel workers finish chunks out of order, so UidWatermark advances the
+checkpoint only over an unbroken run of processed UIDs; UIDs processed above
+it are stored as a range-compressed set.
+"""
+import imaplib
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from gui.imap_search_components.uid_set import UidSet
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+CHECKPOINT_FILE = Path.home() / '.poczta_faktury_scan_checkpoints.json'
+
+# Minimum seconds between checkpoint file writes during a scan
+SAVE_INTERVAL = 10
+
+# Reconnect attempts after a lost connection, with exponential backoff
+MAX_RECONNECT_ATTEMPTS = 6
+INITIAL_RECONNECT_DELAY = 2
+MAX_RECONNECT_DELAY = 120
+
+# Lost connections tolerated within one folder scan
+MAX_RECONNECTS_PER_SCAN = 10
+
+
+def scan_signature(nip, cutoff_dt=None, end_dt=None):
+    """
+    Identify a search whose checkpoints can be resumed.
+
+    Args:
+        nip: NIP number searched for
+        cutoff_dt: Start datetime (inclusive) or None
+        end_dt: End datetime (exclusive) or None
+
+    Returns:
+        str: e.g. '1234567890|2025-01-01|'
+    """
+    def fmt(dt):
+        return dt.date().isoformat() if dt else ''
+    return f"{nip}|{fmt(cutoff_dt)}|{fmt(end_dt)}"
+
+
+def uids_after(uids, last_uid):
+    """Return the UIDs > last_uid (UidSet or list; all of them when last_uid is None)."""
+    if last_uid is None:
+        return uids
+    if hasattr(uids, 'from_uid'):
+        return uids.from_uid(int(last_uid) + 1)
+    return [uid for uid in uids if int(uid) > int(last_uid)]
+
+
+def is_connection_error(error):
+    """Check if an exception means the connection is gone (and a reconnect may help)."""
+    return isinstance(error, (imaplib.IMAP4.abort, OSError, EOFError))
+
+
+def reconnect_with_backoff(connect, should_stop=None, max_attempts=MAX_RECONNECT_ATTEMPTS,
+                           initial_delay=INITIAL_RECONNECT_DELAY, max_delay=MAX_RECONNECT_DELAY,
+                           sleep=time.sleep):
+    """
+    Open a new connection, retrying with exponential backoff.
+
+    Args:
+        connect: Callable returning a new connection (logged in, folder selected)
+        should_stop: Optional callable returning True to give up waiting
+        max_attempts: Number of connection attempts
+        initial_delay: Seconds before the second attempt (doubled each time)
+        max_delay: Upper bound of the delay
+        sleep: Sleep function (for tests)
+
+    Returns:
+        The connection, or None if should_stop() became True
+
+    Raises:
+        Exception: The last connection error after max_attempts failures
+    """
+    should_stop = should_stop or (lambda: False)
+    delay = initial_delay
+    last_error = None
+    for attempt in range(1, max_attempts + 1):
+        if should_stop():
+            return None
+        try:
+            return connect()
+        except Exception as e:
+            last_error = e
+            log(f"Reconnect attempt {attempt}/{max_attempts} failed: {e}", level="WARNING")
+        if attempt == max_attempts:
+            break
+        deadline = time.monotonic() + delay
+        while not should_stop() and time.monotonic() < deadline:
+            sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, max_delay)
+    raise last_error
+
+
+class UidWatermark:
+    """Highest UID below which every UID of a scan has been processed"""
+
+    def __init__(self, uids):
+        """
+        Args:
+            uids: UIDs of the scan in ascending order (list or UidSet)
+        """
+        self._uids = uids
+        self._next = 0
+        self._done = set()
+        self._lock = threading.Lock()
+        self.value = None
+
+    def mark_done(self, uids):
+        """
+        Mark UIDs as processed.
+
+        Args:
+            uids: Iterable of UIDs (str or int)
+
+        Returns:
+            int: Current watermark, or None if the first UID is not done yet
+        """
+        with self._lock:
+            self._done.update(int(uid) for uid in uids)
+            while self._next < len(self._uids):
+                uid = int(self._uids[self._next])
+                if uid not in self._done:
+                    break
+                self._done.discard(uid)
+                self.value = uid
+                self._next += 1
+            return self.value
+
+    def done_above(self):
+        """Return the processed UIDs above the watermark (sorted ints)."""
+        with self._lock:
+            return sorted(self._done)
+
+
+class ScanCheckpointStore:
+    """JSON file with the checkpoint of interrupted scans per (account, folder)"""
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self):
+        try:
+            if self.path.exists():
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    return data
+        except Exception as e:
+            log(f"Could not read scan checkpoints (starting fresh): {e}", level="WARNING")
+        return {}
+
+    def get(self, account, folder, signature, uidvalidity):
+        """
+        Return the checkpoint of a folder if it belongs to the same search.
+
+        Returns:
+            dict: {'last_uid': int or None, 'done': sequence set of UIDs
+                  processed above last_uid, 'found_count': int, ...} or None
+        """
+        with self._lock:
+            checkpoint = self._data.get(account, {}).get(folder)
+            if (not checkpoint or checkpoint.get('signature') != signature
+                    or checkpoint.get('uidvalidity') != uidvalidity):
+                return None
+            return dict(checkpoint)
+
+    def update(self, account, folder, signature, uidvalidity, last_uid, found_count, done_uids=()):
+        """Record progress of a scan."""
+        with self._lock:
+            self._data.setdefault(account, {})[folder] = {
+                'signature': signature,
+                'uidvalidity': uidvalidity,
+                'last_uid': None if last_uid is None else int(last_uid),
+                'done': str(UidSet(done_uids)),
+                'found_count': found_count,
+                'updated': datetime.now().isoformat(timespec='seconds'),
+            }
+
+    def clear_search(self, account, signature):
+        """Remove the checkpoints of a completed search."""
+        with self._lock:
+            folders = self._data.get(account, {})
+            for folder in [f for f, checkpoint in folders.items() if checkpoint.get('signature') == signature]:
+                del folders[folder]
+            if not folders:
+                self._data.pop(account, None)
+
+    def resume_found_count(self, account, signature):
+        """Highest hit count stored by checkpoints of a search (continues file numbering)."""
+        with self._lock:
+            counts = [checkpoint.get('found_count') or 0
+                      for checkpoint in self._data.get(account, {}).values()
+                      if checkpoint.get('signature') == signature]
+        return max(counts, default=0)
+
+    def save(self):
+        """Write the checkpoint file."""
+        with self._lock:
+            try:
+                with open(self.path, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, indent=2, ensure_ascii=False)
+            except Exception as e:
+                log(f"Could not save scan checkpoints: {e}", level="WARNING")
+
+
+class FolderCheckpoint:
+    """Checkpoint of one folder scan, written to the store at most every SAVE_INTERVAL seconds"""
+
+    def __init__(self, store, account, folder, signature, uidvalidity, save_interval=SAVE_INTERVAL):
+        self.store = store
+        self.account = account
+        self.folder = folder
+        self.signature = signature
+        self.uidvalidity = uidvalidity
+        self.save_interval = save_interval
+        previous = store.get(account, folder, signature, uidvalidity)
+        self.resume_uid = previous['last_uid'] if previous else None
+        self.done_uids = UidSet.parse(previous.get('done') or '') if previous else UidSet()
+        self.found_count = previous['found_count'] if previous else 0
+        self._last_save = time.monotonic()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @property
+    def resumed(self):
+        """True if an interrupted scan is being continued."""
+        return self.resume_uid is not None or bool(self.done_uids)
+
+    def is_pending(self, uid):
+        """Check if a UID still has to be scanned."""
+        return ((self.resume_uid is None or int(uid) > self.resume_uid)
+                and uid not in self.done_uids)
+
+    def remaining(self, uids):
+        """Drop UIDs processed before the interruption (UidSet or list)."""
+        uids = uids_after(uids, self.resume_uid)
+        if not self.done_uids:
+            return uids
+        if isinstance(uids, UidSet):
+            return uids.difference(self.done_uids)
+        return [uid for uid in uids if uid not in self.done_uids]
+
+    def advance(self, last_uid, found_count, done_uids=()):
+        """
+        Record progress of the scan.
+
+        Args:
+            last_uid: Every UID up to this one has been processed (or None)
+            found_count: Hits so far
+            done_uids: UIDs processed above last_uid
+        """
+        if last_uid is None and not done_uids:
+            return
+        # UIDs processed by the interrupted run stay processed
+        done_uids = UidSet(list(done_uids) + [uid for uid in self.done_uids
+                                              if last_uid is None or int(uid) > last_uid])
+        with self._lock:
+            self.store.update(self.account, self.folder, self.signature, self.uidvalidity,
+                              last_uid, found_count, done_uids)
+            self._dirty = True
+            if time.monotonic() - self._last_save < self.save_interval:
+                return
+            self._last_save = time.monotonic()
+            self._dirty = False
+        self.store.save()
+
+    def flush(self):
+        """Write pending progress (after a stop or a lost connection)."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, False
+        if dirty:
+            self.store.save()
@@ -0,0 +1,402 @@
+"""
+Persistent ledger of scanned messages
+
+A local SQLite database remembers every message whose PDF attachments have
+been examined, keyed by (account, folder, UIDVALIDITY, UID). For each PDF
+part it stores the content hash; the extracted text (zlib-compressed) and the
+NIP-like tokens found in it are stored once per hash, so the same invoice
+attached to several messages is extracted only once.
+
+A later search - also for a different NIP - answers already scanned messages
+from the stored text and downloads only the messages that match (to save the
+files) or were never scanned. POP3 mailboxes use folder 'INBOX', UIDVALIDITY
+0 and the UIDL string as UID.
+
+Message fingerprints (see message_dedup) are stored with the hashes of the
+PDFs they carried, so copies of a scanned message in other folders can be
+answered without downloading them.
+
+Hits are recorded per NIP, so an incremental search (POP3 by UIDL) does not
+download again messages whose invoices have already been saved.
+
+A PDF whose text extraction returned nothing (a scan without a text layer, an
+engine failure) is not a final answer - another PDF engine or OCR may read
+it. Such messages are not recorded as scanned and empty stored texts count as
+unknown, so they are examined again in later searches.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+from gui.imap_search_components.uid_set import UidSet
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+LEDGER_FILE = Path.home() / '.poczta_faktury_ledger.sqlite3'
+
+# Maximum number of SQL parameters per IN (...) query
+_QUERY_CHUNK_SIZE = 500
+
+# NIP candidates: 10 digits, optionally grouped 3-3-2-2 or 3-2-2-3 with '-' or ' '
+_NIP_TOKEN_RE = re.compile(
+    r'(?<!\d)(\d{3}[- ]?\d{3}[- ]?\d{2}[- ]?\d{2}|\d{3}[- ]?\d{2}[- ]?\d{2}[- ]?\d{3})(?!\d)'
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    uid TEXT NOT NULL,
+    pdf_count INTEGER NOT NULL,
+    scanned_at TEXT NOT NULL,
+    PRIMARY KEY (account, folder, uidvalidity, uid)
+);
+CREATE TABLE IF NOT EXISTS parts (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    uid TEXT NOT NULL,
+    part_index INTEGER NOT NULL,
+    filename TEXT,
+    sha256 TEXT NOT NULL,
+    size INTEGER,
+    PRIMARY KEY (account, folder, uidvalidity, uid, part_index)
+);
+CREATE TABLE IF NOT EXISTS pdf_texts (
+    sha256 TEXT PRIMARY KEY,
+    text_z BLOB NOT NULL,
+    nip_tokens TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hits (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    uid TEXT NOT NULL,
+    nip TEXT NOT NULL,
+    saved_at TEXT NOT NULL,
+    PRIMARY KEY (account, folder, uidvalidity, uid, nip)
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    account TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    sha256s TEXT NOT NULL,
+    PRIMARY KEY (account, fingerprint)
+);
+"""
+
+
+def pdf_hash(pdf_data):
+    """Return the SHA-256 hex digest of decoded PDF bytes."""
+    return hashlib.sha256(pdf_data or b'').hexdigest()
+
+
+def extract_nip_tokens(text):
+    """
+    Find NIP-like numbers in extracted PDF text.
+
+    Returns:
+        list: Sorted unique 10-digit strings (separators removed)
+    """
+    return sorted({re.sub(r'\D', '', match) for match in _NIP_TOKEN_RE.findall(text or '')})
+
+
+class ScanLedger:
+    """SQLite ledger of messages whose PDF attachments have been examined"""
+
+    def __init__(self, path=LEDGER_FILE):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        # Shared by worker threads; every access goes through self._lock
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+
+    def scanned_uids(self, account, folder, uidvalidity, uids):
+        """
+        Return the subset of uids already recorded in the ledger.
+
+        Args:
+            account: Account key (e.g. email address)
+            folder: Folder name
+            uidvalidity: Folder UIDVALIDITY (0 for POP3)
+            uids: Iterable of UIDs
+
+        Returns:
+            set: UIDs (as str) that have been scanned
+        """
+        uids = [str(uid) for uid in uids]
+        found = set()
+        with self._lock:
+            for i in range(0, len(uids), _QUERY_CHUNK_SIZE):
+                chunk = uids[i:i + _QUERY_CHUNK_SIZE]
+                rows = self._db.execute(
+                    f"SELECT uid FROM messages WHERE account = ? AND folder = ? AND uidvalidity = ?"
+                    f" AND uid IN ({','.join('?' * len(chunk))})",
+                    [account, folder, uidvalidity] + chunk
+                )
+                found.update(row[0] for row in rows)
+        return found
+
+    def scanned_uid_set(self, account, folder, uidvalidity):
+        """
+        Return all numeric UIDs recorded for a folder as a UidSet.
+
+        Used for range-based set difference against large IMAP search results
+        instead of one IN (...) query per 500 UIDs.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uid FROM messages WHERE account = ? AND folder = ? AND uidvalidity = ?",
+                (account, folder, uidvalidity)
+            )
+            return UidSet(row[0] for row in rows if row[0].isdigit())
+
+    def matching_uids(self, account, folder, uidvalidity, uids, match):
+        """
+        Return the scanned UIDs having a PDF part whose stored text matches.
+
+        Args:
+            account: Account key
+            folder: Folder name
+            uidvalidity: Folder UIDVALIDITY (0 for POP3)
+            uids: Iterable of scanned UIDs to check
+            match: Callable(text) -> bool, e.g. a NIP search
+
+        Returns:
+            set: Matching UIDs (as str), including those with a PDF whose
+                 text is unknown
+        """
+        uids = [str(uid) for uid in uids]
+        uids_by_hash = {}
+        with self._lock:
+            for i in range(0, len(uids), _QUERY_CHUNK_SIZE):
+                chunk = uids[i:i + _QUERY_CHUNK_SIZE]
+                rows = self._db.execute(
+                    f"SELECT uid, sha256 FROM parts WHERE account = ? AND folder = ? AND uidvalidity = ?"
+                    f" AND uid IN ({','.join('?' * len(chunk))})",
+                    [account, folder, uidvalidity] + chunk
+                )
+                for uid, sha256 in rows:
+                    uids_by_hash.setdefault(sha256, set()).add(uid)
+
+        matching = set()
+        for sha256, hash_uids in uids_by_hash.items():
+            text = self.cached_text(sha256)
+            # Unknown text (nothing extracted) cannot rule the NIP out
+            if text is None or match(text):
+                matching.update(hash_uids)
+        return matching
+
+    def cached_text(self, sha256):
+        """Return the stored extracted text of a PDF with this hash, or None (also for empty text)."""
+        with self._lock:
+            row = self._db.execute("SELECT text_z FROM pdf_texts WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None:
+            return None
+        try:
+            text = zlib.decompress(row[0]).decode('utf-8')
+        except (zlib.error, UnicodeDecodeError) as e:
+            log(f"Corrupt ledger text for {sha256}: {e}", level="WARNING")
+            return None
+        return text if text.strip() else None
+
+    def fingerprint_matches(self, account, fingerprint, match):
+        """
+        Check the stored PDF text of a message recorded under a fingerprint.
+
+        Args:
+            account: Account key
+            fingerprint: Message fingerprint (see message_dedup.message_fingerprint)
+            match: Callable(text) -> bool
+
+        Returns:
+            bool: Whether any PDF of the message matches, or None when the
+                  fingerprint or the text of one of its PDFs is unknown
+        """
+        with self._lock:
+            row = self._db.execute("SELECT sha256s FROM fingerprints WHERE account = ? AND fingerprint = ?",
+                                   (account, fingerprint)).fetchone()
+        if row is None:
+            return None
+        texts = [self.cached_text(sha256) for sha256 in row[0].split()]
+        if any(text is None for text in texts):
+            return None
+        return any(match(text) for text in texts)
+
+    def record_message(self, account, folder, uidvalidity, uid, parts, fingerprint=None):
+        """
+        Record a fully examined message and its PDF parts.
+
+        The text of PDFs is stored per hash; a message with a PDF whose text
+        could not be extracted is not recorded as scanned (see module docstring).
+
+        Args:
+            account: Account key
+            folder: Folder name
+            uidvalidity: Folder UIDVALIDITY (0 for POP3)
+            uid: Message UID (or POP3 UIDL)
+            parts: List of dicts {'filename', 'sha256', 'size', 'text'};
+                   empty for messages without PDF attachments
+            fingerprint: Optional message fingerprint to link to the PDF hashes
+        """
+        uid = str(uid)
+        scanned_at = datetime.now().isoformat(timespec='seconds')
+        final = all((part.get('text') or '').strip() for part in parts)
+        with self._lock:
+            try:
+                for part in parts:
+                    text = part.get('text') or ''
+                    if not text.strip():
+                        continue
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO pdf_texts (sha256, text_z, nip_tokens) VALUES (?, ?, ?)",
+                        (part['sha256'], zlib.compress(text.encode('utf-8')),
+                         ' '.join(extract_nip_tokens(text)))
+                    )
+                self._db.execute(
+                    "DELETE FROM parts WHERE account = ? AND folder = ? AND uidvalidity = ? AND uid = ?",
+                    (account, folder, uidvalidity, uid)
+                )
+                if not final:
+                    self._db.execute(
+                        "DELETE FROM messages WHERE account = ? AND folder = ? AND uidvalidity = ? AND uid = ?",
+                        (account, folder, uidvalidity, uid)
+                    )
+                    self._db.commit()
+                    return
+                self._db.executemany(
+                    "INSERT INTO parts (account, folder, uidvalidity, uid, part_index, filename, sha256, size)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(account, folder, uidvalidity, uid, index, part.get('filename'),
+                      part['sha256'], part.get('size')) for index, part in enumerate(parts)]
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO messages (account, folder, uidvalidity, uid, pdf_count, scanned_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (account, folder, uidvalidity, uid, len(parts), scanned_at)
+                )
+                if fingerprint and parts:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO fingerprints (account, fingerprint, sha256s) VALUES (?, ?, ?)",
+                        (account, fingerprint, ' '.join(part['sha256'] for part in parts))
+                    )
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db.rollback()
+                log(f"Could not record message {uid} in ledger: {e}", level="WARNING")
+
+    def record_hit(self, account, folder, uidvalidity, uid, nip):
+        """
+        Record that invoices with this NIP were saved from a message.
+
+        Args:
+            account: Account key
+            folder: Folder name
+            uidvalidity: Folder UIDVALIDITY (0 for POP3)
+            uid: Message UID (or POP3 UIDL)
+            nip: NIP searched for (separators are ignored)
+        """
+        saved_at = datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO hits (account, folder, uidvalidity, uid, nip, saved_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (account, folder, uidvalidity, str(uid), re.sub(r'\D', '', nip), saved_at)
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db.rollback()
+                log(f"Could not record hit of message {uid} in ledger: {e}", level="WARNING")
+
+    def saved_uids(self, account, folder, uidvalidity, nip):
+        """Return the UIDs (as str) invoices with this NIP were saved from."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uid FROM hits WHERE account = ? AND folder = ? AND uidvalidity = ? AND nip = ?",
+                (account, folder, uidvalidity, re.sub(r'\D', '', nip))
+            )
+            return {row[0] for row in rows}
+
+    def nip_tokens(self, sha256):
+        """Return the NIP-like tokens stored for a PDF hash (empty list if unknown)."""
+        with self._lock:
+            row = self._db.execute("SELECT nip_tokens FROM pdf_texts WHERE sha256 = ?", (sha256,)).fetchone()
+        return row[0].split() if row and row[0] else []
+
+
+def uids_to_scan(ledger, account, folder, uidvalidity, uids, match):
+    """
+    Drop UIDs the ledger can already answer without downloading.
+
+    Scanned messages whose stored text does not match are skipped; scanned
+    matches are kept (their PDFs must be downloaded to save them) and so are
+    messages never scanned or with a PDF whose text is unknown.
+
+    Args:
+        ledger: ScanLedger
+        account: Account key
+        folder: Folder name
+        uidvalidity: Folder UIDVALIDITY (0 for POP3)
+        uids: List of UIDs in scan order
+        match: Callable(text) -> bool
+
+    Returns:
+        tuple: (uids_to_scan, skipped_count) - a UidSet when uids is a UidSet
+    """
+    if isinstance(uids, UidSet):
+        scanned = uids & ledger.scanned_uid_set(account, folder, uidvalidity)
+        if not scanned:
+            return uids, 0
+        matching = ledger.matching_uids(account, folder, uidvalidity, scanned, match)
+        remaining = uids - (scanned - UidSet(matching))
+        return remaining, len(uids) - len(remaining)
+
+    scanned = ledger.scanned_uids(account, folder, uidvalidity, uids)
+    if not scanned:
+        return list(uids), 0
+    matching = ledger.matching_uids(account, folder, uidvalidity, scanned, match)
+    remaining = [uid for uid in uids if str(uid) not in scanned or str(uid) in matching]
+    return remaining, len(uids) - len(remaining)
+
+
+def unseen_uids(ledger, account, folder, uidvalidity, uids, nip, match):
+    """
+    Keep the UIDs an incremental search still has to download.
+
+    These are messages never scanned, plus scanned messages whose stored PDF
+    text matches and whose invoices have not been saved for this NIP yet.
+
+    Args:
+        ledger: ScanLedger
+        account: Account key
+        folder: Folder name
+        uidvalidity: Folder UIDVALIDITY (0 for POP3)
+        uids: List of UIDs (POP3: UIDLs) in scan order
+        nip: NIP searched for
+        match: Callable(text) -> bool
+
+    Returns:
+        tuple: (uids_to_download, skipped_count)
+    """
+    remaining, _ = uids_to_scan(ledger, account, folder, uidvalidity, uids, match)
+    saved = ledger.saved_uids(account, folder, uidvalidity, nip)
+    if saved:
+        remaining = [uid for uid in remaining if str(uid) not in saved]
+    return remaining, len(uids) - len(remaining)
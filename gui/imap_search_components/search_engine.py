@@ -9,9 +9,9 @@ Original files:
 This is a simplified implementation focusing on core search functionality.
 """
 import threading
+import time
 import re
 import email
-import email.utils
 from datetime import datetime, timedelta
 
 # Import logger from our local gui module
@@ -28,6 +28,33 @@ except ImportError:
     log("Warning: PDFProcessor not available, PDF search will be disabled")
     PDFProcessor = None
 
+from gui.imap_search_components.batch_sizer import AdaptiveBatchSizer
+from gui.imap_search_components.date_gate import local_naive
+from gui.imap_search_components.fetch_parser import parse_fetch_items
+from gui.imap_search_components.fetch_pipeline import DEFAULT_MAX_IN_FLIGHT, compress_uid_set
+from gui.imap_search_components.imap_scanner import iter_pdf_messages
+from gui.imap_search_components.sync_state import (
+    read_mailbox_state,
+    plan_incremental_scan,
+    filter_new_uids,
+)
+from gui.imap_search_components.scan_checkpoint import scan_signature
+from gui.imap_search_components.message_dedup import MessageDeduplicator
+from gui.imap_search_components.scan_ledger import pdf_hash, uids_to_scan
+from gui.imap_search_components.gmail_search import (
+    supports_gmail_extensions,
+    gmail_search_uids,
+    find_all_mail_folder,
+    GmailMessageDeduplicator,
+)
+from gui.imap_search_components.uid_set import UidSet
+from gui.imap_search_components.search_planner import (
+    MIN_PDF_MESSAGE_SIZE,
+    server_capabilities,
+    plan_imap_search,
+    run_search_plans,
+)
+
 
 # IMAP date formatting helper functions
 
@@ -108,10 +135,15 @@ def _normalize_date_range(criteria):
     return (None, None)
 
 
-def imap_search_uids_for_date_range(imap_conn, folder, date_from, date_to, extra_criteria=None):
+def imap_search_uids_for_date_range(imap_conn, folder, date_from, date_to, extra_criteria=None,
+                                    narrow=False, min_size=MIN_PDF_MESSAGE_SIZE, subject_keywords=None):
     """
     Perform server-side IMAP UID SEARCH with SINCE/BEFORE date criteria.
     
+    With narrow=True the search planner adds the filters the server supports
+    (LARGER, HEADER Content-Type, SUBJECT keywords, ESEARCH) and falls back
+    to the plain date search if the server rejects them.
+    
     IMAP date semantics:
     - SINCE <date>: Messages with internal date >= <date> (inclusive)
     - BEFORE <date>: Messages with internal date < <date> (exclusive)
@@ -126,9 +158,12 @@ def imap_search_uids_for_date_range(imap_conn, folder, date_from, date_to, extra
         date_from: Start date (datetime object, inclusive)
         date_to: End date (datetime object, inclusive)
         extra_criteria: Optional list of additional IMAP search criteria
+        narrow: Let the search planner add server-side filters
+        min_size: LARGER threshold for narrow searches (bytes)
+        subject_keywords: Optional subject keywords for narrow searches
         
     Returns:
-        list: List of UIDs (as strings) matching the criteria, or None on error
+        UidSet: UIDs matching the criteria, or None on error
     """
     try:
         # Select folder
@@ -156,6 +191,17 @@ def imap_search_uids_for_date_range(imap_conn, folder, date_from, date_to, extra
         if extra_criteria:
             search_parts.extend(extra_criteria)
         
+        if narrow:
+            plans = plan_imap_search(server_capabilities(imap_conn), search_parts, min_size=min_size,
+                                     content_type_filter=True, subject_keywords=subject_keywords)
+            log(f"Executing IMAP UID SEARCH in {folder} ({len(plans)} plan(s))")
+            uids, plan = run_search_plans(imap_conn, plans)
+            if uids is None:
+                log(f"IMAP UID SEARCH failed in {folder} for every plan", level="WARNING")
+                return None
+            log(f"Found {len(uids)} UIDs in {folder} using plan: {plan['description']}")
+            return uids
+        
         # Combine all criteria
         search_query = ' '.join(search_parts) if search_parts else 'ALL'
         
@@ -171,9 +217,9 @@ def imap_search_uids_for_date_range(imap_conn, folder, date_from, date_to, extra
         # Parse UIDs from response
         if not data or not data[0]:
             log(f"No messages found in {folder} matching criteria")
-            return []
+            return UidSet()
         
-        uids = data[0].decode('utf-8').split()
+        uids = UidSet.from_search_response(data[0])
         log(f"Found {len(uids)} UIDs in {folder} matching date range")
         
         return uids
@@ -193,12 +239,12 @@ def filter_uids_by_internaldate(imap_conn, folder, uids, date_from, date_to):
     Args:
         imap_conn: IMAP connection object
         folder: Folder name
-        uids: List of UIDs to filter
+        uids: List (or UidSet) of UIDs to filter
         date_from: Start date (datetime object, inclusive)
         date_to: End date (datetime object, inclusive)
         
     Returns:
-        list: Filtered list of UIDs matching the date range
+        list: Filtered list of UIDs matching the date range (UidSet for a UidSet)
     """
     if not uids:
         return []
@@ -212,59 +258,51 @@ def filter_uids_by_internaldate(imap_conn, folder, uids, date_from, date_to):
         
         filtered_uids = []
         
-        # Fetch INTERNALDATE in batches to avoid overwhelming the server
-        batch_size = 200
-        for i in range(0, len(uids), batch_size):
-            batch_uids = uids[i:i+batch_size]
-            uid_range = ','.join(batch_uids)
+        # Fetch INTERNALDATE in batches sized to the measured round-trip time
+        sizer = AdaptiveBatchSizer()
+        position = 0
+        batch_number = 0
+        while position < len(uids):
+            batch_uids = uids[position:position + sizer.size]
+            position += len(batch_uids)
+            batch_number += 1
+            uid_range = compress_uid_set(batch_uids)
             
             # Fetch INTERNALDATE for this batch
+            started = time.monotonic()
             status, data = imap_conn.uid('fetch', uid_range, '(INTERNALDATE)')
+            sizer.record(len(batch_uids), time.monotonic() - started)
             
             if status != 'OK':
-                log(f"Failed to fetch INTERNALDATE for batch {i//batch_size + 1}", level="WARNING")
+                log(f"Failed to fetch INTERNALDATE for batch {batch_number}", level="WARNING")
                 filtered_uids.extend(batch_uids)  # Include all from failed batch
                 continue
             
-            # Parse INTERNALDATE from each response
-            for response in data:
-                if not response or not isinstance(response, tuple):
+            for record in parse_fetch_items(data):
+                if record.uid is None:
                     continue
-                
-                response_str = response[0].decode('utf-8', errors='ignore')
-                
-                # Extract UID and INTERNALDATE
-                # Format: UID 123 (INTERNALDATE "15-Dec-2024 10:30:00 +0000")
-                uid_match = re.search(r'UID (\d+)', response_str)
-                date_match = re.search(r'INTERNALDATE "([^"]+)"', response_str)
-                
-                if not uid_match or not date_match:
+                uid = str(record.uid)
+                msg_date = record.internaldate
+                if msg_date is None:
+                    log(f"Could not parse INTERNALDATE for UID {uid}: {record.get('INTERNALDATE')}", level="WARNING")
+                    filtered_uids.append(uid)  # Include on parse error
                     continue
                 
-                uid = uid_match.group(1)
-                date_str = date_match.group(1)
+                # Compared in local time (the offset is converted, not dropped)
+                msg_date = local_naive(msg_date)
                 
-                # Parse INTERNALDATE
-                try:
-                    # INTERNALDATE format: "15-Dec-2024 10:30:00 +0000"
-                    msg_date = email.utils.parsedate_to_datetime(date_str)
-                    
-                    # Check if date is in range
-                    in_range = True
-                    if date_from and msg_date < date_from:
-                        in_range = False
-                    if date_to and msg_date > date_to:
-                        in_range = False
-                    
-                    if in_range:
-                        filtered_uids.append(uid)
-                        
-                except Exception as e:
-                    log(f"Error parsing INTERNALDATE for UID {uid}: {e}", level="WARNING")
-                    filtered_uids.append(uid)  # Include on parse error
+                # Check if date is in range
+                in_range = True
+                if date_from and msg_date < local_naive(date_from):
+                    in_range = False
+                if date_to and msg_date > local_naive(date_to):
+                    in_range = False
+                
+                if in_range:
+                    filtered_uids.append(uid)
         
         log(f"Client-side filtering: {len(filtered_uids)}/{len(uids)} UIDs match date range")
-        return filtered_uids
+        return UidSet(filtered_uids) if isinstance(uids, UidSet) else filtered_uids
         
     except Exception as e:
         log(f"Error in filter_uids_by_internaldate: {str(e)}", level="ERROR")
@@ -292,6 +330,24 @@ def search_messages(criteria, progress_callback=None):
             - 'range_1m': Search last 30 days (optional boolean flag)
             - 'range_3m': Search last 90 days (optional boolean flag)
             - 'range_6m': Search last 180 days (optional boolean flag)
+            - 'pipeline_depth': Number of FETCH commands kept in flight (default: 4)
+            - 'sync_state': SyncStateStore for incremental scans (optional); only
+              messages added since the last completed scan of a folder are checked
+            - 'ledger': ScanLedger (optional); messages scanned before are answered
+              from the stored PDF text and downloaded only when they match
+            - 'gmail_fast_path': Use X-GM-RAW search and X-GM-MSGID deduplication
+              when the server supports Gmail extensions (default: True)
+            - 'account': Account key for 'sync_state' and 'ledger' (e.g. email address)
+            - 'narrow_search': Let the server skip messages that cannot carry a PDF
+              (LARGER, HEADER Content-Type, ESEARCH - as supported; default: False,
+              since a PDF in a single-part or very small message would be missed)
+            - 'min_message_size': LARGER threshold in bytes (default: 1024)
+            - 'subject_keywords': Optional list of subject keywords (any matches)
+            - 'envelope_triage': Read Subject/From/Date/Message-ID from ENVELOPE
+              instead of downloading and parsing header fields (default: False)
+            - 'deduplicate': Scan copies of a message found in several folders
+              once, by Message-ID and PDF filenames/sizes; with 'ledger' also
+              across searches (default: False)
         progress_callback: Optional callback function(message, progress_percent)
         
     Returns:
@@ -317,6 +373,16 @@ def search_messages(criteria, progress_callback=None):
     folder_path = criteria.get('folder_path')
     excluded_folders = criteria.get('excluded_folders', '').split(',') if criteria.get('excluded_folders') else []
     cancel_check = criteria.get('_cancel_check', lambda: False)
+    pipeline_depth = criteria.get('pipeline_depth', DEFAULT_MAX_IN_FLIGHT)
+    sync_store = criteria.get('sync_state')
+    ledger = criteria.get('ledger')
+    account = criteria.get('account')
+    gmail_fast_path = criteria.get('gmail_fast_path', True) and supports_gmail_extensions(connection)
+    narrow_search = criteria.get('narrow_search', False)
+    min_message_size = criteria.get('min_message_size', MIN_PDF_MESSAGE_SIZE)
+    subject_keywords = criteria.get('subject_keywords')
+    envelope_triage = criteria.get('envelope_triage', False)
+    deduplicate = criteria.get('deduplicate', False)
     
     if not nip:
         log("Error: NIP not provided in search criteria")
@@ -348,6 +414,9 @@ def search_messages(criteria, progress_callback=None):
     else:
         log(f"Searching for NIP: {nip} (no date filter)")
     
+    # Incremental state is reused only by searches for the same NIP and date range
+    sync_signature = scan_signature(nip, date_from, date_to)
+    
     # Initialize results structure
     results = {
         'messages': [],
@@ -363,6 +432,26 @@ def search_messages(criteria, progress_callback=None):
     if PDFProcessor:
         pdf_processor = PDFProcessor()
     
+    # Copies in other folders (same Message-ID and PDF parts) are scanned once
+    dedup = None
+    if deduplicate:
+        if ledger is not None and account and pdf_processor:
+            dedup = MessageDeduplicator(ledger, account,
+                                        lambda text: pdf_processor.search_in_text(text, nip)['found'])
+        else:
+            dedup = MessageDeduplicator()
+    
+    # Gmail: one message appears in every label it has; scan it only once
+    gmail_dedup = GmailMessageDeduplicator() if gmail_fast_path else None
+    if gmail_fast_path:
+        log("Gmail extensions available - using X-GM-RAW search")
+        # X-GM-RAW before: is exclusive, date_to is the inclusive end of day
+        gmail_before = date_to + timedelta(microseconds=1) if date_to else None
+    
+    if narrow_search:
+        # Many servers announce ESEARCH and other extensions only after login
+        server_capabilities(connection, refresh=True)
+    
     try:
         # Determine folders to search
         folders_to_search = []
@@ -373,6 +462,7 @@ def search_messages(criteria, progress_callback=None):
             try:
                 status, folder_list = connection.list()
                 if status == 'OK':
+                    all_mail_folder = find_all_mail_folder(folder_list) if gmail_fast_path else None
                     for folder_info in folder_list:
                         if not folder_info:
                             continue
@@ -383,6 +473,10 @@ def search_messages(criteria, progress_callback=None):
                             folder_name = folder_match.group(1)
                             if folder_name not in excluded_folders:
                                 folders_to_search.append(folder_name)
+                    # All Mail holds every message, so labels add only duplicates after it
+                    if all_mail_folder in folders_to_search:
+                        folders_to_search.remove(all_mail_folder)
+                        folders_to_search.insert(0, all_mail_folder)
                 else:
                     # Fallback to INBOX only
                     folders_to_search = ['INBOX']
@@ -392,8 +486,6 @@ def search_messages(criteria, progress_callback=None):
         
         log(f"Searching in {len(folders_to_search)} folder(s): {folders_to_search}")
         
-        total_processed = 0
-        
         # Search each folder
         for folder_idx, folder in enumerate(folders_to_search):
             # Check for cancellation
@@ -402,16 +494,40 @@ def search_messages(criteria, progress_callback=None):
                 results['error'] = 'Wyszukiwanie przerwane przez użytkownika'
                 break
             
+            folder_progress = int((folder_idx / len(folders_to_search)) * 90)
             if progress_callback:
-                folder_progress = int((folder_idx / len(folders_to_search)) * 90)
                 progress_callback(f"Przeszukiwanie folderu: {folder}", folder_progress)
             
             log(f"Searching folder: {folder}")
             
+            # Incremental mode: read the folder state before searching, so
+            # messages arriving during the scan are picked up next time
+            folder_state = None
+            sync_plan = None
+            if sync_store is not None and account:
+                try:
+                    status, data = connection.select(folder, readonly=True)
+                    if status == 'OK':
+                        folder_state = read_mailbox_state(connection, folder)
+                        sync_plan = plan_incremental_scan(sync_store.get(account, folder), folder_state, nip,
+                                                          sync_signature)
+                        log(f"Incremental scan of {folder}: {sync_plan['mode']} ({sync_plan['reason']})")
+                except Exception as e:
+                    log(f"Could not read sync state of {folder}: {e}", level="WARNING")
+                
+                if sync_plan and sync_plan['mode'] == 'unchanged':
+                    results['folder_results'][folder] = {'total_checked': 0, 'matches_found': 0}
+                    continue
+            
             # Try server-side IMAP date search first
             uids = None
-            if date_from or date_to:
-                uids = imap_search_uids_for_date_range(connection, folder, date_from, date_to)
+            if gmail_fast_path:
+                uids = gmail_search_uids(connection, folder, date_from, gmail_before)
+            if uids is None and (date_from or date_to or narrow_search):
+                uids = imap_search_uids_for_date_range(
+                    connection, folder, date_from, date_to, narrow=narrow_search,
+                    min_size=min_message_size, subject_keywords=subject_keywords
+                )
             
             # If server-side search failed or no date filter, get all UIDs
             if uids is None:
@@ -420,7 +536,7 @@ def search_messages(criteria, progress_callback=None):
                     if status == 'OK':
                         status, data = connection.uid('search', None, 'ALL')
                         if status == 'OK' and data and data[0]:
-                            all_uids = data[0].decode('utf-8').split()
+                            all_uids = UidSet.from_search_response(data[0])
                             
                             # Apply client-side date filtering if needed
                             if date_from or date_to:
@@ -438,127 +554,144 @@ def search_messages(criteria, progress_callback=None):
                     log(f"Error searching folder {folder}: {e}", level="ERROR")
                     continue
             
+            if sync_plan and sync_plan['mode'] == 'incremental':
+                uids = filter_new_uids(uids, sync_plan['min_uid'])
+            
+            if gmail_dedup is not None:
+                uids = gmail_dedup.filter_new(connection, uids)
+            
+            # Ledger: skip messages already scanned whose stored PDF text does not match
+            ledger_uidvalidity = None
+            if ledger is not None and account and pdf_processor and uids:
+                try:
+                    ledger_uidvalidity = (folder_state or read_mailbox_state(connection, folder)).get('uidvalidity')
+                    if ledger_uidvalidity is not None:
+                        uids, skipped = uids_to_scan(
+                            ledger, account, folder, ledger_uidvalidity, uids,
+                            lambda text: pdf_processor.search_in_text(text, nip)['found']
+                        )
+                        if skipped:
+                            log(f"Ledger: skipping {skipped} already scanned messages in {folder}")
+                except Exception as e:
+                    log(f"Could not consult ledger for {folder}: {e}", level="WARNING")
+                    ledger_uidvalidity = None
+            
             if not uids:
                 log(f"No messages found in {folder} matching criteria")
+                if folder_state:
+                    sync_store.set(account, folder, folder_state, nip, sync_signature)
                 continue
             
             log(f"Processing {len(uids)} messages in {folder}")
             
-            # Process UIDs in batches to avoid memory/IO storms
-            batch_size = 200
+            # Triage and PDF section FETCH commands are pipelined (pipeline_depth
+            # in flight); batches adapt to throughput and are bounded by bytes
             messages_found = 0
             
-            for batch_idx in range(0, len(uids), batch_size):
-                # Check for cancellation
-                if cancel_check():
-                    log("Search cancelled by user during batch processing")
-                    break
-                
-                batch_uids = uids[batch_idx:batch_idx + batch_size]
-                uid_range = ','.join(batch_uids)
-                
-                try:
-                    # Fetch message headers and structure
-                    status, data = connection.uid('fetch', uid_range, '(BODY.PEEK[HEADER] BODYSTRUCTURE)')
-                    
-                    if status != 'OK':
-                        log(f"Failed to fetch batch {batch_idx//batch_size + 1} in {folder}", level="WARNING")
-                        continue
+            def report_progress(processed, total, folder=folder, folder_progress=folder_progress):
+                # Update progress periodically
+                if processed % 50 == 0 and progress_callback:
+                    progress = min(90, folder_progress + int((processed / total) * 10))
+                    progress_callback(f"Przetworzono {processed} wiadomości w {folder}", progress)
+            
+            failed_uids = []
+            pdf_messages = iter_pdf_messages(
+                connection, uids,
+                should_stop=cancel_check,
+                progress_callback=report_progress,
+                max_in_flight=pipeline_depth,
+                use_envelope=envelope_triage,
+                claim=dedup.claim_callback(folder) if dedup is not None else None,
+                failed=failed_uids.extend
+            )
+            
+            try:
+                for pdf_message in pdf_messages:
+                    msg = pdf_message['headers']
+                    msg_uid = pdf_message['uid']
                     
-                    # Process each message in the batch
-                    # IMAP can return mixed results, so we process each item individually
-                    for item in data:
-                        if not item or not isinstance(item, tuple) or len(item) < 2:
-                            continue
-                        
-                        total_processed += 1
+                    try:
+                        has_pdf = bool(pdf_message['attachments'])
+                        pdf_matches = []
+                        ledger_parts = []
+                        ledger_complete = True
                         
-                        # Update progress periodically
-                        if total_processed % 50 == 0 and progress_callback:
-                            progress = min(90, folder_progress + int((total_processed / len(uids)) * 10))
-                            progress_callback(f"Przetworzono {total_processed} wiadomości w {folder}", progress)
-                        
-                        # Parse message
-                        try:
-                            # item is a tuple: (header_line, header_data)
-                            raw_headers = item[1]
-                            msg = email.message_from_bytes(raw_headers)
-                            
-                            # Extract UID from header_line
-                            uid_match = re.search(r'UID (\d+)', item[0].decode('utf-8', errors='ignore'))
-                            msg_uid = uid_match.group(1) if uid_match else str(total_processed)
-                            
-                            # Check if message has PDF attachments (simplified check from BODYSTRUCTURE)
-                            # For now, we'll fetch full message if needed
-                            # TODO: More efficient attachment detection from BODYSTRUCTURE
-                            
-                            # Fetch full message to check attachments
-                            status, msg_data = connection.uid('fetch', msg_uid, '(BODY.PEEK[])')
-                            if status != 'OK' or not msg_data or not msg_data[0]:
-                                continue
+                        # Extract and search PDF if processor available
+                        if pdf_processor:
+                            for filename, pdf_content in pdf_message['attachments']:
+                                # Check for cancellation before processing PDF
+                                if cancel_check():
+                                    ledger_complete = False  # Incomplete - do not record
+                                    break
+                                
+                                try:
+                                    if not pdf_content:
+                                        continue
+                                    if ledger_uidvalidity is not None:
+                                        # Text is extracted once per PDF content and kept in the ledger
+                                        content_hash = pdf_hash(pdf_content)
+                                        text = ledger.cached_text(content_hash)
+                                        if text is None:
+                                            text = pdf_processor.extract_text(pdf_content, filename)
+                                        ledger_parts.append({
+                                            'filename': filename,
+                                            'sha256': content_hash,
+                                            'size': len(pdf_content),
+                                            'text': text,
+                                        })
+                                        result = pdf_processor.search_in_text(text, nip)
+                                    else:
+                                        result = pdf_processor.search_in_pdf_attachment(
+                                            pdf_content, nip, filename
+                                        )
+                                    if result.get('found'):
+                                        pdf_matches.extend(result.get('matches', []))
+                                except Exception as e:
+                                    log(f"Error processing PDF {filename}: {e}", level="WARNING")
+                                    ledger_complete = False
                             
-                            if isinstance(msg_data[0], tuple):
-                                full_msg = email.message_from_bytes(msg_data[0][1])
-                            else:
-                                continue
+                            if ledger_uidvalidity is not None and ledger_complete:
+                                ledger.record_message(account, folder, ledger_uidvalidity, msg_uid, ledger_parts,
+                                                      fingerprint=pdf_message.get('fingerprint'))
+                        
+                        # If PDF found with NIP match, add to results
+                        if pdf_matches:
+                            message_id = msg.get('Message-ID', msg_uid)
                             
-                            # Look for PDF attachments
-                            has_pdf = False
-                            pdf_matches = []
+                            message_obj = {
+                                'id': message_id,
+                                'uid': msg_uid,
+                                'subject': msg.get('Subject', ''),
+                                'from': msg.get('From', ''),
+                                'date': msg.get('Date', ''),
+                                'folder': folder,
+                                'has_pdf': has_pdf
+                            }
                             
-                            for part in full_msg.walk():
-                                if part.get_content_maintype() == 'multipart':
-                                    continue
-                                
-                                filename = part.get_filename()
-                                if filename and filename.lower().endswith('.pdf'):
-                                    has_pdf = True
-                                    
-                                    # Extract and search PDF if processor available
-                                    if pdf_processor:
-                                        # Check for cancellation before processing PDF
-                                        if cancel_check():
-                                            break
-                                        
-                                        try:
-                                            pdf_content = part.get_payload(decode=True)
-                                            if pdf_content:
-                                                result = pdf_processor.search_in_pdf_attachment(
-                                                    pdf_content, nip, filename
-                                                )
-                                                if result.get('found'):
-                                                    pdf_matches.extend(result.get('matches', []))
-                                        except Exception as e:
-                                            log(f"Error processing PDF {filename}: {e}", level="WARNING")
+                            results['messages'].append(message_obj)
+                            results['message_to_folder_map'][message_id] = folder
+                            results['matches'][message_id] = pdf_matches
+                            messages_found += 1
                             
-                            # If PDF found with NIP match, add to results
-                            if pdf_matches:
-                                message_id = msg.get('Message-ID', msg_uid)
-                                
-                                message_obj = {
-                                    'id': message_id,
-                                    'uid': msg_uid,
-                                    'subject': msg.get('Subject', ''),
-                                    'from': msg.get('From', ''),
-                                    'date': msg.get('Date', ''),
-                                    'folder': folder,
-                                    'has_pdf': has_pdf
-                                }
-                                
-                                results['messages'].append(message_obj)
-                                results['message_to_folder_map'][message_id] = folder
-                                results['matches'][message_id] = pdf_matches
-                                messages_found += 1
-                                
-                                log(f"Found match in message UID {msg_uid}: {msg.get('Subject', 'No Subject')}")
-                        
-                        except Exception as e:
-                            log(f"Error processing message: {e}", level="WARNING")
-                            continue
-                
-                except Exception as e:
-                    log(f"Error fetching batch in {folder}: {e}", level="ERROR")
-                    continue
+                            log(f"Found match in message UID {msg_uid}: {msg.get('Subject', 'No Subject')}")
+                    
+                    except Exception as e:
+                        log(f"Error processing message: {e}", level="WARNING")
+                        continue
+            
+            except Exception as e:
+                log(f"Error fetching messages in {folder}: {e}", level="ERROR")
+                folder_state = None  # Incomplete scan - do not advance the sync state
+            
+            if failed_uids:
+                log(f"{len(failed_uids)} messages in {folder} could not be scanned - "
+                    f"the sync state is not advanced", level="WARNING")
+                folder_state = None
+            
+            if cancel_check():
+                log("Search cancelled by user during batch processing")
+            elif folder_state:
+                sync_store.set(account, folder, folder_state, nip, sync_signature)
             
             # Store folder results
             results['folder_results'][folder] = {
@@ -574,12 +707,17 @@ def search_messages(criteria, progress_callback=None):
         if progress_callback:
             progress_callback(f"Wyszukiwanie zakończone. Znaleziono {results['total_count']} wiadomości", 100)
         
+        if dedup is not None and dedup.skipped:
+            log(f"Skipped {dedup.skipped} copies of messages already scanned in another folder")
         log(f"Search completed. Found {results['total_count']} messages with NIP matches")
     
     except Exception as e:
         log(f"Error in search_messages: {str(e)}", level="ERROR")
         results['error'] = str(e)
     
+    if sync_store is not None:
+        sync_store.save()
+    
     return results
 
 
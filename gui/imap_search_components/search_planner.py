@@ -0,0 +1,222 @@
+"""
+Capability-aware IMAP SEARCH planner
+
+Builds the narrowest SEARCH the server supports, so messages that cannot
+carry a PDF invoice are filtered out on the server instead of being fetched
+and thrown away:
+
+- LARGER n: skips messages too small to contain a PDF attachment (opt-in)
+- HEADER Content-Type: keeps multipart messages (and bare application/pdf
+  ones) (opt-in)
+- SUBJECT: optional keywords (ASCII only - non-ASCII would need CHARSET literals)
+- RETURN (ALL COUNT): RFC 4731 ESEARCH, the result comes back as a compact
+  sequence set instead of one number per message
+
+The planner returns a list of plans from the narrowest to the plain base
+criteria. A plan the server rejects (NO/BAD) is logged and the next one is
+tried, so an unusual server still gets the SINCE/BEFORE search it got before.
+Without a known CAPABILITY list only the base criteria are used.
+
+LARGER and HEADER Content-Type drop messages the server never shows to the
+client - a PDF sent as a single application/octet-stream part, or in an
+unusually small message, would be lost without a trace - so they are used
+only when the caller asks for them.
+"""
+import re
+
+from gui.imap_search_components.uid_set import UidSet
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+# Smallest message worth checking: headers plus a minimal base64-encoded PDF
+MIN_PDF_MESSAGE_SIZE = 1024
+
+# Messages with attachments are multipart; a PDF can also be the only body part
+CONTENT_TYPE_CRITERION = 'OR HEADER Content-Type multipart HEADER Content-Type application/pdf'
+
+ESEARCH_RETURN = 'RETURN (ALL COUNT)'
+
+
+def server_capabilities(imap_conn, refresh=False):
+    """
+    Return the server's CAPABILITY list.
+
+    imaplib reads CAPABILITY once before login; many servers announce more
+    after authentication, so refresh=True asks again and stores the result
+    in imap_conn.capabilities.
+
+    Args:
+        imap_conn: IMAP connection object
+        refresh: Send a CAPABILITY command first
+
+    Returns:
+        tuple: Upper-case capability names, or None if unknown
+    """
+    if refresh:
+        try:
+            status, data = imap_conn.capability()
+            if status == 'OK' and data and isinstance(data[-1], bytes):
+                imap_conn.capabilities = tuple(data[-1].decode('ascii', errors='ignore').upper().split())
+        except Exception as e:
+            log(f"CAPABILITY failed: {e}", level="WARNING")
+
+    capabilities = getattr(imap_conn, 'capabilities', None)
+    if not isinstance(capabilities, (tuple, list, set)) or not capabilities:
+        return None
+    return tuple(str(c).upper() for c in capabilities)
+
+
+def _quote(value):
+    """Quote a search string argument."""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _subject_criterion(keywords):
+    """Build 'OR SUBJECT a OR SUBJECT b SUBJECT c' for a list of keywords."""
+    keys = [f'SUBJECT {_quote(k)}' for k in keywords]
+    criterion = keys[-1]
+    for key in reversed(keys[:-1]):
+        criterion = f'OR {key} {criterion}'
+    return criterion
+
+
+def plan_imap_search(capabilities, base_criteria=None, min_size=None,
+                     content_type_filter=False, subject_keywords=None):
+    """
+    Plan IMAP SEARCH commands from the narrowest to the plain base criteria.
+
+    Args:
+        capabilities: Tuple from server_capabilities() or None if unknown
+        base_criteria: List of criteria the search must keep (e.g.
+                       ['SINCE 01-Dec-2025', 'BEFORE 08-Dec-2025']) or a string
+        min_size: LARGER threshold in bytes, e.g. MIN_PDF_MESSAGE_SIZE (0 or
+                  None to skip)
+        content_type_filter: Keep only multipart/application/pdf messages
+        subject_keywords: Optional list of subject keywords (any of them matches)
+
+    Returns:
+        list: Plan dicts {'criteria': str, 'esearch': bool, 'filters': list,
+              'description': str}; the last one is always the base search
+    """
+    if isinstance(base_criteria, str):
+        base_criteria = [base_criteria]
+    base = [c for c in (base_criteria or []) if c and c.upper() != 'ALL']
+
+    filters = []
+    if capabilities is not None:
+        if min_size:
+            filters.append(('LARGER', f'LARGER {int(min_size)}'))
+        if content_type_filter:
+            filters.append(('HEADER Content-Type', CONTENT_TYPE_CRITERION))
+        keywords = [k.strip() for k in (subject_keywords or []) if k and k.strip()]
+        ascii_keywords = [k for k in keywords if k.isascii()]
+        if len(ascii_keywords) < len(keywords):
+            log(f"Skipping non-ASCII subject keywords in IMAP SEARCH: "
+                f"{[k for k in keywords if not k.isascii()]}", level="WARNING")
+        if ascii_keywords:
+            filters.append(('SUBJECT', _subject_criterion(ascii_keywords)))
+    esearch = capabilities is not None and 'ESEARCH' in capabilities
+
+    def make_plan(extra, use_esearch):
+        criteria = ' '.join(base + [c for _, c in extra]) or 'ALL'
+        names = [name for name, _ in extra] + (['ESEARCH'] if use_esearch else [])
+        description = criteria + (f" ({', '.join(names)})" if names else " (base criteria)")
+        return {'criteria': criteria, 'esearch': use_esearch,
+                'filters': names, 'description': description}
+
+    plans = []
+    if filters:
+        if esearch:
+            plans.append(make_plan(filters, True))
+        plans.append(make_plan(filters, False))
+    if esearch:
+        plans.append(make_plan([], True))
+    plans.append(make_plan([], False))
+    return plans
+
+
+def parse_esearch_response(data):
+    """
+    Parse an ESEARCH response.
+
+    Args:
+        data: List of untagged ESEARCH data, e.g.
+              [b'(TAG "A3") UID COUNT 3 ALL 1:2,7']
+
+    Returns:
+        dict: {'count': int or None, 'all': sequence set str ('' for no matches)}
+    """
+    result = {'count': None, 'all': ''}
+    for item in data or []:
+        if isinstance(item, bytes):
+            item = item.decode('ascii', errors='ignore')
+        if not isinstance(item, str):
+            continue
+        count = re.search(r'\bCOUNT\s+(\d+)', item, re.IGNORECASE)
+        if count:
+            result['count'] = int(count.group(1))
+        all_set = re.search(r'\bALL\s+([\d:,]+)', item, re.IGNORECASE)
+        if all_set:
+            result['all'] = all_set.group(1)
+    return result
+
+
+def _execute_plan(imap_conn, plan, use_uid):
+    """Run one plan; return the UIDs/numbers or None if the server refused it."""
+    if plan['esearch']:
+        imap_conn.untagged_responses.pop('ESEARCH', None)
+        status, data = imap_conn.uid('search', ESEARCH_RETURN, plan['criteria'])
+        if status != 'OK':
+            return None
+        esearch = parse_esearch_response(imap_conn.untagged_responses.pop('ESEARCH', []))
+        numbers = UidSet.parse(esearch['all'])
+        if esearch['count'] is not None and esearch['count'] != len(numbers):
+            log(f"ESEARCH COUNT {esearch['count']} does not match ALL ({len(numbers)})", level="WARNING")
+        return numbers
+
+    if use_uid:
+        status, data = imap_conn.uid('search', None, plan['criteria'])
+        if status != 'OK':
+            return None
+        return UidSet.from_search_response(data[0] if data else None)
+
+    status, data = imap_conn.search(None, plan['criteria'])
+    if status != 'OK':
+        return None
+    return data[0].decode('utf-8').split() if data and data[0] else []
+
+
+def run_search_plans(imap_conn, plans, use_uid=True):
+    """
+    Run planned searches on the selected folder until one succeeds.
+
+    Args:
+        imap_conn: IMAP connection with the folder selected
+        plans: List from plan_imap_search()
+        use_uid: UID SEARCH (True) or SEARCH by sequence numbers (False,
+                 ESEARCH plans are skipped)
+
+    Returns:
+        tuple: (numbers, plan) - UidSet of UIDs (list of sequence numbers as
+               strings with use_uid=False) and the plan used, or (None, None)
+               if every plan failed
+    """
+    for plan in plans:
+        if plan['esearch'] and not use_uid:
+            continue
+        log(f"IMAP SEARCH plan: {plan['description']}")
+        try:
+            numbers = _execute_plan(imap_conn, plan, use_uid)
+        except Exception as e:
+            log(f"IMAP SEARCH plan rejected: {e}", level="WARNING")
+            continue
+        if numbers is not None:
+            return numbers, plan
+        log(f"IMAP SEARCH plan failed: {plan['criteria']}", level="WARNING")
+    return None, None
@@ -0,0 +1,201 @@
+"""
+Incremental IMAP scan state per (account, folder)
+
+After a completed scan the folder's UIDVALIDITY, UIDNEXT and HIGHESTMODSEQ
+(RFC 7162 CONDSTORE) are stored in a small JSON file. The next scan of the
+same folder for the same search (NIP and date range) only has to look at UIDs >= the stored UIDNEXT;
+when UIDNEXT and HIGHESTMODSEQ are both unchanged the folder is skipped
+without any SEARCH. A changed UIDVALIDITY invalidates the stored UIDs and
+forces a full scan.
+
+Message bodies never change in IMAP, so flag changes reported through
+HIGHESTMODSEQ cannot turn a message into a new invoice; the mod-sequence is
+used only as a "nothing changed" check when the server omits UIDNEXT.
+"""
+import json
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from gui.imap_search_components.uid_set import UidSet
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+STATE_FILE = Path.home() / '.poczta_faktury_sync_state.json'
+
+# Mailbox state keys, as used in SELECT response codes and STATUS items
+STATE_KEYS = ('UIDVALIDITY', 'UIDNEXT', 'HIGHESTMODSEQ')
+
+
+def quote_mailbox(folder):
+    """Quote a mailbox name for commands where imaplib does not do it."""
+    if folder.startswith('"') or not re.search(r'[\s"\\()]', folder):
+        return folder
+    return '"' + folder.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _first_int(values):
+    """Return the first value of an imaplib response list as int, or None."""
+    for value in values or []:
+        if isinstance(value, bytes):
+            value = value.decode('ascii', errors='ignore')
+        try:
+            return int(str(value).split()[0])
+        except (ValueError, IndexError):
+            continue
+    return None
+
+
+def read_mailbox_state(imap_conn, folder):
+    """
+    Read UIDVALIDITY, UIDNEXT and HIGHESTMODSEQ of the selected folder.
+
+    The values are taken from the response codes of the last SELECT/EXAMINE
+    (kept by imaplib in untagged_responses); STATUS is used for whatever the
+    server did not send there.
+
+    Args:
+        imap_conn: IMAP connection with the folder selected
+        folder: Folder name (for STATUS)
+
+    Returns:
+        dict: {'uidvalidity': int or None, 'uidnext': int or None,
+               'highestmodseq': int or None}
+    """
+    state = {key.lower(): None for key in STATE_KEYS}
+
+    responses = getattr(imap_conn, 'untagged_responses', None)
+    if isinstance(responses, dict):
+        for key in STATE_KEYS:
+            state[key.lower()] = _first_int(responses.get(key))
+
+    missing = [key for key in STATE_KEYS if state[key.lower()] is None]
+    capabilities = getattr(imap_conn, 'capabilities', ()) or ()
+    if 'HIGHESTMODSEQ' in missing and 'CONDSTORE' not in capabilities:
+        missing.remove('HIGHESTMODSEQ')
+
+    if missing:
+        try:
+            status, data = imap_conn.status(quote_mailbox(folder), f"({' '.join(missing)})")
+            if status == 'OK' and data and isinstance(data[0], bytes):
+                text = data[0].decode('utf-8', errors='ignore')
+                for key in missing:
+                    match = re.search(rf'\b{key}\s+(\d+)', text, re.IGNORECASE)
+                    if match:
+                        state[key.lower()] = int(match.group(1))
+        except Exception as e:
+            log(f"STATUS failed for folder {folder}: {e}", level="WARNING")
+
+    return state
+
+
+def plan_incremental_scan(previous, current, nip, signature=None):
+    """
+    Decide how much of a folder has to be scanned.
+
+    Messages below the stored UIDNEXT were only checked within the date range
+    of the previous scan, so a stored state is reused only for the same range.
+
+    Args:
+        previous: Stored state dict from SyncStateStore.get() or None
+        current: State dict from read_mailbox_state()
+        nip: NIP searched for in this scan
+        signature: Search signature (NIP and date range, see
+                   scan_checkpoint.scan_signature) of this scan
+
+    Returns:
+        dict: {
+            'mode': 'full', 'incremental' or 'unchanged',
+            'min_uid': lowest UID to scan (incremental mode) or None,
+            'reason': short English description for the log
+        }
+    """
+    if not previous:
+        return {'mode': 'full', 'min_uid': None, 'reason': 'no previous scan'}
+
+    if previous.get('nip') != nip:
+        return {'mode': 'full', 'min_uid': None, 'reason': 'previous scan was for another NIP'}
+
+    if previous.get('signature') != signature:
+        return {'mode': 'full', 'min_uid': None, 'reason': 'previous scan covered another date range'}
+
+    if current.get('uidvalidity') is None or previous.get('uidvalidity') != current['uidvalidity']:
+        return {'mode': 'full', 'min_uid': None,
+                'reason': f"UIDVALIDITY changed ({previous.get('uidvalidity')} -> {current.get('uidvalidity')})"}
+
+    old_uidnext = previous.get('uidnext')
+    new_uidnext = current.get('uidnext')
+    if old_uidnext is not None and new_uidnext is not None:
+        if new_uidnext <= old_uidnext:
+            return {'mode': 'unchanged', 'min_uid': None, 'reason': 'no new messages'}
+        return {'mode': 'incremental', 'min_uid': old_uidnext,
+                'reason': f"scanning UIDs {old_uidnext}:{new_uidnext - 1}"}
+
+    old_modseq = previous.get('highestmodseq')
+    if old_modseq is not None and old_modseq == current.get('highestmodseq'):
+        return {'mode': 'unchanged', 'min_uid': None, 'reason': 'HIGHESTMODSEQ unchanged'}
+
+    return {'mode': 'full', 'min_uid': None, 'reason': 'server did not report UIDNEXT'}
+
+
+def filter_new_uids(uids, min_uid):
+    """Keep UIDs >= min_uid (a 'UID n:*' search also returns the last message)."""
+    if min_uid is None:
+        return uids if isinstance(uids, UidSet) else list(uids)
+    if isinstance(uids, UidSet):
+        return uids.from_uid(min_uid)
+    return [uid for uid in uids if int(uid) >= min_uid]
+
+
+class SyncStateStore:
+    """JSON file with the last completed scan state per (account, folder)"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self):
+        try:
+            if self.path.exists():
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    return data
+        except Exception as e:
+            log(f"Could not read sync state (starting fresh): {e}", level="WARNING")
+        return {}
+
+    def get(self, account, folder):
+        """Return the stored state dict for (account, folder) or None."""
+        with self._lock:
+            state = self._data.get(account, {}).get(folder)
+            return dict(state) if state else None
+
+    def set(self, account, folder, state, nip, signature=None):
+        """Record the state a completed scan started from (signature: see plan_incremental_scan)."""
+        with self._lock:
+            self._data.setdefault(account, {})[folder] = {
+                'uidvalidity': state.get('uidvalidity'),
+                'uidnext': state.get('uidnext'),
+                'highestmodseq': state.get('highestmodseq'),
+                'nip': nip,
+                'signature': signature,
+                'updated': datetime.now().isoformat(timespec='seconds'),
+            }
+
+    def save(self):
+        """Write the state file."""
+        with self._lock:
+            try:
+                with open(self.path, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, indent=2, ensure_ascii=False)
+            except Exception as e:
+                log(f"Could not save sync state: {e}", level="WARNING")
@@ -0,0 +1,256 @@
+"""
+Range-compressed UID set
+
+UidSet stores UIDs as sorted, non-overlapping (start, end) ranges in compact
+integer arrays instead of one Python string per message. A SEARCH result of
+a 2M-message archive is usually a handful of ranges, so it costs kilobytes
+instead of hundreds of megabytes, and serializes straight back to a minimal
+IMAP sequence set ('1:5000,5002:9000') for FETCH command lines.
+
+It behaves like the sorted list of UID strings the scanners used before:
+len(), iteration (yields str), 'in', and positional indexing/slicing (a
+slice is again a UidSet, so batches stay compact). Set difference and
+intersection work range by range, e.g. against the UIDs recorded in the
+scan ledger.
+"""
+import re
+from array import array
+from bisect import bisect_right
+
+_NUMBER_RE = re.compile(rb'\d+')
+
+
+class UidSet:
+    """Sorted set of IMAP UIDs stored as ranges"""
+
+    __slots__ = ('_starts', '_ends', '_offsets', '_size')
+
+    def __init__(self, uids=None):
+        """
+        Args:
+            uids: Iterable of UIDs (str, bytes or int), another UidSet or None
+        """
+        if isinstance(uids, UidSet):
+            self._set_ranges(uids.ranges())
+        else:
+            self._set_ranges(_ranges_from_numbers(int(uid) for uid in (uids or ())))
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """Build a set from (start, end) pairs (inclusive, any order, may overlap)."""
+        uid_set = cls.__new__(cls)
+        uid_set._set_ranges(_normalize_ranges(list(ranges)))
+        return uid_set
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parse an IMAP sequence set such as '1:3,7,9:12' (no '*').
+
+        Args:
+            text: Sequence set as str or bytes ('' for an empty set)
+
+        Returns:
+            UidSet
+        """
+        if isinstance(text, bytes):
+            text = text.decode('ascii')
+        ranges = []
+        for part in text.strip().split(','):
+            if not part:
+                continue
+            if ':' in part:
+                start, end = (int(x) for x in part.split(':'))
+                ranges.append((min(start, end), max(start, end)))
+            else:
+                ranges.append((int(part), int(part)))
+        return cls.from_ranges(ranges)
+
+    @classmethod
+    def from_search_response(cls, data):
+        """
+        Build a set from a SEARCH response line (b'1 2 3 7') without
+        creating a list of strings.
+        """
+        if not data:
+            return cls()
+        uid_set = cls.__new__(cls)
+        uid_set._set_ranges(_ranges_from_numbers(int(m.group()) for m in _NUMBER_RE.finditer(data)))
+        return uid_set
+
+    @classmethod
+    def from_esearch(cls, data):
+        """
+        Build a set from untagged ESEARCH data, e.g. [b'(TAG "A3") UID COUNT 4 ALL 1:3,7'].
+        """
+        for item in data or []:
+            if isinstance(item, bytes):
+                item = item.decode('ascii', errors='ignore')
+            match = re.search(r'\bALL\s+([\d:,]+)', item or '', re.IGNORECASE)
+            if match:
+                return cls.parse(match.group(1))
+        return cls()
+
+    def _set_ranges(self, ranges):
+        self._starts = array('q')
+        self._ends = array('q')
+        self._offsets = array('q')
+        size = 0
+        for start, end in ranges:
+            self._starts.append(start)
+            self._ends.append(end)
+            self._offsets.append(size)
+            size += end - start + 1
+        self._size = size
+
+    def ranges(self):
+        """Iterate over (start, end) ranges in ascending order."""
+        return zip(self._starts, self._ends)
+
+    def range_count(self):
+        """Number of ranges (length of the sequence set)."""
+        return len(self._starts)
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __iter__(self):
+        for start, end in self.ranges():
+            for uid in range(start, end + 1):
+                yield str(uid)
+
+    def __contains__(self, uid):
+        try:
+            uid = int(uid)
+        except (TypeError, ValueError):
+            return False
+        i = bisect_right(self._starts, uid) - 1
+        return i >= 0 and uid <= self._ends[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._size)
+            if step != 1:
+                raise ValueError("UidSet slices do not support a step")
+            return self._positional_slice(start, stop)
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("UidSet index out of range")
+        i = bisect_right(self._offsets, index) - 1
+        return str(self._starts[i] + index - self._offsets[i])
+
+    def _positional_slice(self, start, stop):
+        result = UidSet()
+        if start >= stop:
+            return result
+        ranges = []
+        i = bisect_right(self._offsets, start) - 1
+        while i < len(self._starts) and self._offsets[i] < stop:
+            first = self._starts[i] + max(0, start - self._offsets[i])
+            last = min(self._ends[i], self._starts[i] + (stop - 1 - self._offsets[i]))
+            ranges.append((first, last))
+            i += 1
+        result._set_ranges(ranges)
+        return result
+
+    def difference(self, other):
+        """Return UIDs of this set not in other (UidSet or iterable of UIDs)."""
+        other = other if isinstance(other, UidSet) else UidSet(other)
+        ranges = []
+        j = 0
+        other_ranges = list(other.ranges())
+        for start, end in self.ranges():
+            while j < len(other_ranges) and other_ranges[j][1] < start:
+                j += 1
+            k = j
+            while k < len(other_ranges) and other_ranges[k][0] <= end:
+                o_start, o_end = other_ranges[k]
+                if o_start > start:
+                    ranges.append((start, o_start - 1))
+                start = max(start, o_end + 1)
+                if start > end:
+                    break
+                k += 1
+            if start <= end:
+                ranges.append((start, end))
+        result = UidSet()
+        result._set_ranges(ranges)
+        return result
+
+    def intersection(self, other):
+        """Return UIDs present in both sets."""
+        other = other if isinstance(other, UidSet) else UidSet(other)
+        ranges = []
+        mine, theirs = list(self.ranges()), list(other.ranges())
+        i = j = 0
+        while i < len(mine) and j < len(theirs):
+            start = max(mine[i][0], theirs[j][0])
+            end = min(mine[i][1], theirs[j][1])
+            if start <= end:
+                ranges.append((start, end))
+            if mine[i][1] < theirs[j][1]:
+                i += 1
+            else:
+                j += 1
+        result = UidSet()
+        result._set_ranges(ranges)
+        return result
+
+    __sub__ = difference
+    __and__ = intersection
+
+    def from_uid(self, min_uid):
+        """Return the UIDs >= min_uid."""
+        return self.difference(UidSet.from_ranges([(0, int(min_uid) - 1)])) if min_uid > 0 else UidSet(self)
+
+    def to_sequence_set(self):
+        """Serialize to a minimal IMAP sequence set ('' for an empty set)."""
+        return ','.join(str(start) if start == end else f"{start}:{end}" for start, end in self.ranges())
+
+    __str__ = to_sequence_set
+
+    def __eq__(self, other):
+        if not isinstance(other, UidSet):
+            return NotImplemented
+        return self._starts == other._starts and self._ends == other._ends
+
+    def __repr__(self):
+        text = self.to_sequence_set()
+        if len(text) > 60:
+            text = text[:57] + '...'
+        return f"UidSet({text!r}, count={self._size})"
+
+
+def _ranges_from_numbers(numbers):
+    """Collapse numbers into ranges; input in ascending order stays streaming."""
+    ranges = []
+    ordered = True
+    start = end = None
+    for number in numbers:
+        if end is not None and number == end + 1:
+            end = number
+            continue
+        if end is not None:
+            if number <= end:
+                ordered = False
+            ranges.append((start, end))
+        start = end = number
+    if start is not None:
+        ranges.append((start, end))
+    return ranges if ordered else _normalize_ranges(ranges)
+
+
+def _normalize_ranges(ranges):
+    """Sort ranges and merge overlapping or adjacent ones."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
@@ -0,0 +1,317 @@
+"""
+Pool of logged-in IMAP/POP3 connections reused across searches
+
+Every search used to open a new TLS connection and log in again, which costs
+1-3 s against slow endpoints (Exchange IMAP). The pool keeps released
+connections per account and hands them out again:
+
+- health check: an idle connection is checked with NOOP before reuse; a
+  connection that fails it is dropped and a new one is opened and logged in
+- idle timeout: connections idle longer than the timeout are logged out
+  (servers drop idle IMAP clients after 30 minutes, POP3 ones much sooner),
+  by a reaper timer that runs while idle connections are pooled - a POP3
+  session keeps the maildrop locked for other clients until it quits
+- a connection released after an error is not reused
+
+Accounts are keyed by protocol, server, port, SSL, address and password, so
+changed settings never get an old session.
+
+POP3 servers show the maildrop as it was at login, so a reused POP3 session
+does not see messages delivered since; POP3_IDLE_TIMEOUT is kept short so only
+back-to-back searches share a session.
+"""
+import atexit
+import imaplib
+import poplib
+import threading
+import time
+from contextlib import contextmanager
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+# Seconds an unused IMAP connection is kept
+IMAP_IDLE_TIMEOUT = 10 * 60
+
+# Seconds an unused POP3 connection is kept (the session shows a snapshot of the maildrop)
+POP3_IDLE_TIMEOUT = 60
+
+# Idle connections kept per account
+MAX_IDLE_PER_ACCOUNT = 4
+
+
+def account_key(config):
+    """
+    Return the pool key of an email configuration.
+
+    Args:
+        config: Email config dict ('protocol', 'server', 'port', 'email',
+                'password', 'use_ssl')
+
+    Returns:
+        tuple: Hashable key
+    """
+    protocol = 'POP3' if config.get('protocol') == 'POP3' else 'IMAP'
+    return (protocol, config.get('server'), int(config.get('port')), bool(config.get('use_ssl')),
+            config.get('email'), config.get('password'))
+
+
+def open_mail_connection(config):
+    """
+    Open and log in a new IMAP or POP3 connection (EXCHANGE uses IMAP).
+
+    Args:
+        config: Email config dict (see account_key)
+
+    Returns:
+        imaplib.IMAP4 or poplib.POP3 connection
+    """
+    server, port = config['server'], int(config['port'])
+    if config.get('protocol') == 'POP3':
+        if config.get('use_ssl'):
+            conn = poplib.POP3_SSL(server, port)
+        else:
+            conn = poplib.POP3(server, port)
+        conn.user(config['email'])
+        conn.pass_(config['password'])
+        return conn
+
+    if config.get('use_ssl'):
+        conn = imaplib.IMAP4_SSL(server, port)
+    else:
+        conn = imaplib.IMAP4(server, port)
+    conn.login(config['email'], config['password'])
+    return conn
+
+
+def _is_pop3(conn):
+    """Check if a connection is a POP3 session."""
+    return isinstance(conn, poplib.POP3) or hasattr(conn, 'retr')
+
+
+def _is_healthy(conn):
+    """Check a pooled connection with NOOP."""
+    try:
+        if _is_pop3(conn):
+            return conn.noop().startswith(b'+OK')
+        status, _ = conn.noop()
+        return status == 'OK'
+    except Exception:
+        return False
+
+
+def _reset(conn):
+    """Return an IMAP connection to the authenticated state before pooling."""
+    if _is_pop3(conn) or getattr(conn, 'state', None) != 'SELECTED':
+        return
+    capabilities = getattr(conn, 'capabilities', None) or ()
+    if 'UNSELECT' in capabilities and hasattr(conn, 'unselect'):
+        conn.unselect()
+    else:
+        conn.close()
+
+
+def _logout(conn):
+    """Log out, ignoring errors of a broken connection."""
+    try:
+        if _is_pop3(conn):
+            conn.quit()
+        else:
+            conn.logout()
+    except Exception:
+        pass
+
+
+class MailConnectionPool:
+    """Logged-in connections per account, reused across searches"""
+
+    def __init__(self, connect=open_mail_connection, imap_idle_timeout=IMAP_IDLE_TIMEOUT,
+                 pop3_idle_timeout=POP3_IDLE_TIMEOUT, max_idle=MAX_IDLE_PER_ACCOUNT,
+                 clock=time.monotonic, timer=threading.Timer):
+        """
+        Args:
+            connect: Callable(config) returning a new logged-in connection
+            imap_idle_timeout: Seconds an unused IMAP connection is kept
+            pop3_idle_timeout: Seconds an unused POP3 connection is kept
+            max_idle: Idle connections kept per account
+            clock: Time source (seconds)
+            timer: Callable(delay, function) returning a startable timer
+                   (threading.Timer) for the reaper of expired connections
+        """
+        self._connect = connect
+        self._timeouts = {'IMAP': imap_idle_timeout, 'POP3': pop3_idle_timeout}
+        self._max_idle = max_idle
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._idle = {}       # key -> list of (connection, released_at), most recent last
+        self._keys = {}       # id(connection) -> key of connections handed out
+        self._timer = timer
+        self._reaper = None   # Pending reaper timer, if any
+        self.stats = {'opened': 0, 'reused': 0, 'dropped': 0}
+
+    def _take_idle(self, key):
+        """Remove and return expired and the freshest idle connection of an account."""
+        now = self._clock()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            expired = [conn for conn, released in idle if now - released > self._timeouts[key[0]]]
+            idle[:] = [(conn, released) for conn, released in idle
+                       if now - released <= self._timeouts[key[0]]]
+            fresh = idle.pop()[0] if idle else None
+        return expired, fresh
+
+    def _schedule_reaper(self):
+        """Start the reaper timer for the earliest expiry, unless one is pending (lock held)."""
+        if self._reaper is not None or self._timer is None:
+            return
+        expiries = [released + self._timeouts[key[0]]
+                    for key, idle in self._idle.items() for _, released in idle]
+        if not expiries:
+            return
+        delay = max(min(expiries) - self._clock(), 0) + 1
+        self._reaper = self._timer(delay, self._run_reaper)
+        if hasattr(self._reaper, 'daemon'):
+            self._reaper.daemon = True
+        self._reaper.start()
+
+    def _run_reaper(self):
+        with self._lock:
+            self._reaper = None
+        self.reap()
+        with self._lock:
+            self._schedule_reaper()
+
+    def reap(self):
+        """
+        Log out idle connections past their timeout.
+
+        Returns:
+            int: Number of connections logged out
+        """
+        now = self._clock()
+        expired = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                timeout = self._timeouts[key[0]]
+                expired.extend(conn for conn, released in idle if now - released > timeout)
+                idle[:] = [(conn, released) for conn, released in idle if now - released <= timeout]
+        for conn in expired:
+            _logout(conn)
+        return len(expired)
+
+    def acquire(self, config):
+        """
+        Return a logged-in connection for an account.
+
+        Reuses an idle connection that passes the NOOP check, otherwise opens
+        (and logs in) a new one.
+
+        Args:
+            config: Email config dict (see account_key)
+
+        Returns:
+            Connection; give it back with release()
+        """
+        key = account_key(config)
+        while True:
+            expired, conn = self._take_idle(key)
+            for old in expired:
+                _logout(old)
+            if conn is None:
+                break
+            if _is_healthy(conn):
+                with self._lock:
+                    self.stats['reused'] += 1
+                    self._keys[id(conn)] = key
+                return conn
+            log(f"Pooled {key[0]} connection to {key[1]} failed NOOP - reconnecting", level="WARNING")
+            with self._lock:
+                self.stats['dropped'] += 1
+            _logout(conn)
+
+        conn = self._connect(config)
+        with self._lock:
+            self.stats['opened'] += 1
+            self._keys[id(conn)] = key
+        return conn
+
+    def release(self, conn, reusable=True):
+        """
+        Give a connection back to the pool.
+
+        Args:
+            conn: Connection returned by acquire()
+            reusable: False after an error - the connection is logged out
+        """
+        with self._lock:
+            key = self._keys.pop(id(conn), None)
+        if key is None or not reusable:
+            _logout(conn)
+            return
+        try:
+            _reset(conn)
+        except Exception:
+            _logout(conn)
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            idle.append((conn, self._clock()))
+            surplus = idle[:-self._max_idle] if len(idle) > self._max_idle else []
+            del idle[:len(surplus)]
+            self._schedule_reaper()
+        for old, _ in surplus:
+            _logout(old)
+
+    @contextmanager
+    def connection(self, config):
+        """
+        Context manager around acquire()/release().
+
+        A connection whose block raised is logged out instead of pooled, since
+        the protocol state after a failed command is unknown.
+        """
+        conn = self.acquire(config)
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, reusable=False)
+            raise
+        self.release(conn)
+
+    def idle_count(self, config=None):
+        """Number of idle connections (of one account, or all)."""
+        with self._lock:
+            if config is not None:
+                return len(self._idle.get(account_key(config), []))
+            return sum(len(idle) for idle in self._idle.values())
+
+    def close_all(self):
+        """Log out all idle connections and stop the reaper (application shutdown)."""
+        with self._lock:
+            idle = [conn for conns in self._idle.values() for conn, _ in conns]
+            self._idle = {}
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+        for conn in idle:
+            _logout(conn)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """Return the application-wide connection pool."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = MailConnectionPool()
+            # Log out pooled sessions instead of dropping them when the application exits
+            atexit.register(_default_pool.close_all)
+        return _default_pool
@@ -0,0 +1,394 @@
+"""
+Streaming MIME parsing with bounded memory per message
+
+email.message_from_bytes() keeps the raw message, every part payload as a
+string and, on get_payload(decode=True), the decoded copy in memory at once:
+a 100 MB message with scanned invoices costs several hundred MB.
+
+StreamingMessageParser reads a message in chunks (or lines, e.g. from a POP3
+RETR) and keeps only what is needed:
+
+- header blocks are parsed with email.parser.BytesFeedParser, so headers,
+  encoded filenames and RFC 2231 parameters behave as in the email package
+- bodies of wanted parts (PDF attachments by default) are decoded
+  incrementally (base64 / quoted-printable) into SpooledTemporaryFiles that
+  move to disk above SPOOL_THRESHOLD; other bodies are skipped
+- the raw message can be spooled as well, for the .eml copy of a hit
+
+Nested multiparts and attached messages (message/rfc822) are followed like
+Message.walk() does.
+"""
+import binascii
+import hashlib
+import re
+import shutil
+import tempfile
+from email.parser import BytesFeedParser
+
+# Bytes of a spooled part or raw message kept in memory before moving to disk
+SPOOL_THRESHOLD = 4 * 1024 * 1024
+
+# Chunk size used to feed in-memory messages and to copy spooled data
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Longest line that can still be a MIME boundary (70 chars + "--" twice + padding)
+MAX_BOUNDARY_LINE = 1024
+
+_BASE64_JUNK_RE = re.compile(rb'[^A-Za-z0-9+/=]')
+
+
+def is_pdf_attachment(headers):
+    """Check if part headers describe a PDF attachment (by filename)."""
+    filename = headers.get_filename()
+    return bool(filename) and filename.lower().endswith('.pdf')
+
+
+class SpooledData:
+    """Bytes written to a SpooledTemporaryFile, with size and SHA-256"""
+
+    def __init__(self, spool_threshold=SPOOL_THRESHOLD):
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data):
+        if data:
+            self.file.write(data)
+            self._sha256.update(data)
+            self.size += len(data)
+
+    @property
+    def sha256(self):
+        """SHA-256 hex digest of the data (same as scan_ledger.pdf_hash)."""
+        return self._sha256.hexdigest()
+
+    def read(self):
+        """Return all data as bytes (loads spooled data into memory)."""
+        self.file.seek(0)
+        return self.file.read()
+
+    def copy_to(self, fileobj):
+        """Copy the data to a writable binary file object."""
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, fileobj, COPY_CHUNK_SIZE)
+
+    def close(self):
+        self.file.close()
+
+
+class SpooledPart(SpooledData):
+    """Decoded body of a MIME part"""
+
+    def __init__(self, headers, spool_threshold=SPOOL_THRESHOLD):
+        """
+        Args:
+            headers: email.message.Message with the part headers (no payload)
+            spool_threshold: Bytes kept in memory before moving to disk
+        """
+        super().__init__(spool_threshold)
+        self.headers = headers
+        self.filename = headers.get_filename()
+        self.content_type = headers.get_content_type()
+
+
+class _Base64Decoder:
+    """Incremental base64 decoder (ignores line breaks and junk like the email package)"""
+
+    def __init__(self, target):
+        self.target = target
+        self._rest = b''
+
+    def write(self, data):
+        data = self._rest + _BASE64_JUNK_RE.sub(b'', data)
+        usable = len(data) - len(data) % 4
+        self._rest = data[usable:]
+        if usable:
+            self._decode(data[:usable])
+
+    def _decode(self, data):
+        try:
+            self.target.write(binascii.a2b_base64(data))
+        except binascii.Error:
+            pass
+
+    def finish(self):
+        if self._rest.strip(b'='):
+            self._decode(self._rest + b'=' * (-len(self._rest) % 4))
+        self._rest = b''
+
+
+class _QuotedPrintableDecoder:
+    """Incremental quoted-printable decoder (decodes whole lines, soft breaks included)"""
+
+    def __init__(self, target):
+        self.target = target
+        self._rest = b''
+
+    def write(self, data):
+        data = self._rest + data
+        end = data.rfind(b'\n') + 1
+        self._rest = data[end:]
+        if end:
+            self.target.write(binascii.a2b_qp(data[:end]))
+
+    def finish(self):
+        if self._rest:
+            self.target.write(binascii.a2b_qp(self._rest))
+        self._rest = b''
+
+
+class _RawDecoder:
+    """7bit, 8bit and binary bodies are written as they are"""
+
+    def __init__(self, target):
+        self.target = target
+
+    def write(self, data):
+        self.target.write(data)
+
+    def finish(self):
+        pass
+
+
+def _decoder_for(headers, target):
+    encoding = (headers.get('Content-Transfer-Encoding') or '').strip().lower()
+    if encoding == 'base64':
+        return _Base64Decoder(target)
+    if encoding == 'quoted-printable':
+        return _QuotedPrintableDecoder(target)
+    return _RawDecoder(target)
+
+
+class StreamedMessage:
+    """Result of a streaming parse: top-level headers, wanted parts and raw spool"""
+
+    def __init__(self, headers, parts, raw=None):
+        self.headers = headers
+        self.parts = parts
+        self.raw = raw
+
+    def close(self):
+        """Remove the spooled data."""
+        for part in self.parts:
+            part.close()
+        if self.raw is not None:
+            self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StreamingMessageParser:
+    """Incremental MIME parser keeping only wanted part bodies (spooled)"""
+
+    _HEADERS, _PREAMBLE, _BODY, _EPILOGUE = range(4)
+
+    def __init__(self, want_part=is_pdf_attachment, spool_raw=False, spool_threshold=SPOOL_THRESHOLD):
+        """
+        Args:
+            want_part: Callable(part_headers) -> bool selecting parts to keep
+            spool_raw: Also keep the raw message (for saving an .eml copy)
+            spool_threshold: Bytes kept in memory per spool before moving to disk
+        """
+        self.want_part = want_part
+        self.spool_threshold = spool_threshold
+        self.raw = SpooledData(spool_threshold) if spool_raw else None
+        self.headers = None         # Top-level headers, once read
+        self.parts = []
+        self._state = self._HEADERS
+        self._boundaries = []       # b'--boundary' of enclosing multiparts, innermost last
+        self._header_lines = []
+        self._buffer = b''
+        self._decoder = None
+        self._pending_eol = b''     # Line break that belongs to a boundary if one follows
+        self._midline = False       # Next line continues body data flushed without a line break
+
+    def feed(self, data):
+        """Parse the next chunk of the raw message."""
+        if self.raw is not None:
+            self.raw.write(data)
+        data = self._buffer + bytes(data)
+        start = 0
+        while True:
+            end = data.find(b'\n', start) + 1
+            if not end:
+                break
+            self._line(data[start:end])
+            start = end
+        self._buffer = data[start:]
+        if self._state == self._BODY and len(self._buffer) > MAX_BOUNDARY_LINE:
+            # Too long for a boundary - body data without line breaks
+            self._body(self._buffer, b'')
+            self._buffer = b''
+            self._midline = True
+
+    def close(self):
+        """
+        Finish parsing.
+
+        Returns:
+            StreamedMessage (close it to remove the spooled data)
+        """
+        if self._buffer:
+            self._line(self._buffer)
+            self._buffer = b''
+        if self._state == self._HEADERS and self._header_lines:
+            self._end_headers()
+        if self._state == self._BODY:
+            self._end_body(keep_eol=True)
+        if self.headers is None:
+            self.headers = BytesFeedParser().close()
+        return StreamedMessage(self.headers, self.parts, self.raw)
+
+    def _line(self, line):
+        if self._midline:
+            self._midline = False
+            stripped = line.rstrip(b'\r\n')
+            self._body(stripped, line[len(stripped):])
+            return
+        if line.startswith(b'--') and self._boundaries and self._boundary(line):
+            return
+        if self._state == self._HEADERS:
+            if line.strip(b'\r\n'):
+                self._header_lines.append(line)
+            else:
+                self._end_headers()
+        elif self._state == self._BODY:
+            stripped = line.rstrip(b'\r\n')
+            self._body(stripped, line[len(stripped):])
+
+    def _boundary(self, line):
+        """Handle a boundary line; returns False if the line is not a boundary."""
+        marker = line.rstrip()
+        for level in range(len(self._boundaries) - 1, -1, -1):
+            boundary = self._boundaries[level]
+            if marker == boundary or marker == boundary + b'--':
+                break
+        else:
+            return False
+        if self._state == self._BODY:
+            self._end_body(keep_eol=False)
+        self._header_lines = []
+        if marker == boundary:
+            del self._boundaries[level + 1:]
+            self._state = self._HEADERS
+        else:
+            del self._boundaries[level:]
+            self._state = self._EPILOGUE
+        return True
+
+    def _end_headers(self):
+        parser = BytesFeedParser()
+        parser.feed(b''.join(self._header_lines) + b'\r\n')
+        headers = parser.close()
+        self._header_lines = []
+        if self.headers is None:
+            self.headers = headers
+
+        if headers.get_content_maintype() == 'multipart' and headers.get_boundary():
+            self._boundaries.append(b'--' + headers.get_boundary().encode('utf-8', errors='replace'))
+            self._state = self._PREAMBLE
+        elif headers.get_content_type() == 'message/rfc822':
+            self._state = self._HEADERS  # Headers of the attached message follow
+        else:
+            self._state = self._BODY
+            self._pending_eol = b''
+            if self.want_part(headers):
+                part = SpooledPart(headers, self.spool_threshold)
+                self.parts.append(part)
+                self._decoder = _decoder_for(headers, part)
+
+    def _body(self, data, eol):
+        if self._decoder is not None:
+            self._decoder.write(self._pending_eol + data)
+        self._pending_eol = eol
+
+    def _end_body(self, keep_eol):
+        if self._decoder is not None:
+            if keep_eol:
+                self._decoder.write(self._pending_eol)
+            self._decoder.finish()
+            self._decoder = None
+        self._pending_eol = b''
+
+
+def parse_message_stream(chunks, want_part=is_pdf_attachment, spool_raw=False,
+                         accept_headers=None, spool_threshold=SPOOL_THRESHOLD):
+    """
+    Parse a message from an iterable of byte chunks.
+
+    Args:
+        chunks: Iterable of bytes (any split, e.g. lines with their line breaks)
+        want_part: Callable(part_headers) -> bool selecting parts to keep
+        spool_raw: Also keep the raw message (StreamedMessage.raw)
+        accept_headers: Optional callable(headers) -> bool checked as soon as
+                        the top-level headers are read; False stops parsing
+        spool_threshold: Bytes kept in memory per spool before moving to disk
+
+    Returns:
+        StreamedMessage, or None if accept_headers rejected the message
+    """
+    parser = StreamingMessageParser(want_part, spool_raw, spool_threshold)
+    checked = accept_headers is None
+    chunks = iter(chunks)
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+            if not checked and parser.headers is not None:
+                checked = True
+                if not accept_headers(parser.headers):
+                    parser.close().close()
+                    return None
+    finally:
+        # Let a generator finish its protocol exchange (e.g. POP3 RETR) when stopped early
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    message = parser.close()
+    if not checked and not accept_headers(message.headers):
+        message.close()
+        return None
+    return message
+
+
+def iter_bytes_chunks(data, chunk_size=COPY_CHUNK_SIZE):
+    """Split in-memory message bytes into chunks without copying them."""
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def iter_pop3_message(pop_conn, which):
+    """
+    Retrieve a POP3 message (RETR) line by line instead of as one list.
+
+    Lines are yielded with CRLF and dot-stuffing removed. If the consumer
+    stops early, the rest of the response is read and dropped, so the
+    connection stays usable.
+
+    Args:
+        pop_conn: poplib.POP3 connection
+        which: Message number
+
+    Yields:
+        bytes: Message lines ending in b'\\r\\n'
+    """
+    pop_conn._putcmd('RETR %s' % which)
+    pop_conn._getresp()  # Raises poplib.error_proto on -ERR
+    finished = False
+    try:
+        while True:
+            line, _ = pop_conn._getline()
+            if line == b'.':
+                finished = True
+                return
+            if line.startswith(b'..'):
+                line = line[1:]
+            yield line + b'\r\n'
+    finally:
+        if not finished:
+            line = None
+            while line != b'.':
+                line, _ = pop_conn._getline()
@@ -0,0 +1,157 @@
+"""
+Pipelined POP3 commands (RFC 2449 PIPELINING)
+
+poplib sends one command and reads its whole response into a list of lines
+before the next one can be issued, so a scan costs one network round trip
+per TOP or RETR, and every message is held in memory twice (the lines and
+the joined bytes). This module keeps several multi-line commands in flight
+when the server advertises PIPELINING and hands each response to the caller
+as an iterator of lines read straight from the socket, e.g. into the
+streaming MIME parser.
+
+Servers without PIPELINING get the same interface with one command in
+flight.
+"""
+import poplib
+from collections import deque
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+# Default number of commands kept in flight when the server allows pipelining
+DEFAULT_MAX_IN_FLIGHT = 8
+
+
+def supports_pipelining(pop_conn):
+    """Check if the server advertises PIPELINING in its CAPA response."""
+    if not isinstance(pop_conn, poplib.POP3):
+        return False
+    try:
+        return 'PIPELINING' in pop_conn.capa()
+    except poplib.error_proto:
+        return False
+
+
+def pipeline_depth(pop_conn, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Number of commands to keep in flight on a connection.
+
+    Returns:
+        int: max_in_flight with PIPELINING, else 1
+    """
+    if supports_pipelining(pop_conn):
+        log(f"POP3 server supports PIPELINING, up to {max_in_flight} commands in flight")
+        return max_in_flight
+    return 1
+
+
+class Pop3Response:
+    """Lines of one multi-line response (TOP, RETR), read lazily from the connection"""
+
+    def __init__(self, pop_conn):
+        self.conn = pop_conn
+        self._started = False
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """
+        Next line ending in b'\\r\\n', dot-stuffing removed.
+
+        Raises:
+            poplib.error_proto: The server answered -ERR (on the first line)
+        """
+        if self._finished:
+            raise StopIteration
+        if not self._started:
+            self._started = True
+            try:
+                self.conn._getresp()
+            except poplib.error_proto:
+                self._finished = True
+                raise
+        line, _ = self.conn._getline()
+        if line == b'.':
+            self._finished = True
+            raise StopIteration
+        if line.startswith(b'..'):
+            line = line[1:]
+        return line + b'\r\n'
+
+    def close(self):
+        """Read and drop the rest of the response, so the next one can be read."""
+        try:
+            for _ in self:
+                pass
+        except poplib.error_proto:
+            pass
+
+
+def pipelined_commands(pop_conn, commands, max_in_flight=1):
+    """
+    Send multi-line commands keeping up to max_in_flight of them outstanding.
+
+    Each response must be used before the next one is yielded; whatever the
+    caller leaves unread is dropped. Closing the generator early (e.g. on
+    user stop) reads and drops the responses of commands already sent, so
+    the connection stays usable.
+
+    Args:
+        pop_conn: poplib.POP3 connection
+        commands: Iterable of (key, command line) tuples, e.g. [(5, 'RETR 5')]
+        max_in_flight: Commands outstanding at once (more than 1 only with
+                       PIPELINING, see pipeline_depth)
+
+    Yields:
+        tuple: (key, Pop3Response) in command order
+    """
+    commands = iter(commands)
+    pending = deque()
+
+    def send():
+        while len(pending) < max(1, max_in_flight):
+            command = next(commands, None)
+            if command is None:
+                return
+            pop_conn._putcmd(command[1])
+            pending.append(command[0])
+
+    try:
+        send()
+        while pending:
+            response = Pop3Response(pop_conn)
+            try:
+                yield pending.popleft(), response
+            finally:
+                response.close()
+            send()
+    finally:
+        try:
+            while pending:
+                pending.popleft()
+                Pop3Response(pop_conn).close()
+        except Exception as e:
+            log(f"Error discarding pipelined POP3 responses: {e}", level="WARNING")
+
+
+def iter_pop3_messages(pop_conn, numbers, max_in_flight=1):
+    """
+    Retrieve messages (RETR) as streams of lines, pipelined when allowed.
+
+    Args:
+        pop_conn: poplib.POP3 connection
+        numbers: Message numbers in retrieval order
+        max_in_flight: Commands outstanding at once
+
+    Yields:
+        tuple: (message number, Pop3Response); iterating the response raises
+               poplib.error_proto if the server refused the message
+    """
+    return pipelined_commands(pop_conn, ((which, 'RETR %s' % which) for which in numbers), max_in_flight)
@@ -0,0 +1,260 @@
+"""
+POP3 triage before RETR
+
+POP3 has no SEARCH: every message used to be downloaded in full (RETR) and
+only then checked against the date range and for PDF attachments. Here the
+header block is read first with TOP n 0, and messages outside the date range
+or whose top-level Content-Type cannot hold a PDF attachment (e.g. a plain
+text or HTML message) are rejected before RETR.
+
+LIST sizes decide where triage pays off: for messages below MIN_TRIAGE_SIZE
+the TOP round trip costs about as much as downloading the whole message, so
+they are retrieved directly.
+
+TOP is optional in POP3 (RFC 1939); servers rejecting it are scanned with
+RETR only. TOP commands are pipelined when the server allows it (see
+pop3_pipeline).
+
+Message numbers follow arrival order, so in large maildrops the date range
+is first located by binary search (locate_date_window) with TOP probes and
+only that slice is triaged. Probes read the arrival time from the topmost
+Received header (added by the delivering server; the Date header set by the
+sender is the fallback) and take the median over neighbouring messages, so
+a single message with an odd date does not send the search astray; the
+slice is widened by WINDOW_MARGIN messages on both sides, where triage
+checks the dates exactly.
+"""
+import poplib
+from contextlib import closing
+from email.parser import BytesParser
+
+from gui.imap_search_components.date_gate import local_naive, parse_date_header
+from gui.mail_search_components.mime_stream import is_pdf_attachment
+from gui.mail_search_components.pop3_pipeline import pipelined_commands
+
+# Import logger from our local gui module
+try:
+    from gui.logger import log
+except ImportError:
+    # Fallback if running standalone
+    def log(message, level="INFO"):
+        print(f"[{level}] {message}", flush=True)
+
+# Messages smaller than this (LIST octets) are retrieved without a TOP first
+MIN_TRIAGE_SIZE = 16 * 1024
+
+# Maildrops with fewer messages are triaged whole instead of located by binary search
+MIN_LOCATE_COUNT = 500
+
+# Neighbouring messages read per binary search probe (median of their arrival times)
+PROBE_SIZE = 3
+
+# Messages added on both sides of the located window
+WINDOW_MARGIN = 25
+
+
+def parse_list_sizes(listings):
+    """
+    Parse a LIST response into message sizes.
+
+    Args:
+        listings: Lines of the LIST response (b'1 2048', ...)
+
+    Returns:
+        dict: {message number: size in octets}
+    """
+    sizes = {}
+    for listing in listings:
+        parts = listing.split()
+        if len(parts) >= 2 and parts[0].isdigit() and parts[1].isdigit():
+            sizes[int(parts[0])] = int(parts[1])
+    return sizes
+
+
+def iter_top_headers(pop_conn, numbers, max_in_flight=1):
+    """
+    Read the header blocks of messages with TOP n 0.
+
+    Args:
+        pop_conn: poplib.POP3 connection
+        numbers: Message numbers
+        max_in_flight: Commands outstanding at once (see pop3_pipeline)
+
+    Yields:
+        tuple: (message number, email.message.Message with the headers only,
+                or None if the server answered -ERR, e.g. TOP not supported)
+    """
+    commands = ((which, 'TOP %s 0' % which) for which in numbers)
+    with closing(pipelined_commands(pop_conn, commands, max_in_flight)) as responses:
+        for which, lines in responses:
+            try:
+                header_block = b''.join(lines)
+            except poplib.error_proto:
+                yield which, None
+                continue
+            yield which, BytesParser().parsebytes(header_block + b'\r\n', headersonly=True)
+
+
+def arrival_time(headers):
+    """
+    Arrival time of a message from its headers.
+
+    Args:
+        headers: email.message.Message with the top-level headers
+
+    Returns:
+        datetime: Time of the topmost Received header, else the Date header,
+                  else None
+    """
+    received = headers.get_all('Received') or []
+    if received and ';' in str(received[0]):
+        arrived = parse_date_header(' '.join(str(received[0]).rsplit(';', 1)[1].split()))
+        if arrived is not None:
+            return arrived
+    return parse_date_header(headers.get('Date'))
+
+
+class _Stopped(Exception):
+    """Binary search given up (stop requested or no dates to compare)"""
+
+
+def locate_date_window(pop_conn, count, start, end, min_count=MIN_LOCATE_COUNT,
+                       probe_size=PROBE_SIZE, margin=WINDOW_MARGIN, max_in_flight=1, should_stop=None):
+    """
+    Locate the messages of [start, end) in a maildrop by binary search.
+
+    Args:
+        pop_conn: poplib.POP3 connection
+        count: Number of messages in the maildrop
+        start: Inclusive start datetime or None
+        end: Exclusive end datetime or None
+        min_count: Smaller maildrops are not searched (None is returned)
+        probe_size: Neighbouring messages read per probe
+        margin: Messages added on both sides of the window
+        max_in_flight: TOP commands outstanding at once (see pop3_pipeline)
+        should_stop: Optional callable returning True to stop
+
+    Returns:
+        tuple: (first, last) message numbers, inclusive (first > last when
+               no message is in range), or None when the window could not
+               be located (small maildrop, no range, no TOP, no dates) and
+               all messages should be scanned
+    """
+    if count < min_count or (start is None and end is None):
+        return None
+    should_stop = should_stop or (lambda: False)
+    times = {}
+
+    def probe(which):
+        low = max(1, which - probe_size // 2)
+        numbers = range(low, min(count, low + probe_size - 1) + 1)
+        for number, headers in iter_top_headers(pop_conn, [n for n in numbers if n not in times],
+                                                max_in_flight):
+            times[number] = arrival_time(headers) if headers is not None else None
+        found = sorted(local_naive(times[number]) for number in numbers if times[number] is not None)
+        return found[len(found) // 2] if found else None
+
+    def first_at_or_after(bound):
+        if bound is None:
+            return None
+        bound = local_naive(bound)
+        low, high = 1, count + 1
+        while low < high:
+            if should_stop():
+                raise _Stopped()
+            middle = (low + high) // 2
+            arrived = probe(middle)
+            if arrived is None:
+                raise _Stopped()
+            if arrived >= bound:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    try:
+        first = first_at_or_after(start)
+        after_last = first_at_or_after(end)
+    except _Stopped:
+        return None
+    except poplib.error_proto as e:
+        log(f"POP3 date window not located, all messages are scanned: {e}", level="WARNING")
+        return None
+
+    first = max(1, (first or 1) - margin)
+    last = min(count, (after_last or count + 1) - 1 + margin)
+    log(f"POP3 date window: messages {first}-{last} of {count} ({len(times)} headers read)")
+    return first, last
+
+
+def may_contain_pdf(headers):
+    """
+    Check whether a message with these top-level headers can carry a PDF attachment.
+
+    Multipart messages and attached messages are always kept (a PDF may be in
+    any part); a single-part message is kept only if it is a PDF attachment
+    itself.
+
+    Args:
+        headers: email.message.Message with the top-level headers
+
+    Returns:
+        bool
+    """
+    if headers.get_content_maintype() == 'multipart' or headers.get_content_type() == 'message/rfc822':
+        return True
+    return is_pdf_attachment(headers)
+
+
+def triage_pop3_messages(pop_conn, numbers, sizes=None, accept_headers=None,
+                         min_size=MIN_TRIAGE_SIZE, max_in_flight=1, should_stop=None):
+    """
+    Reject messages by their headers before they are retrieved.
+
+    Args:
+        pop_conn: poplib.POP3 connection
+        numbers: Message numbers in scan order
+        sizes: Optional {message number: octets} from parse_list_sizes()
+        accept_headers: Optional callable(headers) -> bool, e.g. the date
+                        range check; False rejects the message
+        min_size: Messages known to be smaller are kept without a TOP
+        max_in_flight: TOP commands outstanding at once (see pop3_pipeline)
+        should_stop: Optional callable returning True to stop (the rest of
+                     the messages is then kept)
+
+    Returns:
+        tuple: (numbers to retrieve, numbers without PDF attachments,
+                numbers rejected by accept_headers), each in scan order
+    """
+    sizes = sizes or {}
+    should_stop = should_stop or (lambda: False)
+    candidates = [which for which in numbers if sizes.get(which) is None or sizes[which] >= min_size]
+    verdicts = {}   # Message number -> 'no_pdf' or 'rejected'
+    top_supported = False
+
+    with closing(iter_top_headers(pop_conn, candidates, max_in_flight)) as headers_stream:
+        for which, headers in headers_stream:
+            if should_stop():
+                break
+            if headers is None:
+                if not top_supported:
+                    log("POP3 server rejected TOP, messages are retrieved without triage", level="WARNING")
+                    break
+                continue
+            top_supported = True
+            if accept_headers is not None and not accept_headers(headers):
+                verdicts[which] = 'rejected'
+            elif not may_contain_pdf(headers):
+                verdicts[which] = 'no_pdf'
+
+    retrieve = [which for which in numbers if which not in verdicts]
+    no_pdf = [which for which in numbers if verdicts.get(which) == 'no_pdf']
+    rejected = [which for which in numbers if verdicts.get(which) == 'rejected']
+
+    if no_pdf or rejected:
+        skipped = no_pdf + rejected
+        skipped_octets = sum(sizes.get(which, 0) for which in skipped)
+        log(f"POP3 triage: skipping {len(skipped)} of {len(numbers)} messages "
+            f"({len(rejected)} outside the date range, {len(no_pdf)} without attachments, "
+            f"{skipped_octets} octets not retrieved)")
+    return retrieve, no_pdf, rejected
@@ -21,6 +21,7 @@ from datetime import datetime, timedelta, date
 from email.utils import parsedate_to_datetime
 import threading
 import queue
+from contextlib import closing, contextmanager
 
 # Import EmailAccountManager - use direct file import to avoid circular dependency
 import importlib.util
@@ -47,6 +48,134 @@ try:
 except Exception:
     open_znalezione_window = None
 
+# Safe import for attachment-level IMAP scanning (fetches only PDF sections)
+try:
+    from gui.imap_search_components.imap_scanner import iter_pdf_messages, fetch_full_message
+except Exception:
+    iter_pdf_messages = None
+    fetch_full_message = None
+
+# Safe import for parallel multi-connection IMAP scanning
+try:
+    from gui.imap_search_components.parallel_scanner import (
+        scan_uids_parallel, ScanResultSink, DEFAULT_NUM_CONNECTIONS, MAX_NUM_CONNECTIONS
+    )
+except Exception:
+    scan_uids_parallel = None
+    ScanResultSink = None
+    DEFAULT_NUM_CONNECTIONS = 1
+    MAX_NUM_CONNECTIONS = 1
+
+# Safe import for incremental IMAP scan state (UIDVALIDITY/UIDNEXT/HIGHESTMODSEQ)
+try:
+    from gui.imap_search_components.sync_state import (
+        SyncStateStore, read_mailbox_state, plan_incremental_scan, filter_new_uids, quote_mailbox
+    )
+except Exception:
+    SyncStateStore = None
+    read_mailbox_state = None
+
+# Safe import for the persistent ledger of scanned messages (SQLite)
+try:
+    from gui.imap_search_components.scan_ledger import ScanLedger, pdf_hash, uids_to_scan, unseen_uids
+    from gui.imap_search_components.fetch_pipeline import compress_uid_set
+except Exception:
+    ScanLedger = None
+
+# Safe import for exact date range gating before body download (INTERNALDATE / Date field)
+try:
+    from gui.imap_search_components.date_gate import filter_uids_by_date, datetime_in_range
+except Exception:
+    filter_uids_by_date = None
+    datetime_in_range = None
+
+# Safe import for cross-folder duplicate suppression (Message-ID + PDF parts)
+try:
+    from gui.imap_search_components.message_dedup import MessageDeduplicator
+except Exception:
+    MessageDeduplicator = None
+
+# Safe import for the FETCH response parser
+try:
+    from gui.imap_search_components.fetch_parser import parse_fetch_items, fetch_message_body
+except Exception:
+    parse_fetch_items = None
+    fetch_message_body = None
+
+# Safe import for the Gmail fast path (X-GM-RAW server-side search)
+try:
+    from gui.imap_search_components.gmail_search import (
+        supports_gmail_extensions, build_gmail_raw_query, gmail_raw_criterion, find_all_mail_folder
+    )
+except Exception:
+    supports_gmail_extensions = None
+
+# Safe import for the capability-aware IMAP SEARCH planner
+try:
+    from gui.imap_search_components.search_planner import (
+        server_capabilities, plan_imap_search, run_search_plans, MIN_PDF_MESSAGE_SIZE
+    )
+except Exception:
+    plan_imap_search = None
+
+# Safe import for folder-level parallel IMAP scanning (all folders, largest first)
+try:
+    from gui.imap_search_components.folder_scheduler import plan_folder_scan, scan_folders_parallel
+except Exception:
+    plan_folder_scan = None
+
+# Safe import for the pool of logged-in IMAP/POP3 connections reused across searches
+try:
+    from gui.mail_search_components.connection_pool import get_connection_pool
+except Exception:
+    get_connection_pool = None
+
+# Safe import for resumable scans (UID checkpoints, reconnect with backoff)
+try:
+    from gui.imap_search_components.scan_checkpoint import (
+        ScanCheckpointStore, FolderCheckpoint, UidWatermark, scan_signature, uids_after,
+        is_connection_error, reconnect_with_backoff, MAX_RECONNECTS_PER_SCAN
+    )
+except Exception:
+    ScanCheckpointStore = None
+
+# Safe import for streaming MIME parsing (PDF parts spooled to disk, bounded memory)
+try:
+    from gui.mail_search_components.mime_stream import (
+        parse_message_stream, iter_bytes_chunks, iter_pop3_message
+    )
+except Exception:
+    parse_message_stream = None
+
+# Safe import for POP3 triage (TOP n 0 headers and LIST sizes checked before RETR,
+# date window located by binary search over message numbers)
+try:
+    from gui.mail_search_components.pop3_triage import (
+        parse_list_sizes, triage_pop3_messages, locate_date_window
+    )
+except Exception:
+    triage_pop3_messages = None
+
+# Safe import for pipelined POP3 commands (RFC 2449 PIPELINING, RETR streamed to the parser)
+try:
+    from gui.mail_search_components.pop3_pipeline import pipeline_depth, iter_pop3_messages
+except Exception:
+    pipeline_depth = None
+
+# Safe import for native Exchange scanning over EWS (exchangelib)
+try:
+    from gui.mail_search_components.exchange_scanner import (
+        HAVE_EXCHANGELIB, connect_account, candidate_items, iter_pdf_messages as iter_ews_pdf_messages
+    )
+except Exception:
+    HAVE_EXCHANGELIB = False
+
+# Safe import for IMAP IDLE watch mode (continuous capture of new messages)
+try:
+    from gui.imap_search_components.idle_watcher import watch_folders
+except Exception:
+    watch_folders = None
+
 # Safe import for logger with extended functionality
 try:
     from gui.logger import log, set_level, init_from_config, save_level_to_config, LOG_LEVEL_NAMES, get_level
@@ -304,7 +433,7 @@ class EmailInvoiceFinderApp:
                        value='IMAP').pack(side='left', padx=5)
         ttk.Radiobutton(protocol_frame, text="POP3", variable=self.protocol_var, 
                        value='POP3').pack(side='left', padx=5)
-        ttk.Radiobutton(protocol_frame, text="Exchange (IMAP)", variable=self.protocol_var, 
+        ttk.Radiobutton(protocol_frame, text="Exchange", variable=self.protocol_var, 
                        value='EXCHANGE').pack(side='left', padx=5)
         
         # Serwer
@@ -549,20 +678,93 @@ class EmailInvoiceFinderApp:
             self.date_to_entry = None
             self.date_range_info_label = None
         
+        # Data wiadomości wg nagłówka Date (data nadawcy) zamiast daty odbioru przez serwer
+        # (INTERNALDATE) - zakres dat jest sprawdzany przed pobraniem treści wiadomości
+        self.date_by_header_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(date_range_frame, text="Wg nagłówka Date", 
+                       variable=self.date_by_header_var).pack(side='left', padx=10)
+        
         # Zapisz ustawienia
         self.save_search_config_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(self.search_frame, text="Zapisz ustawienia", 
                        variable=self.save_search_config_var).grid(row=3, column=0, columnspan=2, padx=10, pady=5)
         
+        # Opcje wyszukiwania (jeden wiersz z checkboxami)
+        search_options_frame = ttk.Frame(self.search_frame)
+        search_options_frame.grid(row=4, column=0, columnspan=2, padx=10, pady=5, sticky='w')
+        
         # Sortuj w folderach - checkbox umieszczony w zakładce "Wyszukiwanie"
         # Gdy zaznaczony, podczas zapisu wyników utworzone zostaną podfoldery MM.YYYY (np. 10.2025)
         self.sort_in_folders_var = tk.BooleanVar(value=False)
-        ttk.Checkbutton(self.search_frame, text="Sortuj w folderach", 
-                       variable=self.sort_in_folders_var).grid(row=4, column=0, columnspan=2, padx=10, pady=5, sticky='w')
+        ttk.Checkbutton(search_options_frame, text="Sortuj w folderach", 
+                       variable=self.sort_in_folders_var).pack(side='left')
+        
+        # Pobieraj tylko załączniki PDF (IMAP) - zamiast całych wiadomości (RFC822)
+        # pobierane są tylko sekcje MIME z plikami PDF; pełna wiadomość (.eml)
+        # jest pobierana wyłącznie dla znalezionych faktur
+        self.fetch_pdf_sections_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_options_frame, text="Pobieraj tylko załączniki PDF (IMAP)", 
+                       variable=self.fetch_pdf_sections_var).pack(side='left', padx=(15, 0))
+        
+        # Liczba równoległych połączeń IMAP (tylko w trybie pobierania załączników PDF)
+        # Większość serwerów pozwala na 10-15 sesji na konto
+        ttk.Label(search_options_frame, text="Połączenia IMAP:").pack(side='left', padx=(15, 0))
+        self.imap_connections_var = tk.IntVar(value=DEFAULT_NUM_CONNECTIONS)
+        ttk.Spinbox(search_options_frame, from_=1, to=MAX_NUM_CONNECTIONS, width=4,
+                    textvariable=self.imap_connections_var).pack(side='left', padx=(5, 0))
+        
+        # Tylko nowe wiadomości - skanowanie przyrostowe: IMAP przeszukuje tylko wiadomości
+        # dodane od ostatniego zakończonego skanowania tego samego NIP; POP3 pobiera tylko
+        # wiadomości o nieznanym UIDL (oraz wcześniej sprawdzone trafienia jeszcze niezapisane)
+        self.incremental_scan_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_options_frame, text="Tylko nowe wiadomości", 
+                       variable=self.incremental_scan_var).pack(side='left', padx=(15, 0))
+        
+        # Pamiętaj przeskanowane wiadomości - lokalna baza (SQLite) z tekstem sprawdzonych
+        # załączników PDF; ponowne wyszukiwanie (także innego NIP) pobiera tylko trafienia
+        # i wiadomości jeszcze nieprzeskanowane
+        self.use_scan_ledger_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(search_options_frame, text="Pamiętaj przeskanowane wiadomości", 
+                       variable=self.use_scan_ledger_var).pack(side='left', padx=(15, 0))
+        
+        # Wszystkie foldery (IMAP) - foldery z LIST przeszukiwane równolegle (po jednym na
+        # połączenie), od największego wg STATUS; foldery z listy "Pomiń foldery" są pomijane
+        imap_folders_frame = ttk.Frame(self.search_frame)
+        imap_folders_frame.grid(row=5, column=0, columnspan=2, padx=10, pady=5, sticky='w')
+        
+        self.all_imap_folders_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(imap_folders_frame, text="Wszystkie foldery (IMAP)", 
+                       variable=self.all_imap_folders_var).pack(side='left')
+        ttk.Label(imap_folders_frame, text="Pomiń foldery:").pack(side='left', padx=(15, 0))
+        self.excluded_folders_entry = ttk.Entry(imap_folders_frame, width=40)
+        self.excluded_folders_entry.pack(side='left', padx=(5, 0))
+        ttk.Label(imap_folders_frame, text="(oddzielone przecinkami)", 
+                 foreground="gray").pack(side='left', padx=(5, 0))
+        
+        # Wznawiaj przerwane wyszukiwanie (IMAP) - postęp (ostatni UID) jest zapisywany na bieżąco;
+        # wyszukiwanie przerwane ("Przerwij" lub zerwane połączenie) uruchomione ponownie z tym samym
+        # NIP i zakresem dat jest kontynuowane od miejsca przerwania
+        self.resume_scan_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(imap_folders_frame, text="Wznawiaj przerwane wyszukiwanie", 
+                       variable=self.resume_scan_var).pack(side='left', padx=(15, 0))
+        
+        # Pomijaj kopie wiadomości - ta sama wiadomość (Message-ID oraz nazwy i rozmiary
+        # załączników PDF) w kilku folderach jest pobierana i sprawdzana tylko raz; z bazą
+        # przeskanowanych wiadomości także kopie wiadomości sprawdzonych wcześniej
+        self.skip_duplicates_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(imap_folders_frame, text="Pomijaj kopie wiadomości", 
+                       variable=self.skip_duplicates_var).pack(side='left', padx=(15, 0))
+        
+        # Filtruj na serwerze (IMAP) - serwer pomija wiadomości mniejsze niż 1 KB i inne niż
+        # multipart/application/pdf; szybsze, ale faktura wysłana jako jedyna część
+        # application/octet-stream nie zostanie znaleziona, dlatego domyślnie wyłączone
+        self.narrow_imap_search_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(imap_folders_frame, text="Filtruj na serwerze (IMAP)", 
+                       variable=self.narrow_imap_search_var).pack(side='left', padx=(15, 0))
         
         # Przyciski wyszukiwania
         button_frame = ttk.Frame(self.search_frame)
-        button_frame.grid(row=5, column=0, columnspan=2, pady=20)
+        button_frame.grid(row=6, column=0, columnspan=2, pady=20)
         
         self.search_button = ttk.Button(button_frame, text="Szukaj faktur", 
                    command=self.start_search_thread)
@@ -600,22 +802,32 @@ class EmailInvoiceFinderApp:
                                              command=_open_znalezione_with_criteria)
         self.znalezione_button.pack(side='left', padx=5)
         
+        # Obserwuj skrzynkę (IMAP IDLE) - po zakończeniu wyszukiwania sesja IDLE czeka na nowe
+        # wiadomości w podanych folderach i sprawdza je od razu (do kliknięcia "Przerwij")
+        self.watch_mailbox_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="Obserwuj skrzynkę (IMAP IDLE)", 
+                       variable=self.watch_mailbox_var).pack(side='left', padx=(15, 0))
+        ttk.Label(button_frame, text="Foldery:").pack(side='left', padx=(5, 0))
+        self.watch_folders_entry = ttk.Entry(button_frame, width=20)
+        self.watch_folders_entry.insert(0, 'INBOX')
+        self.watch_folders_entry.pack(side='left', padx=(5, 0))
+        
         # Selected date range display (above progress bar)
         self.selected_range_label = ttk.Label(self.search_frame, text="", foreground="green", font=('Arial', 9, 'bold'))
-        self.selected_range_label.grid(row=5, column=0, columnspan=2, sticky='w', padx=10, pady=2)
+        self.selected_range_label.grid(row=6, column=0, columnspan=2, sticky='w', padx=10, pady=2)
         
         # Pasek postępu
         self.progress = ttk.Progressbar(self.search_frame, mode='indeterminate')
-        self.progress.grid(row=6, column=0, columnspan=2, sticky='ew', padx=10, pady=5)
+        self.progress.grid(row=7, column=0, columnspan=2, sticky='ew', padx=10, pady=5)
         
         # Wyniki
-        ttk.Label(self.search_frame, text="Wyniki:").grid(row=7, column=0, columnspan=2, sticky='w', padx=10, pady=5)
+        ttk.Label(self.search_frame, text="Wyniki:").grid(row=8, column=0, columnspan=2, sticky='w', padx=10, pady=5)
         
         self.results_text = scrolledtext.ScrolledText(self.search_frame, height=20, width=70)
-        self.results_text.grid(row=8, column=0, columnspan=2, sticky='nsew', padx=10, pady=5)
+        self.results_text.grid(row=9, column=0, columnspan=2, sticky='nsew', padx=10, pady=5)
         
         self.search_frame.columnconfigure(1, weight=1)
-        self.search_frame.rowconfigure(8, weight=1)
+        self.search_frame.rowconfigure(9, weight=1)
     
     def create_about_tab(self):
         """Tworzenie zakładki O programie"""
@@ -1069,7 +1281,9 @@ class EmailInvoiceFinderApp:
             'output_folder': self.folder_entry.get() if self.save_search_config_var.get() else '',
             'save_search_settings': self.save_search_config_var.get(),
             'date_from': self.search_config.get('date_from') if self.save_search_config_var.get() else None,
-            'date_to': self.search_config.get('date_to') if self.save_search_config_var.get() else None
+            'date_to': self.search_config.get('date_to') if self.save_search_config_var.get() else None,
+            'watch_folders': self.watch_folders_entry.get() if hasattr(self, 'watch_folders_entry') else 'INBOX',
+            'excluded_folders': self.excluded_folders_entry.get() if hasattr(self, 'excluded_folders_entry') else ''
         }
         
         try:
@@ -1146,6 +1360,12 @@ class EmailInvoiceFinderApp:
             self.folder_entry.insert(0, self.search_config['output_folder'])
         if 'save_search_settings' in self.search_config:
             self.save_search_config_var.set(self.search_config['save_search_settings'])
+        if self.search_config.get('excluded_folders'):
+            self.excluded_folders_entry.delete(0, tk.END)
+            self.excluded_folders_entry.insert(0, self.search_config['excluded_folders'])
+        if self.search_config.get('watch_folders'):
+            self.watch_folders_entry.delete(0, tk.END)
+            self.watch_folders_entry.insert(0, self.search_config['watch_folders'])
         
         # Apply date range configuration
         if TKCALENDAR_AVAILABLE and self.date_from_entry and self.date_to_entry:
@@ -1203,7 +1423,13 @@ class EmailInvoiceFinderApp:
         self.root.update()
         
         try:
-            if protocol == 'POP3':
+            if get_connection_pool is not None:
+                # Sesja trafia do puli połączeń - następne wyszukiwanie użyje jej bez ponownego logowania
+                test_config = {'protocol': protocol, 'server': server, 'port': port,
+                               'email': email_addr, 'password': password, 'use_ssl': use_ssl}
+                with get_connection_pool().connection(test_config):
+                    pass
+            elif protocol == 'POP3':
                 if use_ssl:
                     mail = poplib.POP3_SSL(server, port)
                 else:
@@ -1534,15 +1760,221 @@ class EmailInvoiceFinderApp:
             return dest_folder
     
     def _save_attachment_with_timestamp(self, attachment_data, output_path, email_message):
-        """Save attachment and set its timestamp from email date"""
+        """Save attachment (bytes or spooled part) and set its timestamp from email date"""
         with open(output_path, 'wb') as f:
-            f.write(attachment_data)
+            self._write_data(f, attachment_data)
         
         # Set file timestamp from email date
         email_dt = self._get_email_timestamp(email_message)
         if email_dt:
             self._set_file_timestamp(output_path, email_dt)
     
+    def _write_data(self, file_obj, data):
+        """Write bytes or spooled data (mime_stream.SpooledData) to an open binary file"""
+        if hasattr(data, 'copy_to'):
+            data.copy_to(file_obj)
+        else:
+            file_obj.write(data)
+    
+    def _extract_pdf_text_from_bytes(self, pdf_data):
+        """Extract text from PDF attachment data - bytes or spooled part (via temporary file)"""
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+            self._write_data(tmp_file, pdf_data)
+            tmp_path = tmp_file.name
+        
+        try:
+            return self.extract_text_from_pdf(tmp_path)
+        finally:
+            # Remove temporary file
+            try:
+                os.unlink(tmp_path)
+            except (OSError, PermissionError):
+                # Silently ignore - temp file cleanup is not critical
+                pass
+    
+    def _pdf_contains_nip(self, pdf_data, nip):
+        """Check if PDF attachment data contains the given NIP (via temporary file)"""
+        pdf_text = self._extract_pdf_text_from_bytes(pdf_data)
+        
+        # Check if contains NIP
+        return self.search_nip_in_text(pdf_text, nip)
+    
+    def _open_scan_ledger(self, folder, uidvalidity, required=False):
+        """Open the ledger of scanned messages for one folder (checkbox in search tab)
+        
+        Args:
+            folder: Folder name ('INBOX' for POP3)
+            uidvalidity: Folder UIDVALIDITY (0 for POP3), None if unknown
+            required: Open even with the checkbox off (POP3 incremental scans
+                      keep their state in the ledger)
+        
+        Returns:
+            dict: {'ledger', 'account', 'folder', 'uidvalidity'} or None when the
+                  ledger is disabled or unavailable
+        """
+        # Use hasattr for safety: use_scan_ledger_var is created in create_search_tab()
+        if ScanLedger is None or uidvalidity is None:
+            return None
+        if not required and (not hasattr(self, 'use_scan_ledger_var') or not self.use_scan_ledger_var.get()):
+            return None
+        try:
+            ledger = ScanLedger()
+        except Exception as e:
+            self.safe_log(f"Ostrzeżenie: nie można otworzyć bazy przeskanowanych wiadomości: {e}")
+            return None
+        return {
+            'ledger': ledger,
+            'account': self.email_config['email'],
+            'folder': folder,
+            'uidvalidity': uidvalidity,
+        }
+    
+    def _close_scan_ledger(self, ledger_ctx):
+        """Close a ledger opened by _open_scan_ledger()"""
+        if ledger_ctx:
+            ledger_ctx['ledger'].close()
+    
+    def _ledger_uids_to_scan(self, ledger_ctx, uids, nip, unseen_only=False):
+        """Drop messages the ledger already knows not to contain the NIP
+        
+        With unseen_only, messages whose invoices with this NIP have already
+        been saved are dropped too (incremental scan).
+        """
+        if not ledger_ctx or not uids:
+            return uids
+        try:
+            if unseen_only:
+                remaining, skipped = unseen_uids(
+                    ledger_ctx['ledger'], ledger_ctx['account'], ledger_ctx['folder'],
+                    ledger_ctx['uidvalidity'], uids, nip,
+                    lambda text: self.search_nip_in_text(text, nip)
+                )
+            else:
+                remaining, skipped = uids_to_scan(
+                    ledger_ctx['ledger'], ledger_ctx['account'], ledger_ctx['folder'],
+                    ledger_ctx['uidvalidity'], uids,
+                    lambda text: self.search_nip_in_text(text, nip)
+                )
+        except Exception as e:
+            self.safe_log(f"Ostrzeżenie: błąd odczytu bazy przeskanowanych wiadomości: {e}")
+            return uids
+        if skipped and unseen_only:
+            self.safe_log(f"Pominięto {skipped} wcześniej przeskanowanych wiadomości")
+        elif skipped:
+            self.safe_log(f"Pominięto {skipped} wcześniej przeskanowanych wiadomości (bez tego NIP)")
+        return remaining
+    
+    def _pdf_matches_nip(self, pdf_data, nip, filename, ledger_ctx=None, ledger_parts=None):
+        """Check a PDF for the NIP, reusing text stored in the ledger
+        
+        Args:
+            pdf_data: Decoded PDF bytes or spooled part (mime_stream.SpooledPart)
+            nip: NIP number to search for
+            filename: Attachment filename
+            ledger_ctx: Ledger context from _open_scan_ledger() or None
+            ledger_parts: List collecting the part records of the message
+        """
+        if not ledger_ctx:
+            return self._pdf_contains_nip(pdf_data, nip)
+        
+        if hasattr(pdf_data, 'sha256'):
+            content_hash, size = pdf_data.sha256, pdf_data.size
+        else:
+            content_hash, size = pdf_hash(pdf_data), len(pdf_data or b'')
+        text = ledger_ctx['ledger'].cached_text(content_hash)
+        if text is None:
+            text = self._extract_pdf_text_from_bytes(pdf_data)
+        ledger_parts.append({
+            'filename': filename,
+            'sha256': content_hash,
+            'size': size,
+            'text': text,
+        })
+        return self.search_nip_in_text(text, nip)
+    
+    def _ledger_record(self, ledger_ctx, uid, ledger_parts, fingerprint=None, hit_nip=None):
+        """Record a fully examined message in the ledger (hit_nip: NIP its invoices were saved for)"""
+        if ledger_ctx and uid is not None:
+            ledger_ctx['ledger'].record_message(ledger_ctx['account'], ledger_ctx['folder'],
+                                                ledger_ctx['uidvalidity'], uid, ledger_parts,
+                                                fingerprint=fingerprint)
+            if hit_nip:
+                ledger_ctx['ledger'].record_hit(ledger_ctx['account'], ledger_ctx['folder'],
+                                                ledger_ctx['uidvalidity'], uid, hit_nip)
+    
+    def _open_message_dedup(self, nip):
+        """Start suppressing copies of messages found in several folders (checkbox in search tab)
+        
+        With the ledger enabled, copies of messages scanned in earlier searches
+        whose stored PDF text does not contain the NIP are skipped as well.
+        
+        Returns:
+            MessageDeduplicator or None when disabled or unavailable
+        """
+        # Use hasattr for safety: skip_duplicates_var is created in create_search_tab()
+        if (MessageDeduplicator is None or not hasattr(self, 'skip_duplicates_var')
+                or not self.skip_duplicates_var.get()):
+            return None
+        ledger = None
+        if ScanLedger is not None and hasattr(self, 'use_scan_ledger_var') and self.use_scan_ledger_var.get():
+            try:
+                ledger = ScanLedger()
+            except Exception as e:
+                self.safe_log(f"Ostrzeżenie: nie można otworzyć bazy przeskanowanych wiadomości: {e}")
+        return MessageDeduplicator(ledger, self.email_config['email'],
+                                   lambda text: self.search_nip_in_text(text, nip))
+    
+    def _close_message_dedup(self, dedup):
+        """Close the ledger of a MessageDeduplicator and log the skipped copies"""
+        if dedup is None:
+            return
+        if dedup.ledger is not None:
+            dedup.ledger.close()
+        if dedup.skipped:
+            self.safe_log(f"Pominięto {dedup.skipped} kopii wiadomości już sprawdzonych")
+    
+    def _save_found_invoice(self, output_folder, found_count, filename, pdf_data, email_message, email_body):
+        """
+        Save a found invoice PDF and the complete email (.eml) with timestamps.
+        
+        Args:
+            output_folder: Base output folder
+            found_count: Sequence number of the hit (used as file name prefix)
+            filename: Decoded attachment filename
+            pdf_data: Decoded PDF bytes or spooled part (mime_stream.SpooledPart)
+            email_message: email.message.Message with at least the Date header
+            email_body: Raw message bytes, spooled raw message (mime_stream.SpooledData),
+                        or a callable returning the bytes (fetched on demand)
+        """
+        # Get email timestamp
+        email_dt = self._get_email_timestamp(email_message)
+        
+        # Determine destination folder (base or MM.YYYY subfolder)
+        dest_folder = self._ensure_dir_for_email_date(output_folder, email_dt)
+        
+        # Save PDF file with timestamp
+        safe_filename = self.make_safe_filename(filename)
+        output_path = os.path.join(dest_folder, f"{found_count}_{safe_filename}")
+        
+        self._save_attachment_with_timestamp(pdf_data, output_path, email_message)
+        
+        # Also save the complete email as .eml file in Poczta subfolder
+        poczta_folder = self._ensure_poczta_subfolder(dest_folder)
+        eml_filename = f"{found_count}_email.eml"
+        eml_path = os.path.join(poczta_folder, eml_filename)
+        try:
+            if callable(email_body):
+                email_body = email_body()
+            if email_body is None:
+                raise ValueError("brak treści wiadomości")
+            with open(eml_path, 'wb') as eml_file:
+                self._write_data(eml_file, email_body)
+            # Set timestamp on EML file too
+            if email_dt:
+                self._set_file_timestamp(eml_path, email_dt)
+        except Exception as e:
+            self.safe_log(f"Ostrzeżenie: Nie można zapisać pliku .eml: {e}")
+    
     def _search_worker(self, params):
         """Worker thread for searching emails - runs in background"""
         try:
@@ -1570,8 +2002,14 @@ class EmailInvoiceFinderApp:
             # Connect to email server
             if protocol == 'POP3':
                 found_count = self._search_with_pop3_threaded(nip, output_folder, cutoff_dt, end_dt)
-            else:  # IMAP or EXCHANGE
+            elif protocol == 'EXCHANGE' and HAVE_EXCHANGELIB:
+                found_count = self._search_with_ews_threaded(nip, output_folder, cutoff_dt, end_dt)
+            else:  # IMAP or EXCHANGE without exchangelib
                 found_count = self._search_with_imap_threaded(nip, output_folder, cutoff_dt, end_dt)
+                
+                # Watch mode: keep IDLE sessions open and check new messages as they arrive
+                if self._use_imap_watch() and not self.stop_event.is_set():
+                    found_count = self._watch_imap_mailbox(nip, output_folder, found_count)
             
             # Log completion
             if self.stop_event.is_set():
@@ -1623,9 +2061,9 @@ class EmailInvoiceFinderApp:
         
         try:
             email_dt = parsedate_to_datetime(date_header)
-            # Jeśli email_dt ma timezone, usuń go dla porównania
+            # Porównanie w czasie lokalnym: data ze strefą jest przeliczana, a nie obcinana
             if email_dt.tzinfo is not None:
-                email_dt = email_dt.replace(tzinfo=None)
+                email_dt = email_dt.astimezone().replace(tzinfo=None)
             
             # Check lower bound
             if cutoff_dt is not None and email_dt < cutoff_dt:
@@ -1639,6 +2077,56 @@ class EmailInvoiceFinderApp:
         except (TypeError, ValueError):
             return True  # W razie błędu parsowania, nie odrzucamy
     
+    def _date_by_header(self):
+        """Check if the date range applies to the Date header instead of INTERNALDATE (checkbox in search tab)"""
+        # Use hasattr for safety: date_by_header_var is created in create_search_tab()
+        return hasattr(self, 'date_by_header_var') and self.date_by_header_var.get()
+    
+    def _triage_date_is_within_range(self, headers, cutoff_dt, end_dt=None):
+        """Check triage headers against [cutoff_dt, end_dt): INTERNALDATE when known, else the Date header
+        
+        Args:
+            headers: Triage headers (EnvelopeHeaders carry the INTERNALDATE)
+            cutoff_dt: Start datetime (inclusive) or None
+            end_dt: End datetime (exclusive) or None
+        """
+        internaldate = getattr(headers, 'internaldate', None)
+        if internaldate is not None and datetime_in_range is not None and not self._date_by_header():
+            return datetime_in_range(internaldate, cutoff_dt, end_dt)
+        return self._email_date_is_within_range(headers.get('Date'), cutoff_dt, end_dt)
+    
+    def _gate_imap_messages_by_date(self, mail, messages, cutoff_dt, end_dt=None):
+        """Drop messages outside [cutoff_dt, end_dt) before their bodies are downloaded
+        
+        IMAP SINCE/BEFORE match whole days, so the first and last day of the range
+        return messages outside it. Their INTERNALDATE (or the Date header field
+        alone) is fetched and checked here instead of after the RFC822 download.
+        
+        Args:
+            mail: IMAP connection with the folder selected
+            messages: List of (sequence number, UID) pairs
+            cutoff_dt: Start datetime (inclusive) or None
+            end_dt: End datetime (exclusive) or None
+            
+        Returns:
+            tuple: (messages in range, True when the dates have been checked)
+        """
+        if (filter_uids_by_date is None or (cutoff_dt is None and end_dt is None)
+                or not messages or not all(uid for _, uid in messages)):
+            return messages, False
+        try:
+            allowed = set(filter_uids_by_date(mail, [uid for _, uid in messages], cutoff_dt, end_dt,
+                                              use_date_header=self._date_by_header(),
+                                              should_stop=self.stop_event.is_set))
+        except Exception as e:
+            self.safe_log(f"Ostrzeżenie: nie można sprawdzić dat wiadomości przed pobraniem: {e}")
+            return messages, False
+        in_range = [(msg_id, uid) for msg_id, uid in messages if str(uid) in allowed]
+        if len(in_range) < len(messages):
+            self.safe_log(f"Pominięto {len(messages) - len(in_range)} wiadomości spoza zakresu dat "
+                          f"(bez pobierania treści)")
+        return in_range, True
+    
     def _search_with_imap_threaded(self, nip, output_folder, cutoff_dt, end_dt=None):
         """Threaded IMAP search with stop event checking and timestamp setting
         
@@ -1648,24 +2136,62 @@ class EmailInvoiceFinderApp:
             cutoff_dt: Start datetime (inclusive) or None
             end_dt: End datetime (exclusive) or None
         """
-        found_count = 0
-        
-        # Connect to server
-        if self.email_config['use_ssl']:
-            mail = imaplib.IMAP4_SSL(self.email_config['server'], int(self.email_config['port']))
-        else:
-            mail = imaplib.IMAP4(self.email_config['server'], int(self.email_config['port']))
-        
-        mail.login(self.email_config['email'], self.email_config['password'])
+        # Connect to server (a pooled session from a previous search is reused)
+        with self._mail_session() as mail:
+            self.safe_log(f"Połączono z serwerem IMAP (adres: {self.email_config['email']})")
+            
+            # All folders: scanned concurrently, largest first
+            if self._use_all_imap_folders():
+                return self._search_imap_all_folders(mail, nip, output_folder, cutoff_dt, end_dt)
+            
+            # Select INBOX (unselected again when the connection goes back to the pool)
+            mail.select('INBOX')
+            
+            found_count = self._search_imap_folder(mail, 'INBOX', nip, output_folder, cutoff_dt, end_dt)
+            self._clear_scan_checkpoints(nip, cutoff_dt, end_dt)
+            return found_count
+    
+    def _search_imap_folder(self, mail, folder, nip, output_folder, cutoff_dt, end_dt=None,
+                            sink=None, parallel=True, dedup=None, sync_store=None):
+        """Search one selected IMAP folder for invoices
         
-        self.safe_log(f"Połączono z serwerem IMAP (adres: {self.email_config['email']})")
+        Args:
+            mail: IMAP connection with the folder selected
+            folder: Folder name (incremental state and ledger are kept per folder)
+            nip: NIP number to search for
+            output_folder: Directory to save found invoices
+            cutoff_dt: Start datetime (inclusive) or None
+            end_dt: End datetime (exclusive) or None
+            sink: ScanResultSink shared between folders (hit numbering), or None
+            parallel: Allow parallel connections within the folder
+            dedup: MessageDeduplicator shared between folders, or None (used when
+                   only PDF sections are downloaded)
+            sync_store: SyncStateStore shared between folders scanned concurrently,
+                        or None to open one for this folder
+            
+        Returns:
+            int: Number of hits (total of the sink when one is given)
+        """
+        found_count = sink.found_count if sink is not None else 0
         
-        # Select INBOX
-        mail.select('INBOX')
+        # Incremental mode: only messages added since the last completed scan
+        sync_store, folder_state, sync_plan = self._plan_incremental_imap_scan(
+            mail, folder, nip, cutoff_dt, end_dt, sync_store)
+        if sync_plan and sync_plan['mode'] == 'unchanged':
+            self.safe_log(f"Brak nowych wiadomości od ostatniego skanowania ({folder})")
+            return found_count
         
         # Build search criteria with server-side date filtering
         search_criteria_parts = []
         
+        min_uid = None
+        if sync_plan and sync_plan['mode'] == 'incremental':
+            min_uid = sync_plan['min_uid']
+            search_criteria_parts.append(f'UID {min_uid}:*')
+            self.safe_log(f"Skanowanie przyrostowe: wiadomości od UID {min_uid}")
+        elif sync_plan:
+            self.safe_log("Skanowanie przyrostowe: pełne skanowanie folderu (brak zgodnego stanu)")
+        
         if cutoff_dt:
             # Use IMAP SINCE to filter on server side (messages on or after cutoff_dt)
             since_date_str = cutoff_dt.strftime("%d-%b-%Y")
@@ -1678,248 +2204,1108 @@ class EmailInvoiceFinderApp:
             search_criteria_parts.append(f'BEFORE {before_date_str}')
             self.safe_log(f"Używam filtrowania IMAP: BEFORE {before_date_str}")
         
-        if search_criteria_parts:
-            search_criteria = ' '.join(search_criteria_parts)
-            status, messages = mail.search(None, search_criteria)
-        else:
-            # No date filter, search all messages
-            status, messages = mail.search(None, 'ALL')
-        
-        if status != 'OK':
-            raise Exception("Nie można pobrać listy wiadomości")
-        
-        message_ids = messages[0].split()
-        total_messages = len(message_ids)
-        
-        self.safe_log(f"Znaleziono {total_messages} wiadomości do przeszukania")
-        
-        # Process messages with stop event checking
-        for i, msg_id in enumerate(message_ids, 1):
-            # Check if stop was requested
-            if self.stop_event.is_set():
-                break
-            
-            if i % 10 == 0:
-                self.safe_log(f"Przetworzono {i}/{total_messages} wiadomości...")
-            
-            try:
-                status, msg_data = mail.fetch(msg_id, '(RFC822)')
-                
-                if status != 'OK':
-                    continue
-                
-                email_body = msg_data[0][1]
-                email_message = email.message_from_bytes(email_body)
+        # Gmail: let the server select messages with PDF attachments
+        if self._use_gmail_fast_path(mail):
+            gmail_query = build_gmail_raw_query(cutoff_dt, end_dt)
+            search_criteria_parts.append(gmail_raw_criterion(gmail_query))
+            self.safe_log(f"Gmail: wyszukiwanie po stronie serwera (X-GM-RAW \"{gmail_query}\")")
+        
+        # Section-level mode: download only PDF MIME sections instead of RFC822
+        if self._use_pdf_section_fetch():
+            search_criteria = ' '.join(search_criteria_parts) if search_criteria_parts else 'ALL'
+            failed_uids = []
+            found_count = self._scan_imap_pdf_sections(mail, search_criteria, nip, output_folder,
+                                                       cutoff_dt, end_dt, folder=folder, min_uid=min_uid,
+                                                       sink=sink, parallel=parallel, dedup=dedup,
+                                                       failed_uids=failed_uids)
+            if failed_uids:
+                # Not advancing the state keeps the unscanned messages in the next search
+                self.safe_log(f"Ostrzeżenie: nie udało się przeszukać {len(failed_uids)} wiadomości "
+                              f"w folderze {folder}")
+            else:
+                self._save_incremental_state(sync_store, folder, folder_state, nip, cutoff_dt, end_dt)
+            return found_count
+        
+        message_ids = self._search_imap_messages(mail, search_criteria_parts, use_uid=False)
+        
+        uidvalidity = self._imap_uidvalidity(mail, folder) if message_ids else None
+        # Ledger: skip messages scanned before whose PDFs do not contain the NIP
+        ledger_ctx = self._open_scan_ledger(folder, uidvalidity) if message_ids else None
+        # UIDs (unlike sequence numbers) stay valid after a reconnect
+        uid_by_seq = self._imap_seq_to_uid(mail, message_ids) if message_ids else {}
+        if min_uid is not None:
+            # 'UID n:*' always matches the last message, even below n
+            new_uids = set(filter_new_uids(uid_by_seq.values(), min_uid))
+            message_ids = [msg_id for msg_id in message_ids
+                           if uid_by_seq.get(msg_id) in new_uids or msg_id not in uid_by_seq]
+        if ledger_ctx:
+            allowed = set(self._ledger_uids_to_scan(ledger_ctx, list(uid_by_seq.values()), nip))
+            message_ids = [msg_id for msg_id in message_ids
+                           if uid_by_seq.get(msg_id) in allowed or msg_id not in uid_by_seq]
+        messages = [(msg_id, uid_by_seq.get(msg_id)) for msg_id in message_ids]
+        
+        # Exact date range before any body download; checked messages skip the check after it
+        messages, date_gated = self._gate_imap_messages_by_date(mail, messages, cutoff_dt, end_dt)
+        body_cutoff_dt, body_end_dt = (None, None) if date_gated else (cutoff_dt, end_dt)
+        
+        # Checkpoint and reconnect need the UID of every message
+        watermark = None
+        checkpoint = None
+        if messages and ScanCheckpointStore is not None and all(uid for _, uid in messages):
+            # Checkpoint: continue an interrupted scan of the same search
+            checkpoint = self._open_scan_checkpoint(folder, uidvalidity, nip, cutoff_dt, end_dt)
+            if checkpoint is not None and checkpoint.resumed:
+                messages = [(msg_id, uid) for msg_id, uid in messages if checkpoint.is_pending(uid)]
+                if sink is None:
+                    found_count = max(found_count, checkpoint.found_count)
+            watermark = UidWatermark([uid for _, uid in messages])
+        
+        total_messages = len(messages)
+        
+        self.safe_log(f"Znaleziono {total_messages} wiadomości do przeszukania ({folder})")
+        
+        reconnects = 0
+        reconnected = None
+        completed = False
+        try:
+            # Process messages with stop event checking
+            for i, (msg_id, uid) in enumerate(messages, 1):
+                # Check if stop was requested
+                if self.stop_event.is_set():
+                    break
                 
-                # Check message date
-                date_header = email_message.get('Date')
-                if not self._email_date_is_within_range(date_header, cutoff_dt, end_dt):
-                    continue  # Skip messages older than cutoff
+                if i % 10 == 0:
+                    self.safe_log(f"Przetworzono {i}/{total_messages} wiadomości...")
                 
-                # Get subject
-                subject = self.decode_email_subject(email_message.get('Subject', ''))
+                while True:
+                    try:
+                        found_count = self._scan_imap_rfc822_message(mail, msg_id, uid, nip, output_folder,
+                                                                     body_cutoff_dt, body_end_dt, found_count,
+                                                                     sink, ledger_ctx)
+                    except Exception as e:
+                        if (watermark is not None and is_connection_error(e)
+                                and reconnects < MAX_RECONNECTS_PER_SCAN):
+                            # Lost connection: reconnect with backoff and retry the same message
+                            reconnects += 1
+                            previous, reconnected = reconnected, None
+                            mail = reconnected = self._reconnect_imap_scan(e, folder, checkpoint, previous, reconnects)
+                            if mail is None:
+                                break  # Stopped while waiting to reconnect
+                            continue
+                        # Log error but continue processing other messages
+                        self.safe_log(f"Błąd przetwarzania wiadomości {msg_id}: {e}")
+                    break
                 
-                # Check attachments
-                for part in email_message.walk():
-                    if self.stop_event.is_set():
-                        break
-                    
-                    if part.get_content_maintype() == 'multipart':
-                        continue
-                    
-                    if part.get('Content-Disposition') is None:
-                        continue
-                    
-                    filename = part.get_filename()
-                    
-                    if filename and filename.lower().endswith('.pdf'):
-                        filename = self.decode_email_subject(filename)
-                        
-                        # Save temporarily
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                            tmp_file.write(part.get_payload(decode=True))
-                            tmp_path = tmp_file.name
-                        
-                        try:
-                            # Extract text from PDF
-                            pdf_text = self.extract_text_from_pdf(tmp_path)
-                            
-                            # Check if contains NIP
-                            if self.search_nip_in_text(pdf_text, nip):
-                                found_count += 1
-                                
-                                # Get email timestamp
-                                email_dt = self._get_email_timestamp(email_message)
-                                
-                                # Determine destination folder (base or MM.YYYY subfolder)
-                                dest_folder = self._ensure_dir_for_email_date(output_folder, email_dt)
-                                
-                                # Save PDF file with timestamp
-                                safe_filename = self.make_safe_filename(filename)
-                                output_path = os.path.join(dest_folder, f"{found_count}_{safe_filename}")
-                                
-                                self._save_attachment_with_timestamp(
-                                    part.get_payload(decode=True), 
-                                    output_path, 
-                                    email_message
-                                )
-                                
-                                # Also save the complete email as .eml file in Poczta subfolder
-                                poczta_folder = self._ensure_poczta_subfolder(dest_folder)
-                                eml_filename = f"{found_count}_email.eml"
-                                eml_path = os.path.join(poczta_folder, eml_filename)
-                                try:
-                                    with open(eml_path, 'wb') as eml_file:
-                                        eml_file.write(email_body)
-                                    # Set timestamp on EML file too
-                                    if email_dt:
-                                        self._set_file_timestamp(eml_path, email_dt)
-                                except Exception as e:
-                                    self.safe_log(f"Ostrzeżenie: Nie można zapisać pliku .eml: {e}")
-                                
-                                self.safe_log(f"✓ Znaleziono: {filename} (z: {subject})")
-                        
-                        finally:
-                            # Remove temporary file
-                            try:
-                                os.unlink(tmp_path)
-                            except (OSError, PermissionError):
-                                # Silently ignore - temp file cleanup is not critical
-                                pass
-            
-            except Exception as e:
-                # Log error but continue processing other messages
-                self.safe_log(f"Błąd przetwarzania wiadomości {msg_id}: {e}")
-                continue
+                if mail is None or self.stop_event.is_set():
+                    break
+                if checkpoint is not None:
+                    checkpoint.advance(watermark.mark_done([uid]),
+                                       sink.found_count if sink is not None else found_count)
+            else:
+                completed = True
+        finally:
+            self._close_scan_ledger(ledger_ctx)
+            self._end_scan_checkpoint(checkpoint, completed)
+            if reconnected is not None:
+                self._release_mail_connection(reconnected)
         
-        mail.close()
-        mail.logout()
+        self._save_incremental_state(sync_store, folder, folder_state, nip, cutoff_dt, end_dt)
         
-        return found_count
+        return sink.found_count if sink is not None else found_count
     
-    def _search_with_pop3_threaded(self, nip, output_folder, cutoff_dt, end_dt=None):
-        """Threaded POP3 search with stop event checking and timestamp setting
+    def _scan_imap_rfc822_message(self, mail, msg_id, uid, nip, output_folder, cutoff_dt, end_dt,
+                                  found_count, sink=None, ledger_ctx=None):
+        """Download one whole message (RFC822) and save PDF attachments containing the NIP
         
         Args:
+            mail: IMAP connection with the folder selected
+            msg_id: Message sequence number
+            uid: Message UID (fetched by UID when known) or None
             nip: NIP number to search for
             output_folder: Directory to save found invoices
             cutoff_dt: Start datetime (inclusive) or None
             end_dt: End datetime (exclusive) or None
+            found_count: Hits so far (file numbering without a sink)
+            sink: ScanResultSink numbering the hits, or None
+            ledger_ctx: Ledger context from _open_scan_ledger() or None
+            
+        Returns:
+            int: Updated hit count (the number of the last hit)
         """
-        found_count = 0
-        
-        # Connect to server
-        if self.email_config['use_ssl']:
-            mail = poplib.POP3_SSL(self.email_config['server'], int(self.email_config['port']))
+        if uid:
+            status, msg_data = mail.uid('fetch', uid, '(RFC822)')
         else:
-            mail = poplib.POP3(self.email_config['server'], int(self.email_config['port']))
-        
-        mail.user(self.email_config['email'])
-        mail.pass_(self.email_config['password'])
+            status, msg_data = mail.fetch(msg_id, '(RFC822)')
         
-        self.safe_log(f"Połączono z serwerem POP3 (adres: {self.email_config['email']})")
+        if status != 'OK':
+            return found_count
         
-        # Get message list
-        num_messages = len(mail.list()[1])
+        email_body = fetch_message_body(msg_data) if fetch_message_body else msg_data[0][1]
+        if not email_body:
+            return found_count
+        return self._scan_message_pdfs(None, nip, output_folder, cutoff_dt, end_dt, found_count,
+                                       sink, ledger_ctx, uid, email_body=email_body)
+    
+    def _scan_message_pdfs(self, chunks, nip, output_folder, cutoff_dt, end_dt, found_count,
+                           sink=None, ledger_ctx=None, ledger_uid=None, email_body=None):
+        """Parse one raw message and save PDF attachments containing the NIP
         
-        self.safe_log(f"Znaleziono {num_messages} wiadomości do przeszukania")
+        The message is parsed as a stream: only PDF attachments are decoded,
+        into spooled files that move to disk when large, so memory per
+        message stays bounded. Without email_body the raw message is spooled
+        too, for the .eml copy of a hit.
         
-        # Process messages with stop event checking
-        for i in range(1, num_messages + 1):
-            # Check if stop was requested
-            if self.stop_event.is_set():
-                break
+        Args:
+            chunks: Iterable of raw message bytes (e.g. POP3 lines), or None with email_body
+            nip: NIP number to search for
+            output_folder: Directory to save found invoices
+            cutoff_dt: Start datetime (inclusive) or None
+            end_dt: End datetime (exclusive) or None
+            found_count: Hits so far (file numbering without a sink)
+            sink: ScanResultSink numbering the hits, or None
+            ledger_ctx: Ledger context from _open_scan_ledger() or None
+            ledger_uid: Identifier of the message in the ledger (UID/UIDL) or None
+            email_body: Raw message bytes already in memory, or None
             
-            if i % 10 == 0:
-                self.safe_log(f"Przetworzono {i}/{num_messages} wiadomości...")
+        Returns:
+            int: Updated hit count (the number of the last hit)
+        """
+        def date_in_range(headers):
+            return self._email_date_is_within_range(headers.get('Date'), cutoff_dt, end_dt)
+        
+        if parse_message_stream is None:
+            return self._scan_message_pdfs_in_memory(chunks, nip, output_folder, cutoff_dt, end_dt,
+                                                     found_count, sink, ledger_ctx, ledger_uid, email_body)
+        
+        if email_body is not None:
+            chunks = iter_bytes_chunks(email_body)
+        message = parse_message_stream(chunks, spool_raw=email_body is None, accept_headers=date_in_range)
+        if message is None:
+            return found_count  # Skip messages outside the date range
+        
+        with message:
+            # Get subject
+            subject = self.decode_email_subject(message.headers.get('Subject', ''))
+            ledger_parts = [] if ledger_ctx else None
+            hit_nip = None
             
-            try:
-                response, lines, octets = mail.retr(i)
-                email_body = b'\n'.join(lines)
-                email_message = email.message_from_bytes(email_body)
+            # Check attachments
+            for part in message.parts:
+                if self.stop_event.is_set():
+                    break
                 
-                # Check message date
-                date_header = email_message.get('Date')
-                if not self._email_date_is_within_range(date_header, cutoff_dt, end_dt):
-                    continue  # Skip messages older than cutoff
+                if part.headers.get('Content-Disposition') is None:
+                    continue
                 
-                # Get subject
-                subject = self.decode_email_subject(email_message.get('Subject', ''))
+                filename = self.decode_email_subject(part.filename)
+                if self._pdf_matches_nip(part, nip, filename, ledger_ctx, ledger_parts):
+                    found_count = sink.next_found_number() if sink is not None else found_count + 1
+                    self._save_found_invoice(output_folder, found_count, filename, part, message.headers,
+                                             email_body if email_body is not None else message.raw)
+                    hit_nip = nip
+                    self.safe_log(f"✓ Znaleziono: {filename} (z: {subject})")
+            
+            # Record only messages examined completely
+            if not self.stop_event.is_set():
+                self._ledger_record(ledger_ctx, ledger_uid, ledger_parts, hit_nip=hit_nip)
+        
+        return found_count
+    
+    def _scan_message_pdfs_in_memory(self, chunks, nip, output_folder, cutoff_dt, end_dt, found_count,
+                                     sink=None, ledger_ctx=None, ledger_uid=None, email_body=None):
+        """_scan_message_pdfs() without the streaming parser (whole message in memory)"""
+        if email_body is None:
+            email_body = b''.join(chunks)
+        email_message = email.message_from_bytes(email_body)
+        
+        # Check message date
+        if not self._email_date_is_within_range(email_message.get('Date'), cutoff_dt, end_dt):
+            return found_count  # Skip messages outside the date range
+        
+        subject = self.decode_email_subject(email_message.get('Subject', ''))
+        ledger_parts = [] if ledger_ctx else None
+        hit_nip = None
+        
+        for part in email_message.walk():
+            if self.stop_event.is_set():
+                break
+            
+            if part.get_content_maintype() == 'multipart' or part.get('Content-Disposition') is None:
+                continue
+            
+            filename = part.get_filename()
+            if filename and filename.lower().endswith('.pdf'):
+                filename = self.decode_email_subject(filename)
+                pdf_data = part.get_payload(decode=True)
                 
-                # Check attachments
-                for part in email_message.walk():
+                if self._pdf_matches_nip(pdf_data, nip, filename, ledger_ctx, ledger_parts):
+                    found_count = sink.next_found_number() if sink is not None else found_count + 1
+                    self._save_found_invoice(output_folder, found_count, filename,
+                                             pdf_data, email_message, email_body)
+                    hit_nip = nip
+                    self.safe_log(f"✓ Znaleziono: {filename} (z: {subject})")
+        
+        if not self.stop_event.is_set():
+            self._ledger_record(ledger_ctx, ledger_uid, ledger_parts, hit_nip=hit_nip)
+        
+        return found_count
+    
+    def _checkpoint_store(self):
+        """Return the store of scan checkpoints (shared by all folders of a search)
+        
+        Concurrent folder scans get it created before their workers start
+        (see _search_imap_all_folders), so only one instance is ever written.
+        """
+        if not hasattr(self, 'scan_checkpoints'):
+            self.scan_checkpoints = ScanCheckpointStore()
+        return self.scan_checkpoints
+    
+    def _open_scan_checkpoint(self, folder, uidvalidity, nip, cutoff_dt, end_dt):
+        """Open the checkpoint of a folder scan (checkbox in search tab)
+        
+        Returns:
+            FolderCheckpoint or None when resuming is off or UIDVALIDITY is unknown
+        """
+        # Use hasattr for safety: resume_scan_var is created in create_search_tab()
+        if (ScanCheckpointStore is None or uidvalidity is None
+                or not hasattr(self, 'resume_scan_var') or not self.resume_scan_var.get()):
+            return None
+        try:
+            checkpoint = FolderCheckpoint(self._checkpoint_store(), self.email_config['email'], folder,
+                                          scan_signature(nip, cutoff_dt, end_dt), uidvalidity)
+        except Exception as e:
+            self.safe_log(f"Ostrzeżenie: nie można odczytać punktu wznowienia: {e}")
+            return None
+        if checkpoint.resumed:
+            self.safe_log(f"Wznawianie przerwanego wyszukiwania ({folder}) od UID {(checkpoint.resume_uid or 0) + 1}")
+        return checkpoint
+    
+    def _resume_found_count(self, nip, cutoff_dt, end_dt):
+        """Hit count of an interrupted search being resumed (continues file numbering)"""
+        if ScanCheckpointStore is None or not hasattr(self, 'resume_scan_var') or not self.resume_scan_var.get():
+            return 0
+        return self._checkpoint_store().resume_found_count(self.email_config['email'],
+                                                           scan_signature(nip, cutoff_dt, end_dt))
+    
+    def _end_scan_checkpoint(self, checkpoint, completed):
+        """Save the checkpoint of a folder scan (kept until the whole search completes)"""
+        if checkpoint is None:
+            return
+        checkpoint.flush()
+        if not completed or self.stop_event.is_set():
+            self.safe_log(f"Postęp zapisany ({checkpoint.folder}) - ponowne wyszukiwanie tego samego NIP "
+                          f"i zakresu dat będzie kontynuowane od miejsca przerwania")
+    
+    def _clear_scan_checkpoints(self, nip, cutoff_dt, end_dt):
+        """Remove the checkpoints of a search that completed without interruption"""
+        if ScanCheckpointStore is None or self.stop_event.is_set() or not hasattr(self, 'scan_checkpoints'):
+            return
+        self.scan_checkpoints.clear_search(self.email_config['email'], scan_signature(nip, cutoff_dt, end_dt))
+        self.scan_checkpoints.save()
+    
+    def _reconnect_imap_folder(self, folder):
+        """Open a new connection with the folder selected, retrying with backoff
+        
+        Returns:
+            IMAP connection, or None if the search was stopped meanwhile
+            
+        Raises:
+            Exception: The last connection error when all attempts failed
+        """
+        def connect():
+            conn = self._acquire_mail_connection()
+            try:
+                status, _ = conn.select(quote_mailbox(folder), readonly=True)
+            except Exception:
+                self._release_mail_connection(conn, reusable=False)
+                raise
+            if status != 'OK':
+                self._release_mail_connection(conn, reusable=False)
+                raise imaplib.IMAP4.error(f"cannot select {folder}")
+            return conn
+        return reconnect_with_backoff(connect, should_stop=self.stop_event.is_set)
+    
+    def _reconnect_imap_scan(self, error, folder, checkpoint, previous, attempt):
+        """Replace a connection lost during a scan
+        
+        Args:
+            error: The connection error
+            folder: Folder being scanned
+            checkpoint: FolderCheckpoint to save before waiting, or None
+            previous: Connection opened by an earlier reconnect (released here), or None
+            attempt: Reconnect number within the scan
+            
+        Returns:
+            New connection with the folder selected, or None if the search was stopped
+        """
+        self.safe_log(f"Utracono połączenie z serwerem IMAP ({error}) - ponowne łączenie "
+                      f"({attempt}/{MAX_RECONNECTS_PER_SCAN})...")
+        if checkpoint is not None:
+            checkpoint.flush()
+        if previous is not None:
+            self._release_mail_connection(previous, reusable=False)
+        conn = self._reconnect_imap_folder(folder)
+        if conn is not None:
+            self.safe_log(f"Połączono ponownie - skanowanie folderu {folder} jest kontynuowane")
+        return conn
+    
+    def _use_all_imap_folders(self):
+        """Check if all IMAP folders should be searched (checkbox in search tab)"""
+        # Use hasattr for safety: all_imap_folders_var is created in create_search_tab()
+        return (plan_folder_scan is not None
+                and ScanResultSink is not None
+                and hasattr(self, 'all_imap_folders_var')
+                and self.all_imap_folders_var.get())
+    
+    def _search_imap_all_folders(self, mail, nip, output_folder, cutoff_dt, end_dt=None):
+        """Search all IMAP folders concurrently, largest folders first
+        
+        Folders are listed with LIST (without the excluded ones) and sized with
+        STATUS; every connection selected in the search tab scans one folder at a time.
+        
+        Args:
+            mail: Logged-in IMAP connection (used for LIST/STATUS)
+            nip: NIP number to search for
+            output_folder: Directory to save found invoices
+            cutoff_dt: Start datetime (inclusive) or None
+            end_dt: End datetime (exclusive) or None
+            
+        Returns:
+            int: Number of hits in all folders
+        """
+        excluded = self.excluded_folders_entry.get() if hasattr(self, 'excluded_folders_entry') else ''
+        folders = plan_folder_scan(mail, excluded)
+        
+        # Gmail: labels are views of All Mail, so All Mail alone covers every message
+        if self._use_gmail_fast_path(mail):
+            all_mail_folder = find_all_mail_folder(mail.list()[1])
+            if all_mail_folder in [name for name, _ in folders]:
+                folders = [(name, count) for name, count in folders if name == all_mail_folder]
+                self.safe_log(f"Gmail: przeszukiwany jest tylko folder {all_mail_folder} (etykiety to jego widoki)")
+        
+        num_connections = min(self._imap_connection_count(), len(folders)) or 1
+        self.safe_log(f"Przeszukiwanie {len(folders)} folderów ({num_connections} połączeń równolegle):")
+        for name, count in folders:
+            self.safe_log(f"  {name}: {count if count is not None else '?'} wiadomości")
+        
+        # Resumed search: continue file numbering after the hits saved before the interruption
+        sink = ScanResultSink(self._resume_found_count(nip, cutoff_dt, end_dt))
+        # The same message in several folders is downloaded and checked once
+        dedup = self._open_message_dedup(nip)
+        # Stores shared by the workers, created before they start: separate instances
+        # would each write back the whole file and drop the other folders' state
+        sync_store = self._open_sync_state_store()
+        if ScanCheckpointStore is not None:
+            try:
+                self._checkpoint_store()
+            except Exception as e:
+                self.safe_log(f"Ostrzeżenie: nie można odczytać punktu wznowienia: {e}")
+        
+        def scan_folder(conn, folder):
+            if self.stop_event.is_set():
+                return
+            status, _ = conn.select(quote_mailbox(folder), readonly=True)
+            if status != 'OK':
+                self.safe_log(f"Nie można otworzyć folderu {folder}")
+                return
+            self._search_imap_folder(conn, folder, nip, output_folder, cutoff_dt, end_dt,
+                                     sink=sink, parallel=False, dedup=dedup, sync_store=sync_store)
+            self.safe_log(f"Zakończono folder {folder}")
+        
+        try:
+            stats = scan_folders_parallel(self._create_imap_connection, [name for name, _ in folders],
+                                          scan_folder, num_connections, should_stop=self.stop_event.is_set)
+        finally:
+            self._close_message_dedup(dedup)
+        for folder, error in stats['errors'].items():
+            self.safe_log(f"Błąd przeszukiwania folderu {folder}: {error}")
+        if not stats['errors']:
+            self._clear_scan_checkpoints(nip, cutoff_dt, end_dt)
+        
+        return sink.found_count
+    
+    @contextmanager
+    def _mail_session(self):
+        """Logged-in IMAP/POP3 connection for the current account (context manager)
+        
+        The connection comes from the connection pool and goes back to it
+        afterwards; after an error it is logged out instead.
+        """
+        mail = self._acquire_mail_connection()
+        try:
+            yield mail
+        except BaseException:
+            self._release_mail_connection(mail, reusable=False)
+            raise
+        self._release_mail_connection(mail)
+    
+    def _acquire_mail_connection(self):
+        """Return a logged-in connection for the current account, reusing a pooled one if possible"""
+        if get_connection_pool is not None:
+            return get_connection_pool().acquire(self.email_config)
+        if self.email_config.get('protocol') == 'POP3':
+            return self._create_pop3_connection()
+        return self._create_imap_connection()
+    
+    def _release_mail_connection(self, mail, reusable=True):
+        """Give a connection from _acquire_mail_connection back to the pool (or log out)"""
+        if get_connection_pool is not None:
+            get_connection_pool().release(mail, reusable=reusable)
+            return
+        try:
+            if self.email_config.get('protocol') == 'POP3':
+                mail.quit()
+            else:
+                mail.logout()
+        except Exception:
+            pass
+    
+    def _create_pop3_connection(self):
+        """Open and log in a new POP3 connection using the current email configuration"""
+        if self.email_config['use_ssl']:
+            mail = poplib.POP3_SSL(self.email_config['server'], int(self.email_config['port']))
+        else:
+            mail = poplib.POP3(self.email_config['server'], int(self.email_config['port']))
+        
+        mail.user(self.email_config['email'])
+        mail.pass_(self.email_config['password'])
+        return mail
+    
+    def _create_imap_connection(self):
+        """Open and log in a new IMAP connection using the current email configuration"""
+        if self.email_config['use_ssl']:
+            mail = imaplib.IMAP4_SSL(self.email_config['server'], int(self.email_config['port']))
+        else:
+            mail = imaplib.IMAP4(self.email_config['server'], int(self.email_config['port']))
+        
+        mail.login(self.email_config['email'], self.email_config['password'])
+        return mail
+    
+    def _imap_connection_count(self):
+        """Number of parallel IMAP connections selected in the search tab (1 = single connection)"""
+        # Use hasattr for safety: imap_connections_var is created in create_search_tab()
+        if scan_uids_parallel is None or not hasattr(self, 'imap_connections_var'):
+            return 1
+        try:
+            count = int(self.imap_connections_var.get())
+        except (tk.TclError, ValueError):
+            return 1
+        return max(1, min(count, MAX_NUM_CONNECTIONS))
+    
+    def _imap_uidvalidity(self, mail, folder):
+        """Return UIDVALIDITY of the selected folder, or None if it cannot be read"""
+        if read_mailbox_state is None:
+            return None
+        try:
+            return read_mailbox_state(mail, folder).get('uidvalidity')
+        except Exception:
+            return None
+    
+    def _imap_seq_to_uid(self, mail, message_ids):
+        """Map message sequence numbers to UIDs with one FETCH (UID) command
+        
+        Returns:
+            dict: {'<seq>': '<uid>'} (empty if the FETCH fails)
+        """
+        seq_set = compress_uid_set(message_ids)
+        try:
+            status, data = mail.fetch(seq_set, '(UID)')
+            if status != 'OK':
+                return {}
+            return {str(record.seq): str(record.uid) for record in parse_fetch_items(data)
+                    if record.uid is not None}
+        except Exception as e:
+            self.safe_log(f"Ostrzeżenie: nie można pobrać UID wiadomości: {e}")
+            return {}
+    
+    def _use_incremental_scan(self):
+        """Check if only new messages should be scanned (checkbox in search tab)"""
+        # Use hasattr for safety: incremental_scan_var is created in create_search_tab()
+        return hasattr(self, 'incremental_scan_var') and self.incremental_scan_var.get()
+    
+    def _incremental_scan_signature(self, nip, cutoff_dt, end_dt):
+        """Signature of the search (NIP and date range) stored with the incremental scan state"""
+        if ScanCheckpointStore is not None:
+            return scan_signature(nip, cutoff_dt, end_dt)
+        return f"{nip}|{cutoff_dt.date().isoformat() if cutoff_dt else ''}|{end_dt.date().isoformat() if end_dt else ''}"
+    
+    def _open_sync_state_store(self):
+        """Open the incremental scan state file, or None when incremental mode is off"""
+        if SyncStateStore is None or not self._use_incremental_scan():
+            return None
+        try:
+            return SyncStateStore()
+        except Exception as e:
+            self.safe_log(f"Ostrzeżenie: nie można odczytać stanu skanowania przyrostowego: {e}")
+            return None
+    
+    def _plan_incremental_imap_scan(self, mail, folder, nip, cutoff_dt, end_dt, sync_store=None):
+        """Plan an incremental scan of the selected folder (checkbox in search tab)
+        
+        The stored state is reused only for the same NIP and date range.
+        
+        Args:
+            sync_store: SyncStateStore shared by the folders of a search, or None
+                        to open one
+        
+        Returns:
+            tuple: (sync_store, folder_state, plan), or (None, None, None) when
+                   incremental mode is off or the folder state cannot be read
+        """
+        if sync_store is None:
+            sync_store = self._open_sync_state_store()
+        if sync_store is None:
+            return None, None, None
+        
+        try:
+            folder_state = read_mailbox_state(mail, folder)
+            previous = sync_store.get(self.email_config['email'], folder)
+            plan = plan_incremental_scan(previous, folder_state, nip,
+                                         self._incremental_scan_signature(nip, cutoff_dt, end_dt))
+        except Exception as e:
+            self.safe_log(f"Ostrzeżenie: nie można odczytać stanu skanowania przyrostowego: {e}")
+            return None, None, None
+        
+        log(f"Incremental scan of {folder}: {plan['mode']} ({plan['reason']})")
+        return sync_store, folder_state, plan
+    
+    def _save_incremental_state(self, sync_store, folder, folder_state, nip, cutoff_dt, end_dt):
+        """Store the folder state after a completed (not interrupted) scan"""
+        if sync_store is None or folder_state is None or self.stop_event.is_set():
+            return
+        sync_store.set(self.email_config['email'], folder, folder_state, nip,
+                       self._incremental_scan_signature(nip, cutoff_dt, end_dt))
+        sync_store.save()
+    
+    def _search_imap_messages(self, mail, search_criteria, use_uid):
+        """Search the selected folder with the narrowest criteria the server supports
+        
+        The search planner adds ESEARCH when the server's CAPABILITY allows it,
+        LARGER / HEADER Content-Type only when server-side filtering is enabled
+        (checkbox in search tab), and falls back to the plain criteria if the
+        server rejects them.
+        
+        Args:
+            mail: IMAP connection with the folder selected
+            search_criteria: List of criteria (or one criteria string)
+            use_uid: Return UIDs (UID SEARCH) instead of sequence numbers
+            
+        Returns:
+            list: UIDs or sequence numbers as strings
+        """
+        if isinstance(search_criteria, str):
+            search_criteria = [search_criteria]
+        
+        if plan_imap_search is None:
+            criteria = ' '.join(search_criteria) or 'ALL'
+            if use_uid:
+                status, messages = mail.uid('search', None, criteria)
+            else:
+                status, messages = mail.search(None, criteria)
+            if status != 'OK':
+                raise Exception("Nie można pobrać listy wiadomości")
+            return messages[0].decode('utf-8').split() if messages and messages[0] else []
+        
+        narrow = self._use_narrow_imap_search()
+        plans = plan_imap_search(server_capabilities(mail, refresh=True), search_criteria,
+                                 min_size=MIN_PDF_MESSAGE_SIZE if narrow else None,
+                                 content_type_filter=narrow)
+        numbers, plan = run_search_plans(mail, plans, use_uid=use_uid)
+        if numbers is None:
+            raise Exception("Nie można pobrać listy wiadomości")
+        if plan['filters']:
+            self.safe_log(f"Filtrowanie po stronie serwera: {', '.join(plan['filters'])}")
+        return numbers
+    
+    def _use_narrow_imap_search(self):
+        """Check if the server should skip messages that cannot carry a PDF (checkbox in search tab)"""
+        # Use hasattr for safety: narrow_imap_search_var is created in create_search_tab()
+        return hasattr(self, 'narrow_imap_search_var') and self.narrow_imap_search_var.get()
+    
+    def _use_imap_watch(self):
+        """Check if the mailbox should be watched with IMAP IDLE after the search (checkbox in search tab)"""
+        # Use hasattr for safety: watch_mailbox_var is created in create_search_tab()
+        return (watch_folders is not None
+                and iter_pdf_messages is not None
+                and ScanResultSink is not None
+                and hasattr(self, 'watch_mailbox_var')
+                and self.watch_mailbox_var.get())
+    
+    def _imap_watch_folders(self):
+        """Folders to watch (comma-separated in the search tab, INBOX by default)"""
+        text = self.watch_folders_entry.get() if hasattr(self, 'watch_folders_entry') else ''
+        folders = [name.strip() for name in text.split(',') if name.strip()]
+        return folders or ['INBOX']
+    
+    def _watch_imap_mailbox(self, nip, output_folder, found_count):
+        """Watch folders with IMAP IDLE and scan new messages until the search is stopped
+        
+        Every folder gets its own connection holding an IDLE session; new messages
+        go through the same PDF/NIP pipeline as the search (_scan_imap_pdf_sections).
+        
+        Args:
+            nip: NIP number to search for
+            output_folder: Directory to save found invoices
+            found_count: Hits of the preceding search (file numbering continues from it)
+            
+        Returns:
+            int: Total number of hits including those found while watching
+        """
+        folders = self._imap_watch_folders()
+        sink = ScanResultSink(found_count)
+        self.safe_log(f"\nObserwowanie skrzynki (IMAP IDLE): {', '.join(folders)}")
+        self.safe_log("Nowe wiadomości są sprawdzane na bieżąco - kliknij 'Przerwij', aby zakończyć")
+        
+        def handle_new_uids(conn, folder, uids):
+            self.safe_log(f"Nowe wiadomości w folderze {folder}: {len(uids)}")
+            self._scan_imap_pdf_sections(conn, f'UID {compress_uid_set(uids)}', nip, output_folder,
+                                         None, None, folder=folder, sink=sink, parallel=False,
+                                         resumable=False)
+        
+        watch_folders(self._create_imap_connection, folders, handle_new_uids, self.stop_event.is_set)
+        self.safe_log("Zakończono obserwowanie skrzynki")
+        return sink.found_count
+    
+    def _use_gmail_fast_path(self, mail):
+        """Check if the IMAP search can use Gmail's X-GM-RAW search (Gmail server with X-GM-EXT-1)"""
+        return (supports_gmail_extensions is not None
+                and is_gmail_server(self.email_config.get('server', ''))
+                and supports_gmail_extensions(mail))
+    
+    def _use_pdf_section_fetch(self):
+        """Check if the IMAP scanner should fetch only PDF sections (checkbox in search tab)"""
+        # Use hasattr for safety: fetch_pdf_sections_var is created in create_search_tab()
+        return (iter_pdf_messages is not None
+                and ScanResultSink is not None
+                and hasattr(self, 'fetch_pdf_sections_var')
+                and self.fetch_pdf_sections_var.get())
+    
+    def _scan_imap_pdf_sections(self, mail, search_criteria, nip, output_folder, cutoff_dt, end_dt=None,
+                                folder='INBOX', min_uid=None, sink=None, parallel=True, resumable=True,
+                                dedup=None, failed_uids=None):
+        """IMAP scan downloading only PDF MIME sections (BODYSTRUCTURE-driven)
+        
+        Triage reads Date/Subject and INTERNALDATE from ENVELOPE (no header download);
+        messages outside [cutoff_dt, end_dt) are skipped before any section is
+        downloaded and the subject is decoded only for hits. The full message is
+        fetched only for hits, to store the .eml copy. With more than one
+        connection selected in the search tab, the UIDs are split across parallel
+        connections (hits are numbered through a shared ScanResultSink).
+        
+        Args:
+            mail: Logged-in IMAP connection with the folder selected
+            search_criteria: IMAP SEARCH criteria string (e.g. 'SINCE 01-Dec-2025')
+            nip: NIP number to search for
+            output_folder: Directory to save found invoices
+            cutoff_dt: Start datetime (inclusive) or None
+            end_dt: End datetime (exclusive) or None
+            folder: Folder selected on mail (selected again on parallel connections)
+            min_uid: Lowest UID to scan (incremental mode) or None
+            sink: ScanResultSink to continue numbering hits from (new one if None)
+            parallel: Allow parallel connections (as selected in the search tab)
+            resumable: Keep a checkpoint so an interrupted scan can be resumed
+            dedup: MessageDeduplicator skipping copies of messages scanned in
+                   other folders, or None
+            failed_uids: List collecting the UIDs that could not be scanned
+                         (not even from the full message), or None
+        """
+        uids = self._search_imap_messages(mail, search_criteria, use_uid=True)
+        if min_uid is not None:
+            uids = filter_new_uids(uids, min_uid)
+        
+        uidvalidity = self._imap_uidvalidity(mail, folder) if uids else None
+        # Ledger: skip messages scanned before whose PDFs do not contain the NIP
+        ledger_ctx = self._open_scan_ledger(folder, uidvalidity) if uids else None
+        uids = self._ledger_uids_to_scan(ledger_ctx, uids, nip)
+        
+        # Checkpoint: continue an interrupted scan of the same search
+        checkpoint = None
+        if resumable and uids:
+            checkpoint = self._open_scan_checkpoint(folder, uidvalidity, nip, cutoff_dt, end_dt)
+        if checkpoint is not None:
+            uids = checkpoint.remaining(uids)
+        
+        # Shared hit counter keeps file numbering unique across connections
+        if sink is None:
+            sink = ScanResultSink(checkpoint.found_count if checkpoint is not None else 0)
+        
+        total_messages = len(uids)
+        
+        self.safe_log(f"Znaleziono {total_messages} wiadomości do przeszukania (tylko załączniki PDF)")
+        
+        def report_progress(processed, total):
+            if processed % 10 == 0:
+                self.safe_log(f"Przetworzono {processed}/{total} wiadomości...")
+        
+        def accept(headers):
+            return self._triage_date_is_within_range(headers, cutoff_dt, end_dt)
+        
+        def handle_message(conn, pdf_message):
+            self._handle_pdf_message(conn, pdf_message, nip, output_folder, sink, ledger_ctx)
+        
+        claim = dedup.claim_callback(folder) if dedup is not None else None
+        
+        # Checkpoint advances over windows/chunks scanned completely (in any order)
+        watermark = UidWatermark(uids) if ScanCheckpointStore is not None else None
+        
+        def scanned(window_uids):
+            last_uid = watermark.mark_done(window_uids)
+            if checkpoint is not None:
+                checkpoint.advance(last_uid, sink.found_count, watermark.done_above())
+        
+        # Use parallel connections only when there is enough work for more than one
+        num_connections = self._imap_connection_count() if parallel else 1
+        
+        def scan(conn, pending_uids):
+            if num_connections > 1 and len(pending_uids) > 1:
+                self.safe_log(f"Skanowanie równoległe: {num_connections} połączeń IMAP")
+                stats = scan_uids_parallel(
+                    self._create_imap_connection, folder, pending_uids, handle_message,
+                    num_connections=num_connections,
+                    should_stop=self.stop_event.is_set,
+                    accept=accept,
+                    progress_callback=report_progress,
+                    sink=sink,
+                    chunk_done=scanned if watermark is not None else None,
+                    use_envelope=True,
+                    claim=claim
+                )
+                if failed_uids is not None:
+                    failed_uids.extend(stats['failed'])
+                if stats['unscanned']:
+                    raise ConnectionError(f"all IMAP connections lost, {stats['unscanned']} messages left")
+                return
+            
+            pdf_messages = iter_pdf_messages(
+                conn, pending_uids,
+                should_stop=self.stop_event.is_set,
+                accept=accept,
+                progress_callback=report_progress,
+                window_done=scanned if watermark is not None else None,
+                use_envelope=True,
+                claim=claim,
+                failed=failed_uids.extend if failed_uids is not None else None
+            )
+            
+            for pdf_message in pdf_messages:
+                handle_message(conn, pdf_message)
+                sink.mark_handled(pdf_message['uid'])
+        
+        completed = False
+        try:
+            if watermark is None:
+                scan(mail, uids)
+            else:
+                self._scan_with_reconnect(mail, folder, uids, scan, watermark, sink, checkpoint)
+            completed = not self.stop_event.is_set()
+            return sink.found_count
+        finally:
+            self._close_scan_ledger(ledger_ctx)
+            self._end_scan_checkpoint(checkpoint, completed)
+    
+    def _scan_with_reconnect(self, mail, folder, uids, scan, watermark, sink, checkpoint=None):
+        """Run scan(conn, uids) and continue after lost connections
+        
+        After a connection error the connection is reopened with backoff and
+        scan() is called again with the UIDs after the watermark that have not
+        been handled yet.
+        
+        Args:
+            mail: IMAP connection with the folder selected
+            folder: Folder being scanned
+            uids: UIDs to scan
+            scan: Callable(conn, pending_uids) raising connection errors
+            watermark: UidWatermark advanced by scan()
+            sink: ScanResultSink with the handled hit messages
+            checkpoint: FolderCheckpoint saved before reconnecting, or None
+        """
+        conn = mail
+        pending = uids
+        reconnects = 0
+        reconnected = None
+        try:
+            while pending:
+                try:
+                    scan(conn, pending)
+                    return
+                except Exception as e:
+                    if not is_connection_error(e) or reconnects >= MAX_RECONNECTS_PER_SCAN:
+                        raise
+                    reconnects += 1
+                    previous, reconnected = reconnected, None
+                    conn = reconnected = self._reconnect_imap_scan(e, folder, checkpoint, previous, reconnects)
+                    if conn is None:
+                        return  # Stopped while waiting to reconnect
+                    pending = sink.unhandled(uids_after(uids, watermark.value))
+        finally:
+            if reconnected is not None:
+                self._release_mail_connection(reconnected)
+    
+    def _handle_pdf_message(self, mail, pdf_message, nip, output_folder, sink, ledger_ctx=None):
+        """Check PDF attachments of one message for the NIP and save hits
+        
+        Args:
+            mail: IMAP connection the message was read from (for the .eml copy)
+            pdf_message: Message dict yielded by iter_pdf_messages()
+            nip: NIP number to search for
+            output_folder: Directory to save found invoices
+            sink: ScanResultSink numbering the hits
+            ledger_ctx: Ledger context from _open_scan_ledger() or None
+        """
+        uid = pdf_message['uid']
+        headers = pdf_message['headers']
+        eml_cache = {}
+        
+        def load_eml():
+            # Full message is downloaded once per hit message, only when needed
+            if 'body' not in eml_cache:
+                eml_cache['body'] = fetch_full_message(mail, uid)
+            return eml_cache['body']
+        
+        ledger_parts = [] if ledger_ctx else None
+        hit_nip = None
+        
+        try:
+            for filename, pdf_data in pdf_message['attachments']:
+                if self.stop_event.is_set():
+                    break
+                
+                if self._pdf_matches_nip(pdf_data, nip, filename, ledger_ctx, ledger_parts):
+                    found_number = sink.next_found_number()
+                    self._save_found_invoice(output_folder, found_number, filename,
+                                             pdf_data, headers, load_eml)
+                    hit_nip = nip
+                    # RFC 2047 subject decoded only for hits
+                    subject = self.decode_email_subject(headers.get('Subject', ''))
+                    self.safe_log(f"✓ Znaleziono: {filename} (z: {subject})")
+            
+            # Record only messages examined completely
+            if not self.stop_event.is_set():
+                self._ledger_record(ledger_ctx, uid, ledger_parts, pdf_message.get('fingerprint'), hit_nip)
+        
+        except Exception as e:
+            # Log error but continue processing other messages
+            self.safe_log(f"Błąd przetwarzania wiadomości UID {uid}: {e}")
+    
+    def _pop3_uidl_map(self, mail):
+        """Map POP3 message numbers to UIDL strings (empty if UIDL is not supported)"""
+        try:
+            response, listings, octets = mail.uidl()
+        except Exception as e:
+            self.safe_log(f"Ostrzeżenie: serwer POP3 nie obsługuje UIDL: {e}")
+            return {}
+        uidl_by_number = {}
+        for listing in listings:
+            parts = listing.decode('utf-8', errors='ignore').split()
+            if len(parts) == 2 and parts[0].isdigit():
+                uidl_by_number[int(parts[0])] = parts[1]
+        return uidl_by_number
+    
+    def _search_with_pop3_threaded(self, nip, output_folder, cutoff_dt, end_dt=None):
+        """Threaded POP3 search with stop event checking and timestamp setting
+        
+        Args:
+            nip: NIP number to search for
+            output_folder: Directory to save found invoices
+            cutoff_dt: Start datetime (inclusive) or None
+            end_dt: End datetime (exclusive) or None
+        """
+        # Connect to server (a pooled session from a previous search is reused)
+        with self._mail_session() as mail:
+            self.safe_log(f"Połączono z serwerem POP3 (adres: {self.email_config['email']})")
+            return self._search_pop3_mailbox(mail, nip, output_folder, cutoff_dt, end_dt)
+    
+    def _search_pop3_mailbox(self, mail, nip, output_folder, cutoff_dt, end_dt=None):
+        """Search the POP3 maildrop for invoices
+        
+        Args:
+            mail: Logged-in POP3 connection
+            nip: NIP number to search for
+            output_folder: Directory to save found invoices
+            cutoff_dt: Start datetime (inclusive) or None
+            end_dt: End datetime (exclusive) or None
+            
+        Returns:
+            int: Number of hits
+        """
+        found_count = 0
+        
+        # Get message list (LIST also gives the message sizes for triage)
+        listings = mail.list()[1]
+        num_messages = len(listings)
+        message_numbers = list(range(1, num_messages + 1))
+        
+        # Commands kept in flight: several only if the server advertises PIPELINING
+        depth = pipeline_depth(mail) if pipeline_depth is not None and num_messages else 1
+        
+        # Large maildrops: message numbers follow arrival order, so the date range is
+        # located by binary search (TOP probes) and only that slice is scanned
+        if triage_pop3_messages is not None:
+            window = locate_date_window(mail, num_messages, cutoff_dt, end_dt, max_in_flight=depth,
+                                        should_stop=self.stop_event.is_set)
+            if window is not None:
+                message_numbers = list(range(window[0], window[1] + 1))
+                self.safe_log(f"Zakres dat: wiadomości {window[0]}-{window[1]} z {num_messages}")
+        
+        # Ledger: skip messages scanned before whose PDFs do not contain the NIP
+        # (POP3 messages are identified by UIDL, folder 'INBOX', UIDVALIDITY 0).
+        # Incremental mode: only UIDLs not seen before (and hits not saved yet) are downloaded
+        incremental = self._use_incremental_scan()
+        ledger_ctx = self._open_scan_ledger('INBOX', 0, required=incremental) if num_messages else None
+        try:
+            uidl_by_number = {}
+            if ledger_ctx:
+                uidl_by_number = self._pop3_uidl_map(mail)
+                if incremental and not uidl_by_number:
+                    self.safe_log("Skanowanie przyrostowe: brak UIDL - pełne skanowanie skrzynki")
+                allowed = set(self._ledger_uids_to_scan(ledger_ctx, list(uidl_by_number.values()), nip,
+                                                        unseen_only=incremental))
+                message_numbers = [i for i in message_numbers
+                                   if i not in uidl_by_number or uidl_by_number[i] in allowed]
+            
+            # Triage: headers (TOP n 0) are checked before RETR - messages outside the date
+            # range or without attachments are not downloaded
+            if triage_pop3_messages is not None and message_numbers:
+                message_numbers, no_pdf, out_of_range = triage_pop3_messages(
+                    mail, message_numbers, parse_list_sizes(listings),
+                    accept_headers=lambda headers: self._email_date_is_within_range(headers.get('Date'),
+                                                                                    cutoff_dt, end_dt),
+                    max_in_flight=depth, should_stop=self.stop_event.is_set
+                )
+                if no_pdf or out_of_range:
+                    self.safe_log(f"Triage POP3: pominięto {len(out_of_range)} wiadomości spoza zakresu dat "
+                                  f"i {len(no_pdf)} bez załączników")
+                # Messages without attachments are final: the ledger skips them in later searches
+                for i in no_pdf:
+                    self._ledger_record(ledger_ctx, uidl_by_number.get(i), [])
+            
+            self.safe_log(f"Znaleziono {len(message_numbers)} wiadomości do przeszukania")
+            
+            # Messages are read line by line straight into the parser (PDF parts and the raw
+            # copy are spooled); with PIPELINING the next RETR commands are already in flight
+            if parse_message_stream is not None and pipeline_depth is not None:
+                retrieved = iter_pop3_messages(mail, message_numbers, depth)
+            else:
+                retrieved = ((i, None) for i in message_numbers)
+            
+            # Process messages with stop event checking (closing drains RETRs still in flight)
+            with closing(retrieved):
+                for i, chunks in retrieved:
+                    # Check if stop was requested
                     if self.stop_event.is_set():
                         break
-                    
-                    if part.get_content_maintype() == 'multipart':
-                        continue
-                    
-                    if part.get('Content-Disposition') is None:
+                
+                    if i % 10 == 0:
+                        self.safe_log(f"Przetworzono {i}/{num_messages} wiadomości...")
+                
+                    try:
+                        if chunks is None and parse_message_stream is not None:
+                            chunks = iter_pop3_message(mail, i)
+                        elif chunks is None:
+                            response, lines, octets = mail.retr(i)
+                            chunks = (line + b'\r\n' for line in lines)
+                        found_count = self._scan_message_pdfs(chunks, nip, output_folder, cutoff_dt, end_dt,
+                                                              found_count, ledger_ctx=ledger_ctx,
+                                                              ledger_uid=uidl_by_number.get(i))
+                    except Exception as e:
+                        # Log error but continue processing other messages
+                        self.safe_log(f"Błąd przetwarzania wiadomości {i}: {e}")
                         continue
-                    
-                    filename = part.get_filename()
-                    
-                    if filename and filename.lower().endswith('.pdf'):
-                        filename = self.decode_email_subject(filename)
-                        
-                        # Save temporarily
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                            tmp_file.write(part.get_payload(decode=True))
-                            tmp_path = tmp_file.name
-                        
-                        try:
-                            # Extract text from PDF
-                            pdf_text = self.extract_text_from_pdf(tmp_path)
-                            
-                            # Check if contains NIP
-                            if self.search_nip_in_text(pdf_text, nip):
-                                found_count += 1
-                                
-                                # Get email timestamp
-                                email_dt = self._get_email_timestamp(email_message)
-                                
-                                # Determine destination folder (base or MM.YYYY subfolder)
-                                dest_folder = self._ensure_dir_for_email_date(output_folder, email_dt)
-                                
-                                # Save PDF file with timestamp
-                                safe_filename = self.make_safe_filename(filename)
-                                output_path = os.path.join(dest_folder, f"{found_count}_{safe_filename}")
-                                
-                                self._save_attachment_with_timestamp(
-                                    part.get_payload(decode=True), 
-                                    output_path, 
-                                    email_message
-                                )
-                                
-                                # Also save the complete email as .eml file in Poczta subfolder
-                                poczta_folder = self._ensure_poczta_subfolder(dest_folder)
-                                eml_filename = f"{found_count}_email.eml"
-                                eml_path = os.path.join(poczta_folder, eml_filename)
-                                try:
-                                    with open(eml_path, 'wb') as eml_file:
-                                        eml_file.write(email_body)
-                                    # Set timestamp on EML file too
-                                    if email_dt:
-                                        self._set_file_timestamp(eml_path, email_dt)
-                                except Exception as e:
-                                    self.safe_log(f"Ostrzeżenie: Nie można zapisać pliku .eml: {e}")
-                                
-                                self.safe_log(f"✓ Znaleziono: {filename} (z: {subject})")
-                        
-                        finally:
-                            # Remove temporary file
-                            try:
-                                os.unlink(tmp_path)
-                            except (OSError, PermissionError):
-                                # Silently ignore - temp file cleanup is not critical
-                                pass
+        finally:
+            self._close_scan_ledger(ledger_ctx)
+        
+        return found_count
+    
+    def _search_with_ews_threaded(self, nip, output_folder, cutoff_dt, end_dt=None):
+        """Threaded Exchange search over EWS (exchangelib), IMAP if EWS is not available
+        
+        Args:
+            nip: NIP number to search for
+            output_folder: Directory to save found invoices
+            cutoff_dt: Start datetime (inclusive) or None
+            end_dt: End datetime (exclusive) or None
             
+        Returns:
+            int: Number of hits
+        """
+        try:
+            account = connect_account(self.email_config['server'], self.email_config['email'],
+                                      self.email_config['password'])
+            if self._use_all_imap_folders():
+                folders = [folder for folder in account.msg_folder_root.walk()
+                           if getattr(folder, 'folder_class', None) == 'IPF.Note']
+            else:
+                folders = [account.inbox]
+        except Exception as e:
+            # Tenants with EWS disabled: search over IMAP as before
+            self.safe_log(f"Exchange (EWS) niedostępny: {e} - wyszukiwanie przez IMAP")
+            return self._search_with_imap_threaded(nip, output_folder, cutoff_dt, end_dt)
+        
+        self.safe_log(f"Połączono z serwerem Exchange przez EWS (adres: {self.email_config['email']})")
+        found_count = 0
+        for folder in folders:
+            if self.stop_event.is_set():
+                break
+            try:
+                found_count = self._search_ews_folder(account, folder, nip, output_folder,
+                                                      cutoff_dt, end_dt, found_count)
             except Exception as e:
-                # Log error but continue processing other messages
-                self.safe_log(f"Błąd przetwarzania wiadomości {i}: {e}")
-                continue
+                # Log error but continue with other folders
+                self.safe_log(f"Błąd przeszukiwania folderu {folder.name}: {e}")
+        return found_count
+    
+    def _search_ews_folder(self, account, folder, nip, output_folder, cutoff_dt, end_dt, found_count):
+        """Search one Exchange folder over EWS
+        
+        The server selects messages with attachments received in the date
+        range; attachment metadata and the MIME content of messages with PDFs
+        are then fetched in batches and scanned like IMAP/POP3 messages.
+        
+        Args:
+            account: exchangelib Account
+            folder: exchangelib Folder
+            nip: NIP number to search for
+            output_folder: Directory to save found invoices
+            cutoff_dt: Start datetime (inclusive) or None
+            end_dt: End datetime (exclusive) or None
+            found_count: Hits so far (file numbering)
+            
+        Returns:
+            int: Updated hit count
+        """
+        items = list(candidate_items(folder, cutoff_dt, end_dt))
+        self.safe_log(f"Exchange: {len(items)} wiadomości z załącznikami w folderze {folder.name}")
+        
+        # Ledger keyed by EWS item id (folder path, UIDVALIDITY 0); incremental mode as in POP3
+        incremental = self._use_incremental_scan()
+        folder_key = getattr(folder, 'absolute', None) or folder.name
+        ledger_ctx = self._open_scan_ledger(folder_key, 0, required=incremental) if items else None
+        if ledger_ctx:
+            allowed = set(self._ledger_uids_to_scan(ledger_ctx, [item.id for item in items], nip,
+                                                    unseen_only=incremental))
+            items = [item for item in items if item.id in allowed]
+        
+        # The server range is exact on the received time; the Date header is checked only on request
+        body_cutoff_dt, body_end_dt = (cutoff_dt, end_dt) if self._date_by_header() else (None, None)
         
-        mail.quit()
+        try:
+            for message in iter_ews_pdf_messages(account, items, should_stop=self.stop_event.is_set):
+                if self.stop_event.is_set():
+                    break
+                if message['mime_content'] is None:
+                    # No PDF attachments: final, the ledger skips the message in later searches
+                    self._ledger_record(ledger_ctx, message['id'], [])
+                    continue
+                try:
+                    found_count = self._scan_message_pdfs(None, nip, output_folder, body_cutoff_dt, body_end_dt,
+                                                          found_count, ledger_ctx=ledger_ctx,
+                                                          ledger_uid=message['id'],
+                                                          email_body=message['mime_content'])
+                except Exception as e:
+                    # Log error but continue processing other messages
+                    self.safe_log(f"Błąd przetwarzania wiadomości Exchange: {e}")
+        finally:
+            self._close_scan_ledger(ledger_ctx)
         
         return found_count
     
@@ -2065,13 +3451,8 @@ class EmailInvoiceFinderApp:
         found_count = 0
         cutoff_dt = None  # No cutoff date in deprecated method
         
-        # Połącz z serwerem
-        if self.email_config['use_ssl']:
-            mail = imaplib.IMAP4_SSL(self.email_config['server'], self.email_config['port'])
-        else:
-            mail = imaplib.IMAP4(self.email_config['server'], self.email_config['port'])
-        
-        mail.login(self.email_config['email'], self.email_config['password'])
+        # Połącz z serwerem (z puli połączeń)
+        mail = self._acquire_mail_connection()
         
         self.results_text.insert(tk.END, "Połączono z serwerem IMAP\n")
         self.root.update()
@@ -2112,7 +3493,9 @@ class EmailInvoiceFinderApp:
                 if status != 'OK':
                     continue
                 
-                email_body = msg_data[0][1]
+                email_body = fetch_message_body(msg_data) if fetch_message_body else msg_data[0][1]
+                if not email_body:
+                    continue
                 email_message = email.message_from_bytes(email_body)
                 
                 # Sprawdź datę wiadomości
@@ -2170,8 +3553,7 @@ class EmailInvoiceFinderApp:
                 print(f"Błąd przetwarzania wiadomości {msg_id}: {e}")
                 continue
         
-        mail.close()
-        mail.logout()
+        self._release_mail_connection(mail)
         
         return found_count
     
@@ -2180,14 +3562,8 @@ class EmailInvoiceFinderApp:
         found_count = 0
         cutoff_dt = None  # No cutoff date in deprecated method
         
-        # Połącz z serwerem
-        if self.email_config['use_ssl']:
-            mail = poplib.POP3_SSL(self.email_config['server'], self.email_config['port'])
-        else:
-            mail = poplib.POP3(self.email_config['server'], self.email_config['port'])
-        
-        mail.user(self.email_config['email'])
-        mail.pass_(self.email_config['password'])
+        # Połącz z serwerem (z puli połączeń)
+        mail = self._acquire_mail_connection()
         
         self.results_text.insert(tk.END, "Połączono z serwerem POP3\n")
         self.root.update()
@@ -2264,7 +3640,7 @@ class EmailInvoiceFinderApp:
                 print(f"Błąd przetwarzania wiadomości {i}: {e}")
                 continue
         
-        mail.quit()
+        self._release_mail_connection(mail)
         
         return found_count
     
@@ -2341,6 +3717,9 @@ def main():
     root = tk.Tk()
     app = EmailInvoiceFinderApp(root)
     root.mainloop()
+    # Log out pooled sessions right away (an idle POP3 session keeps the maildrop locked)
+    if get_connection_pool is not None:
+        get_connection_pool().close_all()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scripted in-memory IMAP server for tests.
+
+FakeIMAP4 is a real imaplib.IMAP4 subclass whose socket I/O is replaced by an
+in-memory FakeImapServer, so tests exercise imaplib's own command/response
+handling (tags, literals, pipelined commands) without any network access.
+"""
+import email
+import email.utils
+import imaplib
+import re
+
+from gui.imap_search_components.fetch_pipeline import compress_uid_set
+
+
+def make_message(uid, header=b'Subject: Test\r\n\r\n', structure=None, sections=None,
+                 full=None, internaldate='15-Dec-2025 10:00:00 +0000', size=None, gm_msgid=None):
+    """Build a message dict for FakeImapServer."""
+    if structure is None:
+        structure = b'("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    full = full if full is not None else header + b'body'
+    return {
+        'uid': uid,
+        'header': header,
+        'structure': structure,
+        'sections': sections or {},
+        'full': full,
+        'internaldate': internaldate,
+        'size': size if size is not None else len(full),
+        'gm_msgid': gm_msgid,
+    }
+
+
+def _quoted(value):
+    """Quote a header value as an IMAP string (NIL for None)."""
+    if value is None:
+        return b'NIL'
+    value = re.sub(r'\r?\n(?=[ \t])', '', value)  # Unfold
+    value = value.encode('utf-8', 'surrogateescape')
+    return b'"' + value.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+
+
+def _envelope(header):
+    """Build the ENVELOPE of a message from its raw header block."""
+    message = email.message_from_bytes(header)
+    fields = [_quoted(message.get('Date')), _quoted(message.get('Subject'))]
+    for name in ('From', 'Sender', 'Reply-To', 'To', 'Cc', 'Bcc'):
+        values = message.get_all(name)
+        if not values and name in ('Sender', 'Reply-To'):
+            values = message.get_all('From')  # RFC 3501: defaults to From
+        if not values:
+            fields.append(b'NIL')
+            continue
+        addresses = []
+        for display_name, address in email.utils.getaddresses(values):
+            mailbox, _, host = address.partition('@')
+            addresses.append(b'(' + b' '.join([_quoted(display_name or None), b'NIL',
+                                               _quoted(mailbox), _quoted(host)]) + b')')
+        fields.append(b'(' + b''.join(addresses) + b')')
+    fields += [_quoted(message.get('In-Reply-To')), _quoted(message.get('Message-ID'))]
+    return b'(' + b' '.join(fields) + b')'
+
+
+def _parse_sequence_set(text, max_uid):
+    """Parse an IMAP sequence set like '1:3,7,9:*' into a set of ints."""
+    result = set()
+    for part in text.split(','):
+        if ':' in part:
+            start, end = part.split(':')
+            start = max_uid if start == '*' else int(start)
+            end = max_uid if end == '*' else int(end)
+            result.update(range(min(start, end), max(start, end) + 1))
+        elif part:
+            result.add(max_uid if part == '*' else int(part))
+    return result
+
+
+class FakeImapServer:
+    """In-memory IMAP server holding folders of messages"""
+
+    def __init__(self, folders=None, capabilities='IMAP4rev1', uidvalidity=1, highestmodseq=1):
+        # folders: {'INBOX': [message dict, ...]}
+        self.folders = folders or {'INBOX': []}
+        self.capabilities = capabilities
+        self.uidvalidity = uidvalidity
+        self.highestmodseq = highestmodseq  # Reported only with CONDSTORE capability
+        self.commands = []          # Received command lines (without tags)
+        self.search_filter = None   # Optional callable(criteria, message) -> bool
+        self.folder_flags = {}      # Optional LIST flags per folder, e.g. {'[Gmail]/All Mail': '\\All'}
+        self.reject = None          # Optional callable(command_line) -> bool, answered with BAD
+        self.connections = []       # FakeIMAP4 instances (for IDLE notifications)
+
+    def handle(self, conn, tag, line):
+        """Return response bytes for one command line."""
+        self.commands.append(line)
+        if self.reject is not None and self.reject(line):
+            return tag + b' BAD command rejected\r\n'
+        self._tag = tag
+        parts = line.split(' ', 1)
+        name = parts[0].upper()
+        args = parts[1] if len(parts) > 1 else ''
+        if name == 'IDLE':
+            # Completed only after the client sends DONE (see idle_done)
+            conn.idle_tag = tag
+            return b'+ idling\r\n'
+        handler = getattr(self, f'_cmd_{name.lower()}', None)
+        if handler is None:
+            return tag + b' BAD unknown command\r\n'
+        untagged = handler(conn, args)
+        return untagged + tag + b' OK ' + name.encode() + b' completed\r\n'
+
+    def idle_done(self, conn):
+        """Complete the IDLE command of a connection after DONE."""
+        tag, conn.idle_tag = conn.idle_tag, None
+        return tag + b' OK IDLE terminated\r\n'
+
+    def deliver(self, folder, message):
+        """Add a message and notify connections idling on the folder."""
+        self.folders.setdefault(folder, []).append(message)
+        for conn in self.connections:
+            if conn.idle_tag is not None and conn.selected == folder:
+                conn._inbuf += b'* %d EXISTS\r\n' % len(self.folders[folder])
+
+    def _cmd_capability(self, conn, args):
+        return b'* CAPABILITY ' + self.capabilities.encode() + b'\r\n'
+
+    def _cmd_login(self, conn, args):
+        return b''
+
+    def _cmd_logout(self, conn, args):
+        return b'* BYE logging out\r\n'
+
+    def _cmd_noop(self, conn, args):
+        return b''
+
+    def _cmd_close(self, conn, args):
+        conn.selected = None
+        return b''
+
+    def _messages(self, conn):
+        return self.folders.get(conn.selected, [])
+
+    def _uidnext(self, folder):
+        return max([m['uid'] for m in self.folders.get(folder, [])], default=0) + 1
+
+    def _cmd_select(self, conn, args):
+        folder = args.strip().strip('"')
+        conn.selected = folder
+        messages = self.folders.get(folder, [])
+        response = (b'* %d EXISTS\r\n' % len(messages)
+                    + b'* OK [UIDVALIDITY %d] UIDs valid\r\n' % self.uidvalidity
+                    + b'* OK [UIDNEXT %d] Predicted next UID\r\n' % self._uidnext(folder))
+        if 'CONDSTORE' in self.capabilities:
+            response += b'* OK [HIGHESTMODSEQ %d] Highest\r\n' % self.highestmodseq
+        return response
+
+    _cmd_examine = _cmd_select
+
+    def _cmd_list(self, conn, args):
+        return b''.join(b'* LIST (\\HasNoChildren' + self._list_flags(name) + b') "/" "'
+                        + name.encode() + b'"\r\n' for name in self.folders)
+
+    def _list_flags(self, name):
+        flags = self.folder_flags.get(name)
+        return b' ' + flags.encode() if flags else b''
+
+    def _cmd_status(self, conn, args):
+        folder, _, _ = args.rpartition(' (')
+        folder = folder.strip().strip('"')
+        messages = self.folders.get(folder, [])
+        items = b'MESSAGES %d UIDNEXT %d UIDVALIDITY %d' % (
+            len(messages), self._uidnext(folder), self.uidvalidity)
+        if 'CONDSTORE' in self.capabilities:
+            items += b' HIGHESTMODSEQ %d' % self.highestmodseq
+        return b'* STATUS "' + folder.encode() + b'" (' + items + b')\r\n'
+
+    def _cmd_uid(self, conn, args):
+        sub, _, rest = args.partition(' ')
+        sub = sub.upper()
+        messages = self._messages(conn)
+        if sub == 'SEARCH':
+            esearch = re.match(r'RETURN \(([^)]*)\) ', rest, re.IGNORECASE)
+            if esearch:
+                rest = rest[esearch.end():]
+            found = [m['uid'] for m in messages
+                     if self.search_filter is None or self.search_filter(rest, m)]
+            uid_criterion = re.search(r'\bUID (\S+)', rest, re.IGNORECASE)
+            if uid_criterion:
+                max_uid = max([m['uid'] for m in messages], default=0)
+                wanted = _parse_sequence_set(uid_criterion.group(1), max_uid)
+                found = [uid for uid in found if uid in wanted]
+            if esearch:
+                response = b'* ESEARCH (TAG "' + self._tag + b'") UID COUNT %d' % len(found)
+                if found:
+                    response += b' ALL ' + compress_uid_set(found).encode()
+                return response + b'\r\n'
+            return b'* SEARCH ' + ' '.join(str(uid) for uid in found).encode() + b'\r\n'
+        if sub == 'FETCH':
+            uid_set, _, items = rest.partition(' ')
+            max_uid = max([m['uid'] for m in messages], default=0)
+            wanted = _parse_sequence_set(uid_set, max_uid)
+            out = b''
+            for seq, message in enumerate(messages, 1):
+                if message['uid'] in wanted:
+                    out += self._fetch_response(seq, message, items)
+            return out
+        return b''
+
+    def _cmd_fetch(self, conn, args):
+        seq_set, _, items = args.partition(' ')
+        messages = self._messages(conn)
+        wanted = _parse_sequence_set(seq_set, len(messages))
+        return b''.join(self._fetch_response(seq, message, items)
+                        for seq, message in enumerate(messages, 1) if seq in wanted)
+
+    def _fetch_response(self, seq, message, items):
+        names = re.findall(r'BODY\.PEEK\[[^\]]*\]|BODY\[[^\]]*\]|[^\s()]+', items)
+        out = [b'UID %d' % message['uid']]
+        literals = []
+        for name in names:
+            upper = name.upper()
+            if upper == 'UID':
+                continue
+            if upper == 'BODYSTRUCTURE':
+                out.append(b'BODYSTRUCTURE ' + message['structure'])
+            elif upper == 'INTERNALDATE':
+                out.append(b'INTERNALDATE "' + message['internaldate'].encode() + b'"')
+            elif upper == 'RFC822.SIZE':
+                out.append(b'RFC822.SIZE %d' % message['size'])
+            elif upper == 'FLAGS':
+                out.append(b'FLAGS ()')
+            elif upper == 'ENVELOPE':
+                out.append(b'ENVELOPE ' + _envelope(message['header']))
+            elif upper == 'X-GM-MSGID' and message['gm_msgid'] is not None:
+                out.append(b'X-GM-MSGID %d' % message['gm_msgid'])
+            elif upper.startswith('BODY'):
+                spec = name[name.index('[') + 1:-1]
+                if spec == '':
+                    data = message['full']
+                elif spec.upper().startswith('HEADER'):
+                    data = message['header']
+                else:
+                    data = message['sections'].get(spec, b'')
+                literals.append((b'BODY[' + spec.encode() + b']', data))
+        response = b'* %d FETCH (' % seq + b' '.join(out)
+        for key, data in literals:
+            response += b' ' + key + b' {%d}\r\n' % len(data) + data
+        return response + b')\r\n'
+
+
+class FakeIMAP4(imaplib.IMAP4):
+    """imaplib.IMAP4 talking to a FakeImapServer instead of a socket"""
+
+    def __init__(self, server):
+        self.server = server
+        self.selected = None
+        self.idle_tag = None        # Tag of the IDLE command in progress
+        server.connections.append(self)
+        self.outstanding = 0        # Commands sent but not yet completed
+        self.max_outstanding = 0    # Highest number of commands in flight
+        super().__init__('fake.example.com', 143)
+
+    def open(self, host='', port=143, timeout=None):
+        self.host = host
+        self.port = port
+        self._inbuf = bytearray(b'* OK fake IMAP server ready\r\n')
+
+    def send(self, data):
+        for line in data.split(b'\r\n'):
+            if not line:
+                continue
+            if line == b'DONE':
+                self._inbuf += self.server.idle_done(self)
+                continue
+            tag, _, command = line.partition(b' ')
+            self.outstanding += 1
+            self.max_outstanding = max(self.max_outstanding, self.outstanding)
+            self._inbuf += self.server.handle(self, tag, command.decode())
+
+    def readline(self):
+        end = self._inbuf.find(b'\n')
+        if end < 0:
+            raise self.abort('connection closed')
+        line = bytes(self._inbuf[:end + 1])
+        del self._inbuf[:end + 1]
+        if hasattr(self, 'tagre') and self.tagre.match(line):
+            self.outstanding -= 1
+        return line
+
+    def read(self, size):
+        data = bytes(self._inbuf[:size])
+        del self._inbuf[:size]
+        return data
+
+    def shutdown(self):
+        pass
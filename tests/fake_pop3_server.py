@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scripted in-memory POP3 server for tests.
+
+FakePOP3 is a real poplib.POP3 subclass whose socket is replaced by an
+in-memory FakePop3Server, so tests exercise poplib's own response handling
+(multi-line responses, dot-stuffing) and pipelined commands without any
+network access.
+"""
+import poplib
+from collections import deque
+
+
+def _multiline(lines):
+    """Format a multi-line +OK response with dot-stuffing."""
+    body = b''.join((b'.' + line if line.startswith(b'.') else line) + b'\r\n' for line in lines)
+    return b'+OK\r\n' + body + b'.\r\n'
+
+
+class FakePop3Server:
+    """In-memory POP3 maildrop"""
+
+    def __init__(self, messages=None, capabilities=('USER', 'TOP', 'UIDL', 'PIPELINING')):
+        # messages: raw message bytes (LF or CRLF line breaks); capabilities: CAPA lines,
+        # None for a server without CAPA
+        self.messages = list(messages or [])
+        self.capabilities = capabilities
+        self.commands = []      # Received command lines
+
+    def _lines(self, which):
+        message = self.messages[which - 1].replace(b'\r\n', b'\n')
+        return message[:-1].split(b'\n') if message.endswith(b'\n') else message.split(b'\n')
+
+    def handle(self, line):
+        """Return response bytes for one command line."""
+        self.commands.append(line)
+        parts = line.split()
+        name = parts[0].upper() if parts else ''
+        args = [int(arg) for arg in parts[1:] if arg.isdigit()]
+        if name in ('USER', 'PASS', 'NOOP', 'QUIT'):
+            return b'+OK\r\n'
+        if name == 'CAPA' and self.capabilities is not None:
+            return _multiline([capability.encode() for capability in self.capabilities])
+        if name == 'STAT':
+            return b'+OK %d %d\r\n' % (len(self.messages), sum(map(len, self.messages)))
+        if name == 'LIST':
+            return _multiline([b'%d %d' % (number, len(message))
+                               for number, message in enumerate(self.messages, 1)])
+        if name == 'UIDL' and 'UIDL' in (self.capabilities or ()):
+            return _multiline([b'%d uid-%d' % (number, number) for number in range(1, len(self.messages) + 1)])
+        if name in ('RETR', 'TOP') and args and 1 <= args[0] <= len(self.messages):
+            lines = self._lines(args[0])
+            if name == 'TOP':
+                if 'TOP' not in (self.capabilities or ()) or len(args) < 2:
+                    return b'-ERR unknown command\r\n'
+                header_end = lines.index(b'') if b'' in lines else len(lines)
+                lines = lines[:header_end + 1 + args[1]]
+            return _multiline(lines)
+        if name in ('RETR', 'TOP'):
+            return b'-ERR no such message\r\n'
+        return b'-ERR unknown command\r\n'
+
+
+class _FakeSocket:
+    """Socket and file object of a FakePOP3 connection"""
+
+    def __init__(self, server):
+        self.server = server
+        self.responses = deque([bytearray(b'+OK fake POP3 server ready\r\n')])
+        self.max_outstanding = 0    # Highest number of commands in flight
+
+    def sendall(self, data):
+        for line in data.split(b'\r\n'):
+            if line:
+                self.responses.append(bytearray(self.server.handle(line.decode())))
+                self.max_outstanding = max(self.max_outstanding, len(self.responses))
+
+    def makefile(self, mode):
+        return self
+
+    def readline(self, limit=-1):
+        if not self.responses:
+            return b''
+        response = self.responses[0]
+        end = response.find(b'\n') + 1 or len(response)
+        line = bytes(response[:end])
+        del response[:end]
+        if not response:
+            self.responses.popleft()
+        return line
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakePOP3(poplib.POP3):
+    """poplib.POP3 talking to a FakePop3Server instead of a socket"""
+
+    def __init__(self, server):
+        self.server = server
+        super().__init__('fake.example.com')
+
+    def _create_socket(self, timeout):
+        return _FakeSocket(self.server)
+
+    @property
+    def max_outstanding(self):
+        """Highest number of commands sent before their responses were read."""
+        return self.sock.max_outstanding
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the asyncio search engine.
+
+Tests the asyncio IMAP client against FakeImapServer served over a local
+socket: pipelined commands with literals, searching several folders and
+accounts at once, the result dict shape and cancellation.
+"""
+import asyncio
+import threading
+from unittest import mock
+
+import pytest
+
+from gui.imap_search_components import async_search_engine
+from gui.imap_search_components.async_search_engine import (
+    AsyncEmailSearchEngine,
+    AsyncImapConnection,
+    search_messages_async,
+)
+from tests.fake_imap_server import FakeImapServer, make_message
+
+
+PDF_STRUCTURE = (
+    b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "7BIT" 13 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL)'
+)
+
+
+def _invoice(uid, nip):
+    header = b'Subject: Faktura %d\r\nMessage-ID: <%d@example.com>\r\n\r\n' % (uid, uid)
+    return make_message(uid, header=header, structure=PDF_STRUCTURE, sections={'2': b'%PDF NIP ' + nip})
+
+
+class _Session:
+    """Per-connection state FakeImapServer.handle() expects"""
+    selected = None
+    idle_tag = None
+
+
+class AsyncFakeServer:
+    """FakeImapServer listening on a local port"""
+
+    def __init__(self, server):
+        self.server = server
+        self.sessions = 0
+        self.open_sessions = 0
+        self.max_pipelined = 0
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @property
+    def config(self):
+        return {'server': '127.0.0.1', 'port': self._server.sockets[0].getsockname()[1],
+                'use_ssl': False, 'email': 'user@example.com', 'password': 'secret'}
+
+    async def _handle(self, reader, writer):
+        self.sessions += 1
+        self.open_sessions += 1
+        session = _Session()
+        writer.write(b'* OK fake IMAP server ready\r\n')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # Commands already waiting in the buffer were sent without waiting for answers
+                self.max_pipelined = max(self.max_pipelined, 1 + reader._buffer.count(b'\r\n'))
+                tag, _, command = line.rstrip(b'\r\n').partition(b' ')
+                writer.write(self.server.handle(session, tag, command.decode()))
+                await writer.drain()
+                if command.upper() == b'LOGOUT':
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.open_sessions -= 1
+            writer.close()
+
+
+class FakeProcessor:
+    """PDFProcessor stand-in: finds the NIP in the raw PDF bytes"""
+
+    delay = 0
+
+    def __init__(self):
+        self.cancelled = False
+
+    def search_in_pdf_attachment(self, content, nip, filename=''):
+        if self.delay:
+            threading.Event().wait(self.delay)
+        found = nip.encode() in content
+        return {'found': found, 'matches': [f'NIP {nip}'] if found else []}
+
+    def cancel_search(self):
+        self.cancelled = True
+
+
+@pytest.fixture
+def processor():
+    with mock.patch.object(async_search_engine, 'PDFProcessor', FakeProcessor):
+        yield
+
+
+class TestAsyncImapConnection:
+    """Test cases for AsyncImapConnection"""
+
+    def test_pipelined_fetch_with_literals(self):
+        """Concurrent FETCH commands share the connection and get their own literals"""
+        server = FakeImapServer({'INBOX': [_invoice(uid, b'%d' % uid) for uid in range(1, 7)]})
+
+        async def run():
+            async with AsyncFakeServer(server) as fake:
+                conn = await AsyncImapConnection.open('127.0.0.1', fake.config['port'], use_ssl=False)
+                await conn.login('user', 'secret')
+                assert (await conn.examine('INBOX'))['exists'] == 6
+                batches = await asyncio.gather(*(conn.uid_fetch(str(uid), '(UID BODY.PEEK[2])')
+                                                 for uid in range(1, 7)))
+                await conn.logout()
+                return batches, fake.max_pipelined
+
+        batches, max_pipelined = asyncio.run(run())
+
+        assert [items[0]['BODY[2]'] for items in batches] == [b'%%PDF NIP %d' % uid for uid in range(1, 7)]
+        assert max_pipelined > 1
+
+
+class TestSearchMessagesAsync:
+    """Test cases for search_messages_async"""
+
+    def test_folders_scanned_concurrently(self, processor):
+        """Matches from all folders come back in the search_messages() result shape"""
+        server = FakeImapServer({
+            'INBOX': [_invoice(1, b'1234567890'), _invoice(2, b'999')],
+            'Faktury': [_invoice(uid, b'1234567890') for uid in range(1, 4)],
+            'Spam': [_invoice(1, b'1234567890')],
+        })
+
+        async def run():
+            async with AsyncFakeServer(server) as fake:
+                results = await search_messages_async({
+                    'nip': '1234567890', 'email_config': fake.config,
+                    'excluded_folders': 'Spam', 'num_connections': 2,
+                })
+                return results, fake.sessions
+
+        results, sessions = asyncio.run(run())
+
+        assert set(results) == {'messages', 'message_to_folder_map', 'matches',
+                                'folder_results', 'total_count', 'error'}
+        assert results['error'] is None
+        assert results['total_count'] == 4
+        assert sorted((m['folder'], m['uid']) for m in results['messages']) == [
+            ('Faktury', '1'), ('Faktury', '2'), ('Faktury', '3'), ('INBOX', '1')]
+        assert results['folder_results'] == {
+            'Faktury': {'total_checked': 3, 'matches_found': 3},
+            'INBOX': {'total_checked': 2, 'matches_found': 1},
+        }
+        assert results['matches']['<1@example.com>'] == ['NIP 1234567890']
+        assert sessions == 2
+
+    def test_several_accounts(self, processor):
+        """Accounts are searched at once and folders are labelled by account"""
+        first = FakeImapServer({'INBOX': [_invoice(1, b'1234567890')]})
+        second = FakeImapServer({'INBOX': [_invoice(5, b'1234567890')]})
+
+        async def run():
+            async with AsyncFakeServer(first) as one, AsyncFakeServer(second) as two:
+                other = dict(two.config, email='other@example.com')
+                return await search_messages_async({'nip': '1234567890', 'accounts': [one.config, other]})
+
+        results = asyncio.run(run())
+
+        assert sorted(m['folder'] for m in results['messages']) == [
+            'other@example.com: INBOX', 'user@example.com: INBOX']
+
+    def test_task_cancellation_closes_connections(self, processor):
+        """Cancelling the task stops the search and closes every connection"""
+        server = FakeImapServer({'INBOX': [_invoice(uid, b'1234567890') for uid in range(1, 50)]})
+
+        async def run():
+            async with AsyncFakeServer(server) as fake:
+                with mock.patch.object(FakeProcessor, 'delay', 0.05):
+                    task = asyncio.ensure_future(search_messages_async(
+                        {'nip': '1234567890', 'email_config': fake.config}))
+                    await asyncio.sleep(0.3)
+                    task.cancel()
+                    with pytest.raises(asyncio.CancelledError):
+                        await task
+                for _ in range(50):
+                    if not fake.open_sessions:
+                        break
+                    await asyncio.sleep(0.01)
+                return fake.open_sessions
+
+        assert asyncio.run(run()) == 0
+
+
+class TestAsyncEmailSearchEngine:
+    """Test cases for AsyncEmailSearchEngine"""
+
+    def test_result_callback(self, processor):
+        """The engine runs the search on its own loop and reports the results"""
+        server = FakeImapServer({'INBOX': [_invoice(1, b'1234567890')]})
+        done = threading.Event()
+        received = []
+
+        async def serve():
+            async with AsyncFakeServer(server) as fake:
+                engine = AsyncEmailSearchEngine(lambda message, percent: None,
+                                                lambda results: (received.append(results), done.set()))
+                engine.search_emails_threaded(fake.config, {'nip': '1234567890'})
+                await asyncio.get_running_loop().run_in_executor(None, done.wait, 10)
+
+        asyncio.run(serve())
+
+        assert received[0]['total_count'] == 1
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for adaptive FETCH batch sizing.
+
+Tests how the batch size follows measured throughput and round-trip time,
+fixed batch sizes, byte-budget grouping and the section downloads of
+iter_pdf_messages bounded by BODYSTRUCTURE sizes.
+"""
+from gui.imap_search_components.batch_sizer import (
+    AdaptiveBatchSizer,
+    make_batch_sizer,
+    split_by_budget,
+)
+from gui.imap_search_components.imap_scanner import iter_pdf_messages
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+class TestAdaptiveBatchSizer:
+    """Test cases for AdaptiveBatchSizer"""
+
+    def test_fast_batches_grow_gradually(self):
+        """Batches much faster than the target at most double per step"""
+        sizer = AdaptiveBatchSizer(100, max_size=1000, target_seconds=1.0)
+
+        assert sizer.record(100, 0.01) == 200
+        assert sizer.record(200, 0.02) == 400
+        assert sizer.record(400, 0.04) == 800
+        assert sizer.record(800, 0.08) == 1000
+
+    def test_slow_batches_shrink_at_once(self):
+        """A slow batch (large messages) cuts the size to fit the target"""
+        sizer = AdaptiveBatchSizer(200, target_seconds=1.0)
+
+        assert sizer.record(200, 20.0) == 20
+        assert sizer.size == sizer.min_size
+
+    def test_round_trip_time_raises_target(self):
+        """On a high-latency link batches take several round trips"""
+        near = AdaptiveBatchSizer(100, target_seconds=0.5)
+        far = AdaptiveBatchSizer(100, target_seconds=0.5)
+
+        near.record(100, 1.0, latency=0.01)
+        far.record(100, 1.0, latency=0.5)
+
+        assert near.size == 50
+        assert far.size == 200
+
+    def test_fixed_batch_size(self):
+        """An explicit batch size never changes"""
+        sizer = make_batch_sizer(7)
+
+        assert not sizer.adaptive
+        assert sizer.record(7, 0.001) == 7
+        assert make_batch_sizer(None).adaptive
+
+
+class TestSplitByBudget:
+    """Test cases for split_by_budget"""
+
+    def test_groups_stay_within_budget(self):
+        """Groups are cut before the budget or count is exceeded"""
+        sizes = {'1': 40, '2': 40, '3': 40, '4': 500, '5': 10}
+
+        assert list(split_by_budget(['1', '2', '3', '4', '5'], sizes, 100)) == [
+            ['1', '2'], ['3'], ['4'], ['5']]
+        assert list(split_by_budget(['1', '2', '3'], {}, 100, max_count=2)) == [['1', '2'], ['3']]
+
+
+class TestSectionBudget:
+    """Test cases for byte-bounded section downloads"""
+
+    def test_large_sections_fetched_in_small_commands(self):
+        """Sections of 5 MB each are requested at most one per 8 MB command"""
+        structure = (
+            b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+            b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "BASE64" 5000000 NIL NIL NIL NIL)'
+            b' "MIXED" NIL NIL NIL NIL)'
+        )
+        server = FakeImapServer({'INBOX': [
+            make_message(uid, structure=structure, sections={'2': b'JVBERi0xLjQ='}) for uid in range(1, 5)]})
+        conn = FakeIMAP4(server)
+        conn.login('user', 'secret')
+        conn.select('INBOX')
+
+        results = list(iter_pdf_messages(conn, ['1', '2', '3', '4']))
+
+        assert [result['uid'] for result in results] == ['1', '2', '3', '4']
+        section_fetches = [c for c in server.commands if 'BODY.PEEK[2]' in c]
+        assert len(section_fetches) == 4
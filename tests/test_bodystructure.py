@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for BODYSTRUCTURE-driven PDF part selection.
+
+Tests that PDF parts are found with correct section numbers and sizes, and that
+search_messages only downloads PDF sections for messages that carry them.
+"""
+import base64
+import unittest.mock as mock
+
+from gui.imap_search_components.bodystructure import (
+    parse_fetch_items,
+    find_pdf_parts,
+    build_section_fetch,
+    decode_part_payload,
+)
+from gui.imap_search_components import search_engine
+from gui.imap_search_components.imap_scanner import TRIAGE_FETCH
+
+
+MIXED_STRUCTURE = (
+    b' BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 10 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "OCTET-STREAM" ("NAME" "faktura.pdf") NIL NIL "BASE64" 1234 NIL'
+    b' ("ATTACHMENT" ("FILENAME" "faktura.pdf")) NIL NIL)'
+    b'("IMAGE" "JPEG" ("NAME" "photo.jpg") NIL NIL "BASE64" 99999 NIL NIL NIL NIL)'
+    b' "MIXED" ("BOUNDARY" "xyz") NIL NIL NIL))'
+)
+
+PLAIN_STRUCTURE = b' BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 10 1 NIL NIL NIL NIL))'
+
+HEADER = b'Subject: Faktura\r\nMessage-ID: <a@b>\r\n\r\n'
+
+
+class TestParseFetchItems:
+    """Test cases for regrouping imaplib FETCH data"""
+
+    def test_structure_after_header_literal(self):
+        """BODYSTRUCTURE sent after the header literal is attached to the same message"""
+        data = [(b'1 (UID 5 BODY[HEADER] {%d}' % len(HEADER), HEADER), MIXED_STRUCTURE]
+        items = parse_fetch_items(data)
+
+        assert len(items) == 1
+        assert items[0]['UID'] == '5'
+        assert items[0]['BODY[HEADER]'] == HEADER
+        assert isinstance(items[0]['BODYSTRUCTURE'], list)
+
+    def test_structure_before_header_literal(self):
+        """BODYSTRUCTURE sent before the header literal is parsed too"""
+        data = [
+            (b'1 (UID 5' + PLAIN_STRUCTURE[:-1] + b' BODY[HEADER] {%d}' % len(HEADER), HEADER),
+            b')',
+            (b'2 (UID 6 BODY[HEADER] {%d}' % len(HEADER), HEADER),
+            PLAIN_STRUCTURE,
+        ]
+        items = parse_fetch_items(data)
+
+        assert [item['UID'] for item in items] == ['5', '6']
+        assert all(item['BODY[HEADER]'] == HEADER for item in items)
+
+
+class TestFindPdfParts:
+    """Test cases for PDF part detection"""
+
+    def _structure(self, text):
+        return parse_fetch_items([b'1 (UID 1' + text])[0]['BODYSTRUCTURE']
+
+    def test_octet_stream_named_pdf(self):
+        """Octet-stream part named *.pdf is found with section and size"""
+        parts = find_pdf_parts(self._structure(MIXED_STRUCTURE))
+
+        assert len(parts) == 1
+        assert parts[0]['section'] == '2'
+        assert parts[0]['size'] == 1234
+        assert parts[0]['filename'] == 'faktura.pdf'
+        assert parts[0]['encoding'] == 'BASE64'
+
+    def test_no_pdf_parts(self):
+        """Plain text message has no PDF parts"""
+        assert find_pdf_parts(self._structure(PLAIN_STRUCTURE)) == []
+
+    def test_single_part_pdf_message(self):
+        """Non-multipart application/pdf message is section 1"""
+        text = b' BODYSTRUCTURE ("APPLICATION" "PDF" NIL NIL NIL "BASE64" 50 NIL NIL NIL NIL))'
+        parts = find_pdf_parts(self._structure(text))
+
+        assert [part['section'] for part in parts] == ['1']
+
+    def test_pdf_inside_forwarded_message(self):
+        """PDF in an encapsulated message/rfc822 gets a nested section number"""
+        text = (
+            b' BODYSTRUCTURE (("TEXT" "PLAIN" NIL NIL NIL "7BIT" 1 1 NIL NIL NIL NIL)'
+            b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 500 (NIL "s" NIL NIL NIL NIL NIL NIL NIL NIL)'
+            b' (("TEXT" "PLAIN" NIL NIL NIL "7BIT" 1 1 NIL NIL NIL NIL)'
+            b'("APPLICATION" "PDF" ("NAME" "f.pdf") NIL NIL "BASE64" 99 NIL NIL NIL NIL)'
+            b' "MIXED" NIL NIL NIL NIL) 20 NIL NIL NIL NIL) "MIXED" NIL NIL NIL NIL))'
+        )
+        parts = find_pdf_parts(self._structure(text))
+
+        assert [part['section'] for part in parts] == ['2.2']
+
+    def test_rfc2231_filename(self):
+        """RFC 2231 encoded filename is decoded"""
+        text = (
+            b' BODYSTRUCTURE ("APPLICATION" "OCTET-STREAM" NIL NIL NIL "BASE64" 10 NIL'
+            b' ("ATTACHMENT" ("FILENAME*" "utf-8\'\'fa%C5%82.pdf")) NIL NIL))'
+        )
+        parts = find_pdf_parts(self._structure(text))
+
+        assert parts[0]['filename'] == 'fał.pdf'
+
+    def test_build_section_fetch(self):
+        """Section fetch list names every part"""
+        parts = [{'section': '2'}, {'section': '3.1'}]
+        assert build_section_fetch(parts) == '(BODY.PEEK[2] BODY.PEEK[3.1])'
+
+    def test_decode_base64_payload(self):
+        """Base64 section with line breaks is decoded"""
+        raw = base64.encodebytes(b'%PDF-1.4 test')
+        assert decode_part_payload(raw, 'BASE64') == b'%PDF-1.4 test'
+
+
+class TestSearchMessagesSectionFetch:
+    """Test cases for search_messages using BODYSTRUCTURE"""
+
+    def test_only_pdf_sections_are_fetched(self):
+        """Messages without PDFs are skipped, PDF messages fetch only their sections"""
+        connection = mock.Mock()
+        connection.select.return_value = ('OK', [b'2'])
+        pdf_b64 = base64.encodebytes(b'%PDF-1.4 NIP 1234567890')
+
+        def uid(command, *args):
+            if command == 'search':
+                return ('OK', [b'5 6'])
+            if args[1] == TRIAGE_FETCH:
+                return ('OK', [
+                    (b'1 (UID 5 BODY[HEADER] {%d}' % len(HEADER), HEADER), PLAIN_STRUCTURE,
+                    (b'2 (UID 6 BODY[HEADER] {%d}' % len(HEADER), HEADER), MIXED_STRUCTURE,
+                ])
+            return ('OK', [(b'2 (UID 6 BODY[2] {%d}' % len(pdf_b64), pdf_b64), b')'])
+
+        connection.uid.side_effect = uid
+
+        processor = mock.Mock()
+        processor.search_in_pdf_attachment.return_value = {'found': True, 'matches': ['NIP 1234567890']}
+
+        with mock.patch.object(search_engine, 'PDFProcessor', return_value=processor):
+            results = search_engine.search_messages({
+                'nip': '1234567890',
+                'connection': connection,
+                'folder_path': 'INBOX',
+            })
+
+        fetch_calls = [c for c in connection.uid.call_args_list if c.args[0] == 'fetch']
+        assert [c.args[1:] for c in fetch_calls] == [
+            ('5:6', TRIAGE_FETCH),
+            ('6', '(BODY.PEEK[2])'),
+        ]
+        processor.search_in_pdf_attachment.assert_called_once_with(
+            b'%PDF-1.4 NIP 1234567890', '1234567890', 'faktura.pdf'
+        )
+        assert results['total_count'] == 1
+        assert results['messages'][0]['uid'] == '6'
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the pool of reusable IMAP/POP3 connections.
+
+Tests reuse of logged-in sessions, NOOP health checks with re-login,
+idle timeouts with the reaper of expired connections and separation of
+accounts.
+"""
+import pytest
+
+from gui.mail_search_components.connection_pool import MailConnectionPool, account_key
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+CONFIG = {'protocol': 'IMAP', 'server': 'imap.example.com', 'port': '993',
+          'email': 'faktury@example.com', 'password': 'secret', 'use_ssl': True}
+
+
+class FakePOP3:
+    """Minimal POP3 session recording its commands"""
+
+    def __init__(self):
+        self.commands = []
+        self.broken = False
+
+    def retr(self, which):
+        raise NotImplementedError
+
+    def noop(self):
+        self.commands.append('NOOP')
+        if self.broken:
+            raise OSError('connection reset')
+        return b'+OK'
+
+    def quit(self):
+        self.commands.append('QUIT')
+        return b'+OK bye'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeTimer:
+    """threading.Timer stand-in started and fired by the test"""
+
+    def __init__(self, delay, function):
+        self.delay = delay
+        self.function = function
+        self.started = False
+        self.cancelled = False
+
+    def start(self):
+        self.started = True
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def _pool(server, clock=None, timers=None, **kwargs):
+    opened = []
+
+    def connect(config):
+        if config.get('protocol') == 'POP3':
+            conn = FakePOP3()
+        else:
+            conn = FakeIMAP4(server)
+            conn.login(config['email'], config['password'])
+        opened.append(conn)
+        return conn
+
+    def timer(delay, function):
+        fake = FakeTimer(delay, function)
+        if timers is not None:
+            timers.append(fake)
+        return fake
+
+    return MailConnectionPool(connect=connect, clock=clock or Clock(), timer=timer, **kwargs), opened
+
+
+class TestMailConnectionPool:
+    """Test cases for MailConnectionPool"""
+
+    def test_session_reused_after_noop(self):
+        """A released connection is checked with NOOP and handed out again"""
+        server = FakeImapServer({'INBOX': [make_message(1)]})
+        pool, opened = _pool(server)
+
+        with pool.connection(CONFIG) as conn:
+            conn.select('INBOX')
+        with pool.connection(CONFIG) as again:
+            assert again is conn
+            assert again.state == 'AUTH'
+
+        assert len(opened) == 1
+        assert sum(c.startswith('LOGIN') for c in server.commands) == 1
+        assert 'CLOSE' in server.commands and 'NOOP' in server.commands
+        assert pool.stats == {'opened': 1, 'reused': 1, 'dropped': 0}
+
+    def test_failed_health_check_logs_in_again(self):
+        """A connection the server dropped is replaced by a new login"""
+        server = FakeImapServer()
+        pool, opened = _pool(server)
+        conn = pool.acquire(CONFIG)
+        pool.release(conn)
+        conn._inbuf = bytearray()
+        conn.send = lambda data: (_ for _ in ()).throw(OSError('connection reset'))
+
+        fresh = pool.acquire(CONFIG)
+
+        assert fresh is not conn and len(opened) == 2
+        assert pool.stats['dropped'] == 1
+
+    def test_idle_timeout(self):
+        """Connections idle longer than the timeout are logged out, not reused"""
+        server = FakeImapServer()
+        clock = Clock()
+        pool, opened = _pool(server, clock, imap_idle_timeout=60)
+        pool.release(pool.acquire(CONFIG))
+
+        clock.now = 61
+        pool.acquire(CONFIG)
+
+        assert len(opened) == 2
+        assert 'LOGOUT' in server.commands
+
+    def test_error_in_block_discards_connection(self):
+        """A connection used by a failing block is not pooled"""
+        pool, _ = _pool(FakeImapServer())
+
+        with pytest.raises(ValueError):
+            with pool.connection(CONFIG):
+                raise ValueError('parse error')
+
+        assert pool.idle_count() == 0
+
+    def test_accounts_are_separate(self):
+        """Another account or changed password never gets an old session"""
+        pool, opened = _pool(FakeImapServer())
+        pool.release(pool.acquire(CONFIG))
+
+        pool.release(pool.acquire(dict(CONFIG, password='changed')))
+
+        assert len(opened) == 2
+        assert pool.idle_count(CONFIG) == 1
+        assert account_key(CONFIG) != account_key(dict(CONFIG, protocol='POP3'))
+        assert account_key(CONFIG) == account_key(dict(CONFIG, protocol='EXCHANGE'))
+
+    def test_pop3_session(self):
+        """POP3 sessions are pooled with their own (short) timeout"""
+        clock = Clock()
+        pool, opened = _pool(None, clock, pop3_idle_timeout=30)
+        config = dict(CONFIG, protocol='POP3', port='995')
+
+        pool.release(pool.acquire(config))
+        assert pool.acquire(config) is opened[0]
+        assert opened[0].commands == ['NOOP']
+
+        pool.release(opened[0])
+        clock.now = 31
+        pool.acquire(config)
+        assert opened[0].commands[-1] == 'QUIT' and len(opened) == 2
+
+    def test_reaper_logs_out_expired_sessions(self):
+        """An idle POP3 session is quit after its timeout without another acquire"""
+        clock, timers = Clock(), []
+        pool, opened = _pool(FakeImapServer(), clock, timers, pop3_idle_timeout=30)
+        config = dict(CONFIG, protocol='POP3', port='995')
+        pool.release(pool.acquire(config))
+        pool.release(pool.acquire(CONFIG))
+
+        assert len(timers) == 1 and timers[0].started and timers[0].delay == 31
+        clock.now = 31
+        timers[0].function()
+
+        assert opened[0].commands == ['QUIT']
+        assert pool.idle_count(config) == 0 and pool.idle_count(CONFIG) == 1
+        assert len(timers) == 2 and timers[1].delay == 600 - 31 + 1
+
+        pool.close_all()
+        assert timers[1].cancelled
+
+    def test_close_all(self):
+        """close_all logs out every idle connection"""
+        server = FakeImapServer()
+        pool, _ = _pool(server)
+        first, second = pool.acquire(CONFIG), pool.acquire(CONFIG)
+        pool.release(first)
+        pool.release(second)
+
+        pool.close_all()
+
+        assert server.commands.count('LOGOUT') == 2
+        assert pool.idle_count() == 0
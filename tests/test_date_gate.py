@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for date range gating before body download.
+
+Tests the half-open, time-zone correct range check and filtering UIDs on
+INTERNALDATE or the Date header field with date-only FETCH commands.
+"""
+from datetime import datetime, timedelta, timezone
+
+from gui.imap_search_components.date_gate import datetime_in_range, filter_uids_by_date, parse_date_header
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+UTC = timezone.utc
+START = datetime(2025, 12, 1, tzinfo=UTC)
+END = datetime(2025, 12, 2, tzinfo=UTC)
+
+
+class TestDatetimeInRange:
+    """Test cases for datetime_in_range"""
+
+    def test_offset_converted_not_dropped(self):
+        """00:30 +0100 is 23:30 UTC the day before - outside a range starting at 00:00 UTC"""
+        assert not datetime_in_range(parse_date_header('Mon, 1 Dec 2025 00:30:00 +0100'), START, END)
+        assert datetime_in_range(parse_date_header('Sun, 30 Nov 2025 23:30:00 -0100'), START, END)
+
+    def test_half_open(self):
+        """The start is inclusive, the end exclusive; unknown dates are kept"""
+        assert datetime_in_range(START, START, END)
+        assert not datetime_in_range(END, START, END)
+        assert datetime_in_range(END - timedelta(microseconds=1), START, None)
+        assert datetime_in_range(None, START, END)
+        assert parse_date_header('not a date') is None
+
+
+class TestFilterUidsByDate:
+    """Test cases for filter_uids_by_date"""
+
+    def _connection(self):
+        server = FakeImapServer({'INBOX': [
+            make_message(1, internaldate='30-Nov-2025 23:59:59 +0000',
+                         header=b'Date: Mon, 1 Dec 2025 10:00:00 +0000\r\n\r\n'),
+            make_message(2, internaldate='01-Dec-2025 00:30:00 +0100',
+                         header=b'Date: Mon, 1 Dec 2025 10:00:00 +0000\r\n\r\n'),
+            make_message(3, internaldate='01-Dec-2025 12:00:00 +0000',
+                         header=b'Date: Tue, 2 Dec 2025 00:00:00 +0000\r\n\r\n'),
+            make_message(4, internaldate='02-Dec-2025 00:00:00 +0000', header=b'Subject: x\r\n\r\n'),
+        ]})
+        conn = FakeIMAP4(server)
+        conn.login('user', 'secret')
+        conn.select('INBOX', readonly=True)
+        return server, conn
+
+    def test_internaldate(self):
+        """Edge-day messages outside the range are dropped without fetching bodies"""
+        server, conn = self._connection()
+
+        assert filter_uids_by_date(conn, ['1', '2', '3', '4'], START, END) == ['3']
+        fetches = [line for line in server.commands if 'FETCH' in line.upper()]
+        assert fetches and all('INTERNALDATE' in line and 'BODY' not in line for line in fetches)
+
+    def test_date_header(self):
+        """The Date field alone decides when configured; messages without it are kept"""
+        server, conn = self._connection()
+
+        assert filter_uids_by_date(conn, ['1', '2', '3', '4'], START, END, use_date_header=True) == ['1', '2', '4']
+        assert all('HEADER.FIELDS (DATE)' in line for line in server.commands if 'FETCH' in line.upper())
+
+    def test_no_range(self):
+        """Without bounds nothing is fetched"""
+        server, conn = self._connection()
+        server.commands.clear()
+
+        assert filter_uids_by_date(conn, [1, 2], None, None) == ['1', '2']
+        assert server.commands == []
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for ENVELOPE-based triage.
+
+Tests that EnvelopeHeaders answers header lookups like the parsed header
+fields did, and that scans in envelope mode send ENVELOPE instead of a
+header FETCH while returning the same message metadata.
+"""
+from datetime import datetime, timezone
+from unittest import mock
+
+from gui.imap_search_components.fetch_parser import EnvelopeHeaders, parse_fetch_items
+from gui.imap_search_components.imap_scanner import iter_pdf_messages
+from gui.imap_search_components import search_engine
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+PDF_STRUCTURE = (
+    b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "7BIT" 13 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL)'
+)
+
+HEADER = (b'Date: Mon, 1 Dec 2025 10:00:00 +0100\r\n'
+          b'Subject: =?utf-8?B?RmFrdHVyYSDFvA==?=\r\n'
+          b'From: "Jan Kowalski" <jan@example.com>\r\n'
+          b'To: biuro@firma.pl, Anna <anna@firma.pl>\r\n'
+          b'Message-ID: <fv-1@example.com>\r\n\r\n')
+
+
+def _connection(messages):
+    server = FakeImapServer({'INBOX': messages})
+    conn = FakeIMAP4(server)
+    conn.login('user', 'secret')
+    conn.select('INBOX', readonly=True)
+    return server, conn
+
+
+class TestEnvelopeHeaders:
+    """Test cases for EnvelopeHeaders"""
+
+    def test_lookup_like_message(self):
+        """Fields are found case-insensitively, raw as sent; missing ones give the default"""
+        _, conn = _connection([make_message(1, header=HEADER)])
+        status, data = conn.uid('FETCH', '1', '(UID INTERNALDATE ENVELOPE)')
+        record = parse_fetch_items(data)[0]
+        headers = EnvelopeHeaders(record.envelope, record.internaldate)
+
+        assert headers.get('subject') == '=?utf-8?B?RmFrdHVyYSDFvA==?='
+        assert headers['Date'] == 'Mon, 1 Dec 2025 10:00:00 +0100'
+        assert headers.get('From') == 'Jan Kowalski <jan@example.com>'
+        assert headers.get('To') == 'biuro@firma.pl, Anna <anna@firma.pl>'
+        assert headers.get('Message-ID') == '<fv-1@example.com>'
+        assert headers.get('Cc', '') == ''
+        assert headers.get('X-Mailer') is None
+        assert 'Subject' in headers and 'In-Reply-To' not in headers
+        assert headers.internaldate == datetime(2025, 12, 15, 10, 0, tzinfo=timezone.utc)
+
+
+class TestEnvelopeScan:
+    """Test cases for scans with envelope triage"""
+
+    def test_no_header_fetch(self):
+        """Envelope mode sends ENVELOPE and no header section FETCH"""
+        server, conn = _connection([
+            make_message(1, header=HEADER, structure=PDF_STRUCTURE, sections={'2': b'%PDF faktura'}),
+            make_message(2),
+        ])
+
+        messages = list(iter_pdf_messages(conn, ['1', '2'], use_envelope=True))
+
+        fetches = [line for line in server.commands if 'FETCH' in line.upper()]
+        assert all('HEADER' not in line.upper() for line in fetches)
+        assert any('ENVELOPE' in line.upper() for line in fetches)
+        assert [m['uid'] for m in messages] == ['1']
+        assert messages[0]['headers'].get('Date') == 'Mon, 1 Dec 2025 10:00:00 +0100'
+        assert messages[0]['attachments'] == [('fv.pdf', b'%PDF faktura')]
+
+    def test_same_results_as_header_mode(self):
+        """search_messages() returns the same metadata in both triage modes"""
+        def run(envelope_triage):
+            _, conn = _connection([
+                make_message(uid, header=HEADER, structure=PDF_STRUCTURE, sections={'2': b'%PDF NIP 1234567890'})
+                for uid in (1, 2)
+            ])
+            processor = mock.Mock()
+            processor.search_in_pdf_attachment.return_value = {'found': True, 'matches': ['NIP 1234567890']}
+            with mock.patch.object(search_engine, 'PDFProcessor', return_value=processor):
+                results = search_engine.search_messages({'nip': '1234567890', 'connection': conn,
+                                                         'folder_path': 'INBOX',
+                                                         'envelope_triage': envelope_triage})
+            return [(m['id'], m['uid'], m['subject'], m['date']) for m in results['messages']]
+
+        envelope_results = run(True)
+        assert envelope_results == run(False)
+        assert [uid for _, uid, _, _ in envelope_results] == ['1', '2']
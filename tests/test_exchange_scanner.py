@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for native EWS scanning.
+
+Tests the server-side restriction and projection of the candidate query and
+that attachment metadata and MIME content are fetched in batches, only for
+messages that may carry PDF attachments. exchangelib objects are replaced by
+simple fakes, so the tests run without the library.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+from gui.mail_search_components import exchange_scanner
+from gui.mail_search_components.exchange_scanner import candidate_items, iter_pdf_messages, may_contain_pdf
+
+
+class FakeQuery:
+    """Records the QuerySet calls of candidate_items"""
+
+    def __init__(self):
+        self.calls = []
+        self.page_size = None
+
+    def filter(self, **kwargs):
+        self.calls.append(('filter', kwargs))
+        return self
+
+    def only(self, *fields):
+        self.calls.append(('only', fields))
+        return self
+
+    def order_by(self, *fields):
+        self.calls.append(('order_by', fields))
+        return self
+
+
+class FakeAccount:
+    """Answers GetItem (fetch) from a dict of items, recording the batches"""
+
+    def __init__(self, items):
+        self.items = items          # id -> (attachments, mime_content)
+        self.calls = []
+
+    def fetch(self, ids, only_fields):
+        self.calls.append(([item.id for item in ids], tuple(only_fields)))
+        for item in ids:
+            if item.id not in self.items:
+                yield ValueError(f"ErrorItemNotFound {item.id}")
+                continue
+            attachments, mime_content = self.items[item.id]
+            yield SimpleNamespace(id=item.id, changekey='ck', datetime_received=None,
+                                  attachments=attachments if 'attachments' in only_fields else None,
+                                  mime_content=mime_content if 'mime_content' in only_fields else None)
+
+
+def _pdf(name='fv.pdf'):
+    return SimpleNamespace(name=name, size=100, content_type='application/pdf')
+
+
+def _candidates(*ids):
+    return [SimpleNamespace(id=item_id, changekey='ck') for item_id in ids]
+
+
+class TestCandidateItems:
+    """Test cases for candidate_items"""
+
+    def test_restriction_and_projection(self):
+        """Attachments and the half-open received range are filtered on the server, ids only"""
+        folder = FakeQuery()
+        start, end = datetime(2025, 12, 1), datetime(2026, 1, 1)
+
+        with mock.patch.object(exchange_scanner, 'ews_datetime', lambda dt: dt):
+            query = candidate_items(folder, start, end, page_size=50)
+
+        assert query.calls == [
+            ('filter', {'has_attachments': True, 'datetime_received__gte': start, 'datetime_received__lt': end}),
+            ('only', ('id', 'changekey', 'datetime_received')),
+            ('order_by', ('datetime_received',)),
+        ]
+        assert query.page_size == 50
+        assert candidate_items(FakeQuery()).calls[0] == ('filter', {'has_attachments': True})
+
+
+class TestIterPdfMessages:
+    """Test cases for iter_pdf_messages"""
+
+    def test_only_pdf_messages_downloaded(self):
+        """Metadata and MIME content are fetched in batches; other messages are not downloaded"""
+        account = FakeAccount({
+            'a': ([_pdf()], b'MIME a'),
+            'b': ([_pdf('zdjecie.jpg')], b'MIME b'),
+            'c': ([SimpleNamespace(name='Fwd', item=object())], b'MIME c'),
+            'd': ([_pdf('FV.PDF')], b'MIME d'),
+        })
+
+        messages = list(iter_pdf_messages(account, _candidates('a', 'b', 'c', 'd', 'x'), batch_size=3))
+
+        assert sorted((m['id'], m['mime_content']) for m in messages) == [
+            ('a', b'MIME a'), ('b', None), ('c', b'MIME c'), ('d', b'MIME d')
+        ]
+        assert account.calls == [
+            (['a', 'b', 'c'], ('attachments', 'datetime_received')),
+            (['a', 'c'], ('mime_content', 'datetime_received')),
+            (['d', 'x'], ('attachments', 'datetime_received')),
+            (['d'], ('mime_content', 'datetime_received')),
+        ]
+
+    def test_stop(self):
+        """Nothing more is fetched once stop is requested"""
+        account = FakeAccount({'a': ([_pdf()], b'MIME a'), 'b': ([_pdf()], b'MIME b')})
+        stop = []
+
+        for message in iter_pdf_messages(account, _candidates('a', 'b'), batch_size=1,
+                                         should_stop=lambda: bool(stop)):
+            stop.append(message['id'])
+
+        assert stop == ['a']
+        assert [ids for ids, _ in account.calls] == [['a'], ['a']]
+
+    def test_may_contain_pdf(self):
+        """PDF files by name, attached messages always"""
+        assert may_contain_pdf(_pdf('Faktura.Pdf'))
+        assert not may_contain_pdf(_pdf('umowa.docx'))
+        assert not may_contain_pdf(SimpleNamespace(name=None))
+        assert may_contain_pdf(SimpleNamespace(name='Fwd: faktura', item=None))
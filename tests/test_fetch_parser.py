@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the FETCH response parser.
+
+Tests tokenizing of literals, nested lists and quoted strings, the typed
+values of FetchRecord (UID, INTERNALDATE, RFC822.SIZE, FLAGS, ENVELOPE) and
+the INTERNALDATE fallback filter that reads them.
+"""
+from datetime import datetime, timedelta, timezone
+
+from gui.imap_search_components.fetch_parser import (
+    fetch_message_body,
+    parse_fetch_items,
+    parse_internaldate,
+    tokenize,
+)
+from gui.imap_search_components.search_engine import filter_uids_by_internaldate
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+ENVELOPE = (b'ENVELOPE ("Mon, 1 Dec 2025 10:00:00 +0100" "=?utf-8?B?RmFrdHVyYQ==?="'
+            b' (("Jan \\"JK\\" Kowalski" NIL "jan" "example.com")) NIL NIL'
+            b' ((NIL NIL "biuro" "firma.pl")) NIL NIL NIL "<a@b>")')
+
+
+class TestTokenize:
+    """Test cases for tokenize"""
+
+    def test_nested_lists_quoted_and_literals(self):
+        """Lists nest, quoted strings are unescaped, literals are inserted in order"""
+        tokens = tokenize(b'1 (A ("x \\"y\\"" NIL) {3} B[HEADER.FIELDS (DATE)]<0> {2})', [b'abc', b'de'])
+
+        assert tokens == ['1', ['A', ['x "y"', None], b'abc', 'B[HEADER.FIELDS (DATE)]<0>', b'de']]
+
+
+class TestFetchRecord:
+    """Test cases for parse_fetch_items records"""
+
+    def test_typed_values(self):
+        """UID, size, flags and dates are converted to Python types"""
+        data = [b'7 (UID 42 RFC822.SIZE 1234 FLAGS (\\Seen $Faktura) '
+                b'INTERNALDATE " 5-Dec-2025 23:30:00 -0200" MODSEQ (99) ' + ENVELOPE + b')']
+        record = parse_fetch_items(data)[0]
+
+        assert (record.seq, record.uid, record.size, record.modseq) == (7, 42, 1234, 99)
+        assert record.flags == ('\\Seen', '$Faktura')
+        assert record.internaldate == datetime(2025, 12, 5, 23, 30, tzinfo=timezone(timedelta(hours=-2)))
+        assert record['UID'] == '42'
+
+        envelope = record.envelope
+        assert envelope.subject == '=?utf-8?B?RmFrdHVyYQ==?='
+        assert envelope.from_[0].name == 'Jan "JK" Kowalski'
+        assert envelope.to[0].mailbox == 'biuro'
+        assert envelope.message_id == '<a@b>'
+
+    def test_sections_and_body(self):
+        """Sections are found by spec (also partial), the body skips unsolicited FETCH"""
+        data = [
+            b'3 (FLAGS (\\Seen))',
+            (b'4 (UID 9 BODY[2]<0> {4}', b'%PDF'),
+            (b' BODY[HEADER.FIELDS (SUBJECT)] {9}', b'Subject:\n'),
+            (b' BODY[] {5}', b'whole'),
+            b')',
+        ]
+        records = parse_fetch_items(data)
+
+        assert records[0].uid is None
+        assert records[1].section('2') == b'%PDF'
+        assert records[1].header == b'Subject:\n'
+        assert fetch_message_body(data) == b'whole'
+
+    def test_malformed_internaldate(self):
+        """Malformed dates give None instead of raising"""
+        assert parse_internaldate('32-Dec-2025 10:00:00 +0000') is None
+        assert parse_internaldate('yesterday') is None
+
+
+class TestInternaldateFilter:
+    """Test cases for filter_uids_by_internaldate"""
+
+    def test_filters_responses_without_literals(self):
+        """INTERNALDATE-only responses (no literals) are filtered by date"""
+        server = FakeImapServer({'INBOX': [
+            make_message(1, internaldate='01-Nov-2025 10:00:00 +0000'),
+            make_message(2, internaldate='03-Dec-2025 10:00:00 +0000'),
+            make_message(3, internaldate='20-Dec-2025 10:00:00 +0000'),
+        ]})
+        conn = FakeIMAP4(server)
+        conn.login('user', 'secret')
+
+        uids = filter_uids_by_internaldate(conn, 'INBOX', ['1', '2', '3'],
+                                           datetime(2025, 12, 1), datetime(2025, 12, 10))
+
+        assert uids == ['2']
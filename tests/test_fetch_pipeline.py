@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for pipelined UID FETCH.
+
+Tests UID set compression, that several FETCH commands are kept in flight on a
+real imaplib connection, and that stopping early leaves the connection usable.
+"""
+import unittest.mock as mock
+from contextlib import closing
+
+from gui.imap_search_components.fetch_pipeline import (
+    compress_uid_set,
+    chunk_uids,
+    pipelined_uid_fetch,
+)
+from gui.imap_search_components.imap_scanner import iter_pdf_messages
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+PDF_STRUCTURE = (
+    b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "7BIT" 8 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL)'
+)
+
+
+def _connection(count=10, structure=None, sections=None):
+    messages = [make_message(uid, structure=structure, sections=sections)
+                for uid in range(1, count + 1)]
+    conn = FakeIMAP4(FakeImapServer({'INBOX': messages}))
+    conn.login('user', 'secret')
+    conn.select('INBOX')
+    return conn
+
+
+class TestCompressUidSet:
+    """Test cases for sequence set serialization"""
+
+    def test_ranges_and_singles(self):
+        """Consecutive UIDs collapse to ranges"""
+        assert compress_uid_set(['1', '2', '3', '7', '9', '10']) == '1:3,7,9:10'
+
+    def test_unsorted_duplicates(self):
+        """UIDs are sorted and deduplicated"""
+        assert compress_uid_set([5, '3', 4, 5]) == '3:5'
+
+    def test_empty(self):
+        """No UIDs gives an empty set"""
+        assert compress_uid_set([]) == ''
+
+    def test_chunk_uids(self):
+        """UID list is split into fixed-size chunks"""
+        assert list(chunk_uids(['1', '2', '3'], 2)) == [['1', '2'], ['3']]
+
+
+class TestPipelinedUidFetch:
+    """Test cases for pipelined_uid_fetch"""
+
+    def test_commands_are_pipelined(self):
+        """Several FETCH commands are outstanding at once and all items arrive"""
+        conn = _connection(10)
+        commands = [(compress_uid_set(chunk), '(UID RFC822.SIZE)')
+                    for chunk in chunk_uids([str(uid) for uid in range(1, 11)], 2)]
+
+        items = list(pipelined_uid_fetch(conn, commands, max_in_flight=3))
+
+        assert [item['UID'] for item in items] == [str(uid) for uid in range(1, 11)]
+        assert conn.max_outstanding == 3
+
+    def test_early_close_keeps_connection_usable(self):
+        """Closing the generator drains responses of commands already sent"""
+        conn = _connection(10)
+        commands = [(str(uid), '(UID RFC822.SIZE)') for uid in range(1, 11)]
+
+        with closing(pipelined_uid_fetch(conn, commands, max_in_flight=4)) as items:
+            next(items)
+
+        assert conn.noop()[0] == 'OK'
+        status, data = conn.uid('fetch', '10', '(UID)')
+        assert status == 'OK'
+        assert b'UID 10' in data[0]
+
+    def test_sequential_fallback(self):
+        """Non-imaplib connections get plain uid('fetch') calls"""
+        connection = mock.Mock()
+        connection.uid.return_value = ('OK', [b'1 (UID 4 RFC822.SIZE 10)'])
+
+        items = list(pipelined_uid_fetch(connection, [('4', '(UID RFC822.SIZE)')]))
+
+        assert items[0]['UID'] == '4'
+        connection.uid.assert_called_once_with('fetch', '4', '(UID RFC822.SIZE)')
+
+
+class TestIterPdfMessagesPipelined:
+    """Test cases for iter_pdf_messages on a real imaplib connection"""
+
+    def test_sections_grouped_into_few_commands(self):
+        """All PDF sections sharing a spec are fetched with one command"""
+        conn = _connection(6, structure=PDF_STRUCTURE, sections={'2': b'%PDF-1.4'})
+
+        results = list(iter_pdf_messages(conn, [str(uid) for uid in range(1, 7)],
+                                         batch_size=2, max_in_flight=3))
+
+        assert [r['uid'] for r in results] == [str(uid) for uid in range(1, 7)]
+        assert all(r['attachments'] == [('fv.pdf', b'%PDF-1.4')] for r in results)
+        section_fetches = [c for c in conn.server.commands if 'BODY.PEEK[2]' in c]
+        assert section_fetches == ['UID FETCH 1:6 (BODY.PEEK[2])']
+
+    def test_caller_may_fetch_while_iterating(self):
+        """No FETCH is in flight when a result is yielded"""
+        conn = _connection(4, structure=PDF_STRUCTURE, sections={'2': b'%PDF-1.4'})
+
+        for result in iter_pdf_messages(conn, ['1', '2', '3', '4'], batch_size=1, max_in_flight=4):
+            assert conn.outstanding == 0
+            assert conn.uid('fetch', result['uid'], '(UID)')[0] == 'OK'
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for folder-level parallel IMAP scanning.
+
+Tests LIST parsing, excluded folders, ordering by STATUS message counts and
+scanning folders over several connections.
+"""
+import threading
+import unittest.mock as mock
+
+import pytest
+
+from gui.imap_search_components import folder_scheduler
+from gui.imap_search_components.folder_scheduler import (
+    parse_list_response,
+    parse_excluded_folders,
+    prioritize_folders,
+    plan_folder_scan,
+    scan_folders_parallel,
+)
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+def _server():
+    return FakeImapServer({
+        'INBOX': [make_message(uid) for uid in range(1, 4)],
+        'Faktury/2025': [make_message(uid) for uid in range(1, 11)],
+        'Spam': [make_message(1)],
+        'Puste': [],
+        'Archiwum': [],
+    })
+
+
+def _connect_factory(server):
+    connections = []
+    lock = threading.Lock()
+
+    def connect():
+        conn = FakeIMAP4(server)
+        conn.login('user', 'secret')
+        with lock:
+            connections.append(conn)
+        return conn
+
+    return connect, connections
+
+
+class TestFolderPlanning:
+    """Test cases for listing and ordering folders"""
+
+    def test_parse_list_response(self):
+        """Quoted, atom and literal names are read; NIL delimiter is None"""
+        folders = parse_list_response([
+            b'(\\HasNoChildren) "/" "Faktury/2025"',
+            b'(\\HasChildren \\Noselect) "." Archiwum',
+            (b'(\\HasNoChildren) NIL {13}', b'Faktury "Q1"'),
+            b'(\\HasNoChildren) "/" "Dzia\\"l"',
+        ])
+
+        assert [f['name'] for f in folders] == ['Faktury/2025', 'Archiwum', 'Faktury "Q1"', 'Dzia"l']
+        assert folders[1]['flags'] == ('\\HASCHILDREN', '\\NOSELECT')
+        assert folders[2]['delimiter'] is None
+
+    def test_parse_excluded_folders(self):
+        """Names are split on commas and stripped"""
+        assert parse_excluded_folders('Spam, Kosz ,,') == {'Spam', 'Kosz'}
+        assert parse_excluded_folders(None) == set()
+
+    def test_prioritize_folders(self):
+        """Largest first, unknown sizes last, empty folders dropped"""
+        assert prioritize_folders([('a', 2), ('b', None), ('c', 0), ('d', 9)]) == [
+            ('d', 9), ('a', 2), ('b', None)]
+
+    def test_plan_folder_scan(self):
+        """Excluded and non-selectable folders are skipped, the rest ordered by STATUS"""
+        server = _server()
+        server.folder_flags = {'Archiwum': '\\Noselect'}
+        connect, _ = _connect_factory(server)
+
+        assert plan_folder_scan(connect(), 'Spam') == [('Faktury/2025', 10), ('INBOX', 3)]
+        assert not any('Archiwum' in c for c in server.commands if c.startswith('STATUS'))
+
+
+class TestScanFoldersParallel:
+    """Test cases for scan_folders_parallel"""
+
+    def test_folders_scanned_concurrently(self):
+        """Every folder is scanned once, spread over the connections"""
+        server = _server()
+        connect, connections = _connect_factory(server)
+        barrier = threading.Barrier(2, timeout=5)
+        scanned = []
+
+        def scan_folder(conn, folder):
+            # Both workers must be busy at the same time to pass the barrier
+            barrier.wait()
+            scanned.append((folder, conn))
+            return folder.upper()
+
+        stats = scan_folders_parallel(connect, ['Faktury/2025', 'INBOX'], scan_folder, 2)
+
+        assert stats['results'] == {'Faktury/2025': 'FAKTURY/2025', 'INBOX': 'INBOX'}
+        assert stats['connections'] == 2
+        assert len({id(conn) for _, conn in scanned}) == 2
+        assert server.commands.count('LOGOUT') == len(connections)
+
+    def test_lost_connection_hands_folder_over(self):
+        """A folder whose connection dropped is scanned by another worker"""
+        server = _server()
+        connect, _ = _connect_factory(server)
+        attempts = []
+
+        def scan_folder(conn, folder):
+            attempts.append(folder)
+            if len(attempts) == 1:
+                raise OSError('connection reset')
+            return 'ok'
+
+        stats = scan_folders_parallel(connect, ['INBOX', 'Faktury/2025'], scan_folder, 2)
+
+        assert sorted(stats['results']) == ['Faktury/2025', 'INBOX']
+        assert not stats['errors']
+
+    def test_failed_folder_leaves_live_connection(self):
+        """After a folder runs out of retries the next folder gets a new connection"""
+        server = _server()
+        connect, connections = _connect_factory(server)
+        dead = set()
+
+        def scan_folder(conn, folder):
+            if id(conn) in dead or folder == 'INBOX':
+                dead.add(id(conn))
+                raise OSError('connection reset')
+            return 'ok'
+
+        with mock.patch.object(folder_scheduler, 'MAX_FOLDER_RETRIES', 0):
+            stats = scan_folders_parallel(connect, ['INBOX', 'Faktury/2025'], scan_folder, 1)
+
+        assert stats['results'] == {'Faktury/2025': 'ok'}
+        assert list(stats['errors']) == ['INBOX']
+        assert len(connections) == 2
+
+    def test_folder_error_does_not_stop_others(self):
+        """An error in one folder is reported; the rest are still scanned"""
+        server = _server()
+        connect, _ = _connect_factory(server)
+
+        def scan_folder(conn, folder):
+            if folder == 'INBOX':
+                raise ValueError('broken message')
+            return 'ok'
+
+        stats = scan_folders_parallel(connect, ['INBOX', 'Faktury/2025', 'Spam'], scan_folder, 1)
+
+        assert stats['results'] == {'Faktury/2025': 'ok', 'Spam': 'ok'}
+        assert stats['errors'] == {'INBOX': 'broken message'}
+
+    def test_no_connection_raises(self):
+        """The connection error is raised when no worker could connect"""
+        def connect():
+            raise ConnectionRefusedError('too many connections')
+
+        with pytest.raises(ConnectionRefusedError):
+            scan_folders_parallel(connect, ['INBOX'], lambda conn, folder: None, 3)
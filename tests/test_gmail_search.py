@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the Gmail fast path.
+
+Tests the X-GM-RAW query, finding All Mail by its special-use flag,
+X-GM-MSGID deduplication and Gmail-aware search_messages runs.
+"""
+import unittest.mock as mock
+from datetime import datetime, timezone
+
+from gui.imap_search_components import search_engine
+from gui.imap_search_components.gmail_search import (
+    build_gmail_raw_query,
+    gmail_raw_criterion,
+    find_all_mail_folder,
+    supports_gmail_extensions,
+    GmailMessageDeduplicator,
+)
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+PDF_STRUCTURE = (
+    b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "7BIT" 8 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL)'
+)
+
+GMAIL_CAPABILITIES = 'IMAP4rev1 X-GM-EXT-1'
+
+
+def _pdf_message(uid, gm_msgid):
+    return make_message(uid, structure=PDF_STRUCTURE, sections={'2': b'%PDF-1.4'}, gm_msgid=gm_msgid)
+
+
+def _connection(server):
+    conn = FakeIMAP4(server)
+    conn.login('user', 'secret')
+    return conn
+
+
+class TestGmailQuery:
+    """Test cases for X-GM-RAW query building"""
+
+    def test_query_with_dates(self):
+        """Dates become Unix timestamps; after: is moved back to stay inclusive"""
+        start = datetime(2025, 12, 1, tzinfo=timezone.utc)
+        end = datetime(2025, 12, 8, tzinfo=timezone.utc)
+
+        query = build_gmail_raw_query(start, end)
+
+        assert query == 'has:attachment filename:pdf after:1764547199 before:1765152000'
+
+    def test_query_without_dates(self):
+        """Without dates only the attachment operators are used"""
+        assert build_gmail_raw_query() == 'has:attachment filename:pdf'
+
+    def test_criterion_is_quoted(self):
+        """The query is sent as one quoted string"""
+        assert gmail_raw_criterion('a "b"') == 'X-GM-RAW "a \\"b\\""'
+
+    def test_find_all_mail_folder(self):
+        """All Mail is found by the \\All flag, whatever its localized name"""
+        listing = [
+            b'(\\HasNoChildren) "/" "INBOX"',
+            b'(\\All \\HasNoChildren) "/" "[Gmail]/Wszystkie"',
+        ]
+        assert find_all_mail_folder(listing) == '[Gmail]/Wszystkie'
+        assert find_all_mail_folder(listing[:1]) is None
+
+    def test_supports_gmail_extensions(self):
+        """Capability check works on real connections and ignores mocks"""
+        assert supports_gmail_extensions(_connection(FakeImapServer(capabilities=GMAIL_CAPABILITIES)))
+        assert not supports_gmail_extensions(_connection(FakeImapServer()))
+        assert not supports_gmail_extensions(mock.Mock())
+
+
+class TestGmailMessageDeduplicator:
+    """Test cases for X-GM-MSGID deduplication"""
+
+    def test_filter_new(self):
+        """A message seen under one label is dropped from the next one"""
+        server = FakeImapServer({
+            'INBOX': [_pdf_message(1, 1001), _pdf_message(2, 1002)],
+            'Faktury': [_pdf_message(5, 1002), _pdf_message(6, 1003)],
+        }, capabilities=GMAIL_CAPABILITIES)
+        conn = _connection(server)
+        dedup = GmailMessageDeduplicator()
+
+        conn.select('INBOX')
+        assert dedup.filter_new(conn, ['1', '2']) == ['1', '2']
+        conn.select('Faktury')
+        assert dedup.filter_new(conn, ['5', '6']) == ['6']
+
+
+class TestGmailSearchMessages:
+    """Test cases for search_messages on a Gmail server"""
+
+    def _search(self, conn, **extra):
+        processor = mock.Mock()
+        processor.search_in_pdf_attachment.return_value = {'found': True, 'matches': ['NIP']}
+        criteria = {'nip': '123', 'connection': conn}
+        criteria.update(extra)
+        with mock.patch.object(search_engine, 'PDFProcessor', return_value=processor):
+            return search_engine.search_messages(criteria)
+
+    def _server(self):
+        server = FakeImapServer({
+            'INBOX': [_pdf_message(1, 1001), make_message(2, gm_msgid=1002)],
+            'Faktury': [_pdf_message(3, 1001)],
+            '[Gmail]/All Mail': [_pdf_message(10, 1001), make_message(11, gm_msgid=1002),
+                                 _pdf_message(12, 1003)],
+        }, capabilities=GMAIL_CAPABILITIES)
+        server.folder_flags = {'[Gmail]/All Mail': '\\All'}
+        # Gmail answers X-GM-RAW from its index: only messages with PDFs
+        server.search_filter = lambda criteria, message: (
+            'X-GM-RAW' not in criteria or message['structure'] == PDF_STRUCTURE)
+        return server
+
+    def test_labels_deduplicated_against_all_mail(self):
+        """All Mail is scanned first; labels add no duplicate messages"""
+        server = self._server()
+        results = self._search(_connection(server))
+
+        selects = [c for c in server.commands if c.startswith(('SELECT', 'EXAMINE'))]
+        assert selects[0] == 'EXAMINE "[Gmail]/All Mail"'
+        assert [(m['folder'], m['uid']) for m in results['messages']] == [
+            ('[Gmail]/All Mail', '10'), ('[Gmail]/All Mail', '12')]
+        assert 'UID SEARCH X-GM-RAW "has:attachment filename:pdf"' in server.commands
+        assert not any('BODY.PEEK[2]' in c for c in server.commands if c.startswith('UID FETCH 3 '))
+
+    def test_fast_path_disabled(self):
+        """With gmail_fast_path off every label is scanned as a normal folder"""
+        server = self._server()
+        results = self._search(_connection(server), gmail_fast_path=False, folder_path='Faktury')
+
+        assert [m['uid'] for m in results['messages']] == ['3']
+        assert not any('X-GM' in c for c in server.commands)
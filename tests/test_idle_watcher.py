@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the IMAP IDLE watch mode.
+
+Tests the IDLE command exchange, reporting messages delivered while idling,
+NOOP polling without IDLE and picking up messages after a reconnect.
+"""
+import unittest.mock as mock
+
+from gui.imap_search_components import idle_watcher
+from gui.imap_search_components.idle_watcher import IdleSession, fetch_new_uids, watch_folder
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+def _connect(server):
+    def connect():
+        conn = FakeIMAP4(server)
+        conn.login('user', 'secret')
+        return conn
+    return connect
+
+
+def _scripted_wait(events):
+    """_wait_readable replacement running one scripted event whenever the client would block."""
+    def wait(conn, timeout):
+        if not conn._inbuf and events:
+            events.pop(0)()
+        return bool(conn._inbuf)
+    return wait
+
+
+class TestIdleSession:
+    """Test cases for IdleSession"""
+
+    def test_idle_exchange(self):
+        """IDLE waits for the continuation; DONE reads the completion"""
+        server = FakeImapServer({'INBOX': [make_message(1)]}, capabilities='IMAP4rev1 IDLE')
+        conn = _connect(server)()
+        conn.select('INBOX')
+        session = IdleSession(conn)
+        events = [lambda: server.deliver('INBOX', make_message(2))]
+
+        with mock.patch.object(idle_watcher, '_wait_readable', _scripted_wait(events)):
+            assert session.start() == []
+            assert session.wait(1) == [b'* 2 EXISTS']
+            assert session.wait(0) == []
+            assert session.done() == []
+
+        assert conn.idle_tag is None
+        assert conn.noop()[0] == 'OK'
+
+    def test_fetch_new_uids(self):
+        """The UID n:* quirk does not report the last old message"""
+        server = FakeImapServer({'INBOX': [make_message(4)]})
+        conn = _connect(server)()
+        conn.select('INBOX')
+        assert not fetch_new_uids(conn, 5)
+        server.folders['INBOX'].append(make_message(5))
+        assert str(fetch_new_uids(conn, 5)) == '5'
+
+
+class TestWatchFolder:
+    """Test cases for watch_folder"""
+
+    def test_new_message_handled(self):
+        """A message delivered during IDLE is handed over; old ones are not"""
+        server = FakeImapServer({'INBOX': [make_message(1)]}, capabilities='IMAP4rev1 IDLE')
+        handled = []
+        events = [lambda: server.deliver('INBOX', make_message(2))]
+
+        def handle(conn, folder, uids):
+            handled.append((folder, str(uids), conn.idle_tag))
+
+        with mock.patch.object(idle_watcher, '_wait_readable', _scripted_wait(events)):
+            watch_folder(_connect(server), 'INBOX', handle, lambda: bool(handled))
+
+        assert handled == [('INBOX', '2', None)]
+        assert 'IDLE' in server.commands
+        assert 'UID SEARCH UID 2:*' in server.commands
+
+    def test_polling_without_idle(self):
+        """Servers without IDLE are polled with NOOP"""
+        server = FakeImapServer({'INBOX': []})
+        handled = []
+        calls = []
+
+        def should_stop():
+            calls.append(1)
+            if len(calls) == 3:
+                server.folders['INBOX'].append(make_message(1))
+            return bool(handled)
+
+        watch_folder(_connect(server), 'INBOX', lambda c, f, uids: handled.append(str(uids)),
+                     should_stop, poll_interval=0)
+
+        assert handled == ['1']
+        assert 'NOOP' in server.commands
+        assert 'IDLE' not in server.commands
+
+    def test_reconnect_picks_up_missed_messages(self):
+        """After a lost connection, messages delivered meanwhile are reported"""
+        server = FakeImapServer({'INBOX': [make_message(1)]}, capabilities='IMAP4rev1 IDLE')
+        handled = []
+        connections = []
+
+        def connect():
+            conn = _connect(server)()
+            connections.append(conn)
+            return conn
+
+        def drop_connection():
+            server.folders['INBOX'].append(make_message(2))
+            raise OSError('connection reset')
+
+        events = [drop_connection]
+        with mock.patch.object(idle_watcher, '_wait_readable', _scripted_wait(events)):
+            watch_folder(connect, 'INBOX', lambda c, f, uids: handled.append(str(uids)),
+                         lambda: bool(handled), reconnect_delay=0)
+
+        assert len(connections) == 2
+        assert handled == ['2']
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for attachment-level IMAP scanning.
+
+Tests that iter_pdf_messages downloads only PDF sections, skips messages
+without PDFs or rejected by the header check, that the full message is
+fetched only on demand or when the server did not return the triage or PDF
+sections, and that UIDs lost even then are reported.
+"""
+import base64
+import unittest.mock as mock
+
+from gui.imap_search_components.imap_scanner import (
+    TRIAGE_FETCH,
+    iter_pdf_messages,
+    fetch_full_message,
+)
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+PDF_STRUCTURE = (
+    b' BODYSTRUCTURE (("TEXT" "PLAIN" NIL NIL NIL "7BIT" 10 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "BASE64" 40 NIL NIL NIL NIL)'
+    b'("IMAGE" "PNG" ("NAME" "big.png") NIL NIL "BASE64" 9999999 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL))'
+)
+TEXT_STRUCTURE = b' BODYSTRUCTURE ("TEXT" "PLAIN" NIL NIL NIL "7BIT" 10 1 NIL NIL NIL NIL))'
+
+
+def _header(date):
+    return b'Date: ' + date + b'\r\nSubject: Faktura\r\n\r\n'
+
+
+def _triage_item(seq, uid, structure, date=b'Mon, 15 Dec 2025 10:00:00 +0000'):
+    header = _header(date)
+    head = b'%d (UID %d BODY[HEADER.FIELDS (DATE FROM SUBJECT MESSAGE-ID)] {%d}' % (seq, uid, len(header))
+    return [(head, header), structure]
+
+
+class TestIterPdfMessages:
+    """Test cases for iter_pdf_messages"""
+
+    def _connection(self):
+        pdf_b64 = base64.encodebytes(b'%PDF-1.4')
+        connection = mock.Mock()
+
+        def uid(command, uid_set, spec):
+            if spec == TRIAGE_FETCH:
+                return ('OK', _triage_item(1, 10, TEXT_STRUCTURE)
+                        + _triage_item(2, 11, PDF_STRUCTURE)
+                        + _triage_item(3, 12, PDF_STRUCTURE, date=b'Mon, 01 Jan 2024 10:00:00 +0000'))
+            if spec == '(BODY.PEEK[2])':
+                return ('OK', [(b'2 (UID 11 BODY[2] {%d}' % len(pdf_b64), pdf_b64), b')'])
+            raise AssertionError(f"Unexpected fetch {uid_set} {spec}")
+
+        connection.uid.side_effect = uid
+        return connection
+
+    def test_only_pdf_sections_downloaded(self):
+        """Only the PDF section of the PDF-bearing message is downloaded"""
+        connection = self._connection()
+
+        results = list(iter_pdf_messages(
+            connection, ['10', '11', '12'],
+            accept=lambda headers: '2024' not in headers.get('Date', '')
+        ))
+
+        assert len(results) == 1
+        assert results[0]['uid'] == '11'
+        assert results[0]['attachments'] == [('fv.pdf', b'%PDF-1.4')]
+        assert results[0]['headers']['Subject'] == 'Faktura'
+        specs = [c.args[2] for c in connection.uid.call_args_list]
+        assert specs == [TRIAGE_FETCH, '(BODY.PEEK[2])']
+
+    def test_stop_before_first_batch(self):
+        """No FETCH is sent when stop is already requested"""
+        connection = self._connection()
+
+        results = list(iter_pdf_messages(connection, ['10', '11'], should_stop=lambda: True))
+
+        assert results == []
+        connection.uid.assert_not_called()
+
+    def test_progress_reported_per_message(self):
+        """Progress callback sees every triaged message"""
+        connection = self._connection()
+        progress = []
+
+        list(iter_pdf_messages(connection, ['10', '11', '12'],
+                               progress_callback=lambda done, total: progress.append((done, total))))
+
+        assert progress == [(1, 3), (2, 3), (3, 3)]
+
+
+def _pdf_email(subject):
+    return (b'Subject: ' + subject + b'\r\nDate: Mon, 15 Dec 2025 10:00:00 +0000\r\n'
+            b'Content-Type: multipart/mixed; boundary="b"\r\n\r\n'
+            b'--b\r\nContent-Type: application/pdf; name="fv.pdf"\r\n'
+            b'Content-Disposition: attachment; filename="fv.pdf"\r\n'
+            b'Content-Transfer-Encoding: base64\r\n\r\nJVBERi0xLjQ=\r\n--b--\r\n')
+
+
+class TestFullMessageFallback:
+    """Test cases for messages whose triage or sections the server did not return"""
+
+    STRUCTURE = b'(("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "BASE64" 12 NIL NIL NIL NIL) "MIXED" NIL NIL NIL NIL)'
+
+    def _server(self):
+        return FakeImapServer({'INBOX': [
+            make_message(uid, structure=self.STRUCTURE, full=_pdf_email(b'F%d' % uid),
+                         sections={'1': b'JVBERi0xLjQ='} if uid != 2 else None)
+            for uid in (1, 2, 3)
+        ]})
+
+    def _scan(self, server, **kwargs):
+        conn = FakeIMAP4(server)
+        conn.login('user', 'secret')
+        conn.select('INBOX')
+        windows, failed = [], []
+        results = list(iter_pdf_messages(conn, ['1', '2', '3'], window_done=windows.append,
+                                         failed=failed.extend, **kwargs))
+        return results, windows, failed
+
+    def test_missing_section_scanned_from_full_message(self):
+        """A section the server returned empty is read from the full message"""
+        results, windows, failed = self._scan(self._server())
+
+        assert [(r['uid'], r['attachments']) for r in results] == [
+            ('1', [('fv.pdf', b'%PDF-1.4')]), ('3', [('fv.pdf', b'%PDF-1.4')]), ('2', [('fv.pdf', b'%PDF-1.4')])
+        ]
+        assert windows == [['1', '2', '3']] and failed == []
+
+    def test_rejected_triage_scanned_from_full_message(self):
+        """A rejected triage FETCH falls back to full messages, filtered by accept"""
+        server = self._server()
+        server.reject = lambda line: 'BODYSTRUCTURE' in line
+
+        results, windows, failed = self._scan(server, accept=lambda headers: headers['Subject'] != 'F3')
+
+        assert [(r['uid'], r['headers']['Subject']) for r in results] == [('1', 'F1'), ('2', 'F2')]
+        assert windows == [['1', '2', '3']] and failed == []
+
+    def test_unscanned_uids_reported(self):
+        """UIDs lost in the fallback too are reported and the window is not marked done"""
+        server = self._server()
+        server.reject = lambda line: line == 'UID FETCH 2 (BODY.PEEK[])'
+
+        results, windows, failed = self._scan(server)
+
+        assert [r['uid'] for r in results] == ['1', '3']
+        assert failed == ['2'] and windows == []
+
+
+class TestFetchFullMessage:
+    """Test cases for on-demand full message download"""
+
+    def test_full_message_uses_peek(self):
+        """Full message is fetched with BODY.PEEK[] so \\Seen is not set"""
+        raw = b'Subject: x\r\n\r\nbody'
+        connection = mock.Mock()
+        connection.uid.return_value = ('OK', [(b'1 (UID 7 BODY[] {%d}' % len(raw), raw), b')'])
+
+        assert fetch_full_message(connection, '7') == raw
+        connection.uid.assert_called_once_with('fetch', '7', '(BODY.PEEK[])')
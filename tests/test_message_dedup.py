@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for cross-folder duplicate suppression.
+
+Tests message fingerprints, claiming messages across folders (also after a
+rescan of the same message), fingerprints kept in the ledger between
+searches and search_messages runs over folders holding copies.
+"""
+import email
+import unittest.mock as mock
+
+from gui.imap_search_components import search_engine
+from gui.imap_search_components.message_dedup import MessageDeduplicator, message_fingerprint
+from gui.imap_search_components.scan_ledger import ScanLedger, pdf_hash
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+PDF_STRUCTURE = (
+    b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "7BIT" 20 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL)'
+)
+
+PDF_PARTS = [{'section': '2', 'filename': 'fv.pdf', 'size': 20}]
+
+
+def _headers(message_id):
+    return email.message_from_bytes(b'Message-ID: ' + message_id + b'\r\n\r\n')
+
+
+def _invoice(uid, message_id, nip):
+    header = b'Subject: Faktura\r\nMessage-ID: ' + message_id + b'\r\n\r\n'
+    return make_message(uid, header=header, structure=PDF_STRUCTURE, sections={'2': b'NIP ' + nip})
+
+
+def _processor():
+    processor = mock.Mock()
+    processor.extract_text.side_effect = lambda data, name='': data.decode()
+    processor.search_in_text.side_effect = lambda text, nip: {
+        'found': nip in text, 'matches': [nip] if nip in text else []
+    }
+    processor.search_in_pdf_attachment.side_effect = lambda data, nip, name='': {
+        'found': nip.encode() in data, 'matches': [nip] if nip.encode() in data else []
+    }
+    return processor
+
+
+class TestMessageFingerprint:
+    """Test cases for message_fingerprint"""
+
+    def test_message_id_and_pdf_parts(self):
+        """Copies share the fingerprint; other PDFs or no Message-ID do not"""
+        fingerprint = message_fingerprint(_headers(b'<a@b>'), PDF_PARTS)
+
+        assert fingerprint == message_fingerprint(_headers(b' <a@b>'), list(PDF_PARTS))
+        assert fingerprint != message_fingerprint(_headers(b'<a@b>'), [dict(PDF_PARTS[0], size=21)])
+        assert fingerprint != message_fingerprint(_headers(b'<c@d>'), PDF_PARTS)
+        assert message_fingerprint(email.message_from_bytes(b'Subject: x\r\n\r\n'), PDF_PARTS) is None
+
+
+class TestMessageDeduplicator:
+    """Test cases for MessageDeduplicator"""
+
+    def test_first_folder_claims(self):
+        """Copies in other folders are rejected, the owner may claim again"""
+        dedup = MessageDeduplicator()
+
+        assert dedup.claim('f1', 'INBOX', '5')
+        assert not dedup.claim('f1', 'Archiwum', '9')
+        assert dedup.claim('f1', 'INBOX', 5)
+        assert dedup.claim(None, 'Archiwum', '10')
+        assert dedup.skipped == 1
+
+    def test_ledger_answers_earlier_searches(self, tmp_path):
+        """A copy of a message scanned before is skipped when its stored text does not match"""
+        ledger = ScanLedger(tmp_path / 'ledger.sqlite3')
+        ledger.record_message('a', 'INBOX', 7, '5', [{'filename': 'fv.pdf', 'sha256': pdf_hash(b'x'),
+                                                      'size': 1, 'text': 'NIP 1112223344'}],
+                              fingerprint='f1')
+
+        assert ledger.fingerprint_matches('a', 'f1', lambda text: '1112223344' in text) is True
+        assert ledger.fingerprint_matches('a', 'f2', lambda text: True) is None
+
+        other_nip = MessageDeduplicator(ledger, 'a', lambda text: '5556667788' in text)
+        assert not other_nip.claim('f1', 'Archiwum', '9')
+        assert not other_nip.claim('f1', 'INBOX', '5')
+
+        same_nip = MessageDeduplicator(ledger, 'a', lambda text: '1112223344' in text)
+        assert same_nip.claim('f1', 'Archiwum', '9')
+
+
+class TestSearchMessagesDeduplication:
+    """Test cases for search_messages with 'deduplicate'"""
+
+    def _search(self, server, criteria):
+        conn = FakeIMAP4(server)
+        conn.login('user', 'secret')
+        with mock.patch.object(search_engine, 'PDFProcessor', return_value=_processor()):
+            return search_engine.search_messages(dict({'nip': '1112223344', 'connection': conn}, **criteria))
+
+    def test_copies_fetched_once(self):
+        """The same invoice in three folders is downloaded and reported once"""
+        server = FakeImapServer({
+            'INBOX': [_invoice(1, b'<fv@x>', b'1112223344'), _invoice(2, b'<other@x>', b'1112223344')],
+            'Archiwum': [_invoice(7, b'<fv@x>', b'1112223344')],
+            'Faktury': [_invoice(3, b'<fv@x>', b'1112223344')],
+        })
+
+        results = self._search(server, {'deduplicate': True, 'narrow_search': False})
+
+        assert sorted(m['id'] for m in results['messages']) == ['<fv@x>', '<other@x>']
+        section_fetches = [c for c in server.commands if 'BODY.PEEK[2]' in c]
+        assert len(section_fetches) == 1
+
+    def test_skipped_in_later_search(self, tmp_path):
+        """With the ledger, copies of messages scanned before are not downloaded again"""
+        server = FakeImapServer({'INBOX': [_invoice(1, b'<fv@x>', b'5556667788')]})
+        ledger = ScanLedger(tmp_path / 'ledger.sqlite3')
+        criteria = {'deduplicate': True, 'ledger': ledger, 'account': 'a@example.com', 'narrow_search': False}
+        self._search(server, criteria)
+
+        server.folders['Archiwum'] = [_invoice(4, b'<fv@x>', b'5556667788')]
+        server.commands.clear()
+        results = self._search(server, criteria)
+
+        assert results['messages'] == []
+        assert not [c for c in server.commands if 'BODY.PEEK[2]' in c]
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for streaming MIME parsing.
+
+Tests that PDF parts decoded from a stream match the email package whatever
+the chunk split, that large parts are spooled to disk, early rejection by
+headers and line-by-line POP3 retrieval.
+"""
+import email
+from email.message import EmailMessage
+
+from gui.mail_search_components.mime_stream import (
+    iter_bytes_chunks,
+    iter_pop3_message,
+    parse_message_stream,
+)
+
+
+def _invoice_message(pdf=b'%PDF-1.4 faktura', date='Mon, 01 Jul 2025 10:00:00 +0000'):
+    message = EmailMessage()
+    message['Subject'] = 'Faktura'
+    message['Date'] = date
+    message.set_content('W załączniku faktura.')
+    message.add_attachment(pdf, maintype='application', subtype='pdf', filename='fv.pdf')
+    forwarded = EmailMessage()
+    forwarded['Subject'] = 'Fwd'
+    forwarded.set_content('x')
+    forwarded.add_attachment(b'%PDF inner', maintype='application', subtype='pdf', filename='wew.pdf')
+    message.add_attachment(forwarded)
+    return message.as_bytes()
+
+
+def _email_package_pdfs(raw):
+    return [(part.get_filename(), part.get_payload(decode=True))
+            for part in email.message_from_bytes(raw).walk()
+            if (part.get_filename() or '').endswith('.pdf')]
+
+
+class FakePOP3:
+    """Just the poplib internals used by iter_pop3_message"""
+
+    def __init__(self, responses):
+        self.lines = list(responses)
+        self.sent = []
+
+    def _putcmd(self, line):
+        self.sent.append(line)
+
+    def _getresp(self):
+        return self.lines.pop(0)
+
+    def _getline(self):
+        line = self.lines.pop(0)
+        return line, len(line) + 2
+
+
+class TestStreamingParse:
+    """Test cases for parse_message_stream"""
+
+    def test_parts_match_email_package(self):
+        """PDFs (also in an attached message) decode the same for any chunk split"""
+        raw = _invoice_message(bytes(range(256)) * 50)
+        expected = _email_package_pdfs(raw)
+
+        for chunk_size in (1, 13, 4096):
+            chunks = [raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size)]
+            with parse_message_stream(chunks, spool_raw=True) as message:
+                assert [(part.filename, part.read()) for part in message.parts] == expected
+                assert message.headers['Subject'] == 'Faktura'
+                assert message.raw.read() == raw
+
+    def test_quoted_printable_part(self):
+        """Quoted-printable bodies are decoded across soft line breaks"""
+        raw = (b'Content-Type: multipart/mixed; boundary="XX"\r\n\r\n'
+               b'--XX\r\nContent-Type: application/pdf; name="a.pdf"\r\n'
+               b'Content-Transfer-Encoding: quoted-printable\r\n\r\n'
+               b'%PDF =C5=BC=\r\nolty\r\nkoniec\r\n--XX--\r\n')
+
+        with parse_message_stream(iter_bytes_chunks(raw, 5)) as message:
+            assert message.parts[0].read() == _email_package_pdfs(raw)[0][1] == '%PDF żolty\r\nkoniec'.encode()
+
+    def test_large_part_spooled_to_disk(self):
+        """A part above the spool threshold is kept in a file, not in memory"""
+        pdf = b'%PDF' + b'x' * 200000
+        with parse_message_stream(iter_bytes_chunks(_invoice_message(pdf)), spool_threshold=1024) as message:
+            part = message.parts[0]
+            assert part.file._rolled
+            assert part.size == len(pdf)
+            assert part.read() == pdf
+
+    def test_binary_body_without_line_breaks(self):
+        """Long binary bodies are flushed without waiting for a line break"""
+        body = b'%PDF' + b'\x00\xff' * 5000
+        raw = (b'Content-Type: multipart/mixed; boundary="b1"\r\n\r\n--b1\r\n'
+               b'Content-Type: application/pdf; name="s.pdf"\r\nContent-Transfer-Encoding: binary\r\n\r\n'
+               + body + b'\r\n--b1--\r\n')
+
+        with parse_message_stream(iter_bytes_chunks(raw, 100)) as message:
+            assert message.parts[0].read() == body
+
+    def test_rejected_headers_stop_parsing(self):
+        """accept_headers=False returns None and closes the chunk generator"""
+        closed = []
+
+        def chunks():
+            try:
+                yield from iter_bytes_chunks(_invoice_message(), 64)
+            finally:
+                closed.append(True)
+
+        assert parse_message_stream(chunks(), accept_headers=lambda headers: '2024' in headers['Date']) is None
+        assert closed == [True]
+
+
+class TestPop3Message:
+    """Test cases for iter_pop3_message"""
+
+    def test_lines_unstuffed(self):
+        """RETR lines get CRLF back and lose dot-stuffing"""
+        pop = FakePOP3([b'+OK', b'Subject: x', b'', b'..kropka', b'.'])
+
+        assert list(iter_pop3_message(pop, 3)) == [b'Subject: x\r\n', b'\r\n', b'.kropka\r\n']
+        assert pop.sent == ['RETR 3']
+
+    def test_early_stop_drains_response(self):
+        """Closing the generator early reads the rest of the response"""
+        pop = FakePOP3([b'+OK', b'Subject: x', b'', b'body', b'.', b'+OK next'])
+        lines = iter_pop3_message(pop, 1)
+        next(lines)
+        lines.close()
+
+        assert pop.lines == [b'+OK next']
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for parallel multi-connection IMAP scanning.
+
+Tests that UIDs are spread over several connections, hit numbers stay unique,
+stop requests are honored and failing connections leave their work to others.
+"""
+import threading
+
+import pytest
+
+from gui.imap_search_components.parallel_scanner import (
+    ScanResultSink,
+    scan_uids_parallel,
+    work_chunk_size,
+)
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+PDF_STRUCTURE = (
+    b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "7BIT" 8 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL)'
+)
+
+
+def _server(count):
+    messages = [make_message(uid, structure=PDF_STRUCTURE, sections={'2': b'%PDF-1.4'})
+                for uid in range(1, count + 1)]
+    return FakeImapServer({'INBOX': messages})
+
+
+def _connect_factory(server, fail_after=None):
+    connections = []
+    lock = threading.Lock()
+
+    def connect():
+        with lock:
+            if fail_after is not None and len(connections) >= fail_after:
+                raise ConnectionRefusedError('too many connections')
+            conn = FakeIMAP4(server)
+            connections.append(conn)
+        conn.login('user', 'secret')
+        return conn
+
+    return connect, connections
+
+
+class TestScanUidsParallel:
+    """Test cases for scan_uids_parallel"""
+
+    def test_all_messages_scanned_over_several_connections(self):
+        """Every UID is handled once and every connection takes part"""
+        server = _server(40)
+        connect, connections = _connect_factory(server)
+        sink = ScanResultSink()
+        handled = []
+        numbers = []
+
+        def handle(conn, pdf_message):
+            handled.append(pdf_message['uid'])
+            numbers.append(sink.next_found_number())
+
+        stats = scan_uids_parallel(connect, 'INBOX', [str(uid) for uid in range(1, 41)], handle,
+                                   num_connections=3, chunk_size=5, batch_size=2, sink=sink)
+
+        assert sorted(handled, key=int) == [str(uid) for uid in range(1, 41)]
+        assert sorted(numbers) == list(range(1, 41))
+        assert sink.found_count == 40
+        assert len(connections) == 3
+        assert stats['connections'] == 3
+        assert stats['processed'] == 40
+
+    def test_folder_name_quoted(self):
+        """Folder names with spaces are quoted in EXAMINE"""
+        server = FakeImapServer({'Faktury 2025': _server(3).folders['INBOX']})
+        connect, _ = _connect_factory(server)
+        handled = []
+
+        scan_uids_parallel(connect, 'Faktury 2025', ['1', '2', '3'],
+                           lambda conn, pdf_message: handled.append(pdf_message['uid']),
+                           num_connections=2, chunk_size=2)
+
+        assert sorted(handled) == ['1', '2', '3']
+        assert 'EXAMINE "Faktury 2025"' in server.commands
+
+    def test_stop_request_ends_all_workers(self):
+        """No further messages are handled after stop is requested"""
+        server = _server(40)
+        connect, _ = _connect_factory(server)
+        stop = threading.Event()
+        handled = []
+
+        def handle(conn, pdf_message):
+            handled.append(pdf_message['uid'])
+            stop.set()
+
+        scan_uids_parallel(connect, 'INBOX', [str(uid) for uid in range(1, 41)], handle,
+                           num_connections=2, chunk_size=5, batch_size=1, max_in_flight=1,
+                           should_stop=stop.is_set)
+
+        # Each worker may finish the message it was handling when stop was set
+        assert 1 <= len(handled) <= 2
+
+    def test_connection_limit_leaves_work_to_others(self):
+        """Workers that cannot connect do not lose their share of the UIDs"""
+        server = _server(20)
+        connect, connections = _connect_factory(server, fail_after=1)
+        handled = []
+
+        stats = scan_uids_parallel(connect, 'INBOX', [str(uid) for uid in range(1, 21)],
+                                   lambda conn, message: handled.append(message['uid']),
+                                   num_connections=4, chunk_size=5)
+
+        assert len(handled) == 20
+        assert stats['connections'] == 1
+        assert stats['unscanned'] == 0
+
+    def test_no_connection_raises(self):
+        """Error is raised when no connection can be opened at all"""
+        connect, _ = _connect_factory(_server(5), fail_after=0)
+
+        with pytest.raises(ConnectionRefusedError):
+            scan_uids_parallel(connect, 'INBOX', ['1', '2'], lambda conn, message: None)
+
+    def test_work_chunk_size_bounds(self):
+        """Chunks aim at four per connection within fixed bounds"""
+        assert work_chunk_size(10, 4) == 50
+        assert work_chunk_size(4000, 4) == 250
+        assert work_chunk_size(100000, 4) == 500
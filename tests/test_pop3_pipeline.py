@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for pipelined POP3 commands.
+
+Tests the PIPELINING capability check, several RETR commands in flight with
+responses streamed line by line, refused messages, and that responses left
+unread or still in flight after an early stop are drained so the connection
+stays usable.
+"""
+import poplib
+from contextlib import closing
+
+import pytest
+
+from gui.mail_search_components.mime_stream import parse_message_stream
+from gui.mail_search_components.pop3_pipeline import iter_pop3_messages, pipeline_depth
+from tests.fake_pop3_server import FakePop3Server, FakePOP3
+
+
+def _message(number):
+    return (b'Subject: F%d\r\nContent-Type: multipart/mixed; boundary="b"\r\n\r\n'
+            b'--b\r\nContent-Type: text/plain\r\n\r\n.kropka na poczatku\r\n'
+            b'--b\r\nContent-Type: application/pdf\r\nContent-Disposition: attachment; filename="fv.pdf"\r\n'
+            b'Content-Transfer-Encoding: base64\r\n\r\nJVBERi0xLjQgZmFrdHVyYQ==\r\n--b--\r\n') % number
+
+
+def _connection(count=5, capabilities=('USER', 'UIDL', 'PIPELINING')):
+    server = FakePop3Server([_message(number) for number in range(1, count + 1)], capabilities)
+    return server, FakePOP3(server)
+
+
+class TestPipelineDepth:
+    """Test cases for pipeline_depth"""
+
+    def test_capability(self):
+        """Several commands only when CAPA lists PIPELINING"""
+        assert pipeline_depth(_connection()[1], 6) == 6
+        assert pipeline_depth(_connection(capabilities=('USER', 'UIDL'))[1], 6) == 1
+        assert pipeline_depth(_connection(capabilities=None)[1], 6) == 1
+
+
+class TestIterPop3Messages:
+    """Test cases for iter_pop3_messages"""
+
+    def test_pipelined_retr(self):
+        """Messages arrive in order, dot-unstuffed, with several RETR commands in flight"""
+        server, pop_conn = _connection()
+        server.commands.clear()
+
+        with closing(iter_pop3_messages(pop_conn, [1, 2, 3, 4, 5], max_in_flight=3)) as messages:
+            received = [(which, b''.join(lines)) for which, lines in messages]
+
+        assert received == [(number, _message(number)) for number in range(1, 6)]
+        assert server.commands == ['RETR 1', 'RETR 2', 'RETR 3', 'RETR 4', 'RETR 5']
+        assert pop_conn.max_outstanding == 3
+
+    def test_streamed_to_parser(self):
+        """A response feeds the streaming parser; what the parser leaves unread is dropped"""
+        _, pop_conn = _connection()
+
+        with closing(iter_pop3_messages(pop_conn, [1, 2], max_in_flight=2)) as messages:
+            results = []
+            for which, lines in messages:
+                message = parse_message_stream(lines, accept_headers=lambda headers: headers['Subject'] != 'F1')
+                if message is None:
+                    results.append((which, None))
+                    continue
+                with message:
+                    results.append((which, message.headers['Subject'], [part.read() for part in message.parts]))
+
+        assert results == [(1, None), (2, 'F2', [b'%PDF-1.4 faktura'])]
+
+    def test_refused_message(self):
+        """-ERR for one message is raised when its lines are read; the next ones still arrive"""
+        _, pop_conn = _connection(count=2)
+
+        with closing(iter_pop3_messages(pop_conn, [1, 7, 2], max_in_flight=3)) as messages:
+            received = []
+            for which, lines in messages:
+                try:
+                    received.append((which, len(b''.join(lines)) > 0))
+                except poplib.error_proto:
+                    received.append((which, None))
+
+        assert received == [(1, True), (7, None), (2, True)]
+
+    def test_early_stop_drains(self):
+        """Closing after the first message reads the responses in flight"""
+        server, pop_conn = _connection()
+
+        messages = iter_pop3_messages(pop_conn, [1, 2, 3, 4, 5], max_in_flight=4)
+        which, lines = next(messages)
+        next(lines)
+        messages.close()
+
+        assert which == 1
+        assert [c for c in server.commands if c.startswith('RETR')] == ['RETR 1', 'RETR 2', 'RETR 3', 'RETR 4']
+        assert pop_conn.stat() == (5, sum(len(_message(n)) for n in range(1, 6)))
+        with pytest.raises(StopIteration):
+            next(lines)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for POP3 triage before RETR.
+
+Tests parsing LIST sizes, the attachment check on top-level headers and
+rejecting messages by date or missing attachments from TOP n 0 headers,
+with small messages and servers without TOP left to RETR, and locating the
+date window of a large maildrop by binary search over message numbers.
+"""
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.parser import BytesParser
+
+from gui.mail_search_components.pop3_triage import (
+    arrival_time,
+    locate_date_window,
+    may_contain_pdf,
+    parse_list_sizes,
+    triage_pop3_messages,
+)
+from tests.fake_pop3_server import FakePop3Server, FakePOP3
+
+
+def _message(date, pdf=True, html=False):
+    message = EmailMessage()
+    message['Subject'] = 'Faktura'
+    message['Date'] = date
+    if html:
+        message.set_content('<p>Dzień dobry</p>', subtype='html')
+    else:
+        message.set_content('W załączniku faktura.')
+    if pdf:
+        message.add_attachment(b'%PDF-1.4 faktura', maintype='application', subtype='pdf', filename='fv.pdf')
+    return message.as_bytes()
+
+
+def _headers(raw):
+    return BytesParser().parsebytes(raw, headersonly=True)
+
+
+def _connection(messages, capabilities=('USER', 'TOP', 'PIPELINING')):
+    server = FakePop3Server(messages, capabilities)
+    pop_conn = FakePOP3(server)
+    server.commands.clear()
+    return server, pop_conn
+
+
+class TestParseListSizes:
+    """Test cases for parse_list_sizes"""
+
+    def test_sizes(self):
+        """Message numbers map to octets; malformed lines are ignored"""
+        assert parse_list_sizes([b'1 2048', b'2 120', b'bad', b'3']) == {1: 2048, 2: 120}
+
+
+class TestMayContainPdf:
+    """Test cases for may_contain_pdf"""
+
+    def test_content_types(self):
+        """Multipart messages may hold PDFs, plain text or HTML cannot"""
+        assert may_contain_pdf(_headers(_message('Mon, 1 Dec 2025 10:00:00 +0000')))
+        assert not may_contain_pdf(_headers(_message('Mon, 1 Dec 2025 10:00:00 +0000', pdf=False)))
+        assert not may_contain_pdf(_headers(_message('Mon, 1 Dec 2025 10:00:00 +0000', pdf=False, html=True)))
+        assert not may_contain_pdf(_headers(b'Subject: no content type\r\n\r\n'))
+        assert may_contain_pdf(_headers(b'Content-Type: application/pdf; name="fv.pdf"\r\n'
+                                        b'Content-Disposition: attachment; filename="fv.pdf"\r\n\r\n'))
+
+
+class TestTriagePop3Messages:
+    """Test cases for triage_pop3_messages"""
+
+    def _maildrop(self, capabilities=('USER', 'TOP')):
+        return _connection([
+            _message('Mon, 1 Dec 2025 10:00:00 +0000'),
+            _message('Mon, 1 Dec 2025 11:00:00 +0000', pdf=False),
+            _message('Mon, 3 Nov 2025 10:00:00 +0000'),
+            _message('Mon, 1 Dec 2025 12:00:00 +0000'),
+        ], capabilities)
+
+    @staticmethod
+    def _december(headers):
+        return 'Dec 2025' in headers.get('Date', '')
+
+    def test_rejected_before_retr(self):
+        """Out-of-range messages and messages without attachments are rejected from headers only"""
+        server, pop_conn = self._maildrop()
+
+        result = triage_pop3_messages(pop_conn, [1, 2, 3, 4], accept_headers=self._december, min_size=0)
+
+        assert result == ([1, 4], [2], [3])
+        assert server.commands == ['TOP 1 0', 'TOP 2 0', 'TOP 3 0', 'TOP 4 0']
+        assert pop_conn.max_outstanding == 1
+
+    def test_pipelined(self):
+        """With PIPELINING the TOP commands are sent without waiting for each response"""
+        server, pop_conn = self._maildrop(('USER', 'TOP', 'PIPELINING'))
+
+        result = triage_pop3_messages(pop_conn, [1, 2, 3, 4], accept_headers=self._december,
+                                      min_size=0, max_in_flight=4)
+
+        assert result == ([1, 4], [2], [3])
+        assert pop_conn.max_outstanding == 4
+        assert pop_conn.noop() == b'+OK'
+
+    def test_small_messages_retrieved_directly(self):
+        """Messages below min_size skip the TOP round trip; unknown sizes are triaged"""
+        server, pop_conn = self._maildrop()
+
+        result = triage_pop3_messages(pop_conn, [1, 2, 3, 4], {1: 100, 2: 100, 3: 5000},
+                                      accept_headers=self._december, min_size=1000)
+
+        assert result == ([1, 2, 4], [], [3])
+        assert server.commands == ['TOP 3 0', 'TOP 4 0']
+
+    def test_top_not_supported(self):
+        """Without TOP every message is left to RETR after a single attempt"""
+        server, pop_conn = self._maildrop(capabilities=('USER',))
+
+        assert triage_pop3_messages(pop_conn, [1, 2, 3], min_size=0) == ([1, 2, 3], [], [])
+        assert server.commands == ['TOP 1 0']
+
+
+class TestLocateDateWindow:
+    """Test cases for locate_date_window"""
+
+    FIRST_ARRIVAL = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+    def _maildrop(self, count=2000, outliers=()):
+        """One message every 12 hours; outliers get a Received time far in the future"""
+        messages = []
+        for number in range(1, count + 1):
+            arrived = self.FIRST_ARRIVAL + timedelta(hours=12 * (number - 1))
+            if number in outliers:
+                arrived += timedelta(days=3650)
+            stamp = arrived.strftime('%a, %d %b %Y %H:%M:%S +0000').encode()
+            # Date headers set by senders are unreliable: every 7th is a year off
+            sent = (arrived - timedelta(days=365 if number % 7 == 0 else 0)).strftime(
+                '%a, %d %b %Y %H:%M:%S +0000').encode()
+            messages.append(b'Received: from mx by pop.example.com;\n\t' + stamp +
+                            b'\nDate: ' + sent + b'\nSubject: x\n\nbody')
+        return _connection(messages)
+
+    def _number(self, dt):
+        return int((dt - self.FIRST_ARRIVAL) / timedelta(hours=12)) + 1
+
+    def test_arrival_time(self):
+        """The topmost Received header wins over Date, Date is the fallback"""
+        headers = _headers(b'Received: from a; Mon, 1 Dec 2025 10:00:00 +0000\r\n'
+                           b'Received: from b; Sun, 30 Nov 2025 10:00:00 +0000\r\n'
+                           b'Date: Sat, 1 Nov 2025 10:00:00 +0000\r\n\r\n')
+        assert arrival_time(headers) == datetime(2025, 12, 1, 10, tzinfo=timezone.utc)
+        assert arrival_time(_headers(b'Date: Sat, 1 Nov 2025 10:00:00 +0000\r\n\r\n')).day == 1
+        assert arrival_time(_headers(b'Subject: x\r\n\r\n')) is None
+
+    def test_window_located_with_few_probes(self):
+        """A one-week range in 2000 messages is found with few TOPs, despite an odd first probe"""
+        server, pop_conn = self._maildrop(outliers={1001})
+        start = datetime(2024, 6, 3, tzinfo=timezone.utc)
+        end = start + timedelta(days=7)
+
+        first, last = locate_date_window(pop_conn, 2000, start, end, margin=5, max_in_flight=3)
+
+        assert first == self._number(start) - 5
+        assert last == self._number(end) - 1 + 5
+        assert len(server.commands) < 80
+        assert pop_conn.max_outstanding == 3
+
+    def test_open_ranges_and_small_maildrops(self):
+        """Open bounds extend to the ends; small maildrops or no range are not located"""
+        _, pop_conn = self._maildrop(count=600)
+        start = datetime(2023, 9, 1, tzinfo=timezone.utc)
+
+        assert locate_date_window(pop_conn, 600, start, None, margin=0) == (self._number(start), 600)
+        assert locate_date_window(pop_conn, 600, None, start, margin=0) == (1, self._number(start) - 1)
+        assert locate_date_window(pop_conn, 600, None, None) is None
+        assert locate_date_window(pop_conn, 600, start, None, min_count=1000) is None
+
+    def test_no_top(self):
+        """Without TOP all messages are scanned"""
+        _, pop_conn = _connection([b'Subject: x\n\nbody'] * 600, capabilities=('USER',))
+
+        assert locate_date_window(pop_conn, 600, datetime(2025, 1, 1), None) is None
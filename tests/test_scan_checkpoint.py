@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for resumable IMAP scans.
+
+Tests the UID watermark, the checkpoint store, reconnecting with backoff and
+the progress callbacks of the scanners that feed the checkpoints.
+"""
+import pytest
+
+from gui.imap_search_components.scan_checkpoint import (
+    FolderCheckpoint,
+    ScanCheckpointStore,
+    UidWatermark,
+    reconnect_with_backoff,
+    scan_signature,
+    uids_after,
+)
+from gui.imap_search_components.imap_scanner import iter_pdf_messages
+from gui.imap_search_components.parallel_scanner import scan_uids_parallel
+from gui.imap_search_components.uid_set import UidSet
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+PDF_STRUCTURE = (
+    b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "7BIT" 8 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL)'
+)
+
+
+def _server(count):
+    messages = [make_message(uid, structure=PDF_STRUCTURE, sections={'2': b'%PDF-1.4'})
+                for uid in range(1, count + 1)]
+    return FakeImapServer({'INBOX': messages})
+
+
+def _connect(server):
+    def connect():
+        conn = FakeIMAP4(server)
+        conn.login('user', 'secret')
+        return conn
+    return connect
+
+
+class TestCheckpointState:
+    """Test cases for the watermark and the checkpoint store"""
+
+    def test_watermark_waits_for_gaps(self):
+        """The watermark only covers an unbroken run of processed UIDs"""
+        watermark = UidWatermark(['3', '5', '8', '9'])
+
+        assert watermark.mark_done(['5']) is None
+        assert watermark.mark_done(['3']) == 5
+        assert watermark.mark_done(['9']) == 5
+        assert watermark.mark_done(['8']) == 9
+
+    def test_uids_after(self):
+        """UIDs up to the checkpoint are dropped from lists and UidSets"""
+        assert uids_after(['1', '4', '7'], 4) == ['7']
+        assert str(uids_after(UidSet([1, 2, 3, 10]), 2)) == '3,10'
+        assert uids_after(['1'], None) == ['1']
+
+    def test_checkpoint_matches_search_and_uidvalidity(self, tmp_path):
+        """A checkpoint is only resumed by the same search in the same UIDVALIDITY"""
+        path = tmp_path / 'checkpoints.json'
+        signature = scan_signature('1234567890')
+        store = ScanCheckpointStore(path)
+        checkpoint = FolderCheckpoint(store, 'user@example.com', 'INBOX', signature, '77', save_interval=0)
+        checkpoint.advance(40, 3)
+
+        store = ScanCheckpointStore(path)
+        assert store.get('user@example.com', 'INBOX', signature, '77')['last_uid'] == 40
+        assert store.get('user@example.com', 'INBOX', signature, '78') is None
+        assert store.get('user@example.com', 'INBOX', scan_signature('999'), '77') is None
+
+        resumed = FolderCheckpoint(store, 'user@example.com', 'INBOX', signature, '77')
+        assert resumed.remaining(['39', '40', '41']) == ['41']
+        assert store.resume_found_count('user@example.com', signature) == 3
+
+    def test_uids_done_out_of_order_are_kept(self, tmp_path):
+        """UIDs processed above the watermark are skipped on resume"""
+        store = ScanCheckpointStore(tmp_path / 'checkpoints.json')
+        watermark = UidWatermark(['1', '2', '3', '4', '5', '6'])
+        checkpoint = FolderCheckpoint(store, 'a', 'INBOX', 'one', '1', save_interval=0)
+        checkpoint.advance(watermark.mark_done(['4', '5']), 2, watermark.done_above())
+
+        resumed = FolderCheckpoint(ScanCheckpointStore(tmp_path / 'checkpoints.json'), 'a', 'INBOX', 'one', '1')
+        assert resumed.resumed
+        assert resumed.remaining(['1', '2', '3', '4', '5', '6']) == ['1', '2', '3', '6']
+        assert str(resumed.remaining(UidSet([1, 2, 3, 4, 5, 6]))) == '1:3,6'
+
+    def test_clear_search(self, tmp_path):
+        """Completing a search removes only its own checkpoints"""
+        store = ScanCheckpointStore(tmp_path / 'checkpoints.json')
+        store.update('a', 'INBOX', 'one', '1', 10, 1)
+        store.update('a', 'Faktury', 'one', '1', 20, 2)
+        store.update('a', 'Archiwum', 'two', '1', 30, 3)
+
+        store.clear_search('a', 'one')
+
+        assert store.get('a', 'INBOX', 'one', '1') is None
+        assert store.get('a', 'Archiwum', 'two', '1')['last_uid'] == 30
+        assert store.resume_found_count('a', 'one') == 0
+
+
+class TestReconnectWithBackoff:
+    """Test cases for reconnect_with_backoff"""
+
+    def test_connects_after_failures(self):
+        """Failed attempts are retried until a connection is opened"""
+        attempts = []
+        delays = []
+
+        def connect():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OSError('connection refused')
+            return 'conn'
+
+        conn = reconnect_with_backoff(connect, max_attempts=5, initial_delay=0.01,
+                                      sleep=delays.append)
+
+        assert conn == 'conn'
+        assert len(attempts) == 3
+
+    def test_gives_up_after_max_attempts(self):
+        """The last error is raised once every attempt failed"""
+        def connect():
+            raise OSError('network unreachable')
+
+        with pytest.raises(OSError):
+            reconnect_with_backoff(connect, max_attempts=2, initial_delay=0)
+
+    def test_stop_while_waiting(self):
+        """A stop request ends the wait without connecting"""
+        attempts = []
+
+        def connect():
+            attempts.append(1)
+            raise OSError('connection refused')
+
+        conn = reconnect_with_backoff(connect, should_stop=lambda: bool(attempts),
+                                      initial_delay=60)
+
+        assert conn is None
+        assert len(attempts) == 1
+
+
+class TestScannerProgress:
+    """Test cases for the progress callbacks used by checkpoints"""
+
+    def test_window_done_after_handled_messages(self):
+        """iter_pdf_messages reports each window once its messages were yielded"""
+        server = _server(5)
+        conn = _connect(server)()
+        conn.select('INBOX')
+        windows = []
+
+        for message in iter_pdf_messages(conn, [str(uid) for uid in range(1, 6)], batch_size=2,
+                                         max_in_flight=1,
+                                         window_done=lambda uids: windows.append(list(uids))):
+            # A window is reported only after all of its messages were handled
+            assert all(message['uid'] not in window for window in windows)
+
+        assert [uid for window in windows for uid in window] == ['1', '2', '3', '4', '5']
+
+    def test_chunk_done_covers_every_uid(self):
+        """scan_uids_parallel reports every UID it scanned"""
+        server = _server(20)
+        done = []
+
+        scan_uids_parallel(_connect(server), 'INBOX', [str(uid) for uid in range(1, 21)],
+                           lambda conn, message: None, num_connections=2, chunk_size=5,
+                           chunk_done=lambda uids: done.extend(uids))
+
+        assert sorted(done, key=int) == [str(uid) for uid in range(1, 21)]
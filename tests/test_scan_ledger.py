@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the persistent ledger of scanned messages.
+
+Tests recording messages with PDF texts, skipping scanned messages that do
+not match (or whose hits were saved, for incremental scans), text reuse by
+content hash and ledger-aware search_messages runs.
+"""
+import unittest.mock as mock
+import zlib
+
+from gui.imap_search_components import search_engine
+from gui.imap_search_components.scan_ledger import (
+    ScanLedger,
+    pdf_hash,
+    extract_nip_tokens,
+    uids_to_scan,
+    unseen_uids,
+)
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+PDF_STRUCTURE = (
+    b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "7BIT" 20 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL)'
+)
+
+
+def _part(text, data=None):
+    data = data if data is not None else text.encode()
+    return {'filename': 'fv.pdf', 'sha256': pdf_hash(data), 'size': len(data), 'text': text}
+
+
+class TestScanLedger:
+    """Test cases for ScanLedger"""
+
+    def test_scanned_and_matching_uids(self, tmp_path):
+        """Recorded messages are known; matches are answered from stored text"""
+        ledger = ScanLedger(tmp_path / 'ledger.sqlite3')
+        ledger.record_message('a', 'INBOX', 7, '1', [_part('NIP 111-222-33-44')])
+        ledger.record_message('a', 'INBOX', 7, '2', [_part('NIP 5556667788')])
+        ledger.record_message('a', 'INBOX', 7, '3', [])
+
+        assert ledger.scanned_uids('a', 'INBOX', 7, ['1', '2', '3', '4']) == {'1', '2', '3'}
+        assert ledger.scanned_uids('a', 'INBOX', 8, ['1']) == set()
+        assert ledger.matching_uids('a', 'INBOX', 7, ['1', '2', '3'], lambda t: '5556667788' in t) == {'2'}
+
+    def test_uids_to_scan(self, tmp_path):
+        """Scanned non-matching messages are dropped, order is kept"""
+        ledger = ScanLedger(tmp_path / 'ledger.sqlite3')
+        ledger.record_message('a', 'INBOX', 7, '1', [_part('NIP 1112223344')])
+        ledger.record_message('a', 'INBOX', 7, '2', [_part('other')])
+
+        remaining, skipped = uids_to_scan(ledger, 'a', 'INBOX', 7, ['3', '2', '1'],
+                                          lambda t: '1112223344' in t)
+
+        assert remaining == ['3', '1']
+        assert skipped == 1
+
+    def test_empty_text_not_final(self, tmp_path):
+        """A PDF without extracted text leaves its message to be scanned again"""
+        ledger = ScanLedger(tmp_path / 'ledger.sqlite3')
+        scan = _part('', b'%PDF-1.4 skan')
+        ledger.record_message('a', 'INBOX', 7, '1', [_part('NIP 1112223344'), scan], fingerprint='fp')
+        ledger.record_message('a', 'INBOX', 7, '2', [_part('other')])
+
+        assert ledger.scanned_uids('a', 'INBOX', 7, ['1', '2']) == {'2'}
+        assert ledger.cached_text(scan['sha256']) is None
+        assert ledger.fingerprint_matches('a', 'fp', lambda t: True) is None
+
+        # Rows written before empty texts were left out are treated the same way
+        ledger._db.execute("INSERT INTO pdf_texts VALUES (?, ?, '')", (scan['sha256'], zlib.compress(b'')))
+        ledger._db.execute("INSERT INTO messages VALUES ('a', 'INBOX', 7, '1', 1, '')")
+        ledger._db.execute("INSERT INTO parts VALUES ('a', 'INBOX', 7, '1', 0, 'fv.pdf', ?, 9)", (scan['sha256'],))
+        remaining, _ = uids_to_scan(ledger, 'a', 'INBOX', 7, ['1', '2'], lambda t: '1112223344' in t)
+        assert remaining == ['1']
+
+    def test_text_shared_by_hash_and_persisted(self, tmp_path):
+        """Text is stored once per content hash and survives reopening"""
+        path = tmp_path / 'ledger.sqlite3'
+        ledger = ScanLedger(path)
+        part = _part('NIP 1112223344', data=b'%PDF same')
+        ledger.record_message('a', 'INBOX', 7, '1', [part])
+        ledger.close()
+
+        reopened = ScanLedger(path)
+        assert reopened.cached_text(pdf_hash(b'%PDF same')) == 'NIP 1112223344'
+        assert reopened.nip_tokens(pdf_hash(b'%PDF same')) == ['1112223344']
+        assert reopened.cached_text(pdf_hash(b'other')) is None
+
+    def test_unseen_uids(self, tmp_path):
+        """Incremental scans skip scanned messages unless a match has not been saved yet"""
+        ledger = ScanLedger(tmp_path / 'ledger.sqlite3')
+        ledger.record_message('a', 'INBOX', 0, 'uidl-1', [_part('NIP 1112223344')])
+        ledger.record_message('a', 'INBOX', 0, 'uidl-2', [_part('NIP 1112223344', data=b'2')])
+        ledger.record_message('a', 'INBOX', 0, 'uidl-3', [])
+        ledger.record_hit('a', 'INBOX', 0, 'uidl-1', '111-222-33-44')
+
+        remaining, skipped = unseen_uids(ledger, 'a', 'INBOX', 0, ['uidl-1', 'uidl-2', 'uidl-3', 'uidl-4'],
+                                         '1112223344', lambda t: '1112223344' in t)
+
+        assert remaining == ['uidl-2', 'uidl-4']
+        assert skipped == 2
+        assert ledger.saved_uids('a', 'INBOX', 0, '5556667788') == set()
+
+    def test_extract_nip_tokens(self):
+        """NIP-like numbers are found with common separators"""
+        text = 'NIP: 123-456-78-90, PL 987 65 43 210, tel. 12345678901'
+        assert extract_nip_tokens(text) == ['1234567890', '9876543210']
+
+
+class TestSearchMessagesWithLedger:
+    """Test cases for search_messages consulting the ledger"""
+
+    def _processor(self):
+        processor = mock.Mock()
+        processor.extract_text.side_effect = lambda data, name='': data.decode()
+        processor.search_in_text.side_effect = lambda text, nip: {
+            'found': nip in text, 'matches': [nip] if nip in text else []
+        }
+        return processor
+
+    def _search(self, conn, ledger, nip, processor):
+        with mock.patch.object(search_engine, 'PDFProcessor', return_value=processor):
+            return search_engine.search_messages({
+                'nip': nip,
+                'connection': conn,
+                'folder_path': 'INBOX',
+                'ledger': ledger,
+                'account': 'a@example.com',
+            })
+
+    def test_second_nip_downloads_only_matches(self, tmp_path):
+        """A search for another NIP fetches PDF sections only for matching messages"""
+        server = FakeImapServer({'INBOX': [
+            make_message(1, structure=PDF_STRUCTURE, sections={'2': b'NIP 1112223344'}),
+            make_message(2, structure=PDF_STRUCTURE, sections={'2': b'NIP 5556667788'}),
+        ]})
+        conn = FakeIMAP4(server)
+        conn.login('user', 'secret')
+        ledger = ScanLedger(tmp_path / 'ledger.sqlite3')
+        processor = self._processor()
+
+        first = self._search(conn, ledger, '1112223344', processor)
+        server.commands.clear()
+        second = self._search(conn, ledger, '5556667788', processor)
+
+        assert [m['uid'] for m in first['messages']] == ['1']
+        assert [m['uid'] for m in second['messages']] == ['2']
+        assert [c for c in server.commands if 'BODY.PEEK[2]' in c] == ['UID FETCH 2 (BODY.PEEK[2])']
+        # Text of message 2 came from the ledger, not from a second extraction
+        assert processor.extract_text.call_count == 2
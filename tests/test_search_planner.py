@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the capability-aware IMAP SEARCH planner.
+
+Tests plan building for different CAPABILITY lists, ESEARCH parsing,
+falling back when the server rejects a plan and narrowed search_messages runs.
+"""
+import unittest.mock as mock
+
+from gui.imap_search_components import search_engine
+from gui.imap_search_components.search_planner import (
+    CONTENT_TYPE_CRITERION,
+    server_capabilities,
+    plan_imap_search,
+    parse_esearch_response,
+    run_search_plans,
+)
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+PDF_STRUCTURE = (
+    b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "7BIT" 8 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL)'
+)
+
+
+def _connection(server):
+    conn = FakeIMAP4(server)
+    conn.login('user', 'secret')
+    return conn
+
+
+def _larger_filter(criteria, message):
+    """Evaluate LARGER like a real server; other keys match everything."""
+    if 'LARGER ' in criteria:
+        return message['size'] > int(criteria.split('LARGER ')[1].split()[0])
+    return True
+
+
+class TestPlanImapSearch:
+    """Test cases for plan_imap_search"""
+
+    def test_unknown_capabilities_use_base_criteria(self):
+        """Without CAPABILITY only the base criteria are sent"""
+        plans = plan_imap_search(None, ['SINCE 01-Dec-2025'])
+        assert [p['criteria'] for p in plans] == ['SINCE 01-Dec-2025']
+        assert plan_imap_search(None, 'ALL')[0]['criteria'] == 'ALL'
+
+    def test_plans_narrowest_first(self):
+        """Filters and ESEARCH come first, plain base search last"""
+        plans = plan_imap_search(('IMAP4REV1', 'ESEARCH'), ['SINCE 01-Dec-2025'], min_size=2000,
+                                 content_type_filter=True)
+
+        narrow = f'SINCE 01-Dec-2025 LARGER 2000 {CONTENT_TYPE_CRITERION}'
+        assert [(p['criteria'], p['esearch']) for p in plans] == [
+            (narrow, True), (narrow, False),
+            ('SINCE 01-Dec-2025', True), ('SINCE 01-Dec-2025', False),
+        ]
+        assert plans[0]['filters'] == ['LARGER', 'HEADER Content-Type', 'ESEARCH']
+
+    def test_no_esearch_without_capability(self):
+        """ESEARCH is used only when announced"""
+        plans = plan_imap_search(('IMAP4REV1',), [], min_size=1024)
+        assert [(p['criteria'], p['esearch']) for p in plans] == [('LARGER 1024', False), ('ALL', False)]
+
+    def test_filters_opt_in(self):
+        """Filters that drop messages are not added by default, ESEARCH is"""
+        plans = plan_imap_search(('IMAP4REV1', 'ESEARCH'), ['SINCE 01-Dec-2025'])
+        assert [(p['criteria'], p['esearch']) for p in plans] == [
+            ('SINCE 01-Dec-2025', True), ('SINCE 01-Dec-2025', False),
+        ]
+
+    def test_subject_keywords(self):
+        """Keywords are OR-ed; non-ASCII ones are left out"""
+        plans = plan_imap_search(('IMAP4REV1',), [], min_size=0, content_type_filter=False,
+                                 subject_keywords=['faktura', 'invoice', 'rachunek', 'fakturą'])
+        assert plans[0]['criteria'] == ('OR SUBJECT "faktura" OR SUBJECT "invoice" SUBJECT "rachunek"')
+
+    def test_server_capabilities_refresh(self):
+        """CAPABILITY after login replaces the pre-login list"""
+        server = FakeImapServer()
+        conn = _connection(server)
+        server.capabilities = 'IMAP4rev1 ESEARCH'
+
+        assert 'ESEARCH' not in server_capabilities(conn)
+        assert 'ESEARCH' in server_capabilities(conn, refresh=True)
+        assert server_capabilities(mock.Mock()) is None
+
+
+class TestEsearch:
+    """Test cases for ESEARCH responses"""
+
+    def test_parse_esearch_response(self):
+        """COUNT and ALL are read from the untagged response"""
+        assert parse_esearch_response([b'(TAG "A3") UID COUNT 4 ALL 1:3,7']) == {'count': 4, 'all': '1:3,7'}
+        assert parse_esearch_response([b'(TAG "A3") UID COUNT 0']) == {'count': 0, 'all': ''}
+
+
+class TestRunSearchPlans:
+    """Test cases for run_search_plans against a fake server"""
+
+    def _server(self, capabilities):
+        server = FakeImapServer({'INBOX': [make_message(uid, size=5000 if uid % 2 else 100)
+                                           for uid in range(1, 8)]},
+                                capabilities=capabilities)
+        server.search_filter = _larger_filter
+        return server
+
+    def test_esearch_plan(self):
+        """The narrowest plan runs as ESEARCH and returns the expanded UIDs"""
+        server = self._server('IMAP4rev1 ESEARCH')
+        conn = _connection(server)
+        conn.select('INBOX')
+
+        uids, plan = run_search_plans(conn, plan_imap_search(server_capabilities(conn), [], min_size=1024,
+                                                             content_type_filter=True))
+
+        assert str(uids) == '1,3,5,7'
+        assert plan['esearch']
+        assert server.commands[-1].startswith('UID SEARCH RETURN (ALL COUNT) LARGER 1024 OR HEADER')
+
+    def test_fallback_when_rejected(self):
+        """A rejected HEADER search falls back to the base criteria"""
+        server = self._server('IMAP4rev1')
+        server.reject = lambda line: 'HEADER' in line
+        conn = _connection(server)
+        conn.select('INBOX')
+
+        uids, plan = run_search_plans(conn, plan_imap_search(server_capabilities(conn), ['UID 1:*'],
+                                                             content_type_filter=True))
+
+        assert str(uids) == '1:7'
+        assert plan['criteria'] == 'UID 1:*'
+
+    def test_sequence_numbers_skip_esearch(self):
+        """Searches by sequence number never use ESEARCH"""
+        server = self._server('IMAP4rev1 ESEARCH')
+        conn = _connection(server)
+        conn.select('INBOX')
+        conn.search = mock.Mock(return_value=('OK', [b'1 3']))
+
+        numbers, plan = run_search_plans(conn, plan_imap_search(server_capabilities(conn), []), use_uid=False)
+
+        assert numbers == ['1', '3']
+        assert not plan['esearch']
+
+
+class TestNarrowedSearchMessages:
+    """Test cases for search_messages with the planner"""
+
+    def _search(self, conn, **extra):
+        processor = mock.Mock()
+        processor.search_in_pdf_attachment.return_value = {'found': True, 'matches': ['NIP']}
+        criteria = {'nip': '123', 'connection': conn, 'folder_path': 'INBOX'}
+        criteria.update(extra)
+        with mock.patch.object(search_engine, 'PDFProcessor', return_value=processor):
+            return search_engine.search_messages(criteria)
+
+    def test_small_messages_not_fetched(self):
+        """Messages below the LARGER threshold are never fetched"""
+        server = FakeImapServer({'INBOX': [
+            make_message(1, structure=PDF_STRUCTURE, sections={'2': b'%PDF-1.4'}, size=8000),
+            make_message(2, size=300),
+        ]}, capabilities='IMAP4rev1 ESEARCH')
+        server.search_filter = _larger_filter
+
+        results = self._search(_connection(server), narrow_search=True)
+
+        assert [m['uid'] for m in results['messages']] == ['1']
+        assert not any(c.startswith('UID FETCH') and '2' in c.split()[2] for c in server.commands)
+
+    def test_narrow_search_disabled(self):
+        """Without narrow_search (the default) the plain search is kept"""
+        server = FakeImapServer({'INBOX': [make_message(1)]}, capabilities='IMAP4rev1 ESEARCH')
+
+        self._search(_connection(server))
+
+        assert 'UID SEARCH ALL' in server.commands
+        assert not any('LARGER' in c for c in server.commands)
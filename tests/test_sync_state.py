@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for incremental IMAP scan state.
+
+Tests reading UIDVALIDITY/UIDNEXT/HIGHESTMODSEQ, the full/incremental/unchanged
+decision, state persistence and incremental search_messages runs.
+"""
+from datetime import datetime
+import unittest.mock as mock
+
+from gui.imap_search_components import search_engine
+from gui.imap_search_components.sync_state import (
+    SyncStateStore,
+    read_mailbox_state,
+    plan_incremental_scan,
+    filter_new_uids,
+)
+from tests.fake_imap_server import FakeImapServer, FakeIMAP4, make_message
+
+
+PDF_STRUCTURE = (
+    b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "fv.pdf") NIL NIL "7BIT" 8 NIL NIL NIL NIL)'
+    b' "MIXED" NIL NIL NIL NIL)'
+)
+
+
+def _pdf_message(uid):
+    return make_message(uid, structure=PDF_STRUCTURE, sections={'2': b'%PDF-1.4'})
+
+
+def _connection(server):
+    conn = FakeIMAP4(server)
+    conn.login('user', 'secret')
+    return conn
+
+
+class TestReadMailboxState:
+    """Test cases for read_mailbox_state"""
+
+    def test_state_from_select_response(self):
+        """UIDVALIDITY, UIDNEXT and HIGHESTMODSEQ come from SELECT response codes"""
+        server = FakeImapServer({'INBOX': [make_message(1), make_message(7)]},
+                                capabilities='IMAP4rev1 CONDSTORE', uidvalidity=42, highestmodseq=99)
+        conn = _connection(server)
+        conn.select('INBOX', readonly=True)
+
+        state = read_mailbox_state(conn, 'INBOX')
+
+        assert state == {'uidvalidity': 42, 'uidnext': 8, 'highestmodseq': 99}
+        assert not any(c.startswith('STATUS') for c in server.commands)
+
+    def test_status_fallback(self):
+        """Missing values are requested with STATUS"""
+        server = FakeImapServer({'INBOX': [make_message(3)]}, uidvalidity=5)
+        conn = _connection(server)
+        conn.select('INBOX', readonly=True)
+        conn.untagged_responses.clear()
+
+        state = read_mailbox_state(conn, 'INBOX')
+
+        assert state == {'uidvalidity': 5, 'uidnext': 4, 'highestmodseq': None}
+        assert 'STATUS INBOX (UIDVALIDITY UIDNEXT)' in server.commands
+
+
+class TestPlanIncrementalScan:
+    """Test cases for plan_incremental_scan"""
+
+    PREVIOUS = {'uidvalidity': 1, 'uidnext': 10, 'highestmodseq': 50, 'nip': '123'}
+
+    def test_no_previous_scan(self):
+        """First scan of a folder is a full scan"""
+        plan = plan_incremental_scan(None, {'uidvalidity': 1, 'uidnext': 10}, '123')
+        assert plan['mode'] == 'full'
+
+    def test_new_messages(self):
+        """Only UIDs from the stored UIDNEXT are scanned"""
+        plan = plan_incremental_scan(self.PREVIOUS, {'uidvalidity': 1, 'uidnext': 15}, '123')
+        assert plan['mode'] == 'incremental'
+        assert plan['min_uid'] == 10
+
+    def test_unchanged(self):
+        """Same UIDNEXT means nothing to scan"""
+        plan = plan_incremental_scan(self.PREVIOUS, {'uidvalidity': 1, 'uidnext': 10}, '123')
+        assert plan['mode'] == 'unchanged'
+
+    def test_uidvalidity_changed(self):
+        """Changed UIDVALIDITY forces a full scan"""
+        plan = plan_incremental_scan(self.PREVIOUS, {'uidvalidity': 2, 'uidnext': 15}, '123')
+        assert plan['mode'] == 'full'
+
+    def test_other_nip(self):
+        """State recorded for another NIP is not reused"""
+        plan = plan_incremental_scan(self.PREVIOUS, {'uidvalidity': 1, 'uidnext': 15}, '999')
+        assert plan['mode'] == 'full'
+
+    def test_other_date_range(self):
+        """State recorded for another date range is not reused"""
+        previous = dict(self.PREVIOUS, signature='123|2025-01-01|')
+        current = {'uidvalidity': 1, 'uidnext': 15}
+        assert plan_incremental_scan(previous, current, '123', '123|2025-01-01|')['mode'] == 'incremental'
+        assert plan_incremental_scan(previous, current, '123', '123|2024-01-01|')['mode'] == 'full'
+        assert plan_incremental_scan(self.PREVIOUS, current, '123', '123|2025-01-01|')['mode'] == 'full'
+
+    def test_modseq_without_uidnext(self):
+        """Unchanged HIGHESTMODSEQ skips the folder when UIDNEXT is missing"""
+        current = {'uidvalidity': 1, 'uidnext': None, 'highestmodseq': 50}
+        assert plan_incremental_scan(self.PREVIOUS, current, '123')['mode'] == 'unchanged'
+
+    def test_filter_new_uids(self):
+        """UID n:* quirk (last message returned) is filtered out"""
+        assert filter_new_uids(['9'], 10) == []
+        assert filter_new_uids(['9', '10', '12'], 10) == ['10', '12']
+
+
+class TestSyncStateStore:
+    """Test cases for SyncStateStore persistence"""
+
+    def test_round_trip(self, tmp_path):
+        """State survives saving and loading"""
+        path = tmp_path / 'state.json'
+        store = SyncStateStore(path)
+        store.set('a@example.com', 'INBOX', {'uidvalidity': 1, 'uidnext': 10, 'highestmodseq': None},
+                  '123', '123|2025-01-01|')
+        store.save()
+
+        state = SyncStateStore(path).get('a@example.com', 'INBOX')
+
+        assert state['uidnext'] == 10
+        assert state['nip'] == '123'
+        assert state['signature'] == '123|2025-01-01|'
+        assert SyncStateStore(path).get('a@example.com', 'Sent') is None
+
+    def test_corrupt_file(self, tmp_path):
+        """Unreadable state file starts fresh"""
+        path = tmp_path / 'state.json'
+        path.write_text('{not json')
+        assert SyncStateStore(path).get('a', 'INBOX') is None
+
+
+class TestIncrementalSearchMessages:
+    """Test cases for search_messages with a sync state store"""
+
+    def _search(self, conn, store, **extra):
+        processor = mock.Mock()
+        processor.search_in_pdf_attachment.return_value = {'found': True, 'matches': ['NIP']}
+        criteria = {
+            'nip': '123',
+            'connection': conn,
+            'folder_path': 'INBOX',
+            'sync_state': store,
+            'account': 'a@example.com',
+        }
+        criteria.update(extra)
+        with mock.patch.object(search_engine, 'PDFProcessor', return_value=processor):
+            return search_engine.search_messages(criteria)
+
+    def test_second_run_checks_only_new_messages(self, tmp_path):
+        """Messages scanned before are not fetched again"""
+        server = FakeImapServer({'INBOX': [_pdf_message(1), _pdf_message(2)]})
+        conn = _connection(server)
+        store = SyncStateStore(tmp_path / 'state.json')
+
+        first = self._search(conn, store)
+        server.folders['INBOX'].append(_pdf_message(3))
+        second = self._search(conn, store)
+        third = self._search(conn, store)
+
+        assert [m['uid'] for m in first['messages']] == ['1', '2']
+        assert [m['uid'] for m in second['messages']] == ['3']
+        assert third['messages'] == []
+        assert SyncStateStore(tmp_path / 'state.json').get('a@example.com', 'INBOX')['uidnext'] == 4
+
+    def test_uidvalidity_change_rescans(self, tmp_path):
+        """A new UIDVALIDITY makes the next run a full scan"""
+        server = FakeImapServer({'INBOX': [_pdf_message(1), _pdf_message(2)]})
+        conn = _connection(server)
+        store = SyncStateStore(tmp_path / 'state.json')
+
+        self._search(conn, store)
+        server.uidvalidity = 2
+        results = self._search(conn, store)
+
+        assert [m['uid'] for m in results['messages']] == ['1', '2']
+
+    def test_date_range_change_rescans(self, tmp_path):
+        """State stored by a search over another date range is not reused"""
+        server = FakeImapServer({'INBOX': [_pdf_message(1), _pdf_message(2)]})
+        conn = _connection(server)
+        store = SyncStateStore(tmp_path / 'state.json')
+
+        self._search(conn, store, date_from=datetime(2000, 1, 1), date_to=datetime(2000, 1, 2))
+        previous = store.get('a@example.com', 'INBOX')
+        folder_state = {'uidvalidity': 1, 'uidnext': 3, 'highestmodseq': None}
+        results = self._search(conn, store)
+
+        assert previous['signature'] == '123|2000-01-01|2000-01-02'
+        assert plan_incremental_scan(previous, folder_state, '123', '123||')['mode'] == 'full'
+        assert [m['uid'] for m in results['messages']] == ['1', '2']
+        assert store.get('a@example.com', 'INBOX')['signature'] == '123||'
+
+    def test_unscanned_message_keeps_state(self, tmp_path):
+        """A message that could not be scanned keeps the stored state from advancing"""
+        server = FakeImapServer({'INBOX': [_pdf_message(1), make_message(2, structure=PDF_STRUCTURE)]})
+        server.reject = lambda line: line == 'UID FETCH 2 (BODY.PEEK[])'
+        conn = _connection(server)
+        store = SyncStateStore(tmp_path / 'state.json')
+
+        results = self._search(conn, store)
+
+        assert [m['uid'] for m in results['messages']] == ['1']
+        assert store.get('a@example.com', 'INBOX') is None
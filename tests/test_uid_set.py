@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the range-compressed UID set.
+
+Tests parsing and serializing sequence sets, list-like access, batching,
+set operations and the ledger difference on UidSet search results.
+"""
+from gui.imap_search_components.uid_set import UidSet
+from gui.imap_search_components.fetch_pipeline import chunk_uids, compress_uid_set
+from gui.imap_search_components.scan_ledger import ScanLedger, pdf_hash, uids_to_scan
+from gui.imap_search_components.sync_state import filter_new_uids
+
+
+class TestUidSet:
+    """Test cases for UidSet"""
+
+    def test_search_response_round_trip(self):
+        """A SEARCH line becomes ranges and serializes minimally"""
+        uids = UidSet.from_search_response(b'1 2 3 4 5 7 9 10')
+        assert uids.to_sequence_set() == '1:5,7,9:10'
+        assert uids.range_count() == 3
+        assert len(uids) == 8
+        assert UidSet.parse('9:10,1:5,7') == uids
+
+    def test_unordered_and_duplicate_input(self):
+        """Unsorted input with duplicates is normalized"""
+        assert str(UidSet(['5', 3, '4', '4', 1])) == '1,3:5'
+        assert str(UidSet.parse('3:1,2,10')) == '1:3,10'
+
+    def test_list_like_access(self):
+        """Iteration, indexing and membership behave like the sorted UID list"""
+        uids = UidSet.parse('3:5,10')
+        assert list(uids) == ['3', '4', '5', '10']
+        assert uids[0] == '3' and uids[3] == '10' and uids[-1] == '10'
+        assert '4' in uids and 10 in uids and '6' not in uids
+        assert not UidSet() and UidSet.parse('1')
+
+    def test_positional_slices(self):
+        """Slices are UidSets covering the same positions as a list slice"""
+        uids = UidSet.parse('1:5000,5002:9000')
+        expected = [str(n) for n in list(range(1, 5001)) + list(range(5002, 9001))]
+        assert list(uids[4990:5010]) == expected[4990:5010]
+        assert str(uids[4999:5001]) == '5000,5002'
+        assert len(uids[8990:]) == len(expected[8990:])
+        assert [str(chunk) for chunk in chunk_uids(UidSet.parse('1:5'), 2)] == ['1:2', '3:4', '5']
+
+    def test_difference_and_intersection(self):
+        """Set operations work range by range"""
+        uids = UidSet.parse('1:100')
+        assert str(uids - UidSet.parse('1:10,50,90:200')) == '11:49,51:89'
+        assert str(uids & UidSet.parse('0:5,99:105')) == '1:5,99:100'
+        assert str(uids.difference(['2', '3'])) == '1,4:100'
+        assert str(uids.from_uid(95)) == '95:100'
+
+    def test_esearch(self):
+        """ESEARCH ALL is parsed without expanding"""
+        uids = UidSet.from_esearch([b'(TAG "A4") UID COUNT 4000001 ALL 1:4000000,4000002'])
+        assert len(uids) == 4000001
+        assert compress_uid_set(uids) == '1:4000000,4000002'
+        assert not UidSet.from_esearch([b'(TAG "A4") UID COUNT 0'])
+
+    def test_filter_new_uids_keeps_uid_set(self):
+        """Incremental filtering stays compact"""
+        assert str(filter_new_uids(UidSet.parse('1:20'), 15)) == '15:20'
+
+
+class TestLedgerDifference:
+    """Test cases for uids_to_scan with a UidSet"""
+
+    def test_uids_to_scan_with_uid_set(self, tmp_path):
+        """Scanned non-matching UIDs are removed as ranges; matches are kept"""
+        ledger = ScanLedger(tmp_path / 'ledger.sqlite3')
+        for uid in range(1, 11):
+            text = 'NIP 1112223344' if uid == 5 else 'other'
+            ledger.record_message('a', 'INBOX', 7, str(uid), [
+                {'filename': 'fv.pdf', 'sha256': pdf_hash(text.encode()), 'size': 5, 'text': text}])
+
+        remaining, skipped = uids_to_scan(ledger, 'a', 'INBOX', 7, UidSet.parse('1:1000'),
+                                          lambda text: '1112223344' in text)
+
+        assert str(remaining) == '5,11:1000'
+        assert skipped == 9